@@ -0,0 +1,80 @@
+"""单合约信号策略 (交互式机器人使用)
+
+各策略对一组K线运行 TrendEngine (合约数为 1)，指标与信号与多合约的
+TrendFollowingStrategy 完全一致。generate_signal 返回 'buy' / 'sell' / 'hold'。
+"""
+from typing import Dict, Optional
+
+from core.candles import Candles
+from strategies.grid import GridTradingStrategy  # 网格价位计算，与其他策略统一从这里导入
+from strategies.trend_following import TrendEngine
+
+SIGNAL_LABELS = {1: 'buy', -1: 'sell', 0: 'hold'}
+
+
+class SignalStrategy:
+    """单个 TrendEngine 信号的包装"""
+
+    signal = 'ma'
+    default_params: Dict = {}
+
+    def __init__(self, trader=None, contract: str = '', **params):
+        self.trader = trader
+        self.contract = contract
+        self.params = dict(self.default_params, **params)
+        self.engine: Optional[TrendEngine] = None
+
+    def generate_signal(self, candles) -> str:
+        if not isinstance(candles, Candles):
+            candles = Candles.from_dicts(candles)
+        self.engine = TrendEngine([self.contract], self.params)
+        self.engine.fit(candles.high[None, :], candles.low[None, :], candles.close[None, :])
+        return SIGNAL_LABELS[int(self.engine.signals[self.signal][0])]
+
+    def indicators(self) -> Dict[str, float]:
+        """最近一次 generate_signal 的指标值"""
+        if self.engine is None:
+            return {}
+        return {name: float(values[0]) for name, values in self.engine.values.items()}
+
+
+class MAStrategy(SignalStrategy):
+    """快慢均线: 快线在慢线之上做多"""
+    signal = 'ma'
+
+
+class EMABreakoutStrategy(SignalStrategy):
+    """收盘价突破 EMA"""
+    signal = 'ema'
+
+
+class MACDFastStrategy(SignalStrategy):
+    """短参数 MACD 柱状图方向"""
+    signal = 'macd'
+    default_params = {'macd_fast': 6, 'macd_slow': 13, 'macd_signal': 5}
+
+
+class RSIStrategy(SignalStrategy):
+    """RSI 超卖做多、超买做空"""
+    signal = 'rsi'
+
+
+class BollingerBandsStrategy(SignalStrategy):
+    """跌破布林下轨做多、突破上轨做空"""
+    signal = 'bollinger'
+
+
+class BreakoutStrategy(SignalStrategy):
+    """唐奇安通道突破"""
+    signal = 'breakout'
+
+
+class MomentumBreakoutStrategy(SignalStrategy):
+    """N 根K线涨跌幅超过阈值"""
+    signal = 'momentum'
+
+
+class VolatilityBreakoutStrategy(SignalStrategy):
+    """单根K线涨跌超过 vol_k 倍 ATR"""
+    signal = 'volatility'
+
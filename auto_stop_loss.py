@@ -10,23 +10,35 @@
 
 import os
 import time
-import logging
-from datetime import datetime
+import threading
+from typing import Dict, Set
+from core.startup import startup  # 最先导入项目模块，从这里开始计算启动耗时
 from core.exchange import Exchange
-from core.notifier import logger
+from core.notifier import logger, add_log_file, enable_tick_log, log_tick
+from core.trigger_index import TriggerIndex, FALLING, RISING
 
-# ============ 日志配置 ============
-# 沿用 core.notifier 的 logger，但可以额外添加文件输出
-file_handler = logging.FileHandler("auto_trade.log", encoding='utf-8')
-file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
-logger.addHandler(file_handler)
+startup.mark("导入")
 
 class AutoTradingMonitor:
     """自动止损止盈监控器"""
     
-    def __init__(self, settle: str = 'usdt'):
-        self.exchange = Exchange(settle=settle)
+    def __init__(self, settle: str = 'usdt', price_feed=None, exchange=None, candle_archive=None):
+        # 可注入其他交易所实现 (例如回测用的 core.backtest.SimExchange)，注入的实例由调用方关闭
+        self._owns_exchange = exchange is None
+        self.exchange = exchange if exchange is not None else Exchange(settle=settle, candle_archive=candle_archive)
         self.running = True
+        # 推送行情 (可选)：价格穿越止损/止盈价时立即唤醒检查，无需等待轮询间隔
+        self.price_feed = price_feed
+        # 最近一次计算的止损/止盈价 (ATR 变化时移动价位，无需重建)
+        self.triggers = TriggerIndex()
+        # TriggerIndex 不是线程安全的: 主循环移动价位与行情线程的检查共用此锁
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        # contract -> 上一条推送行情已越过的价位 ID，只在新越过价位时唤醒 (价格停留在价位外、平仓失败待重试时
+        # 不重复唤醒，由轮询重试)；主循环移动价位后 ID 不变，只有新价位被越过时才唤醒
+        self._beyond: Dict[str, Set[str]] = {}
+        if price_feed is not None:
+            price_feed.add_listener(self.on_price)
         logger.info("=" * 100)
         logger.info("自动交易监控已启动 (动态 ATR 模式)")
         logger.info("=" * 100)
@@ -39,9 +51,14 @@ class AutoTradingMonitor:
         if not position:
             logger.warning(f"未找到 {contract} 持仓，停止监控")
             return False
+        self.exchange.warm_close_path([contract])
         
-        # 2. 获取当前价格
-        current_price = self.exchange.get_current_price(contract)
+        # 2. 获取当前价格 (优先使用推送行情)
+        current_price = 0.0
+        if self.price_feed is not None:
+            current_price = self.price_feed.table.get(contract, max_age=5)
+        if current_price == 0:
+            current_price = self.exchange.get_current_price(contract)
         if current_price == 0:
             logger.error("获取价格失败，跳过本次检查")
             return True
@@ -70,15 +87,19 @@ class AutoTradingMonitor:
                 stop_loss_price = entry_price * 1.05
                 take_profit_price = entry_price * 0.95
 
-        # 4. 打印当前状态
+        with self._lock:
+            self.triggers.set(f"{contract}:stop_loss", contract, stop_loss_price, FALLING if is_long else RISING)
+            self.triggers.set(f"{contract}:take_profit", contract, take_profit_price, RISING if is_long else FALLING)
+
+        # 4. 打印当前状态 (格式化延迟到日志后台线程)
         pnl_pct = ((current_price - entry_price) / entry_price) * 100
         direction = "做多" if is_long else "做空"
-        logger.info("-" * 100)
-        logger.info(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] 监控状态")
-        logger.info(f"  合约: {contract} [{direction}] | 数量: {size}")
-        logger.info(f"  入场: ${entry_price:.6f} | 当前: ${current_price:.6f} | 盈亏: {pnl_pct:+.2f}%")
-        logger.info(f"  动态止损价: ${stop_loss_price:.6f} (ATR: {atr:.6f}, K: {atr_k})")
-        logger.info(f"  预设止盈价: ${take_profit_price:.6f} ({take_profit_pct}%)")
+        logger.info("监控状态 | 合约: %s [%s] | 数量: %s | 入场: $%.6f | 当前: $%.6f | 盈亏: %+.2f%%",
+                    contract, direction, size, entry_price, current_price, pnl_pct)
+        logger.info("  动态止损价: $%.6f (ATR: %.6f, K: %s) | 预设止盈价: $%.6f (%s%%)",
+                    stop_loss_price, atr, atr_k, take_profit_price, take_profit_pct)
+        log_tick(contract=contract, price=current_price, entry=entry_price, size=size, pnl_pct=round(pnl_pct, 4),
+                 stop=stop_loss_price, take_profit=take_profit_price, atr=atr)
         
         # 5. 检查触发条件
         should_close = False
@@ -100,11 +121,9 @@ class AutoTradingMonitor:
                 reason = f"触发止盈 (价格 ${current_price:.6f} <= ${take_profit_price:.6f})"
         
         if should_close:
-            logger.warning("=" * 100)
+            detected_at = time.perf_counter()
             logger.warning(f"🚨 {reason}")
-            logger.warning("=" * 100)
-            
-            success = self.exchange.close_position(contract, size, position['mode'])
+            success = self.exchange.close_position(contract, size, position['mode'], detected_at=detected_at)
             if success:
                 logger.info("✅ 自动平仓成功")
                 return False
@@ -113,17 +132,41 @@ class AutoTradingMonitor:
         
         return True
 
+    def on_price(self, contract: str, price: float):
+        """推送行情回调：价格穿越最近一次计算的止损/止盈价时唤醒主循环"""
+        with self._lock:
+            beyond = {trigger.id for trigger in self.triggers.crossed(contract, price, pop=False)}
+            crossed = beyond - self._beyond.get(contract, set())
+            self._beyond[contract] = beyond
+        if crossed:
+            self._wake.set()
+
     def run(self, contract: str, atr_k: float = 2.0, take_profit_pct: float = 5.0, interval: int = 60):
         """运行监控"""
+        if self.price_feed is not None:
+            self.price_feed.subscribe([contract])
+            self.price_feed.start_background()
         try:
             while self.running:
+                # 先清除再检查: 检查期间到达的唤醒会保留到下面的 wait
+                self._wake.clear()
                 if not self.check_and_execute(contract, atr_k, take_profit_pct):
                     break
-                time.sleep(interval)
+                if not startup.reported:
+                    startup.mark("首轮")
+                    startup.report(logger)
+                # 等待下一次轮询，或被推送行情提前唤醒
+                self._wake.wait(interval)
         except KeyboardInterrupt:
             logger.info("用户停止监控")
         except Exception as e:
             logger.error(f"监控异常: {e}", exc_info=True)
+        finally:
+            if self.price_feed is not None:
+                self.price_feed.stop()
+            if self._owns_exchange:
+                # 等待后台的平仓确认完成
+                self.exchange.close()
 
 def main():
     # 配置
@@ -131,9 +174,25 @@ def main():
     ATR_K = 2.0             # ATR 倍数 (越大止损越宽)
     TP_PCT = 5.0            # 止盈比例 (%)
     INTERVAL = 60           # 检查间隔 (秒)
+    USE_PRICE_FEED = False  # 是否启用 WebSocket 推送行情
+    USE_CANDLE_ARCHIVE = True  # 是否使用本地K线归档 (data/archive/)
+    USE_TICK_LOG = False    # 是否把每次检查的状态写入 logs/ticks.jsonl (JSON 行)
 
+    # 沿用 core.notifier 的日志队列，额外输出到滚动文件 logs/auto_trade.log
+    add_log_file("auto_trade.log")
     try:
-        monitor = AutoTradingMonitor()
+        if USE_TICK_LOG:
+            enable_tick_log()
+        price_feed = None
+        if USE_PRICE_FEED:
+            from core.price_feed import GateWebSocketFeed
+            price_feed = GateWebSocketFeed(settle='usdt')
+        candle_archive = None
+        if USE_CANDLE_ARCHIVE:
+            from data.candle_archive import CandleArchive
+            candle_archive = CandleArchive(settle='usdt')
+        monitor = AutoTradingMonitor(price_feed=price_feed, candle_archive=candle_archive)
+        startup.mark("初始化")
         monitor.run(CONTRACT, atr_k=ATR_K, take_profit_pct=TP_PCT, interval=INTERVAL)
     except Exception as e:
         logger.error(f"程序启动失败: {e}")
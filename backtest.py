@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+回测入口
+功能：
+1. 读取 data/candles/ 下的历史K线文件 ({contract}_{interval}.npz 或 .csv)，
+   也可直接指向本地K线归档目录 data/archive/usdt (.bin)
+2. 向量化回测 ATR 动态止损 + 固定比例止盈 (与 auto_stop_loss.py 逻辑一致)
+3. 可选: 逐根K线回放 AutoTradingMonitor，验证与实盘代码一致
+"""
+
+from core.backtest import Backtester, load_candle_files
+from core.notifier import logger
+
+
+def print_report(title: str, report: dict):
+    logger.info("=" * 100)
+    logger.info(title)
+    logger.info(f"  成交笔数: {report['trades']} | 总盈亏: {report['pnl']:.4f} | 手续费: {report['fees']:.4f}")
+    logger.info(f"  胜率: {report['win_rate'] * 100:.2f}% | 最大回撤: {report['max_drawdown']:.4f}")
+    logger.info(f"  耗时: {report['elapsed']:.3f}s | 成交/秒: {report['trades_per_sec']:.0f} | K线/秒: {report['candles_per_sec']:.0f}")
+    logger.info("=" * 100)
+
+
+def main():
+    # 配置
+    DATA_DIR = "data/candles"   # 历史K线目录 (或本地K线归档 data/archive/usdt)
+    INTERVAL = "1m"             # 回测K线周期
+    CONTRACTS = None            # 指定合约列表，None 表示目录下全部
+    ATR_K = 2.0                 # ATR 倍数
+    TP_PCT = 5.0                # 止盈比例 (%)
+    ATR_PERIOD = 14             # ATR 周期
+    ATR_INTERVAL = "1h"         # ATR 使用的K线周期
+    FEE_RATE = 0.0005           # 单边手续费率
+    REPLAY = False              # 是否同时逐根回放 AutoTradingMonitor (较慢)
+
+    candles = load_candle_files(DATA_DIR, INTERVAL, CONTRACTS)
+    if not candles:
+        logger.error(f"未在 {DATA_DIR} 找到 *_{INTERVAL}.npz/.csv 历史K线文件")
+        return
+
+    backtester = Backtester(candles, interval=INTERVAL, fee_rate=FEE_RATE)
+    logger.info(f"已加载 {len(candles)} 个合约，共 {backtester.total_candles} 根K线")
+
+    report = backtester.run_atr_stop(atr_k=ATR_K, take_profit_pct=TP_PCT, period=ATR_PERIOD, atr_interval=ATR_INTERVAL)
+    print_report(f"ATR 止损回测 (K={ATR_K}, 止盈={TP_PCT}%, 周期={ATR_PERIOD}, {ATR_INTERVAL})", report)
+
+    if REPLAY:
+        from auto_stop_loss import AutoTradingMonitor
+
+        def make_step(exchange):
+            monitor = AutoTradingMonitor(exchange=exchange)
+            return lambda: [monitor.check_and_execute(c, ATR_K, TP_PCT) for c in list(exchange.positions)]
+
+        report = backtester.replay(make_step, entries={c: 1 for c in candles})
+        print_report("AutoTradingMonitor 逐根回放", report)
+
+
+if __name__ == "__main__":
+    main()
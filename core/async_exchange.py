@@ -0,0 +1,403 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import re
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlencode
+
+import aiohttp
+
+from core.candles import Candles
+from core.exchange import (Exchange, CandleSeries, RequestScheduler, default_scheduler, MAX_BATCH_ORDERS,
+                           MAX_BATCH_CANCEL, CLOSE_ATTEMPTS, CLOSE_BACKOFF, CLOSE_MAX_BACKOFF, ORDER_TIMEOUT,
+                           CONFIRM_INTERVAL, CONFIRM_TIMEOUT, close_order_text, order_outcome_unknown,
+                           flatten_orders, flatten_report)
+from core.metrics import metrics
+from core.notifier import logger
+from core.snapshot_cache import SnapshotCache
+
+API_HOST = "https://api.gateio.ws"
+API_PREFIX = "/api/v4"
+# 路径中的订单 ID 或自定义标识
+_ID_SEGMENT = re.compile(r'/(\d+|t-[^/]+)(?=/|$)')
+
+
+def endpoint_name(method: str, path: str) -> str:
+    """指标中的接口名: 路径中的订单 ID / 自定义标识替换为 {id}"""
+    return f"{method} " + _ID_SEGMENT.sub('/{id}', path)
+
+
+class AsyncApiError(Exception):
+    """交易所返回的 HTTP 错误"""
+
+    def __init__(self, status: int, body, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers
+        label = body.get('label') if isinstance(body, dict) else None
+        message = body.get('message') if isinstance(body, dict) else body
+        super().__init__(f"HTTP {status} {label or ''} {message or ''}".strip())
+
+
+class AsyncExchange:
+    """交易所 API 异步封装 (与 Exchange 方法一致，均为协程)
+
+    所有请求共用一个 keep-alive 连接池，并发数受 max_concurrency 限制。
+    """
+
+    # 复用同步版本的密钥加载、持仓解析与K线缓存查找
+    load_keys = Exchange.load_keys
+    _parse_position = staticmethod(Exchange._parse_position)
+    _candle_series = Exchange._candle_series
+    _record_order = Exchange._record_order
+    _record_limit_order = Exchange._record_limit_order
+    _parse_order = staticmethod(Exchange._parse_order)
+
+    def __init__(self, settle: str = 'usdt', max_concurrency: int = 10, request_timeout: float = 10,
+                 candle_cache_size: int = 500, storage=None, candle_archive=None,
+                 scheduler: Optional[RequestScheduler] = None, snapshot_ttl: float = 1.0):
+        self.load_keys()
+        self.settle = settle
+        self.scheduler = scheduler or default_scheduler()
+        self.snapshots = SnapshotCache(snapshot_ttl)
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.candle_cache_size = candle_cache_size
+        self._candle_cache: Dict = {}
+        self.storage = storage
+        self.candle_archive = candle_archive
+        # 会话与信号量需在事件循环内创建，首次请求时初始化
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # contract -> 平仓订单模板
+        self._close_templates: Dict[str, Dict] = {}
+        # 后台确认中的平仓单 (保留引用，避免任务被回收)
+        self._confirm_tasks = set()
+        logger.info(f"异步交易所 API 初始化完成 (最大并发: {max_concurrency})")
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+                headers={'Accept': 'application/json', 'Content-Type': 'application/json'},
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def close(self):
+        """等待后台的平仓确认完成后关闭连接池"""
+        if self._confirm_tasks:
+            await asyncio.gather(*self._confirm_tasks, return_exceptions=True)
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _sign(self, method: str, path: str, query_string: str, payload: str) -> Dict[str, str]:
+        """Gate APIv4 签名"""
+        timestamp = str(int(time.time()))
+        hashed_payload = hashlib.sha512(payload.encode('utf-8')).hexdigest()
+        message = f"{method}\n{API_PREFIX}{path}\n{query_string}\n{hashed_payload}\n{timestamp}"
+        sign = hmac.new(self.api_secret.encode('utf-8'), message.encode('utf-8'), hashlib.sha512).hexdigest()
+        return {'KEY': self.api_key, 'Timestamp': timestamp, 'SIGN': sign}
+
+    async def _request(self, method: str, path: str, query: Optional[Dict] = None, body=None,
+                       signed: bool = False):
+        """经调度器限频发送请求，相同的 GET 请求在途时合并"""
+        kind = 'order' if method == 'POST' else 'private' if signed else 'public'
+        items = tuple(sorted((query or {}).items()))
+        return await self.scheduler.call_async(kind, self._send, method, path, items, body, signed,
+                                               coalesce=method == 'GET', endpoint=endpoint_name(method, path))
+
+    async def _send(self, method: str, path: str, query: tuple, body, signed: bool):
+        session = self._get_session()
+        query_string = urlencode({k: v for k, v in query if v is not None})
+        payload = json.dumps(body) if body is not None else ''
+        headers = self._sign(method, path, query_string, payload) if signed else None
+        url = f"{API_HOST}{API_PREFIX}{path}"
+        if query_string:
+            url = f"{url}?{query_string}"
+
+        async with self._semaphore:
+            async with session.request(method, url, data=payload or None, headers=headers) as resp:
+                data = await resp.json(content_type=None)
+                if resp.status >= 400:
+                    raise AsyncApiError(resp.status, data, resp.headers)
+                return data
+
+    async def get_current_price(self, contract: str) -> float:
+        """获取当前市价 (全部行情快照未过期时直接复用)"""
+        tickers = self.snapshots.peek('tickers')
+        if tickers and contract in tickers:
+            return tickers[contract]
+        return await self.snapshots.get_async(('ticker', contract), lambda: self._load_price(contract)) or 0.0
+
+    async def _load_price(self, contract: str) -> Optional[float]:
+        try:
+            ticker = await self._request('GET', f"/futures/{self.settle}/tickers", {'contract': contract})
+            if ticker and len(ticker) > 0:
+                return float(ticker[0]['last'])
+            return 0.0
+        except Exception as e:
+            logger.error(f"获取价格失败: {e}")
+            return None
+
+    async def get_tickers(self) -> Dict[str, float]:
+        """一次请求获取全部合约最新价 (contract -> last)"""
+        return await self.snapshots.get_async('tickers', self._load_tickers) or {}
+
+    async def _load_tickers(self) -> Optional[Dict[str, float]]:
+        try:
+            tickers = await self._request('GET', f"/futures/{self.settle}/tickers")
+            return {t['contract']: float(t['last']) for t in tickers if t.get('last')}
+        except Exception as e:
+            logger.error(f"获取全部行情失败: {e}")
+            return None
+
+    async def get_positions(self) -> Optional[Dict[str, Dict]]:
+        """一次请求获取全部持仓快照 (contract -> position)，失败返回 None"""
+        return await self.snapshots.get_async('positions', self._load_positions)
+
+    async def _load_positions(self) -> Optional[Dict[str, Dict]]:
+        try:
+            positions = await self._request('GET', f"/futures/{self.settle}/positions", signed=True)
+        except Exception as e:
+            logger.error(f"获取持仓失败: {e}")
+            return None
+        result = {}
+        for pos in positions:
+            parsed = self._parse_position(SimpleNamespace(**pos))
+            if parsed:
+                result[parsed['contract']] = parsed
+        return result
+
+    async def get_account(self) -> Optional[Dict[str, float]]:
+        """获取合约账户快照 (total 为不含未实现盈亏的余额)，失败返回 None"""
+        return await self.snapshots.get_async('account', self._load_account)
+
+    async def _load_account(self) -> Optional[Dict[str, float]]:
+        try:
+            account = await self._request('GET', f"/futures/{self.settle}/accounts", signed=True)
+        except Exception as e:
+            logger.error(f"获取账户失败: {e}")
+            return None
+        return {
+            'total': float(account.get('total') or 0),
+            'available': float(account.get('available') or 0),
+            'unrealised_pnl': float(account.get('unrealised_pnl') or 0),
+        }
+
+    async def get_position(self, contract: str):
+        """获取当前持仓"""
+        positions = await self.get_positions()
+        if not positions:
+            return None
+        return positions.get(contract)
+
+    def warm_close_path(self, contracts: List[str]):
+        """有持仓时预先构建平仓模板"""
+        for contract in contracts:
+            self._close_templates.setdefault(contract, {'contract': contract, 'price': "0", 'tif': "ioc",
+                                                        'reduce_only': True})
+
+    async def close_position(self, contract: str, size: float, mode: str, detected_at: Optional[float] = None) -> bool:
+        """市价平仓 (只减仓 IOC)，标识、重试与后台确认同 Exchange.close_position"""
+        close_size = -size
+        text = close_order_text()
+        self.warm_close_path([contract])
+        order = dict(self._close_templates[contract], size=int(close_size), text=text)
+        logger.info("执行平仓: %s, 数量: %s, 标识: %s", contract, close_size, text)
+
+        result, error = None, None
+        for attempt in range(CLOSE_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(min(CLOSE_MAX_BACKOFF, CLOSE_BACKOFF * 2 ** (attempt - 1)))
+                result = await self._order_by_text(text)
+                if result is not None:
+                    logger.info(f"平仓订单已在交易所 (标识 {text})，不再重发")
+                    break
+            try:
+                result = await self.scheduler.call_async(
+                    'order', self._submit_close, order, detected_at if not attempt else None,
+                    endpoint=endpoint_name('POST', f"/futures/{self.settle}/orders"),
+                )
+                break
+            except Exception as e:
+                error = e
+                if not order_outcome_unknown(e):
+                    break
+                logger.warning(f"平仓请求结果不确定 (第 {attempt + 1} 次): {e!r}")
+        # 请求可能已到达交易所，持仓状态不确定
+        self.snapshots.invalidate()
+
+        if result is None:
+            logger.error(f"平仓失败: {error!r}")
+            self._record_order(contract, close_size, error=str(error))
+            return False
+        if detected_at is not None:
+            metrics.observe('close_trigger_to_ack_seconds', time.perf_counter() - detected_at)
+        logger.info("平仓订单已提交: ID=%s, 状态=%s", result.get('id'), result.get('status'))
+        task = asyncio.ensure_future(self._confirm_close(contract, close_size, self._parse_order(SimpleNamespace(**result))))
+        self._confirm_tasks.add(task)
+        task.add_done_callback(self._confirm_tasks.discard)
+        return True
+
+    async def _submit_close(self, order: Dict, detected_at: Optional[float]):
+        if detected_at is not None:
+            metrics.observe('close_trigger_to_send_seconds', time.perf_counter() - detected_at)
+        return await asyncio.wait_for(self._send('POST', f"/futures/{self.settle}/orders", (), order, True),
+                                      timeout=ORDER_TIMEOUT)
+
+    async def _order_by_text(self, text: str) -> Optional[Dict]:
+        """按自定义标识查询订单，不存在或查询失败返回 None"""
+        try:
+            return await self._request('GET', f"/futures/{self.settle}/orders/{text}", signed=True)
+        except Exception as e:
+            if order_outcome_unknown(e):
+                # 无法确认时仍会重发: 平仓单只减仓，重复提交也不会反向开仓
+                logger.warning(f"按标识查询平仓订单失败: {e!r}")
+            return None
+
+    async def _confirm_close(self, contract: str, close_size: float, order: Dict):
+        """后台确认平仓单成交 (IOC 通常已结束，未结束时轮询订单状态) 并记录"""
+        deadline = time.monotonic() + CONFIRM_TIMEOUT
+        while order['status'] != 'finished' and time.monotonic() < deadline:
+            await asyncio.sleep(CONFIRM_INTERVAL)
+            order = await self.get_order(order['id']) or order
+        self._record_order(contract, close_size, order['id'], order['status'], order['fill_price'], order['left'])
+        if order['status'] != 'finished':
+            logger.warning(f"[{contract}] 平仓单 {order['id']} 在 {CONFIRM_TIMEOUT}s 内未结束")
+        elif order['left']:
+            logger.warning(f"[{contract}] 平仓部分成交: 剩余 {order['left']} ({order.get('finish_as')})，下一轮重试")
+        else:
+            logger.info(f"[{contract}] 平仓已成交: 数量 {close_size} 均价 {order['fill_price']}")
+
+    async def place_orders(self, orders: List[Dict]) -> List[Dict]:
+        """批量挂限价单 (每次请求最多 MAX_BATCH_ORDERS 个)，返回与输入一一对应的结果"""
+        results = []
+        for i in range(0, len(orders), MAX_BATCH_ORDERS):
+            batch = orders[i:i + MAX_BATCH_ORDERS]
+            body = []
+            for o in batch:
+                item = {'contract': o['contract'], 'size': int(o['size']), 'price': str(o['price']),
+                        'tif': o.get('tif', 'gtc'), 'reduce_only': o.get('reduce_only', False)}
+                if o.get('text'):
+                    item['text'] = o['text']
+                body.append(item)
+            try:
+                response = await self._request('POST', f"/futures/{self.settle}/batch_orders", body=body, signed=True)
+                batch_results = [
+                    {'succeeded': bool(r.get('succeeded')), 'id': str(r['id']) if r.get('id') is not None else None,
+                     'status': r.get('status'),
+                     'error': None if r.get('succeeded') else f"{r.get('label')} {r.get('detail') or ''}".strip()}
+                    for r in response
+                ]
+            except Exception as e:
+                logger.error(f"批量下单失败: {e}")
+                batch_results = [{'succeeded': False, 'id': None, 'status': None, 'error': str(e)} for _ in batch]
+            for order, result in zip(batch, batch_results):
+                self._record_limit_order(order, result)
+            results += batch_results
+        if orders:
+            self.snapshots.invalidate()
+        return results
+
+    async def flatten(self, contracts: Optional[List[str]] = None, side: Optional[str] = None,
+                      predicate: Optional[Callable[[Dict], bool]] = None) -> Optional[List[Dict]]:
+        """一键平仓: 取一次最新持仓快照，各批平仓单并发提交，同 Exchange.flatten"""
+        self.snapshots.invalidate()
+        positions = await self.get_positions()
+        if positions is None:
+            logger.error("一键平仓失败: 无法获取持仓")
+            return None
+        orders = flatten_orders(positions, contracts, side, predicate)
+        if not orders:
+            logger.info("一键平仓: 没有匹配的持仓")
+            return []
+        batches = [orders[i:i + MAX_BATCH_ORDERS] for i in range(0, len(orders), MAX_BATCH_ORDERS)]
+        logger.warning(f"一键平仓: {len(orders)} 个持仓，分 {len(batches)} 批并发提交")
+        responses = await asyncio.gather(*(self.place_orders(batch) for batch in batches))
+        return flatten_report(orders, [result for batch in responses for result in batch])
+
+    async def cancel_orders(self, order_ids: List[str]) -> Dict[str, bool]:
+        """批量撤单 (每次请求最多 MAX_BATCH_CANCEL 个)，返回 id -> 是否成功"""
+        results = {}
+        for i in range(0, len(order_ids), MAX_BATCH_CANCEL):
+            batch = [str(order_id) for order_id in order_ids[i:i + MAX_BATCH_CANCEL]]
+            try:
+                response = await self._request('POST', f"/futures/{self.settle}/batch_cancel_orders", body=batch,
+                                               signed=True)
+                results.update({str(r['id']): bool(r.get('succeeded')) for r in response})
+            except Exception as e:
+                logger.error(f"批量撤单失败: {e}")
+                results.update({order_id: False for order_id in batch})
+        return results
+
+    async def get_order(self, order_id: str) -> Optional[Dict]:
+        """查询单个订单，失败返回 None"""
+        try:
+            order = await self._request('GET', f"/futures/{self.settle}/orders/{order_id}", signed=True)
+        except Exception as e:
+            logger.error(f"查询订单失败 {order_id}: {e}")
+            return None
+        return self._parse_order(SimpleNamespace(**order))
+
+    async def list_open_orders(self, contract: Optional[str] = None) -> Optional[List[Dict]]:
+        """列出未成交挂单 (可按合约过滤)，失败返回 None"""
+        try:
+            orders = await self._request('GET', f"/futures/{self.settle}/orders",
+                                         {'contract': contract, 'status': 'open'}, signed=True)
+        except Exception as e:
+            logger.error(f"获取挂单失败: {e}")
+            return None
+        return [self._parse_order(SimpleNamespace(**o)) for o in orders]
+
+    async def get_candlesticks(self, contract: str, interval: str = '1h', limit: int = 200,
+                               start: Optional[int] = None) -> Candles:
+        """获取K线数据 (列式存储，按下标访问仍返回字典视图，启用归档时只请求缺失部分)"""
+        try:
+            if self.candle_archive is not None and self.candle_archive.supports(interval):
+                return await self.candle_archive.serve_async(
+                    contract, interval, lambda begin, end: self._list_candlesticks(contract, interval, start=begin, end=end),
+                    limit=limit, start=start,
+                )
+            return await self._list_candlesticks(contract, interval, limit, start)
+        except Exception as e:
+            logger.error(f"获取K线数据失败: {e}")
+            return Candles.empty()
+
+    async def _list_candlesticks(self, contract: str, interval: str, limit: int = 200, start: Optional[int] = None,
+                                 end: Optional[int] = None) -> Candles:
+        query = {'contract': contract, 'interval': interval}
+        if start is not None or end is not None:
+            query['from'] = start
+            query['to'] = end
+        else:
+            query['limit'] = limit
+        candlesticks = await self._request('GET', f"/futures/{self.settle}/candlesticks", query)
+        return Candles.from_api(SimpleNamespace(**cs) for cs in candlesticks)
+
+    async def get_candle_series(self, contract: str, interval: str = '1h', min_size: int = 0) -> Optional[CandleSeries]:
+        """获取缓存的已收盘K线序列，仅在有新K线收盘时增量拉取"""
+        series = self._candle_series(contract, interval, min_size)
+        if series is None:
+            return None
+        now = time.time()
+        params = series.fetch_params(min_size, now)
+        if params is not None:
+            series.extend(await self.get_candlesticks(contract, interval=interval, **params), now)
+        return series
+
+    async def calculate_atr(self, contract: str, interval: str = '1h', period: int = 14) -> float:
+        """计算 ATR (平均真实波幅，基于已收盘K线的滚动均值)"""
+        series = await self.get_candle_series(contract, interval=interval, min_size=period + 1)
+        if series is None:
+            return 0.0
+        if len(series) < period + 1:
+            logger.warning(f"K线数据不足，无法计算 ATR (需要 {period+1}, 实际 {len(series)})")
+            return 0.0
+        return series.atr(period)
@@ -0,0 +1,365 @@
+"""回测引擎
+
+两种方式:
+1. Backtester.replay: 用 SimExchange 替换真实交易所，逐根K线驱动现有策略 (不休眠)，
+   策略代码无需修改，价格取每根K线收盘价 (等价于检查间隔 = K线周期)。
+2. Backtester.run_atr_stop: AutoTradingMonitor 的 ATR 止损/固定比例止盈逻辑的向量化版本，
+   按K线最高/最低价判断盘中触发，用于大规模参数调优。
+"""
+import logging
+import time
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from core import indicators
+from core.candles import Candles
+from core.exchange import INTERVAL_SECONDS
+from core.notifier import logger
+
+
+def load_candle_files(directory, interval: str = '1m', contracts: Optional[List[str]] = None) -> Dict[str, Candles]:
+    """读取目录下的 {contract}_{interval}.npz / .csv / .bin 历史K线文件 (.bin 为本地K线归档)"""
+    directory = Path(directory)
+    result = {}
+    for path in sorted(directory.glob(f"*_{interval}.*")):
+        if path.suffix not in ('.npz', '.csv', '.bin'):
+            continue
+        contract = path.name[:-len(f"_{interval}{path.suffix}")]
+        if contracts and contract not in contracts:
+            continue
+        result[contract] = Candles.load(path)
+    return result
+
+
+class _PriceView(Mapping):
+    """get_tickers 的惰性视图，只在访问时查找对应合约的价格"""
+
+    def __init__(self, exchange: 'SimExchange'):
+        self._exchange = exchange
+
+    def __getitem__(self, contract):
+        if contract not in self._exchange.candles:
+            raise KeyError(contract)
+        return self._exchange.get_current_price(contract)
+
+    def __iter__(self):
+        return iter(self._exchange.candles)
+
+    def __len__(self):
+        return len(self._exchange.candles)
+
+
+class SimExchange:
+    """回测用模拟交易所 (接口与 Exchange 一致)
+
+    now 为当前K线的开盘时间，行情按该K线收盘价计算；get_candlesticks 和 calculate_atr
+    只返回在此刻已经收盘的K线，避免未来函数。平仓按当前价成交并扣除手续费。
+    """
+
+    def __init__(self, candles: Dict[str, Candles], interval: str = '1m', fee_rate: float = 0.0005,
+                 multipliers: Optional[Dict[str, float]] = None):
+        self.candles = candles
+        self.interval = interval
+        self.interval_sec = INTERVAL_SECONDS[interval]
+        self.fee_rate = fee_rate
+        self.multipliers = multipliers or {}
+        self.settle = 'sim'
+        self.now = 0
+        self.positions: Dict[str, Dict] = {}
+        self.fills: List[Dict] = []
+        self._series_cache: Dict = {}
+        self._atr_cache: Dict = {}
+
+    def timeline(self) -> np.ndarray:
+        """所有合约K线时间的并集"""
+        if not self.candles:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([c.time for c in self.candles.values()]))
+
+    def _index(self, contract: str) -> int:
+        candles = self.candles.get(contract)
+        if candles is None:
+            return -1
+        return int(np.searchsorted(candles.time, self.now, side='right')) - 1
+
+    def get_current_price(self, contract: str) -> float:
+        i = self._index(contract)
+        return float(self.candles[contract].close[i]) if i >= 0 else 0.0
+
+    def get_tickers(self) -> Mapping:
+        return _PriceView(self)
+
+    def get_positions(self) -> Dict[str, Dict]:
+        result = {}
+        for contract, pos in self.positions.items():
+            result[contract] = dict(pos, mark_price=self.get_current_price(contract))
+        return result
+
+    def get_position(self, contract: str):
+        return self.get_positions().get(contract)
+
+    def open_position(self, contract: str, size: float) -> bool:
+        """按当前价开仓 (回测入场用)"""
+        price = self.get_current_price(contract)
+        if price == 0 or size == 0 or contract in self.positions:
+            return False
+        self.positions[contract] = {
+            'contract': contract,
+            'size': size,
+            'entry_price': price,
+            'entry_time': self.now,
+            'unrealised_pnl': 0.0,
+            'mode': 'single',
+            'leverage': 0,
+        }
+        return True
+
+    def warm_close_path(self, contracts):
+        pass
+
+    def close_position(self, contract: str, size: float, mode: str, detected_at=None) -> bool:
+        price = self.get_current_price(contract)
+        if contract not in self.positions or price == 0:
+            return False
+        pos = self.positions.pop(contract)
+        self.fills.append(make_fill(contract, pos['size'], pos['entry_time'], self.now, pos['entry_price'], price,
+                                    self.fee_rate, self.multipliers.get(contract, 1.0)))
+        return True
+
+    def _series(self, contract: str, interval: str) -> Candles:
+        key = (contract, interval)
+        series = self._series_cache.get(key)
+        if series is None:
+            interval_sec = INTERVAL_SECONDS[interval]
+            candles = self.candles[contract]
+            if interval_sec == self.interval_sec:
+                series = candles
+            elif interval_sec > self.interval_sec:
+                series = candles.resample(interval_sec)
+            else:
+                raise ValueError(f"回测K线周期 {self.interval} 无法生成更小的周期 {interval}")
+            self._series_cache[key] = series
+        return series
+
+    def _closed_count(self, contract: str, interval: str) -> int:
+        """当前时刻已收盘的K线数量"""
+        series = self._series(contract, interval)
+        interval_sec = INTERVAL_SECONDS[interval]
+        return int(np.searchsorted(series.time + interval_sec, self.now + self.interval_sec, side='right'))
+
+    def get_candlesticks(self, contract: str, interval: str = '1h', limit: int = 200,
+                         start: Optional[int] = None) -> Candles:
+        if contract not in self.candles:
+            return Candles.empty()
+        series = self._series(contract, interval)
+        end = self._closed_count(contract, interval)
+        begin = int(np.searchsorted(series.time, start)) if start is not None else max(0, end - limit)
+        return series[begin:end]
+
+    def calculate_atr(self, contract: str, interval: str = '1h', period: int = 14) -> float:
+        if contract not in self.candles:
+            return 0.0
+        key = (contract, interval, period)
+        atr = self._atr_cache.get(key)
+        if atr is None:
+            series = self._series(contract, interval)
+            atr = self._atr_cache[key] = indicators.atr(series.high, series.low, series.close, period)
+        i = self._closed_count(contract, interval) - 1
+        if i < 0 or np.isnan(atr[i]):
+            return 0.0
+        return float(atr[i])
+
+
+def make_fill(contract: str, size: float, entry_time: int, exit_time: int, entry_price: float, exit_price: float,
+              fee_rate: float, multiplier: float = 1.0, reason: str = '') -> Dict:
+    """生成一条成交记录 (含开平仓手续费)"""
+    fee = fee_rate * abs(size) * multiplier * (entry_price + exit_price)
+    pnl = size * (exit_price - entry_price) * multiplier - fee
+    return {
+        'contract': contract,
+        'side': 'long' if size > 0 else 'short',
+        'size': size,
+        'entry_time': int(entry_time),
+        'exit_time': int(exit_time),
+        'entry_price': float(entry_price),
+        'exit_price': float(exit_price),
+        'fee': float(fee),
+        'pnl': float(pnl),
+        'reason': reason,
+    }
+
+
+def atr_before(candles: Candles, interval_sec: int, atr_interval_sec: int, period: int) -> np.ndarray:
+    """每根K线开盘时已知的 ATR (只使用已收盘的K线，必要时先聚合为 atr_interval)"""
+    if atr_interval_sec == interval_sec:
+        atr = indicators.atr(candles.high, candles.low, candles.close, period)
+        return np.r_[np.nan, atr[:-1]]
+    if atr_interval_sec < interval_sec:
+        raise ValueError("ATR 周期不能小于回测K线周期")
+    series = candles.resample(atr_interval_sec)
+    atr = indicators.atr(series.high, series.low, series.close, period)
+    k = np.searchsorted(series.time + atr_interval_sec, candles.time, side='right') - 1
+    return np.where(k >= 0, atr[np.maximum(k, 0)], np.nan)
+
+
+def _first_exit(candles: Candles, atr_prev: np.ndarray, begin: int, entry: float, side: int,
+                atr_k: float, take_profit_pct: float):
+    """从 begin 开始查找第一根触发止损/止盈的K线，返回 (下标, 成交价, 原因) 或 None
+
+    分段向量化搜索，窗口逐步翻倍，单笔交易的开销与持仓时长成正比。
+    ATR 不可用时与 AutoTradingMonitor 一致，回退为固定 5% 止损止盈；同一根K线同时触发按止损处理。
+    """
+    n = len(candles)
+    pos = begin
+    window = 256
+    while pos < n:
+        end = min(n, pos + window)
+        atr = atr_prev[pos:end]
+        valid = atr > 0
+        high = candles.high[pos:end]
+        low = candles.low[pos:end]
+        if side > 0:
+            stop = np.where(valid, entry - atr_k * atr, entry * 0.95)
+            take = np.where(valid, entry * (1 + take_profit_pct / 100), entry * 1.05)
+            hit_stop = low <= stop
+            hit_take = high >= take
+        else:
+            stop = np.where(valid, entry + atr_k * atr, entry * 1.05)
+            take = np.where(valid, entry * (1 - take_profit_pct / 100), entry * 0.95)
+            hit_stop = high >= stop
+            hit_take = low <= take
+        hits = np.flatnonzero(hit_stop | hit_take)
+        if hits.size:
+            i = hits[0]
+            j = pos + i
+            # 跳空越过触发价时按开盘价成交
+            open_price = candles.open[j]
+            if hit_stop[i]:
+                price = min(open_price, stop[i]) if side > 0 else max(open_price, stop[i])
+                return j, price, 'stop_loss'
+            price = max(open_price, take[i]) if side > 0 else min(open_price, take[i])
+            return j, price, 'take_profit'
+        pos = end
+        window = min(window * 2, 1 << 16)
+    return None
+
+
+def simulate_atr_stop(contract: str, candles: Candles, atr_k: float = 2.0, take_profit_pct: float = 5.0,
+                      period: int = 14, interval: str = '1m', atr_interval: str = '1h', side: int = 1,
+                      size: float = 1.0, fee_rate: float = 0.0005, multiplier: float = 1.0,
+                      atr_prev: Optional[np.ndarray] = None) -> List[Dict]:
+    """单合约 ATR 止损回测: 从第一根K线收盘开仓，平仓后在同一收盘价重新开仓
+
+    回测结束时仍持有的仓位按最后收盘价平仓，reason 为 'end'。
+    atr_prev 为预先计算的 atr_before() 结果，参数扫描时可在多组 atr_k/止盈之间复用。
+    """
+    n = len(candles)
+    if n < 2:
+        return []
+    if atr_prev is None:
+        atr_prev = atr_before(candles, INTERVAL_SECONDS[interval], INTERVAL_SECONDS[atr_interval], period)
+    signed_size = size if side > 0 else -size
+    fills = []
+    start = 0
+    while start < n - 1:
+        entry = candles.close[start]
+        hit = _first_exit(candles, atr_prev, start + 1, entry, side, atr_k, take_profit_pct)
+        if hit is None:
+            fills.append(make_fill(contract, signed_size, candles.time[start], candles.time[-1], entry,
+                                   candles.close[-1], fee_rate, multiplier, 'end'))
+            break
+        j, price, reason = hit
+        fills.append(make_fill(contract, signed_size, candles.time[start], candles.time[j], entry, price,
+                               fee_rate, multiplier, reason))
+        start = j
+    return fills
+
+
+def summarize(fills: List[Dict], elapsed: float, candles: int = 0) -> Dict:
+    """汇总回测结果: 总盈亏、胜率、最大回撤 (按平仓时间的已实现权益) 与吞吐"""
+    ordered = sorted(fills, key=lambda f: f['exit_time'])
+    pnl = np.array([f['pnl'] for f in ordered], dtype=np.float64)
+    equity = np.r_[0.0, np.cumsum(pnl)]
+    drawdown = np.maximum.accumulate(equity) - equity
+    return {
+        'trades': len(ordered),
+        'pnl': float(equity[-1]),
+        'fees': float(sum(f['fee'] for f in ordered)),
+        'win_rate': float((pnl > 0).mean()) if len(pnl) else 0.0,
+        'max_drawdown': float(drawdown.max()),
+        'elapsed': elapsed,
+        'trades_per_sec': len(ordered) / elapsed if elapsed > 0 else 0.0,
+        'candles': candles,
+        'candles_per_sec': candles / elapsed if elapsed > 0 else 0.0,
+        'fills': ordered,
+    }
+
+
+class Backtester:
+    """在历史K线上回放策略"""
+
+    def __init__(self, candles: Dict[str, Candles], interval: str = '1m', fee_rate: float = 0.0005,
+                 multipliers: Optional[Dict[str, float]] = None):
+        self.candles = candles
+        self.interval = interval
+        self.fee_rate = fee_rate
+        self.multipliers = multipliers or {}
+
+    @property
+    def total_candles(self) -> int:
+        return sum(len(c) for c in self.candles.values())
+
+    def replay(self, make_step: Callable[[SimExchange], Callable[[], None]], entries: Dict[str, float],
+               reenter: bool = True, quiet: bool = True) -> Dict:
+        """逐根K线回放
+
+        make_step(exchange) 返回每根K线调用一次的函数，例如
+        ``lambda ex: StopLossStrategy(ex, config).run``。
+        entries 为 contract -> 开仓数量 (正数做多，负数做空)，reenter 为平仓后是否在下一根K线重新开仓。
+        quiet 时回放期间只输出 ERROR 日志。
+        """
+        exchange = SimExchange(self.candles, self.interval, self.fee_rate, self.multipliers)
+        step = make_step(exchange)
+        pending = dict(entries)
+        level = logger.level
+        if quiet:
+            logger.setLevel(logging.ERROR)
+        started = time.perf_counter()
+        try:
+            for now in exchange.timeline().tolist():
+                exchange.now = now
+                if pending:
+                    for contract in [c for c in pending if exchange.open_position(c, pending[c])]:
+                        del pending[contract]
+                opened = len(exchange.fills)
+                step()
+                if reenter:
+                    for fill in exchange.fills[opened:]:
+                        pending[fill['contract']] = entries.get(fill['contract'], fill['size'])
+        finally:
+            logger.setLevel(level)
+        elapsed = time.perf_counter() - started
+
+        # 回放结束时按最后价格平掉剩余仓位
+        for contract, pos in list(exchange.positions.items()):
+            if exchange.close_position(contract, pos['size'], pos['mode']):
+                exchange.fills[-1]['reason'] = 'end'
+            else:
+                logger.warning(f"[{contract}] 回放结束时无价格，剩余仓位未计入结果")
+        return summarize(exchange.fills, elapsed, self.total_candles)
+
+    def run_atr_stop(self, atr_k: float = 2.0, take_profit_pct: float = 5.0, period: int = 14,
+                     atr_interval: str = '1h', side: int = 1, size: float = 1.0) -> Dict:
+        """向量化 ATR 止损回测 (所有合约)"""
+        started = time.perf_counter()
+        fills = []
+        for contract, candles in self.candles.items():
+            fills.extend(simulate_atr_stop(
+                contract, candles, atr_k=atr_k, take_profit_pct=take_profit_pct, period=period,
+                interval=self.interval, atr_interval=atr_interval, side=side, size=size,
+                fee_rate=self.fee_rate, multiplier=self.multipliers.get(contract, 1.0),
+            ))
+        return summarize(fills, time.perf_counter() - started, self.total_candles)
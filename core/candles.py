@@ -0,0 +1,178 @@
+from collections.abc import Mapping
+from datetime import datetime
+from typing import Dict, Iterable, List
+
+import numpy as np
+
+# 兼容旧版字典K线的字段顺序
+CANDLE_KEYS = ('time', 'datetime', 'open', 'close', 'high', 'low', 'volume')
+
+# 定长二进制记录 (本地K线归档 .bin 文件的格式，每根K线 48 字节，小端序)
+RECORD_DTYPE = np.dtype([
+    ('time', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'), ('volume', '<f8'),
+])
+
+
+class CandleView(Mapping):
+    """单根K线的只读字典视图，datetime 仅在访问时计算"""
+
+    __slots__ = ('_candles', '_index')
+
+    def __init__(self, candles: 'Candles', index: int):
+        self._candles = candles
+        self._index = index
+
+    def __getitem__(self, key):
+        c = self._candles
+        i = self._index
+        if key == 'time':
+            return int(c.time[i])
+        if key == 'datetime':
+            return datetime.fromtimestamp(int(c.time[i]))
+        if key in ('open', 'close', 'high', 'low', 'volume'):
+            return float(getattr(c, key)[i])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(CANDLE_KEYS)
+
+    def __len__(self):
+        return len(CANDLE_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class Candles:
+    """列式K线容器: time 为 int64，其余列为 float64 连续数组
+
+    按下标访问返回 CandleView，兼容原有 candles[i]['close'] 写法；
+    指标计算直接使用 .close/.high 等整列数组。
+    """
+
+    __slots__ = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+    def __init__(self, time, open, high, low, close, volume):
+        self.time = np.ascontiguousarray(time, dtype=np.int64)
+        self.open = np.ascontiguousarray(open, dtype=np.float64)
+        self.high = np.ascontiguousarray(high, dtype=np.float64)
+        self.low = np.ascontiguousarray(low, dtype=np.float64)
+        self.close = np.ascontiguousarray(close, dtype=np.float64)
+        self.volume = np.ascontiguousarray(volume, dtype=np.float64)
+
+    @classmethod
+    def empty(cls) -> 'Candles':
+        return cls(*([()] * 6))
+
+    @classmethod
+    def from_api(cls, candlesticks: Iterable) -> 'Candles':
+        """从 gate_api 的 FuturesCandlestick 列表构建"""
+        candlesticks = list(candlesticks or [])
+        return cls(
+            [int(cs.t) for cs in candlesticks],
+            [cs.o for cs in candlesticks],
+            [cs.h for cs in candlesticks],
+            [cs.l for cs in candlesticks],
+            [cs.c for cs in candlesticks],
+            [cs.v if cs.v else 0 for cs in candlesticks],
+        )
+
+    @classmethod
+    def from_records(cls, records: np.ndarray) -> 'Candles':
+        """从 RECORD_DTYPE 结构化数组 (可为 mmap 视图) 构建"""
+        return cls(*(records[k] for k in cls.__slots__))
+
+    @classmethod
+    def concat(cls, parts: Iterable['Candles']) -> 'Candles':
+        parts = [p for p in parts if len(p)]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        return cls(*(np.concatenate([getattr(p, k) for p in parts]) for k in cls.__slots__))
+
+    @classmethod
+    def from_dicts(cls, candles: Iterable[Dict]) -> 'Candles':
+        """从旧版字典K线列表构建"""
+        candles = list(candles)
+        return cls(*([c[k] for c in candles] for k in ('time', 'open', 'high', 'low', 'close', 'volume')))
+
+    def __len__(self):
+        return len(self.time)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Candles(*(getattr(self, k)[index] for k in self.__slots__))
+        n = len(self.time)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("candle index out of range")
+        return CandleView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self.time)):
+            yield CandleView(self, i)
+
+    def __repr__(self):
+        return f"Candles(n={len(self)})"
+
+    @property
+    def datetimes(self) -> List[datetime]:
+        """按需生成整列 datetime"""
+        return [datetime.fromtimestamp(t) for t in self.time.tolist()]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, k).nbytes for k in self.__slots__)
+
+    def resample(self, interval_sec: int) -> 'Candles':
+        """按 interval_sec 聚合为更大周期的K线 (时间按周期起点对齐)"""
+        if len(self) == 0:
+            return Candles.empty()
+        bucket = self.time // interval_sec * interval_sec
+        starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+        ends = np.r_[starts[1:], len(bucket)] - 1
+        return Candles(
+            bucket[starts],
+            self.open[starts],
+            np.maximum.reduceat(self.high, starts),
+            np.minimum.reduceat(self.low, starts),
+            self.close[ends],
+            np.add.reduceat(self.volume, starts),
+        )
+
+    def to_records(self) -> np.ndarray:
+        """转换为 RECORD_DTYPE 结构化数组"""
+        records = np.empty(len(self), dtype=RECORD_DTYPE)
+        for k in self.__slots__:
+            records[k] = getattr(self, k)
+        return records
+
+    def save(self, path):
+        """保存为 .npz (或 .csv / .bin)"""
+        path = str(path)
+        if path.endswith('.bin'):
+            self.to_records().tofile(path)
+        elif path.endswith('.csv'):
+            columns = np.column_stack([getattr(self, k) for k in self.__slots__])
+            np.savetxt(path, columns, delimiter=',', header=','.join(self.__slots__), comments='',
+                       fmt=['%d'] + ['%.10g'] * 5)
+        else:
+            np.savez(path, **{k: getattr(self, k) for k in self.__slots__})
+
+    @classmethod
+    def load(cls, path) -> 'Candles':
+        """读取 .npz、.csv (列: time,open,high,low,close,volume) 或 .bin (本地K线归档)"""
+        path = str(path)
+        if path.endswith('.bin'):
+            return cls.from_records(np.fromfile(path, dtype=RECORD_DTYPE))
+        if path.endswith('.csv'):
+            data = np.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+            return cls(data[:, 0], data[:, 1], data[:, 2], data[:, 3], data[:, 4], data[:, 5])
+        with np.load(path) as data:
+            return cls(*(data[k] for k in cls.__slots__))
+
+    def to_dicts(self) -> List[Dict]:
+        """转换为旧版字典列表"""
+        return [dict(view) for view in self]
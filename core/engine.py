@@ -1,71 +1,441 @@
+import asyncio
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import yaml
 import sys
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from core.exchange import Exchange
-from core.notifier import logger
-from strategies.stop_loss import StopLossStrategy
+from core.metrics import metrics
+from core.notifier import logger, configure_logging
+from core.startup import startup
+from strategies.registry import default_registry, configured_strategies
+
+CONFIG_PATH = Path(__file__).parent.parent / "config" / "settings.yaml"
+# 有 libyaml 时使用 C 实现的解析器
+_YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+# 配置文件路径 -> (修改时间, 配置)
+_config_cache = {}
+
+
+def load_settings(path=CONFIG_PATH):
+    """读取 YAML 配置，文件未修改时返回进程内缓存的结果"""
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"配置文件未找到: {path}")
+    mtime = path.stat().st_mtime_ns
+    cached = _config_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        config = yaml.load(f, Loader=_YamlLoader) or {}
+    _config_cache[path] = (mtime, config)
+    return config
+
+
+def config_mtime(path=CONFIG_PATH) -> Optional[int]:
+    """配置文件修改时间 (纳秒)，文件不存在时 (如编辑器替换文件的瞬间) 返回 None"""
+    try:
+        return Path(path).stat().st_mtime_ns
+    except OSError:
+        return None
+
+
+def open_storage(storage_config):
+    """按配置中的 storage 段打开交易数据库 (引擎与交互式界面共用)"""
+    from data.storage import Storage
+    return Storage(db_path=storage_config.get('path'),
+                   position_interval=float(storage_config.get('position_interval', 300)),
+                   position_retention_days=float(storage_config.get('position_retention_days', 30)))
+
+
+# 热更新时只能重启生效的配置项 (交易所客户端、连接、存储、行情源、风控和指标端点只在启动时创建)
+RESTART_KEYS = ('settle', 'async_mode', 'max_concurrency', 'request_timeout', 'storage', 'candle_archive',
+                'price_feed', 'risk_control', 'metrics')
+
+
+def validate_config(config) -> List[str]:
+    """检查新配置中引擎直接使用的部分，返回错误列表 (策略参数由各策略在热更新时校验)"""
+    if not isinstance(config, dict):
+        return ["配置文件顶层必须是字典"]
+    errors = []
+    for key in ('check_interval', 'strategy_timeout', 'snapshot_ttl', 'price_max_age'):
+        value = config.get(key)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0):
+            errors.append(f"{key} 必须是非负数: {value!r}")
+    if not config.get('check_interval', 60):
+        errors.append("check_interval 必须大于 0")
+    strategies = config.get('strategies')
+    if strategies is not None and (not isinstance(strategies, list)
+                                   or not all(isinstance(item, (str, dict)) for item in strategies)):
+        errors.append("strategies 必须是列表，每项为策略名或字典")
+    if config.get('logging') is not None and not isinstance(config['logging'], dict):
+        errors.append("logging 必须是字典")
+    if not errors:
+        # 同一个状态日志只能由一个移动止损策略写入
+        from data.stop_journal import journal_path
+        journals = [
+            journal_path(dict(config.get('trailing_stop') or {}, **(item.get('params') or {})).get('journal'))
+            for item in configured_strategies(config) if item['type'] == 'trailing_stop'
+        ]
+        if len(journals) != len(set(journals)):
+            errors.append("多个移动止损策略使用同一个状态日志，请分别设置 params.journal")
+    return errors
+
 
 class Engine:
     def __init__(self):
         try:
+            self._config_mtime = config_mtime()
             self.config = self.load_config()
-            # 允许在配置中覆盖 settle 参数
-            self.exchange = Exchange(settle=self.config.get('settle', 'usdt'))
+            errors = validate_config(self.config)
+            if errors:
+                raise ValueError('; '.join(errors))
+            configure_logging(self.config.get('logging'))
+            startup.mark("配置")
+            self.async_mode = self.config.get('async_mode', False)
+            self.metrics_config = self.create_metrics()
+            self.storage = self.create_storage()
+            self.exchange = self.create_exchange()
+            startup.mark("交易所")
             self.strategies = []
+            # 策略标识 -> (配置项, 实例)，热更新时按标识对应已有实例
+            self._loaded: Dict[str, Tuple[Dict, object]] = {}
+            # 进行中的熔断平仓 (异步模式为任务，同步模式为后台线程的 Future)
+            self._kill_tasks = set()
+            # 同步模式的熔断平仓线程 (首次熔断时创建)，熔断可能在推送行情线程中触发，平仓不能阻塞行情
+            self._kill_executor: Optional[ThreadPoolExecutor] = None
             self.running = True
+            self.price_feed = None
+            self.risk = self.create_risk_control()
             
             # 初始化策略
             self.init_strategies()
+            self.init_price_feed()
+            startup.mark("策略")
         except Exception as e:
             logger.critical(f"引擎初始化失败: {e}")
             raise
 
     def load_config(self):
-        """加载配置文件 (使用绝对路径)"""
-        # 获取当前文件 (core/engine.py) 的父目录的父目录 (项目根目录)
-        root_dir = Path(__file__).parent.parent
-        config_path = root_dir / "config" / "settings.yaml"
-        
-        if not config_path.exists():
-            raise FileNotFoundError(f"配置文件未找到: {config_path}")
-        
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return yaml.safe_load(f)
+        """加载配置文件 (项目根目录下的 config/settings.yaml)"""
+        return load_settings()
+
+    def create_metrics(self):
+        """按配置启用延迟指标导出 (本地 HTTP 端点 /metrics 和/或定期输出到日志)"""
+        metrics_config = self.config.get('metrics') or {}
+        self._metrics_dumped = time.time()
+        if not metrics_config.get('enabled', False):
+            return {}
+        port = int(metrics_config.get('port', 0) or 0)
+        if port:
+            host = metrics_config.get('host', '127.0.0.1')
+            metrics.serve(port, host)
+            logger.info(f"指标端点已启动: http://{host}:{port}/metrics")
+        return metrics_config
+
+    def create_storage(self):
+        """按配置启用交易数据持久化 (SQLite)"""
+        storage_config = self.config.get('storage') or {}
+        if not storage_config.get('enabled', False):
+            return None
+        storage = open_storage(storage_config)
+        logger.info(f"交易数据持久化已启用: {storage.db_path}")
+        return storage
+
+    def create_exchange(self):
+        """创建交易所客户端 (异步模式下使用带连接池的 AsyncExchange)"""
+        # 允许在配置中覆盖 settle 参数
+        settle = self.config.get('settle', 'usdt')
+        if self.async_mode:
+            from core.async_exchange import AsyncExchange
+            return AsyncExchange(
+                settle=settle,
+                max_concurrency=self.config.get('max_concurrency', 10),
+                request_timeout=self.config.get('request_timeout', 10),
+                storage=self.storage,
+                candle_archive=self.create_candle_archive(settle),
+                snapshot_ttl=self.config.get('snapshot_ttl', 1.0),
+            )
+        return Exchange(settle=settle, storage=self.storage, candle_archive=self.create_candle_archive(settle),
+                        snapshot_ttl=self.config.get('snapshot_ttl', 1.0))
+
+    def create_candle_archive(self, settle: str):
+        """按配置启用本地K线归档 (默认启用)"""
+        archive_config = self.config.get('candle_archive') or {}
+        if not archive_config.get('enabled', True):
+            return None
+        from data.candle_archive import CandleArchive
+        return CandleArchive(root=archive_config.get('path'), settle=settle)
+
+    def create_risk_control(self):
+        """按配置启用组合风控 (默认关闭)"""
+        risk_config = self.config.get('risk_control') or {}
+        if not risk_config.get('enabled', False):
+            return None
+        from core.risk_control import RiskControl
+        risk = RiskControl(risk_config)
+        risk.add_listener(self.on_kill)
+        logger.info(
+            f"组合风控已启用: 最大回撤 {risk.max_drawdown * 100:.1f}% | 最大保证金率 {risk.max_margin_ratio * 100:.1f}% | "
+            f"熔断平仓: {'是' if risk.close_on_kill else '否'}"
+        )
+        return risk
+
+    def update_risk(self):
+        """每轮开始时用持仓/账户快照同步风控状态 (快照与策略共用，不额外请求持仓)"""
+        positions = self.exchange.get_positions()
+        if positions is not None:
+            self.risk.sync_positions(positions, self.exchange.settle)
+        account = self.exchange.get_account()
+        if account is not None:
+            self.risk.update_account(account['total'])
+
+    async def update_risk_async(self):
+        positions, account = await asyncio.gather(self.exchange.get_positions(), self.exchange.get_account())
+        if positions is not None:
+            self.risk.sync_positions(positions, self.exchange.settle)
+        if account is not None:
+            self.risk.update_account(account['total'])
+
+    def on_kill(self, reason: str):
+        """风控熔断回调: 按配置平掉全部持仓"""
+        if not self.risk.close_on_kill:
+            logger.critical("已禁止开仓，平仓与止损仍然有效 (需人工处理后重启)")
+            return
+        logger.critical(f"熔断平仓: {sorted(self.risk.positions)}")
+        # 一次持仓快照 + 并发批量下单，持仓再多也只需约一个往返
+        contracts = list(self.risk.positions)
+        if asyncio.iscoroutinefunction(self.exchange.flatten):
+            # 保留任务引用 (事件循环只持有弱引用)，退出前等待完成
+            task = asyncio.ensure_future(self.exchange.flatten(contracts=contracts))
+        else:
+            if self._kill_executor is None:
+                self._kill_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kill-flatten")
+            task = self._kill_executor.submit(self.exchange.flatten, contracts=contracts)
+        self._kill_tasks.add(task)
+        task.add_done_callback(self.on_flatten_done)
+
+    def on_flatten_done(self, result):
+        """熔断平仓结束: 记录结果或异常 (result 为已完成的任务或 Future)"""
+        if isinstance(result, (asyncio.Future, Future)):
+            self._kill_tasks.discard(result)
+            if result.cancelled():
+                logger.critical("熔断平仓任务被取消，请人工检查持仓")
+                return
+            if result.exception() is not None:
+                logger.critical(f"熔断平仓出错，请人工检查持仓: {result.exception()!r}")
+                return
+            result = result.result()
+        if result is None:
+            logger.critical("熔断平仓失败: 无法获取持仓，请人工处理")
+            return
+        failed = [item['contract'] for item in result if not item['succeeded']]
+        if failed:
+            logger.critical(f"熔断平仓部分失败: {failed}，请人工处理")
+        else:
+            logger.critical(f"熔断平仓已提交: {len(result)} 个持仓")
 
     def init_strategies(self):
-        """初始化策略"""
-        # 1. 加载止损策略 (默认启用，除非配置中明确禁用)
-        if self.config.get('enable_stop_loss', True):
+        """按配置导入并初始化策略 (只导入用到的策略，单个策略失败不影响其他策略)"""
+        registry = default_registry()
+        for key, item in self.strategy_items(self.config):
             try:
-                sl_strategy = StopLossStrategy(self.exchange, self.config)
-                self.strategies.append(sl_strategy)
+                strategy = registry.create(item, self.exchange, self.config)
             except Exception as e:
-                logger.error(f"加载 StopLossStrategy 失败: {e}")
+                logger.error(f"加载策略 {key} 失败: {e}", exc_info=True)
+                continue
+            self.add_strategy(key, item, strategy)
 
         if not self.strategies:
             logger.warning("没有加载任何策略！请检查配置文件。")
         else:
             logger.info(f"已加载策略: {[s.name for s in self.strategies]}")
 
+    @staticmethod
+    def strategy_items(config: Dict) -> List[Tuple[str, Dict]]:
+        """启用的策略配置项及其标识 (name，未设置时为 type，重复时追加序号)"""
+        result, seen = [], {}
+        for item in configured_strategies(config):
+            key = item.get('name') or item['type']
+            seen[key] = seen.get(key, 0) + 1
+            result.append((key if seen[key] == 1 else f"{key}#{seen[key]}", item))
+        return result
+
+    def add_strategy(self, key: str, item: Dict, strategy):
+        """注入依赖并登记策略实例 (已启动推送行情时同时订阅)"""
+        strategy.storage = self.storage
+        strategy.risk = self.risk
+        self.strategies.append(strategy)
+        self._loaded[key] = (item, strategy)
+        if self.price_feed is not None:
+            self.subscribe_strategy(strategy)
+        summary = strategy.describe()
+        logger.info(f"策略 {strategy.name} 已加载" + (f": {summary}" if summary else ""))
+
+    # ============ 配置热更新 ============
+    def reload_config(self) -> bool:
+        """配置文件修改后 (按修改时间轮询) 重新加载，在两轮之间调用
+
+        新配置先整体校验并准备好全部策略实例，任一步失败则保留原配置和原策略；
+        全部成功后才一次性生效: 就地更新策略参数、增删策略、调整检查间隔和日志设置，交易所客户端不重建。
+        """
+        mtime = config_mtime()
+        if mtime is None or mtime == self._config_mtime:
+            return False
+        self._config_mtime = mtime
+        try:
+            config = self.load_config()
+            # 按新文件判断是否热更新，关闭后再改回 true 时能立即生效
+            if isinstance(config, dict) and not config.get('hot_reload', True):
+                logger.info("配置文件已修改，hot_reload 为 false，需要重启后生效")
+                return False
+            errors = validate_config(config)
+            if errors:
+                raise ValueError('; '.join(errors))
+            plan = self.plan_strategies(config)
+        except Exception as e:
+            logger.error(f"配置热更新失败，继续使用原配置: {e}")
+            return False
+        self.apply_config(config, plan)
+        return True
+
+    def plan_strategies(self, config: Dict) -> List[Tuple]:
+        """为新配置准备策略: [(标识, 配置项, 实例, 生效函数, 策略配置)]
+
+        参数未变化的沿用原实例，支持就地更新的返回生效函数，其余新建实例；失败时停止已新建的实例并抛出异常。
+        """
+        registry = default_registry()
+        plan, created, key = [], [], None
+        try:
+            for key, item in self.strategy_items(config):
+                old_item, strategy = self._loaded.get(key, (None, None))
+                if strategy is not None and old_item['type'] == item['type']:
+                    strategy_config = registry.strategy_config(item, config)
+                    if strategy.settings(strategy_config) == strategy.settings(strategy.config):
+                        plan.append((key, item, strategy, None, None))
+                        continue
+                    apply = strategy.reconfigure(strategy_config)
+                    if apply is not None:
+                        plan.append((key, item, strategy, apply, strategy_config))
+                        continue
+                strategy = registry.create(item, self.exchange, config)
+                created.append(strategy)
+                plan.append((key, item, strategy, None, None))
+        except Exception as e:
+            for strategy in created:
+                self.stop_strategy(strategy)
+            raise ValueError(f"策略 {key}: {e}") from e
+        return plan
+
+    def apply_config(self, config: Dict, plan: List[Tuple]):
+        """一次性应用已校验的新配置和策略计划"""
+        kept = {id(strategy) for _, _, strategy, _, _ in plan}
+        for key, (_, strategy) in self._loaded.items():
+            if id(strategy) not in kept:
+                self.stop_strategy(strategy)
+                logger.info(f"策略 {key} 已停止")
+
+        previous = {id(strategy) for strategy in self.strategies}
+        self.strategies, self._loaded = [], {}
+        for key, item, strategy, apply, strategy_config in plan:
+            if id(strategy) not in previous:
+                self.add_strategy(key, item, strategy)
+                continue
+            if apply is not None:
+                apply()
+                strategy.config = strategy_config
+                if self.price_feed is not None:
+                    self.subscribe_strategy(strategy)
+                summary = strategy.describe()
+                logger.info(f"策略 {strategy.name} 参数已更新" + (f": {summary}" if summary else ""))
+            self.strategies.append(strategy)
+            self._loaded[key] = (item, strategy)
+
+        for key in RESTART_KEYS:
+            if config.get(key) != self.config.get(key):
+                logger.warning(f"配置项 {key} 需要重启后生效")
+        if config.get('check_interval', 60) != self.config.get('check_interval', 60):
+            logger.info(f"检查间隔: {self.config.get('check_interval', 60)}秒 -> {config.get('check_interval', 60)}秒")
+        self.exchange.snapshots.ttl = config.get('snapshot_ttl', 1.0)
+        configure_logging(config.get('logging'))
+        self.config = config
+        logger.info(f"配置已重新加载，当前策略: {[s.name for s in self.strategies]}")
+
+    def stop_strategy(self, strategy):
+        """停止策略实例: 取消行情回调并释放资源"""
+        if self.price_feed is not None:
+            self.price_feed.remove_listener(strategy.on_price)
+        try:
+            strategy.shutdown()
+        except Exception as e:
+            logger.error(f"策略 {strategy.name} 停止出错: {e}", exc_info=True)
+
+    def init_price_feed(self):
+        """按配置启用推送行情 (默认关闭，仅使用轮询)"""
+        feed_config = self.config.get('price_feed') or {}
+        if not feed_config.get('enabled', False):
+            return
+        from core.price_feed import GateWebSocketFeed
+        feed = GateWebSocketFeed(settle=self.config.get('settle', 'usdt'), url=feed_config.get('url'))
+        self.attach_price_feed(feed)
+
+    def attach_price_feed(self, feed):
+        """将行情源接入所有需要行情的策略"""
+        self.price_feed = feed
+        for strategy in self.strategies:
+            self.subscribe_strategy(strategy)
+        if self.risk is not None:
+            feed.add_listener(self.risk.on_price)
+        logger.info(f"推送行情已启用，订阅合约: {sorted(feed.contracts)}")
+
+    def subscribe_strategy(self, strategy):
+        """订阅策略关注的合约并注册行情回调 (重复调用只补订新增的合约)"""
+        contracts = strategy.watched_contracts()
+        if not contracts:
+            return
+        self.price_feed.subscribe(contracts)
+        if strategy.price_feed is None:
+            strategy.price_feed = self.price_feed
+            self.price_feed.add_listener(strategy.on_price)
+
     def start(self):
         """启动主循环"""
-        interval = self.config.get('check_interval', 60)
-        logger.info(f"引擎启动，检查间隔: {interval}秒")
+        if self.async_mode:
+            try:
+                asyncio.run(self.start_async())
+            except KeyboardInterrupt:
+                logger.info("收到停止信号，引擎停止")
+            return
+
+        logger.info(f"引擎启动，检查间隔: {self.config.get('check_interval', 60)}秒")
+        if self.price_feed is not None:
+            self.price_feed.start_background()
         
         try:
             while self.running:
                 start_time = time.time()
+                self.reload_config()
+                interval = self.config.get('check_interval', 60)
+
+                if self.risk is not None:
+                    try:
+                        self.update_risk()
+                    except Exception as e:
+                        logger.error(f"风控状态同步出错: {e}", exc_info=True)
                 
                 for strategy in self.strategies:
                     try:
-                        strategy.run()
+                        with metrics.timer('strategy_run_seconds', strategy=strategy.name):
+                            strategy.run()
                     except Exception as e:
                         logger.error(f"策略 {strategy.name} 执行出错: {e}", exc_info=True)
-                
+                self.report_startup()
+
                 # 计算需要休眠的时间，扣除策略执行消耗的时间
                 elapsed = time.time() - start_time
                 sleep_time = max(0, interval - elapsed)
+                self.record_tick(elapsed, sleep_time)
                 
                 if sleep_time > 0:
                     time.sleep(sleep_time)
@@ -76,3 +446,115 @@ class Engine:
             logger.info("收到停止信号，引擎停止")
         except Exception as e:
             logger.error(f"引擎异常退出: {e}", exc_info=True)
+        finally:
+            if self.price_feed is not None:
+                self.price_feed.stop()
+            if self._kill_executor is not None:
+                if self._kill_tasks:
+                    logger.info("等待熔断平仓完成...")
+                self._kill_executor.shutdown(wait=True)
+            self.shutdown_strategies()
+            self.exchange.close()
+            if self.storage is not None:
+                self.storage.close()
+            self.log_request_stats()
+
+    async def start_async(self):
+        """异步主循环: 同一轮内所有策略并发执行，单个策略超时即取消"""
+        interval = self.config.get('check_interval', 60)
+        timeout = self.config.get('strategy_timeout', interval)
+        logger.info(f"引擎启动 (异步模式)，检查间隔: {interval}秒，策略超时: {timeout}秒")
+        feed_task = asyncio.ensure_future(self.price_feed.run()) if self.price_feed is not None else None
+
+        try:
+            while self.running:
+                start_time = time.time()
+                if self.reload_config():
+                    interval = self.config.get('check_interval', 60)
+                    timeout = self.config.get('strategy_timeout', interval)
+
+                if self.risk is not None:
+                    try:
+                        await self.update_risk_async()
+                    except Exception as e:
+                        logger.error(f"风控状态同步出错: {e}", exc_info=True)
+
+                await asyncio.gather(*(self.run_strategy_async(s, timeout) for s in self.strategies))
+                self.report_startup()
+
+                elapsed = time.time() - start_time
+                sleep_time = max(0, interval - elapsed)
+                self.record_tick(elapsed, sleep_time)
+
+                if sleep_time > 0:
+                    await asyncio.sleep(sleep_time)
+                else:
+                    logger.warning(f"策略执行时间过长 ({elapsed:.2f}s)，跳过本次休眠")
+
+        except asyncio.CancelledError:
+            logger.info("收到停止信号，引擎停止")
+        except Exception as e:
+            logger.error(f"引擎异常退出: {e}", exc_info=True)
+        finally:
+            if feed_task is not None:
+                self.price_feed.stop()
+                feed_task.cancel()
+            if self._kill_tasks:
+                logger.info("等待熔断平仓完成...")
+                await asyncio.gather(*self._kill_tasks, return_exceptions=True)
+            await self.exchange.close()
+            self.shutdown_strategies()
+            if self.storage is not None:
+                self.storage.close()
+            self.log_request_stats()
+
+    def record_tick(self, elapsed: float, sleep_time: float):
+        """记录每轮耗时和超时次数，按 dump_interval 定期输出指标摘要"""
+        metrics.observe('tick_seconds', elapsed)
+        if sleep_time <= 0:
+            metrics.inc('tick_overruns_total')
+        dump_interval = self.metrics_config.get('dump_interval', 0)
+        if dump_interval and time.time() - self._metrics_dumped >= dump_interval:
+            self._metrics_dumped = time.time()
+            self.log_metrics()
+
+    def log_metrics(self):
+        for line in metrics.summary():
+            logger.info(f"指标 {line}")
+
+    def report_startup(self):
+        """第一轮执行完后输出启动耗时"""
+        if not startup.reported:
+            startup.mark("首轮")
+            startup.report(logger)
+
+    def shutdown_strategies(self):
+        for strategy in self.strategies:
+            try:
+                strategy.shutdown()
+            except Exception as e:
+                logger.error(f"策略 {strategy.name} 停止出错: {e}", exc_info=True)
+
+    def log_request_stats(self):
+        """输出各类请求的限频调度统计 (启用指标时同时输出延迟摘要并关闭指标端点)"""
+        if self.metrics_config:
+            self.log_metrics()
+            metrics.shutdown()
+        for kind, stats in self.exchange.scheduler.stats().items():
+            if stats['requests'] or stats['coalesced']:
+                logger.info(
+                    f"请求统计 [{kind}] 请求: {stats['requests']} | 合并: {stats['coalesced']} | "
+                    f"限频: {stats['throttled']} | 最大排队: {stats['queue_max']} | "
+                    f"平均等待: {stats['wait_avg'] * 1000:.1f}ms | 最大等待: {stats['wait_max'] * 1000:.1f}ms"
+                )
+
+    async def run_strategy_async(self, strategy, timeout: float):
+        """执行单个策略，超时或异常不影响其他策略"""
+        try:
+            with metrics.timer('strategy_run_seconds', strategy=strategy.name):
+                await asyncio.wait_for(strategy.run_async(), timeout=timeout)
+        except asyncio.TimeoutError:
+            metrics.inc('strategy_timeouts_total', strategy=strategy.name)
+            logger.warning(f"策略 {strategy.name} 执行超时 ({timeout}s)，已取消")
+        except Exception as e:
+            logger.error(f"策略 {strategy.name} 执行出错: {e}", exc_info=True)
@@ -1,161 +1,952 @@
+import asyncio
+import copy
 import os
-import gate_api
-from typing import List, Dict
-from datetime import datetime
-from gate_api.exceptions import ApiException, GateApiException
+import threading
+import time
+from bisect import insort
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import count
+from typing import Callable, Dict, List, Optional, Tuple
+from core.candles import Candles
+from core.metrics import metrics
 from core.notifier import logger
+from core.sdk import LazyFuturesApi, api_errors, gate_api
+from core.snapshot_cache import SnapshotCache
 from pathlib import Path
-from dotenv import load_dotenv
+
+# K线周期对应的秒数
+INTERVAL_SECONDS = {
+    '10s': 10, '1m': 60, '5m': 300, '15m': 900, '30m': 1800,
+    '1h': 3600, '4h': 14400, '8h': 28800, '1d': 86400, '7d': 604800, '30d': 2592000,
+}
+
+
+class CandleSeries:
+    """单个 (合约, 周期) 的已收盘K线环形缓存，并增量维护滚动 ATR"""
+
+    def __init__(self, interval_sec: int, maxlen: int = 500):
+        self.interval_sec = interval_sec
+        self.candles = deque(maxlen=maxlen)
+        # period -> {'trs': 最近 period 个真实波幅, 'sum': 滚动和, 'pushes': 自上次校准后的追加次数}
+        self._atr_state: Dict[int, Dict] = {}
+        # 已完成预热的K线数量，避免历史不足的合约每次都全量拉取
+        self.warmup = 0
+
+    def __len__(self):
+        return len(self.candles)
+
+    def reset(self, warmup: int):
+        """清空缓存并记录新的预热长度"""
+        self.candles.clear()
+        self._atr_state.clear()
+        self.warmup = warmup
+
+    @property
+    def last_time(self) -> Optional[int]:
+        return self.candles[-1]['time'] if self.candles else None
+
+    def is_stale(self, now: float) -> bool:
+        """下一根K线是否已经收盘 (未收盘前无需请求)"""
+        if not self.candles:
+            return True
+        return now >= self.last_time + 2 * self.interval_sec
+
+    def fetch_params(self, min_size: int, now: float) -> Optional[Dict]:
+        """计算本次需要的 get_candlesticks 参数，无需请求时返回 None"""
+        if self.warmup < min_size:
+            # 预热: 一次拉取足够的历史 (多取一根以覆盖未收盘的K线)
+            self.reset(min_size)
+            return {'limit': min_size + 1}
+        if self.is_stale(now):
+            return {'start': self.last_time + self.interval_sec}
+        return None
+
+    def extend(self, candles, now: float):
+        """追加拉取到的K线，只缓存已收盘的部分 (未收盘K线仍在变化)"""
+        for candle in candles:
+            if candle['time'] + self.interval_sec <= now:
+                self.append(candle)
+
+    def append(self, candle: Dict) -> bool:
+        """追加一根已收盘K线，并以 O(1) 更新所有 ATR 周期"""
+        if self.candles and candle['time'] <= self.last_time:
+            return False
+        prev_close = self.candles[-1]['close'] if self.candles else None
+        self.candles.append(candle)
+        if prev_close is not None:
+            tr = self._true_range(candle, prev_close)
+            for period, state in self._atr_state.items():
+                self._push_tr(state, period, tr)
+        return True
+
+    def atr(self, period: int) -> float:
+        """返回最近 period 根K线的 ATR，数据不足返回 0.0"""
+        state = self._atr_state.get(period)
+        if state is None:
+            state = self._seed_atr(period)
+        if len(state['trs']) < period:
+            return 0.0
+        return state['sum'] / period
+
+    @staticmethod
+    def _true_range(candle: Dict, prev_close: float) -> float:
+        high = candle['high']
+        low = candle['low']
+        return max(
+            high - low,
+            abs(high - prev_close),
+            abs(low - prev_close)
+        )
+
+    @staticmethod
+    def _push_tr(state: Dict, period: int, tr: float):
+        trs = state['trs']
+        if len(trs) == period:
+            state['sum'] -= trs[0]
+        trs.append(tr)
+        state['sum'] += tr
+        state['pushes'] += 1
+        # 每滚动一整轮重新求和一次，消除浮点累计误差 (均摊 O(1))
+        if state['pushes'] >= period:
+            state['sum'] = sum(trs)
+            state['pushes'] = 0
+
+    def _seed_atr(self, period: int) -> Dict:
+        """首次请求某个周期时，从缓存中已有K线初始化滚动状态"""
+        state = {'trs': deque(maxlen=period), 'sum': 0.0, 'pushes': 0}
+        candles = list(self.candles)[-(period + 1):]
+        for i in range(1, len(candles)):
+            self._push_tr(state, period, self._true_range(candles[i], candles[i - 1]['close']))
+        self._atr_state[period] = state
+        return state
+
+
+# 批量下单/撤单单次请求的最大订单数
+MAX_BATCH_ORDERS = 10
+MAX_BATCH_CANCEL = 20
+
+# 平仓快速通道: 结果不确定时立即重试，最多 CLOSE_ATTEMPTS 次，重试间隔从 CLOSE_BACKOFF 翻倍至 CLOSE_MAX_BACKOFF
+CLOSE_ATTEMPTS = 4
+CLOSE_BACKOFF = 0.05
+CLOSE_MAX_BACKOFF = 0.5
+# 平仓单请求超时 (秒)，避免连接卡住时阻塞到下一轮
+ORDER_TIMEOUT = 5
+# 平仓单成交确认: 轮询间隔和最长等待 (秒)
+CONFIRM_INTERVAL = 0.2
+CONFIRM_TIMEOUT = 5
+CLOSE_TEXT_PREFIX = "t-close-"
+_close_seq = count()
+
+
+def close_order_text() -> str:
+    """平仓单的自定义标识 (进程内唯一，不超过交易所限制的 28 个字符)，重试时沿用同一个标识"""
+    return f"{CLOSE_TEXT_PREFIX}{time.time_ns() // 1_000_000 % 10 ** 10}{next(_close_seq) % 100:02d}"
+
+
+def order_outcome_unknown(error: Exception) -> bool:
+    """下单出错后无法确定订单是否已到达交易所 (网络错误、超时、5xx)；4xx 为明确拒绝"""
+    status = getattr(error, 'status', None)
+    return not (isinstance(status, int) and 400 <= status < 500)
+
+
+def flatten_orders(positions: Dict[str, Dict], contracts: Optional[List[str]] = None, side: Optional[str] = None,
+                   predicate: Optional[Callable[[Dict], bool]] = None) -> List[Dict]:
+    """为匹配的持仓生成平仓单 (市价 IOC、只减仓)
+
+    contracts 限定合约，side 为 'long' / 'short' 时只平该方向，predicate(position) 返回 False 的持仓跳过。
+    """
+    orders = []
+    for contract, position in positions.items():
+        size = position['size']
+        if not size:
+            continue
+        if contracts is not None and contract not in contracts:
+            continue
+        if side is not None and (size > 0) != (side == 'long'):
+            continue
+        if predicate is not None and not predicate(position):
+            continue
+        orders.append({'contract': contract, 'size': -int(size), 'price': 0, 'tif': 'ioc', 'reduce_only': True,
+                       'text': close_order_text()})
+    return orders
+
+
+def flatten_report(orders: List[Dict], results: List[Dict]) -> List[Dict]:
+    """合并平仓单与下单结果并输出汇总: [{'contract', 'size', 'succeeded', 'id', 'status', 'error'}]"""
+    report = [dict(result, contract=order['contract'], size=order['size']) for order, result in zip(orders, results)]
+    for item in report:
+        if not item['succeeded']:
+            logger.error(f"[{item['contract']}] 平仓单失败: {item['error']}")
+    succeeded = sum(1 for item in report if item['succeeded'])
+    logger.warning(f"一键平仓完成: 成功 {succeeded}/{len(report)}")
+    return report
+
+# 请求类别 -> (每秒请求数, 突发上限, 优先级)，优先级越小越先放行
+# 取 Gate 合约接口限频的 90%: 行情/私有接口 200次/10秒，下单 100次/秒
+RATE_LIMITS = {
+    'order': (90, 45, 0),
+    'private': (18, 9, 1),
+    'public': (18, 9, 2),
+}
+# 所有类别共享的总请求上限 (每秒, 突发)
+TOTAL_RATE_LIMIT = (100, 50)
+
+
+class TokenBucket:
+    """令牌桶: 每秒补充 rate 个令牌，最多积累 burst 个；被限频后暂停到 paused_until"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated', 'paused_until', 'strikes')
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.burst = float(burst or rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        # 连续 429 次数，用于指数退避
+        self.strikes = 0
+
+    def wait_time(self, now: float) -> float:
+        """距离下一个令牌可用还需等待的秒数 (0 表示可立即获取)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    """按接口类别限频的请求调度器 (线程安全，同步与异步调用共用)
+
+    - 每个类别一个令牌桶，另有一个总令牌桶；争抢总令牌时按优先级放行 (下单 > 持仓 > 行情)
+    - 相同的只读请求同时在途时合并为一次，其余调用方等待同一结果
+    - 收到 429 时暂停该类别，优先按响应头的重置时间，否则指数退避
+    """
+
+    # 等待排在前面的请求时的轮询间隔
+    POLL_INTERVAL = 0.005
+
+    def __init__(self, limits: Optional[Dict] = None, total: Optional[Tuple] = TOTAL_RATE_LIMIT,
+                 max_retries: int = 3, base_backoff: float = 1.0, max_backoff: float = 30.0):
+        limits = limits or RATE_LIMITS
+        self.buckets = {kind: TokenBucket(rate, burst) for kind, (rate, burst, _) in limits.items()}
+        self.priority = {kind: prio for kind, (_, _, prio) in limits.items()}
+        self.total = TokenBucket(*total) if total else None
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        self._seq = count()
+        # 等待中的请求 (priority, seq, kind)，保持有序
+        self._waiting = []
+        self._inflight: Dict[tuple, Future] = {}
+        self._inflight_async: Dict[tuple, asyncio.Future] = {}
+        self._stats = {
+            kind: {'requests': 0, 'coalesced': 0, 'throttled': 0, 'errors': 0,
+                   'wait_total': 0.0, 'wait_max': 0.0, 'queue_max': 0}
+            for kind in self.buckets
+        }
+
+    # ============ 令牌获取 ============
+    def _enqueue(self, kind: str) -> tuple:
+        if kind not in self.buckets:
+            raise ValueError(f"未知的请求类别: {kind}")
+        ticket = (self.priority[kind], next(self._seq), kind)
+        with self._cond:
+            insort(self._waiting, ticket)
+            depth = sum(1 for t in self._waiting if t[2] == kind)
+            stats = self._stats[kind]
+            stats['queue_max'] = max(stats['queue_max'], depth)
+        return ticket
+
+    def _dequeue(self, ticket: tuple):
+        with self._cond:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+
+    def _try_acquire(self, ticket: tuple) -> float:
+        """尝试为 ticket 取得令牌，成功返回 0，否则返回建议等待的秒数 (需持有 _cond)"""
+        kind = ticket[2]
+        now = time.monotonic()
+        total_wait = self.total.wait_time(now) if self.total else 0.0
+        for other in self._waiting:
+            if other == ticket:
+                break
+            # 同类别先到先得；其他类别中更高优先级且已有类别令牌的请求先拿总令牌
+            if other[2] == kind or self.buckets[other[2]].wait_time(now) == 0:
+                return max(total_wait, self.POLL_INTERVAL)
+
+        wait = max(self.buckets[kind].wait_time(now), total_wait)
+        if wait > 0:
+            return wait
+        self.buckets[kind].tokens -= 1
+        if self.total:
+            self.total.tokens -= 1
+        self._waiting.remove(ticket)
+        self._cond.notify_all()
+        return 0.0
+
+    def _record_wait(self, kind: str, waited: float):
+        stats = self._stats[kind]
+        stats['requests'] += 1
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+
+    def acquire(self, kind: str) -> float:
+        """阻塞直到获得 kind 类别的令牌，返回等待秒数"""
+        started = time.monotonic()
+        ticket = self._enqueue(kind)
+        with self._cond:
+            while True:
+                wait = self._try_acquire(ticket)
+                if wait == 0:
+                    break
+                self._cond.wait(wait)
+            waited = time.monotonic() - started
+            self._record_wait(kind, waited)
+        return waited
+
+    async def acquire_async(self, kind: str) -> float:
+        """acquire 的异步版本 (等待期间不阻塞事件循环)"""
+        started = time.monotonic()
+        ticket = self._enqueue(kind)
+        try:
+            while True:
+                with self._cond:
+                    wait = self._try_acquire(ticket)
+                if wait == 0:
+                    break
+                await asyncio.sleep(wait)
+        except BaseException:
+            self._dequeue(ticket)
+            raise
+        waited = time.monotonic() - started
+        with self._cond:
+            self._record_wait(kind, waited)
+        return waited
+
+    # ============ 限频处理 ============
+    @staticmethod
+    def retry_after(error: Exception) -> Optional[float]:
+        """错误为限频 (429) 时返回建议等待秒数 (未知时为 0)，否则返回 None"""
+        status = getattr(error, 'status', None)
+        if status != 429 and getattr(error, 'label', None) != 'TOO_MANY_REQUESTS':
+            return None
+        headers = getattr(error, 'headers', None) or {}
+        reset = headers.get('X-Gate-RateLimit-Reset-Timestamp')
+        if reset:
+            return max(0.0, int(reset) / 1000 - time.time())
+        retry = headers.get('Retry-After')
+        return float(retry) if retry else 0.0
+
+    def throttled(self, kind: str, retry_after: float = 0.0) -> float:
+        """收到 429 后暂停该类别，返回暂停秒数"""
+        with self._cond:
+            bucket = self.buckets[kind]
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** bucket.strikes)
+            delay = retry_after if retry_after > 0 else backoff
+            bucket.strikes += 1
+            bucket.tokens = 0.0
+            bucket.paused_until = max(bucket.paused_until, time.monotonic() + delay)
+            self._stats[kind]['throttled'] += 1
+        logger.warning(f"请求被限频 ({kind})，暂停 {delay:.2f}s")
+        return delay
+
+    def _succeeded(self, kind: str):
+        self.buckets[kind].strikes = 0
+
+    # ============ 调用 ============
+    @staticmethod
+    def _key(kind: str, func: Callable, args: tuple, kwargs: Dict) -> tuple:
+        # 绑定方法带上所属对象，不同账户的客户端不会被合并
+        owner = id(getattr(func, '__self__', None))
+        return (kind, owner, getattr(func, '__qualname__', repr(func)), args, tuple(sorted(kwargs.items())))
+
+    def call(self, kind: str, func: Callable, *args, coalesce: bool = False, endpoint: Optional[str] = None,
+             **kwargs):
+        """限频执行 func(*args, **kwargs)，429 时退避重试；coalesce=True 时合并相同的在途请求
+
+        每次请求的耗时按 endpoint (默认为函数名) 记录到 request_seconds 直方图
+        """
+        endpoint = endpoint or getattr(func, '__name__', kind)
+        if not coalesce:
+            return self._call(kind, func, args, kwargs, endpoint)
+        key = self._key(kind, func, args, kwargs)
+        with self._cond:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+            else:
+                self._stats[kind]['coalesced'] += 1
+        if not leader:
+            return future.result()
+        try:
+            result = self._call(kind, func, args, kwargs, endpoint)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._cond:
+                self._inflight.pop(key, None)
+
+    def _call(self, kind: str, func: Callable, args: tuple, kwargs: Dict, endpoint: str):
+        labels = (('endpoint', endpoint),)
+        for attempt in range(self.max_retries + 1):
+            self.acquire(kind)
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                metrics.histogram('request_seconds', labels).record(time.perf_counter() - started)
+                retry_after = self.retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    with self._cond:
+                        self._stats[kind]['errors'] += 1
+                    metrics.inc_key('request_errors_total', labels)
+                    raise
+                self.throttled(kind, retry_after)
+                continue
+            metrics.histogram('request_seconds', labels).record(time.perf_counter() - started)
+            self._succeeded(kind)
+            return result
+
+    async def call_async(self, kind: str, func: Callable, *args, coalesce: bool = False,
+                         endpoint: Optional[str] = None, **kwargs):
+        """call 的异步版本，func 为协程函数"""
+        endpoint = endpoint or getattr(func, '__name__', kind)
+        if not coalesce:
+            return await self._call_async(kind, func, args, kwargs, endpoint)
+        key = (id(asyncio.get_running_loop()),) + self._key(kind, func, args, kwargs)
+        future = self._inflight_async.get(key)
+        if future is not None:
+            self._stats[kind]['coalesced'] += 1
+            return await asyncio.shield(future)
+        future = self._inflight_async[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await self._call_async(kind, func, args, kwargs, endpoint)
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有其他等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight_async.pop(key, None)
+
+    async def _call_async(self, kind: str, func: Callable, args: tuple, kwargs: Dict, endpoint: str):
+        labels = (('endpoint', endpoint),)
+        for attempt in range(self.max_retries + 1):
+            await self.acquire_async(kind)
+            started = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                metrics.histogram('request_seconds', labels).record(time.perf_counter() - started)
+                retry_after = self.retry_after(e)
+                if retry_after is None or attempt == self.max_retries:
+                    self._stats[kind]['errors'] += 1
+                    metrics.inc_key('request_errors_total', labels)
+                    raise
+                self.throttled(kind, retry_after)
+                continue
+            metrics.histogram('request_seconds', labels).record(time.perf_counter() - started)
+            self._succeeded(kind)
+            return result
+
+    # ============ 指标 ============
+    def stats(self) -> Dict[str, Dict]:
+        """各类别的请求数、合并数、限频次数、当前/最大排队数和等待时间"""
+        with self._cond:
+            result = {}
+            for kind, stats in self._stats.items():
+                item = dict(stats)
+                item['queue_depth'] = sum(1 for t in self._waiting if t[2] == kind)
+                item['wait_avg'] = stats['wait_total'] / stats['requests'] if stats['requests'] else 0.0
+                result[kind] = item
+            return result
+
+
+_default_scheduler: Optional[RequestScheduler] = None
+
+
+def default_scheduler() -> RequestScheduler:
+    """进程内共享的调度器 (限频按账户/IP 计算，同一进程的多个 Exchange 应共用)"""
+    global _default_scheduler
+    if _default_scheduler is None:
+        _default_scheduler = RequestScheduler()
+    return _default_scheduler
+
+
+def submit_batch_orders(futures_api, settle: str, batch: List[Dict], scheduler: RequestScheduler) -> List[Dict]:
+    """一次批量下单请求 (最多 MAX_BATCH_ORDERS 个，经 scheduler 的 order 类别限频)
+
+    batch 元素为 {'contract', 'size' (带方向), 'price', 可选 'tif'/'text'/'reduce_only'}，
+    返回与输入一一对应的 {'succeeded', 'id', 'status', 'error'}。
+    """
+    request = [
+        gate_api().FuturesOrder(
+            contract=o['contract'], size=int(o['size']), price=str(o['price']), tif=o.get('tif', 'gtc'),
+            text=o.get('text'), reduce_only=o.get('reduce_only', False),
+        )
+        for o in batch
+    ]
+    try:
+        response = scheduler.call('order', futures_api.create_batch_futures_order, settle=settle, futures_order=request)
+    except api_errors() as e:
+        logger.error(f"批量下单失败: {e}")
+        error = str(getattr(e, 'body', None) or e)
+        return [{'succeeded': False, 'id': None, 'status': None, 'error': error} for _ in batch]
+    return [
+        {'succeeded': bool(r.succeeded), 'id': str(r.id) if r.id is not None else None,
+         'status': r.status, 'error': None if r.succeeded else f"{r.label} {r.detail or ''}".strip()}
+        for r in response
+    ]
+
+
+def submit_flatten(orders: List[Dict], submit: Callable[[List[Dict]], List[Dict]]) -> List[Dict]:
+    """把平仓单按 MAX_BATCH_ORDERS 分批，各批并发调用 submit(batch)，返回与 orders 一一对应的结果"""
+    batches = [orders[i:i + MAX_BATCH_ORDERS] for i in range(0, len(orders), MAX_BATCH_ORDERS)]
+    logger.warning(f"一键平仓: {len(orders)} 个持仓，分 {len(batches)} 批并发提交")
+    with ThreadPoolExecutor(max_workers=len(batches), thread_name_prefix="flatten") as pool:
+        return [result for batch in pool.map(submit, batches) for result in batch]
+
+
+_api_keys: Optional[Tuple[str, str]] = None
+
+
+def load_api_keys() -> Tuple[str, str]:
+    """读取 GATE_API_KEY / GATE_API_SECRET (环境变量优先，其次 .env 文件)，结果在进程内缓存"""
+    global _api_keys
+    if _api_keys is not None:
+        return _api_keys
+    api_key = os.getenv('GATE_API_KEY')
+    api_secret = os.getenv('GATE_API_SECRET')
+    if not api_key or not api_secret:
+        from dotenv import load_dotenv
+        # 依次尝试 config/.env 和其他路径 (兼容旧逻辑)
+        env_paths = [
+            Path("config/.env"),
+            Path("C:/Users/admin/Desktop/gatekey.env"),
+            Path("/root/gatekey.env"),
+            Path.home() / "gatekey.env",
+        ]
+        for p in env_paths:
+            if p.exists():
+                load_dotenv(p)
+                api_key = os.getenv('GATE_API_KEY')
+                api_secret = os.getenv('GATE_API_SECRET')
+                if api_key and api_secret:
+                    break
+
+    if not api_key or not api_secret:
+        raise ValueError("未找到 API 密钥配置 (GATE_API_KEY, GATE_API_SECRET)")
+    _api_keys = (api_key, api_secret)
+    return _api_keys
+
 
 class Exchange:
     """交易所 API 封装"""
     
-    def __init__(self, settle: str = 'usdt'):
+    def __init__(self, settle: str = 'usdt', candle_cache_size: int = 500, storage=None, candle_archive=None,
+                 scheduler: Optional[RequestScheduler] = None, snapshot_ttl: float = 1.0):
         self.load_keys()
         self.settle = settle
+        # 所有请求经调度器限频，默认与进程内其他 Exchange 共用
+        self.scheduler = scheduler or default_scheduler()
+        # 持仓/行情快照在 snapshot_ttl 秒内共用一次请求，下单后失效
+        self.snapshots = SnapshotCache(snapshot_ttl)
+        self.candle_cache_size = candle_cache_size
+        # 可选的 data.storage.Storage，用于记录下单结果和成交
+        self.storage = storage
+        # 可选的 data.candle_archive.CandleArchive，K线优先从本地归档读取
+        self.candle_archive = candle_archive
+        # (contract, interval) -> CandleSeries
+        self._candle_cache: Dict[Tuple[str, str], CandleSeries] = {}
         
-        configuration = gate_api.Configuration(
-            host="https://api.gateio.ws/api/v4",
-            key=self.api_key,
-            secret=self.api_secret
-        )
-        self.api_client = gate_api.ApiClient(configuration)
-        self.futures_api = gate_api.FuturesApi(self.api_client)
+        # gate_api 在第一次请求时才导入，并创建 ApiClient
+        self.futures_api = LazyFuturesApi(self.api_key, self.api_secret)
+        # contract -> 平仓订单模板
+        self._close_templates: Dict = {}
+        # 平仓成交确认在后台线程执行，不占用触发平仓的线程
+        self._confirmer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="close-confirm")
         logger.info("交易所 API 初始化完成")
 
     def load_keys(self):
-        """加载 API 密钥"""
-        # 尝试加载 config/.env
-        env_path = Path("config/.env")
-        if env_path.exists():
-            load_dotenv(env_path)
-        
-        self.api_key = os.getenv('GATE_API_KEY')
-        self.api_secret = os.getenv('GATE_API_SECRET')
-        
-        if not self.api_key or not self.api_secret:
-            # 尝试其他路径 (兼容旧逻辑)
-            other_paths = [
-                Path("C:/Users/admin/Desktop/gatekey.env"),
-                Path("/root/gatekey.env"),
-                Path.home() / "gatekey.env",
-            ]
-            for p in other_paths:
-                if p.exists():
-                    load_dotenv(p)
-                    self.api_key = os.getenv('GATE_API_KEY')
-                    self.api_secret = os.getenv('GATE_API_SECRET')
-                    if self.api_key and self.api_secret:
-                        break
-                        
-        if not self.api_key or not self.api_secret:
-            raise ValueError("未找到 API 密钥配置 (GATE_API_KEY, GATE_API_SECRET)")
+        """加载 API 密钥 (进程内只读取一次)"""
+        self.api_key, self.api_secret = load_api_keys()
 
     def get_current_price(self, contract: str) -> float:
-        """获取当前市价"""
+        """获取当前市价 (全部行情快照未过期时直接复用)"""
+        tickers = self.snapshots.peek('tickers')
+        if tickers and contract in tickers:
+            return tickers[contract]
+        return self.snapshots.get(('ticker', contract), lambda: self._load_price(contract)) or 0.0
+
+    def _load_price(self, contract: str) -> Optional[float]:
         try:
-            ticker = self.futures_api.list_futures_tickers(settle=self.settle, contract=contract)
+            ticker = self.scheduler.call('public', self.futures_api.list_futures_tickers, settle=self.settle,
+                                         contract=contract, coalesce=True)
             if ticker and len(ticker) > 0:
                 return float(ticker[0].last)
             return 0.0
         except Exception as e:
             logger.error(f"获取价格失败: {e}")
-            return 0.0
+            return None
 
-    def get_position(self, contract: str):
-        """获取当前持仓"""
+    def get_tickers(self) -> Dict[str, float]:
+        """一次请求获取全部合约最新价 (contract -> last)"""
+        return self.snapshots.get('tickers', self._load_tickers) or {}
+
+    def _load_tickers(self) -> Optional[Dict[str, float]]:
         try:
-            positions = self.futures_api.list_positions(settle=self.settle)
-            for pos in positions:
-                if pos.contract == contract:
-                    size = float(pos.size) if pos.size else 0
-                    if abs(size) > 0:
-                        return {
-                            'contract': pos.contract,
-                            'size': size,
-                            'entry_price': float(pos.entry_price) if pos.entry_price else 0,
-                            'mark_price': float(pos.mark_price) if pos.mark_price else 0,
-                            'unrealised_pnl': float(pos.unrealised_pnl) if pos.unrealised_pnl else 0,
-                            'mode': pos.mode,
-                            'leverage': float(pos.leverage) if pos.leverage else 0
-                        }
+            tickers = self.scheduler.call('public', self.futures_api.list_futures_tickers, settle=self.settle, coalesce=True)
+            return {t.contract: float(t.last) for t in tickers if t.last}
+        except Exception as e:
+            logger.error(f"获取全部行情失败: {e}")
+            return None
+
+    @staticmethod
+    def _parse_position(pos) -> Optional[Dict]:
+        """将 SDK 持仓对象转换为字典，空仓返回 None"""
+        size = float(pos.size) if pos.size else 0
+        if abs(size) == 0:
             return None
+        return {
+            'contract': pos.contract,
+            'size': size,
+            'entry_price': float(pos.entry_price) if pos.entry_price else 0,
+            'mark_price': float(pos.mark_price) if pos.mark_price else 0,
+            'unrealised_pnl': float(pos.unrealised_pnl) if pos.unrealised_pnl else 0,
+            'mode': pos.mode,
+            'leverage': float(pos.leverage) if pos.leverage else 0,
+            'margin': float(getattr(pos, 'margin', None) or 0),
+            'value': float(getattr(pos, 'value', None) or 0),
+        }
+
+    def get_positions(self) -> Optional[Dict[str, Dict]]:
+        """一次请求获取全部持仓快照 (contract -> position)，失败返回 None"""
+        return self.snapshots.get('positions', self._load_positions)
+
+    def _load_positions(self) -> Optional[Dict[str, Dict]]:
+        try:
+            positions = self.scheduler.call('private', self.futures_api.list_positions, settle=self.settle, coalesce=True)
         except Exception as e:
             logger.error(f"获取持仓失败: {e}")
             return None
+        result = {}
+        for pos in positions:
+            parsed = self._parse_position(pos)
+            if parsed:
+                result[parsed['contract']] = parsed
+        return result
+
+    def get_account(self) -> Optional[Dict[str, float]]:
+        """获取合约账户快照 (total 为不含未实现盈亏的余额)，失败返回 None"""
+        return self.snapshots.get('account', self._load_account)
 
-    def close_position(self, contract: str, size: float, mode: str) -> bool:
-        """市价平仓"""
+    def _load_account(self) -> Optional[Dict[str, float]]:
         try:
-            close_size = -size
-            reduce_only = True
-            
-            logger.info(f"执行平仓: {contract}, 数量: {close_size}")
-            
-            order = gate_api.FuturesOrder(
-                contract=contract,
-                size=close_size,
-                price="0",
-                tif="ioc",
-                reduce_only=reduce_only
-            )
-            
-            result = self.futures_api.create_futures_order(settle=self.settle, futures_order=order)
-            logger.info(f"平仓订单已提交: ID={result.id}, 状态={result.status}")
-            return True
-            
-        except (ApiException, GateApiException) as e:
-            logger.error(f"平仓失败: {e}")
-            if hasattr(e, 'body'):
-                logger.error(f"错误详情: {e.body}")
+            account = self.scheduler.call('private', self.futures_api.list_futures_accounts, settle=self.settle,
+                                          coalesce=True)
+        except Exception as e:
+            logger.error(f"获取账户失败: {e}")
+            return None
+        return {
+            'total': float(account.total or 0),
+            'available': float(account.available or 0),
+            'unrealised_pnl': float(account.unrealised_pnl or 0),
+        }
+
+    def get_position(self, contract: str):
+        """获取当前持仓"""
+        positions = self.get_positions()
+        if not positions:
+            return None
+        return positions.get(contract)
+
+    def close_template(self, contract: str):
+        """合约的平仓订单模板 (市价 IOC、只减仓)，平仓时复制后只填入数量和标识"""
+        template = self._close_templates.get(contract)
+        if template is None:
+            template = gate_api().FuturesOrder(contract=contract, size=0, price="0", tif="ioc", reduce_only=True)
+            self._close_templates[contract] = template
+        return template
+
+    def warm_close_path(self, contracts: List[str]):
+        """有持仓时预先导入 SDK、建立连接池并构建平仓模板，触发止损时不再承担这些开销"""
+        for contract in contracts:
+            if contract not in self._close_templates:
+                self.close_template(contract)
+
+    def close_position(self, contract: str, size: float, mode: str, detected_at: Optional[float] = None) -> bool:
+        """市价平仓 (只减仓 IOC)
+
+        每次平仓使用唯一的 text 标识，网络错误/超时等结果不确定时先按标识查询，订单未到达交易所才立即重发
+        (间隔有上限)，不会重复平仓。成交结果在后台线程确认并记录。
+        detected_at 为触发时刻 (time.perf_counter())，用于统计触发到发单的延迟。
+        """
+        close_size = -size
+        text = close_order_text()
+        order = copy.copy(self.close_template(contract))
+        order.size = int(close_size)
+        order.text = text
+        logger.info("执行平仓: %s, 数量: %s, 标识: %s", contract, close_size, text)
+
+        result, error = None, None
+        for attempt in range(CLOSE_ATTEMPTS):
+            if attempt:
+                time.sleep(min(CLOSE_MAX_BACKOFF, CLOSE_BACKOFF * 2 ** (attempt - 1)))
+                result = self._order_by_text(text)
+                if result is not None:
+                    logger.info(f"平仓订单已在交易所 (标识 {text})，不再重发")
+                    break
+            try:
+                result = self.scheduler.call('order', self._submit_close, order, detected_at if not attempt else None,
+                                             endpoint='create_futures_order')
+                break
+            except Exception as e:
+                error = e
+                if not order_outcome_unknown(e):
+                    break
+                logger.warning(f"平仓请求结果不确定 (第 {attempt + 1} 次): {e}")
+        # 请求可能已到达交易所，持仓状态不确定
+        self.snapshots.invalidate()
+
+        if result is None:
+            logger.error(f"平仓失败: {error}")
+            if hasattr(error, 'body'):
+                logger.error(f"错误详情: {error.body}")
+            self._record_order(contract, close_size, error=str(getattr(error, 'body', None) or error))
             return False
+        if detected_at is not None:
+            metrics.observe('close_trigger_to_ack_seconds', time.perf_counter() - detected_at)
+        logger.info("平仓订单已提交: ID=%s, 状态=%s", result.id, result.status)
+        self._confirmer.submit(self._confirm_close, contract, close_size, self._parse_order(result))
+        return True
+
+    def close(self):
+        """停止时调用: 等待后台的平仓确认 (及其存储记录) 完成"""
+        self._confirmer.shutdown(wait=True)
 
-    def get_candlesticks(self, contract: str, interval: str = '1h', limit: int = 200) -> List[Dict]:
-        """获取K线数据"""
+    def _submit_close(self, order, detected_at: Optional[float]):
+        if detected_at is not None:
+            metrics.observe('close_trigger_to_send_seconds', time.perf_counter() - detected_at)
+        return self.futures_api.create_futures_order(settle=self.settle, futures_order=order,
+                                                     _request_timeout=ORDER_TIMEOUT)
+
+    def _order_by_text(self, text: str):
+        """按自定义标识查询订单 (交易所对结束 60 秒内的订单支持按标识查询)，不存在或查询失败返回 None"""
         try:
-            candlesticks = self.futures_api.list_futures_candlesticks(
-                settle=self.settle,
-                contract=contract,
-                interval=interval,
-                limit=limit
-            )
-            return [
-                {
-                    'time': int(cs.t),
-                    'datetime': datetime.fromtimestamp(int(cs.t)),
-                    'open': float(cs.o),
-                    'close': float(cs.c),
-                    'high': float(cs.h),
-                    'low': float(cs.l),
-                    'volume': float(cs.v) if cs.v else 0
-                }
-                for cs in candlesticks
-            ]
-        except (ApiException, GateApiException) as e:
-            logger.error(f"获取K线数据失败: {e}")
+            return self.scheduler.call('private', self.futures_api.get_futures_order, settle=self.settle,
+                                       order_id=text, _request_timeout=ORDER_TIMEOUT, endpoint='get_futures_order')
+        except Exception as e:
+            if order_outcome_unknown(e):
+                # 无法确认时仍会重发: 平仓单只减仓，重复提交也不会反向开仓
+                logger.warning(f"按标识查询平仓订单失败: {e}")
+            return None
+
+    def _confirm_close(self, contract: str, close_size: float, order: Dict):
+        """后台确认平仓单成交 (IOC 通常已结束，未结束时轮询订单状态) 并记录"""
+        deadline = time.monotonic() + CONFIRM_TIMEOUT
+        while order['status'] != 'finished' and time.monotonic() < deadline:
+            time.sleep(CONFIRM_INTERVAL)
+            order = self.get_order(order['id']) or order
+        self._record_order(contract, close_size, order['id'], order['status'], order['fill_price'], order['left'])
+        if order['status'] != 'finished':
+            logger.warning(f"[{contract}] 平仓单 {order['id']} 在 {CONFIRM_TIMEOUT}s 内未结束")
+        elif order['left']:
+            logger.warning(f"[{contract}] 平仓部分成交: 剩余 {order['left']} ({order.get('finish_as')})，下一轮重试")
+        else:
+            logger.info(f"[{contract}] 平仓已成交: 数量 {close_size} 均价 {order['fill_price']}")
+
+    @staticmethod
+    def _parse_order(order) -> Dict:
+        """将 SDK 订单对象转换为字典"""
+        return {
+            'id': str(order.id) if order.id is not None else None,
+            'contract': order.contract,
+            'size': float(order.size or 0),
+            'left': float(order.left or 0),
+            'price': float(order.price or 0),
+            'fill_price': float(order.fill_price or 0),
+            'status': order.status,
+            'finish_as': getattr(order, 'finish_as', None),
+            'text': getattr(order, 'text', None),
+        }
+
+    def _record_limit_order(self, order: Dict, result: Dict):
+        """把限价单的下单结果写入存储"""
+        if self.storage is None:
+            return
+        self.storage.save_order({
+            'contract': order['contract'], 'size': order['size'], 'price': str(order['price']),
+            'tif': order.get('tif', 'gtc'), 'reduce_only': int(bool(order.get('reduce_only'))),
+            'order_id': result.get('id'), 'status': result.get('status'),
+            'success': int(result['succeeded']), 'error': result.get('error'),
+        })
+
+    def place_orders(self, orders: List[Dict]) -> List[Dict]:
+        """批量挂限价单 (每次请求最多 MAX_BATCH_ORDERS 个)
+
+        orders 元素为 {'contract', 'size' (带方向), 'price', 可选 'tif'/'text'/'reduce_only'}，
+        返回与输入一一对应的 {'succeeded', 'id', 'status', 'error'}。
+        """
+        results = []
+        for i in range(0, len(orders), MAX_BATCH_ORDERS):
+            batch = orders[i:i + MAX_BATCH_ORDERS]
+            batch_results = submit_batch_orders(self.futures_api, self.settle, batch, self.scheduler)
+            for order, result in zip(batch, batch_results):
+                self._record_limit_order(order, result)
+            results += batch_results
+        if orders:
+            self.snapshots.invalidate()
+        return results
+
+    def flatten(self, contracts: Optional[List[str]] = None, side: Optional[str] = None,
+                predicate: Optional[Callable[[Dict], bool]] = None) -> Optional[List[Dict]]:
+        """一键平仓: 取一次最新持仓快照，为匹配的持仓生成只减仓 IOC 单，按批并发提交
+
+        筛选条件见 flatten_orders。返回每个平仓单的结果 (见 flatten_report)，获取持仓失败时返回 None。
+        平仓单只减仓，重复执行不会反向开仓。
+        """
+        self.snapshots.invalidate()
+        positions = self.get_positions()
+        if positions is None:
+            logger.error("一键平仓失败: 无法获取持仓")
+            return None
+        orders = flatten_orders(positions, contracts, side, predicate)
+        if not orders:
+            logger.info("一键平仓: 没有匹配的持仓")
             return []
+        return flatten_report(orders, submit_flatten(orders, self.place_orders))
+
+    def cancel_orders(self, order_ids: List[str]) -> Dict[str, bool]:
+        """批量撤单 (每次请求最多 MAX_BATCH_CANCEL 个)，返回 id -> 是否成功"""
+        results = {}
+        for i in range(0, len(order_ids), MAX_BATCH_CANCEL):
+            batch = [str(order_id) for order_id in order_ids[i:i + MAX_BATCH_CANCEL]]
+            try:
+                response = self.scheduler.call('order', self.futures_api.cancel_batch_future_orders,
+                                               settle=self.settle, request_body=batch)
+                results.update({str(r.id): bool(r.succeeded) for r in response})
+            except api_errors() as e:
+                logger.error(f"批量撤单失败: {e}")
+                results.update({order_id: False for order_id in batch})
+        return results
+
+    def get_order(self, order_id: str) -> Optional[Dict]:
+        """查询单个订单，失败返回 None"""
+        try:
+            order = self.scheduler.call('private', self.futures_api.get_futures_order, settle=self.settle,
+                                        order_id=str(order_id), coalesce=True)
+        except api_errors() as e:
+            logger.error(f"查询订单失败 {order_id}: {e}")
+            return None
+        return self._parse_order(order)
+
+    def list_open_orders(self, contract: Optional[str] = None) -> Optional[List[Dict]]:
+        """列出未成交挂单 (可按合约过滤)，失败返回 None"""
+        kwargs = {'contract': contract} if contract else {}
+        try:
+            orders = self.scheduler.call('private', self.futures_api.list_futures_orders, settle=self.settle,
+                                         status='open', coalesce=True, **kwargs)
+        except api_errors() as e:
+            logger.error(f"获取挂单失败: {e}")
+            return None
+        return [self._parse_order(o) for o in orders]
+
+    def _record_order(self, contract: str, size: float, order_id=None, status=None, fill_price=None,
+                      left=None, error: Optional[str] = None, reason: str = 'close_position'):
+        """把市价 IOC 平仓结果写入存储 (有成交时同时记录一笔成交)"""
+        if self.storage is None:
+            return
+        self.storage.save_order({
+            'contract': contract, 'size': size, 'price': "0", 'tif': "ioc", 'reduce_only': 1,
+            'order_id': str(order_id) if order_id is not None else None, 'status': status,
+            'success': int(error is None), 'error': error,
+        })
+        filled = size - float(left or 0) if error is None else 0
+        if filled and fill_price and float(fill_price) > 0:
+            self.storage.save_trade({
+                'contract': contract, 'side': 'buy' if filled > 0 else 'sell', 'size': filled,
+                'price': float(fill_price), 'order_id': str(order_id), 'reason': reason,
+            })
+
+    def get_candlesticks(self, contract: str, interval: str = '1h', limit: int = 200,
+                         start: Optional[int] = None) -> Candles:
+        """获取K线数据 (列式存储，按下标访问仍返回字典视图)
+
+        指定 start 时返回该时间戳之后的全部K线，忽略 limit；
+        启用本地K线归档时已收盘部分从归档读取，只向交易所请求缺失的K线
+        """
+        try:
+            if self.candle_archive is not None and self.candle_archive.supports(interval):
+                return self.candle_archive.serve(
+                    contract, interval, lambda begin, end: self._list_candlesticks(contract, interval, start=begin, end=end),
+                    limit=limit, start=start,
+                )
+            return self._list_candlesticks(contract, interval, limit, start)
+        except api_errors() as e:
+            logger.error(f"获取K线数据失败: {e}")
+            return Candles.empty()
+
+    def _list_candlesticks(self, contract: str, interval: str, limit: int = 200, start: Optional[int] = None,
+                           end: Optional[int] = None) -> Candles:
+        """请求交易所K线接口 (失败时抛出异常)"""
+        params = {'settle': self.settle, 'contract': contract, 'interval': interval}
+        if start is not None or end is not None:
+            params['_from'] = start
+            params['to'] = end
+        else:
+            params['limit'] = limit
+        params = {k: v for k, v in params.items() if v is not None}
+        candlesticks = self.scheduler.call('public', self.futures_api.list_futures_candlesticks, coalesce=True, **params)
+        return Candles.from_api(candlesticks)
+
+    def _candle_series(self, contract: str, interval: str, min_size: int) -> Optional[CandleSeries]:
+        """查找或创建 (contract, interval) 的K线缓存"""
+        interval_sec = INTERVAL_SECONDS.get(interval)
+        if interval_sec is None:
+            logger.error(f"不支持的K线周期: {interval}")
+            return None
+
+        key = (contract, interval)
+        series = self._candle_cache.get(key)
+        if series is None or series.candles.maxlen < min_size:
+            series = CandleSeries(interval_sec, maxlen=max(self.candle_cache_size, min_size))
+            self._candle_cache[key] = series
+        return series
+
+    def get_candle_series(self, contract: str, interval: str = '1h', min_size: int = 0) -> Optional[CandleSeries]:
+        """获取缓存的已收盘K线序列，仅在有新K线收盘时增量拉取"""
+        series = self._candle_series(contract, interval, min_size)
+        if series is None:
+            return None
+        now = time.time()
+        params = series.fetch_params(min_size, now)
+        if params is not None:
+            series.extend(self.get_candlesticks(contract, interval=interval, **params), now)
+        return series
 
     def calculate_atr(self, contract: str, interval: str = '1h', period: int = 14) -> float:
-        """计算 ATR (平均真实波幅)"""
-        candles = self.get_candlesticks(contract, interval=interval, limit=period + 1)
-        if len(candles) < period + 1:
-            logger.warning(f"K线数据不足，无法计算 ATR (需要 {period+1}, 实际 {len(candles)})")
+        """计算 ATR (平均真实波幅，基于已收盘K线的滚动均值)"""
+        series = self.get_candle_series(contract, interval=interval, min_size=period + 1)
+        if series is None:
             return 0.0
-        
-        tr_list = []
-        for i in range(1, len(candles)):
-            high = candles[i]['high']
-            low = candles[i]['low']
-            prev_close = candles[i-1]['close']
-            
-            tr = max(
-                high - low,
-                abs(high - prev_close),
-                abs(low - prev_close)
-            )
-            tr_list.append(tr)
-            
-        if not tr_list:
+        if len(series) < period + 1:
+            logger.warning(f"K线数据不足，无法计算 ATR (需要 {period+1}, 实际 {len(series)})")
             return 0.0
-            
-        return sum(tr_list[-period:]) / period
+        return series.atr(period)
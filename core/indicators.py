@@ -0,0 +1,144 @@
+"""向量化技术指标
+
+所有函数接收整列 numpy 数组 (或 Candles 的列)，返回与输入等长的 float64 数组，
+预热期内的值为 NaN。
+"""
+from typing import Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _as_float(x) -> np.ndarray:
+    return np.ascontiguousarray(x, dtype=np.float64)
+
+
+def _ewm(x: np.ndarray, alpha: float, start: int) -> np.ndarray:
+    """一阶递推 y[i] = (1 - alpha) * y[i-1] + alpha * x[i] 的分块闭式解
+
+    x[start] 作为初值，之前的位置为 NaN。块长度受限于 (1-alpha)^-m 不溢出。
+    """
+    out = np.full(len(x), np.nan)
+    if start >= len(x):
+        return out
+    out[start] = x[start]
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        out[start:] = x[start:]
+        return out
+
+    block = max(1, int(250.0 / -np.log10(decay)))
+    prev = x[start]
+    i = start + 1
+    while i < len(x):
+        chunk = x[i:i + block]
+        m = len(chunk)
+        powers = decay ** np.arange(1, m + 1)
+        # y[k] = decay^(k+1) * prev + alpha * sum_{j<=k} decay^(k-j) * x[j]
+        acc = np.cumsum(chunk / powers) * powers
+        y = powers * prev + alpha * acc
+        out[i:i + m] = y
+        prev = y[-1]
+        i += m
+    return out
+
+
+def sma(x, period: int) -> np.ndarray:
+    """简单移动平均"""
+    x = _as_float(x)
+    out = np.full(len(x), np.nan)
+    if period <= 0 or len(x) < period:
+        return out
+    out[period - 1:] = sliding_window_view(x, period).mean(axis=1)
+    return out
+
+
+def ema(x, period: int) -> np.ndarray:
+    """指数移动平均 (alpha = 2/(period+1)，以前 period 个值的 SMA 作为初值)"""
+    return _smoothed(_as_float(x), 2.0 / (period + 1), period)
+
+
+def wilder(x, period: int) -> np.ndarray:
+    """Wilder 平滑 (alpha = 1/period，以 SMA 作为初值)"""
+    return _smoothed(_as_float(x), 1.0 / period, period)
+
+
+def _smoothed(x: np.ndarray, alpha: float, period: int) -> np.ndarray:
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    if period <= 0 or len(valid) < period:
+        return out
+    first = valid[0]
+    seed_at = first + period - 1
+    seeded = x.copy()
+    seeded[seed_at] = x[first:seed_at + 1].mean()
+    return _ewm(seeded, alpha, seed_at)
+
+
+def true_range(high, low, close) -> np.ndarray:
+    """真实波幅，第一根K线没有前收盘价，取 high - low"""
+    high, low, close = _as_float(high), _as_float(low), _as_float(close)
+    tr = high - low
+    if len(close) > 1:
+        prev_close = close[:-1]
+        tr[1:] = np.maximum.reduce([tr[1:], np.abs(high[1:] - prev_close), np.abs(low[1:] - prev_close)])
+    return tr
+
+
+def atr(high, low, close, period: int = 14, method: str = 'sma') -> np.ndarray:
+    """平均真实波幅
+
+    method='sma' 与 Exchange.calculate_atr 一致 (最近 period 个 TR 的均值)，
+    method='wilder' 为 Wilder 平滑。第一根K线的 TR 不参与计算。
+    """
+    tr = true_range(high, low, close)
+    tr[:1] = np.nan
+    out = np.full(len(tr), np.nan)
+    if len(tr) <= period:
+        return out
+    if method == 'wilder':
+        out[1:] = wilder(tr[1:], period)
+    elif method == 'sma':
+        out[1:] = sma(tr[1:], period)
+    else:
+        raise ValueError(f"未知的 ATR 计算方式: {method}")
+    return out
+
+
+def rsi(close, period: int = 14) -> np.ndarray:
+    """相对强弱指数 (Wilder 平滑)"""
+    close = _as_float(close)
+    out = np.full(len(close), np.nan)
+    if len(close) <= period:
+        return out
+    delta = np.diff(close)
+    avg_gain = wilder(np.clip(delta, 0, None), period)
+    avg_loss = wilder(np.clip(-delta, 0, None), period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rs = avg_gain / avg_loss
+        values = 100.0 - 100.0 / (1.0 + rs)
+    # 无下跌时 RSI 为 100
+    values = np.where(avg_loss == 0, 100.0, values)
+    values[np.isnan(avg_gain)] = np.nan
+    out[1:] = values
+    return out
+
+
+def bollinger(close, period: int = 20, k: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """布林带，返回 (中轨, 上轨, 下轨)"""
+    close = _as_float(close)
+    mid = np.full(len(close), np.nan)
+    std = np.full(len(close), np.nan)
+    if period > 0 and len(close) >= period:
+        windows = sliding_window_view(close, period)
+        mid[period - 1:] = windows.mean(axis=1)
+        std[period - 1:] = windows.std(axis=1)
+    return mid, mid + k * std, mid - k * std
+
+
+def macd(close, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD，返回 (DIF, DEA, 柱状图)"""
+    close = _as_float(close)
+    dif = ema(close, fast) - ema(close, slow)
+    dea = ema(dif, signal)
+    return dif, dea, dif - dea
@@ -0,0 +1,235 @@
+"""延迟直方图与计数器
+
+所有 REST 请求 (经 RequestScheduler) 按接口记录耗时和错误数，引擎按策略记录每轮执行耗时、超时次数。
+记录一次约 1µs (一次对数分桶 + 加锁计数)；可通过本地 HTTP 端点以 Prometheus 文本格式导出，
+或由引擎定期输出到日志。
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from typing import Dict, List, Tuple
+
+PREFIX = "qqqrobot_"
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Histogram:
+    """对数分桶直方图 (HDR 风格)
+
+    以 min_value 为单位，每个 2 的幂区间再等分为 sub_buckets 份，分位数的相对误差不超过 1/sub_buckets；
+    桶按需创建，内存只与实际出现的量级有关。
+    """
+
+    def __init__(self, sub_buckets: int = 32, min_value: float = 1e-6):
+        self.sub_buckets = sub_buckets
+        self.min_value = min_value
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, value: float) -> int:
+        scaled = value / self.min_value
+        if scaled < 1:
+            return 0
+        mantissa, exponent = math.frexp(scaled)
+        return 1 + (exponent - 1) * self.sub_buckets + int((mantissa - 0.5) * 2 * self.sub_buckets)
+
+    def _upper(self, index: int) -> float:
+        """桶的上界"""
+        if index == 0:
+            return self.min_value
+        exponent, sub = divmod(index - 1, self.sub_buckets)
+        return (1 + (sub + 1) / self.sub_buckets) * 2 ** exponent * self.min_value
+
+    def record(self, value: float):
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantiles(self, qs=QUANTILES) -> List[float]:
+        """各分位数 (取所在桶的上界，不超过最大值)"""
+        with self._lock:
+            items = sorted(self.counts.items())
+            total, peak = self.count, self.max
+        if not total:
+            return [0.0 for _ in qs]
+        result = []
+        for q in qs:
+            rank = max(1, math.ceil(q * total))
+            seen = 0
+            for index, n in items:
+                seen += n
+                if seen >= rank:
+                    result.append(min(self._upper(index), peak))
+                    break
+        return result
+
+
+class _Timer:
+    """metrics.timer() 返回的上下文管理器: 退出时记录耗时，出现异常时另记错误数"""
+
+    __slots__ = ('metrics', 'name', 'labels', 'start')
+
+    def __init__(self, metrics: 'Metrics', name: str, labels: Tuple):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.histogram(self.name, self.labels).record(time.perf_counter() - self.start)
+        if exc_type is not None:
+            self.metrics.inc_key(f"{self.name.rsplit('_seconds', 1)[0]}_errors_total", self.labels)
+        return False
+
+
+class Metrics:
+    """指标注册表: 名称 + 标签 -> 直方图 / 计数器"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (名称, ((标签, 值), ...)) -> Histogram / 计数
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.server = None
+
+    # ============ 记录 ============
+    def histogram(self, name: str, labels: Tuple = ()) -> Histogram:
+        key = (name, labels)
+        hist = self.histograms.get(key)
+        if hist is None:
+            with self._lock:
+                hist = self.histograms.setdefault(key, Histogram())
+        return hist
+
+    def observe(self, name: str, seconds: float, **labels):
+        self.histogram(name, tuple(labels.items())).record(seconds)
+
+    def inc_key(self, name: str, labels: Tuple = (), value: float = 1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def inc(self, name: str, value: float = 1, **labels):
+        self.inc_key(name, tuple(labels.items()), value)
+
+    def timer(self, name: str, **labels) -> _Timer:
+        """with metrics.timer('strategy_run_seconds', strategy=...): 记录代码块耗时"""
+        return _Timer(self, name, tuple(labels.items()))
+
+    def timed(self, name: str, **labels):
+        """装饰器版本的 timer，支持协程函数"""
+        def decorator(func):
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.timer(name, **labels):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ============ 导出 ============
+    @staticmethod
+    def _labels(labels: Tuple, extra: str = '') -> str:
+        parts = [f'{k}="{str(v)}"' for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式 (直方图导出为 summary)"""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        lines = []
+        typed = set()
+        for (name, labels), hist in histograms:
+            metric = PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} summary")
+            for q, value in zip(QUANTILES, hist.quantiles()):
+                quantile = f'quantile="{q}"'
+                lines.append(f"{metric}{self._labels(labels, quantile)} {value:.6g}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {hist.sum:.6g}")
+            lines.append(f"{metric}_count{self._labels(labels)} {hist.count}")
+        for (name, labels), value in counters:
+            metric = PREFIX + name
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{self._labels(labels)} {value:g}")
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> List[str]:
+        """每个直方图一行: 次数、p50/p99、最大值、错误率 (用于定期输出到日志)"""
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = dict(self.counters)
+        lines = []
+        for (name, labels), hist in histograms:
+            if not hist.count:
+                continue
+            p50, _, p99 = hist.quantiles()
+            label_text = ','.join(str(v) for _, v in labels)
+            line = (f"{name}[{label_text}] 次数: {hist.count} | p50: {p50 * 1000:.1f}ms | "
+                    f"p99: {p99 * 1000:.1f}ms | 最大: {hist.max * 1000:.1f}ms")
+            errors = counters.get((f"{name.rsplit('_seconds', 1)[0]}_errors_total", labels), 0)
+            if errors:
+                line += f" | 错误率: {errors / hist.count * 100:.1f}%"
+            lines.append(line)
+        for (name, labels), value in sorted(counters.items()):
+            if not name.endswith('_errors_total'):
+                lines.append(f"{name}[{','.join(str(v) for _, v in labels)}] {value:g}")
+        return lines
+
+    def serve(self, port: int = 9108, host: str = "127.0.0.1"):
+        """在后台线程启动 HTTP 端点: GET /metrics 返回 Prometheus 文本"""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        return self.server
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+metrics = Metrics()
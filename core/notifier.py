@@ -1,22 +1,163 @@
+import atexit
+import json
 import logging
-import os
+import logging.handlers
+import queue
 from pathlib import Path
+from typing import Dict, Optional
+
+LOG_DIR = Path("logs")
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+# 单个日志文件上限和保留的历史文件数 (每类日志最多占用 max_bytes * (backup_count + 1))
+MAX_BYTES = 10 * 1024 * 1024
+BACKUP_COUNT = 5
+
+
+class LogPipeline:
+    """日志队列 + 后台写入线程
+
+    业务线程只把日志记录放入队列，格式化、写文件和控制台输出都在后台线程完成。
+    进程退出时 (atexit) 写完队列中剩余的记录后停止，之后的日志在调用线程直接输出。
+    """
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.handlers: Dict[str, logging.Handler] = {}
+        self.listener = logging.handlers.QueueListener(self.queue, respect_handler_level=True)
+        self.stopped = False
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def set_handler(self, key: str, handler: Optional[logging.Handler]):
+        """新增、替换或 (handler 为 None 时) 移除一个输出"""
+        old = self.handlers.pop(key, None)
+        if handler is not None:
+            self.handlers[key] = handler
+        self.listener.handlers = tuple(self.handlers.values())
+        if old is not None:
+            old.close()
+
+    def handler(self, level=logging.NOTSET) -> logging.Handler:
+        return _QueueHandler(self, level)
+
+    def stop(self):
+        if not self.stopped:
+            self.stopped = True
+            self.listener.stop()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """只入队，不在调用线程格式化日志"""
+
+    def __init__(self, pipeline: LogPipeline, level=logging.NOTSET):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+        self.setLevel(level)
+
+    def prepare(self, record):
+        return record
+
+    def emit(self, record):
+        if self.pipeline.stopped:
+            self.pipeline.listener.handle(record)
+        else:
+            self.enqueue(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条记录一行 JSON: ts + 记录的 fields (没有 fields 时为 msg)"""
+
+    def format(self, record):
+        data = {'ts': round(record.created, 3)}
+        data.update(getattr(record, 'fields', None) or {'msg': record.getMessage()})
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def rotating_handler(path, max_bytes: int = MAX_BYTES, backup_count: int = BACKUP_COUNT, when: Optional[str] = None,
+                     formatter: Optional[logging.Formatter] = None) -> logging.Handler:
+    """滚动日志文件: 默认按大小滚动，指定 when (如 'midnight') 时按时间滚动，都只保留 backup_count 个历史文件"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count,
+                                                            encoding='utf-8', delay=True)
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                       encoding='utf-8', delay=True)
+    handler.setFormatter(formatter or logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+pipeline = LogPipeline()
+# handler 名称 -> 日志文件路径，configure_logging 修改滚动参数时据此重建 handler
+_log_files: Dict[str, str] = {}
+_rotation: Dict = {'max_bytes': MAX_BYTES, 'backup_count': BACKUP_COUNT, 'when': None}
+
 
 def setup_logger(name: str = "qqqrobot", log_file: str = "bot.log", level=logging.INFO):
-    """配置日志"""
-    # 确保日志目录存在
-    log_path = Path("logs")
-    if not log_path.exists():
-        log_path.mkdir(parents=True)
-        
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler(log_path / log_file, encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+    """配置日志: 根 logger 只挂队列 handler，控制台和滚动日志文件在后台线程输出"""
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    pipeline.set_handler('console', console)
+    add_log_file(log_file, key='file')
+    logging.basicConfig(level=level, handlers=[pipeline.handler()])
     return logging.getLogger(name)
 
+
+def add_log_file(path, key: Optional[str] = None):
+    """增加一个滚动日志文件输出 (相对路径放在 logs/ 下)"""
+    path = Path(path)
+    if not path.is_absolute() and path.parent == Path('.'):
+        path = LOG_DIR / path
+    key = key or str(path)
+    _log_files[key] = str(path)
+    pipeline.set_handler(key, rotating_handler(path, **_rotation))
+
+
+# 逐轮状态 (合约、价格、止损价、盈亏等) 的 JSON 行输出，默认关闭
+tick_logger = logging.getLogger("qqqrobot.ticks")
+tick_logger.propagate = False
+tick_logger.disabled = True
+_tick_pipeline: Optional[LogPipeline] = None
+
+
+def enable_tick_log(path=LOG_DIR / "ticks.jsonl"):
+    """启用逐轮状态输出 (独立的队列和后台线程，按与普通日志相同的参数滚动)"""
+    global _tick_pipeline
+    if _tick_pipeline is None:
+        _tick_pipeline = LogPipeline()
+        tick_logger.addHandler(_tick_pipeline.handler())
+        tick_logger.setLevel(logging.INFO)
+    _tick_pipeline.set_handler('ticks', rotating_handler(path, formatter=JsonLinesFormatter(), **_rotation))
+    tick_logger.disabled = False
+
+
+def log_tick(**fields):
+    """记录一条逐轮状态，未启用时直接返回"""
+    if not tick_logger.disabled:
+        tick_logger.info('', extra={'fields': fields})
+
+
+def configure_logging(options: Optional[Dict]):
+    """按 settings.yaml 的 logging 段调整日志级别、滚动参数和逐轮状态输出"""
+    options = options or {}
+    level = options.get('level')
+    if level:
+        logging.getLogger().setLevel(str(level).upper())
+    rotation = {
+        'max_bytes': int(options.get('max_bytes', MAX_BYTES)),
+        'backup_count': int(options.get('backup_count', BACKUP_COUNT)),
+        'when': options.get('when') or None,
+    }
+    if rotation != _rotation:
+        _rotation.clear()
+        _rotation.update(rotation)
+        for key, path in _log_files.items():
+            pipeline.set_handler(key, rotating_handler(path, **_rotation))
+    if options.get('tick_log', False):
+        enable_tick_log(options.get('tick_log_path') or LOG_DIR / "ticks.jsonl")
+    else:
+        tick_logger.disabled = True
+
+
 logger = setup_logger()
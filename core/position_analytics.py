@@ -0,0 +1,157 @@
+"""持仓分析
+
+把交易所返回的持仓对象直接解析为列式 float64 数组 (不经过 Decimal)，
+收益率、保证金率等指标对全部持仓一次向量化计算。
+Decimal 只应在把下单数量发回交易所时使用。
+"""
+from collections.abc import Mapping
+from operator import attrgetter
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+# SDK 持仓字段 -> 列名 (均为数值列)
+NUMERIC_FIELDS = (
+    'size', 'leverage', 'cross_leverage_limit', 'entry_price', 'mark_price', 'value',
+    'unrealised_pnl', 'realised_pnl', 'pnl_percent', 'margin', 'maintenance_rate',
+)
+# 计算得到的列
+DERIVED_FIELDS = ('roi_percent', 'margin_ratio', 'maintenance_ratio')
+POSITION_KEYS = ('settle', 'contract', 'mode') + NUMERIC_FIELDS + DERIVED_FIELDS
+
+
+_get_numeric = attrgetter(*NUMERIC_FIELDS)
+
+
+def _parse(positions: list):
+    """一次取出全部数值字段并整体转为 float64 矩阵 (每行一个字段)，缺失或空值记为 0；跳过空仓"""
+    try:
+        flat = [value or 0 for pos in positions for value in _get_numeric(pos)]
+    except AttributeError:
+        # 非 SDK 对象可能缺少部分字段
+        flat = [getattr(pos, field, None) or 0 for pos in positions for field in NUMERIC_FIELDS]
+    matrix = np.array(flat, dtype=np.float64).reshape(len(positions), len(NUMERIC_FIELDS)).T.copy()
+    keep = np.flatnonzero(matrix[0] != 0)
+    if len(keep) < len(positions):
+        matrix = matrix[:, keep]
+        positions = [positions[i] for i in keep]
+    return positions, dict(zip(NUMERIC_FIELDS, matrix))
+
+
+class PositionView(Mapping):
+    """单个持仓的只读字典视图，兼容原有 pos['size'] 写法"""
+
+    __slots__ = ('_book', '_index')
+
+    def __init__(self, book: 'PositionBook', index: int):
+        self._book = book
+        self._index = index
+
+    def __getitem__(self, key):
+        if key not in POSITION_KEYS:
+            raise KeyError(key)
+        value = getattr(self._book, key)[self._index]
+        return value if key in ('settle', 'contract', 'mode') else float(value)
+
+    def __iter__(self):
+        return iter(POSITION_KEYS)
+
+    def __len__(self):
+        return len(POSITION_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class PositionBook:
+    """一组持仓的列式存储，按下标访问返回 PositionView"""
+
+    __slots__ = ('settle', 'contract', 'mode') + NUMERIC_FIELDS + DERIVED_FIELDS
+
+    def __init__(self, settle: List[str], contract: List[str], mode: List[str], columns: Dict[str, np.ndarray],
+                 account_leverage: float = 0.0):
+        self.settle = settle
+        self.contract = contract
+        self.mode = mode
+        for field in NUMERIC_FIELDS:
+            setattr(self, field, columns[field])
+        # 杠杆: 逐仓杠杆 > 全仓杠杆上限 > 账户全仓杠杆
+        self.leverage = np.where(
+            self.leverage > 0, self.leverage,
+            np.where(self.cross_leverage_limit > 0, self.cross_leverage_limit, account_leverage),
+        )
+        self.analyze()
+
+    @classmethod
+    def from_api(cls, positions: Iterable, settle: str = 'usdt', account_leverage=None) -> 'PositionBook':
+        """从 SDK 持仓对象列表构建 (跳过空仓)"""
+        positions, columns = _parse(list(positions or []))
+        return cls(
+            [settle] * len(positions),
+            [str(pos.contract) if pos.contract else 'N/A' for pos in positions],
+            [getattr(pos, 'mode', None) or 'unknown' for pos in positions],
+            columns,
+            account_leverage=float(account_leverage or 0),
+        )
+
+    @classmethod
+    def concat(cls, books: Iterable['PositionBook']) -> 'PositionBook':
+        """合并多个结算货币的持仓"""
+        books = list(books)
+        book = cls.__new__(cls)
+        book.settle = [s for b in books for s in b.settle]
+        book.contract = [c for b in books for c in b.contract]
+        book.mode = [m for b in books for m in b.mode]
+        for field in NUMERIC_FIELDS + DERIVED_FIELDS:
+            setattr(book, field, np.concatenate([getattr(b, field) for b in books]) if books else np.empty(0))
+        return book
+
+    def analyze(self):
+        """向量化计算收益率 (按杠杆)、保证金占仓位价值比例、维持保证金占用率"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.where(self.entry_price > 0, (self.mark_price - self.entry_price) / self.entry_price, 0.0)
+            self.roi_percent = np.sign(self.size) * change * self.leverage * 100
+            self.margin_ratio = np.where(self.value > 0, self.margin / self.value, 0.0)
+            equity = self.margin + self.unrealised_pnl
+            self.maintenance_ratio = np.where(equity > 0, self.value * self.maintenance_rate / equity, 0.0)
+
+    def __len__(self):
+        return len(self.contract)
+
+    def __getitem__(self, index: int) -> PositionView:
+        n = len(self.contract)
+        if index < 0:
+            index += n
+        if not 0 <= index < n:
+            raise IndexError("position index out of range")
+        return PositionView(self, index)
+
+    def __iter__(self):
+        for i in range(len(self.contract)):
+            yield PositionView(self, i)
+
+    def __repr__(self):
+        return f"PositionBook(n={len(self)})"
+
+    def find(self, contract: str, settle: Optional[str] = None) -> Optional[PositionView]:
+        for i, c in enumerate(self.contract):
+            if c == contract and (settle is None or self.settle[i] == settle):
+                return PositionView(self, i)
+        return None
+
+    def totals(self) -> Dict[str, Dict[str, float]]:
+        """按结算货币汇总未实现盈亏、保证金和仓位价值"""
+        result = {}
+        settles = np.array(self.settle)
+        for settle in dict.fromkeys(self.settle):
+            mask = settles == settle
+            result[settle] = {
+                'positions': int(mask.sum()),
+                'unrealised_pnl': float(self.unrealised_pnl[mask].sum()),
+                'margin': float(self.margin[mask].sum()),
+                'value': float(self.value[mask].sum()),
+            }
+        return result
+
+    def to_dicts(self) -> List[Dict]:
+        return [dict(view) for view in self]
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+
+from core.notifier import logger
+
+GATE_WS_URL = "wss://fx-ws.gateio.ws/v4/ws/{settle}"
+
+
+class PriceTable:
+    """本地最新价/标记价表，由推送行情实时更新"""
+
+    def __init__(self):
+        # contract -> {'last': 最新价, 'mark_price': 标记价, 'time': 本地接收时间}
+        self._prices: Dict[str, Dict] = {}
+
+    def update(self, contract: str, last: Optional[float] = None, mark_price: Optional[float] = None):
+        entry = self._prices.get(contract)
+        if entry is None:
+            entry = self._prices[contract] = {'last': 0.0, 'mark_price': 0.0, 'time': 0.0}
+        if last:
+            entry['last'] = last
+        if mark_price:
+            entry['mark_price'] = mark_price
+        entry['time'] = time.time()
+
+    def get(self, contract: str, max_age: Optional[float] = None) -> float:
+        """返回最新价，不存在或超过 max_age 秒未更新时返回 0.0"""
+        entry = self._prices.get(contract)
+        if entry is None:
+            return 0.0
+        if max_age is not None and time.time() - entry['time'] > max_age:
+            return 0.0
+        return entry['last']
+
+    def snapshot(self, contracts: Iterable[str], max_age: Optional[float] = None) -> Optional[Dict[str, float]]:
+        """返回指定合约的最新价字典，任一合约缺失或过期时返回 None"""
+        result = {}
+        for contract in contracts:
+            price = self.get(contract, max_age)
+            if price == 0:
+                return None
+            result[contract] = price
+        return result
+
+
+class PriceFeed(ABC):
+    """推送行情源基类
+
+    子类在 run() 中接收行情并调用 publish()，由 publish() 更新价格表并依次通知监听者。
+    监听者签名为 callback(contract, price)，在行情源所在线程中同步调用。
+    """
+
+    def __init__(self):
+        self.table = PriceTable()
+        self.contracts = set()
+        self.running = False
+        self._listeners: List[Callable[[str, float], None]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def subscribe(self, contracts: Iterable[str]):
+        """订阅合约"""
+        self.contracts.update(contracts)
+
+    def add_listener(self, callback: Callable[[str, float], None]):
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, float], None]):
+        # 替换列表而不是原地删除，行情线程正在遍历的旧列表不受影响
+        self._listeners = [cb for cb in self._listeners if cb != callback]
+
+    def publish(self, contract: str, last: Optional[float] = None, mark_price: Optional[float] = None):
+        """写入一条行情并通知监听者 (单个监听者异常不影响其他监听者)"""
+        self.table.update(contract, last, mark_price)
+        if not last:
+            return
+        for callback in self._listeners:
+            try:
+                callback(contract, last)
+            except Exception as e:
+                logger.error(f"行情回调执行出错 [{contract}]: {e}", exc_info=True)
+
+    @abstractmethod
+    async def run(self):
+        """接收行情直到 stop() 被调用"""
+        pass
+
+    def start_background(self):
+        """在后台线程中运行行情源 (供同步引擎使用)"""
+        self.running = True
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), name=type(self).__name__, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+
+
+class GateWebSocketFeed(PriceFeed):
+    """Gate 合约 WebSocket 行情 (futures.tickers 频道)，断线自动重连"""
+
+    def __init__(self, settle: str = 'usdt', url: Optional[str] = None, ping_interval: float = 10,
+                 max_backoff: float = 30):
+        super().__init__()
+        self.url = url or GATE_WS_URL.format(settle=settle)
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        # 当前连接及其事件循环，连接期间新增的合约立即订阅
+        self._ws = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, contracts: Iterable[str]):
+        new = set(contracts) - self.contracts
+        super().subscribe(new)
+        ws, loop = self._ws, self._loop
+        if new and ws is not None and not ws.closed:
+            asyncio.run_coroutine_threadsafe(self._send(ws, 'futures.tickers', 'subscribe', sorted(new)), loop)
+
+    async def run(self):
+        self.running = True
+        backoff = 1.0
+        async with aiohttp.ClientSession() as session:
+            while self.running:
+                try:
+                    async with session.ws_connect(self.url) as ws:
+                        logger.info(f"行情推送已连接: {self.url} ({len(self.contracts)} 个合约)")
+                        backoff = 1.0
+                        self._ws, self._loop = ws, asyncio.get_running_loop()
+                        await self._send(ws, 'futures.tickers', 'subscribe', sorted(self.contracts))
+                        await self._consume(ws)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"行情推送连接异常: {e}")
+                finally:
+                    self._ws = None
+                if self.running:
+                    logger.warning(f"行情推送断开，{backoff:.0f}秒后重连")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+
+    async def _consume(self, ws):
+        while self.running:
+            try:
+                msg = await ws.receive(timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                await self._send(ws, 'futures.ping')
+                continue
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                if msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.ERROR):
+                    return
+                continue
+            self.handle_message(json.loads(msg.data))
+
+    def handle_message(self, message: Dict):
+        """解析 futures.tickers 推送"""
+        if message.get('channel') != 'futures.tickers' or message.get('event') != 'update':
+            return
+        for ticker in message.get('result') or []:
+            contract = ticker.get('contract')
+            if not contract:
+                continue
+            last = float(ticker['last']) if ticker.get('last') else None
+            mark_price = float(ticker['mark_price']) if ticker.get('mark_price') else None
+            self.publish(contract, last, mark_price)
+
+    @staticmethod
+    async def _send(ws, channel: str, event: Optional[str] = None, payload: Optional[list] = None):
+        message = {'time': int(time.time()), 'channel': channel}
+        if event:
+            message['event'] = event
+        if payload is not None:
+            message['payload'] = payload
+        await ws.send_str(json.dumps(message))
+
+
+class ReplayFeed(PriceFeed):
+    """回放行情源，用于测试或离线回放
+
+    events 为 (contract, last) 或 (contract, last, mark_price) 序列；
+    interval 为相邻两条行情之间的等待秒数 (0 表示不等待)。
+    """
+
+    def __init__(self, events: Iterable = (), interval: float = 0):
+        super().__init__()
+        self.events = events
+        self.interval = interval
+
+    async def run(self):
+        self.running = True
+        for event in self.events:
+            if not self.running:
+                break
+            self.publish(*event)
+            if self.interval:
+                await asyncio.sleep(self.interval)
+        self.running = False
@@ -1,6 +1,273 @@
+import threading
+from typing import Callable, Dict, List, Optional
+
+from core.notifier import logger
+
+
 class RiskControl:
-    def __init__(self):
-        pass
-    
-    def check_risk(self):
-        return True
+    """组合级风控
+
+    在内存中维护组合状态: 每个合约及每个结算货币的敞口、总保证金占用、未实现盈亏合计、
+    杠杆加权名义价值。价格或单个持仓变化时只减去旧贡献、加上新贡献 (O(1))；
+    持仓快照同步时整体重算一次，消除累计误差。
+
+    任一全局阈值被突破时触发熔断 (kill switch): 之后禁止开仓，只允许减仓，
+    需人工调用 reset() 解除。阈值为 0 表示不限制。
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        config = config or {}
+        # 熔断阈值
+        self.max_drawdown = float(config.get('max_drawdown', 0) or 0)                # 权益自峰值回撤比例 (0.2 = 20%)
+        self.max_margin_ratio = float(config.get('max_margin_ratio', 0) or 0)        # 保证金占用 / 权益
+        self.max_unrealised_loss = float(config.get('max_unrealised_loss', 0) or 0)  # 未实现亏损合计 (结算货币)
+        # 开仓检查
+        self.max_contract_notional = float(config.get('max_contract_notional', 0) or 0)  # 单合约名义价值
+        self.max_total_notional = float(config.get('max_total_notional', 0) or 0)        # 全部合约名义价值
+        # 熔断时是否由引擎平掉全部持仓
+        self.close_on_kill = bool(config.get('close_on_kill', False))
+
+        self._lock = threading.RLock()
+        self._listeners: List[Callable[[str], None]] = []
+        # contract -> 持仓状态及其对汇总值的贡献
+        self.positions: Dict[str, Dict] = {}
+        # settle -> {'long': 多头名义价值, 'short': 空头名义价值}
+        self.settle_exposure: Dict[str, Dict[str, float]] = {}
+        self.total_margin = 0.0
+        self.total_upnl = 0.0
+        self.gross_notional = 0.0
+        self.leveraged_notional = 0.0
+        # 账户余额 (不含未实现盈亏)，未知时不检查回撤和保证金率
+        self.balance: Optional[float] = None
+        self.peak_equity: Optional[float] = None
+        self.killed = False
+        self.kill_reason: Optional[str] = None
+
+    # ============ 状态更新 ============
+    def add_listener(self, callback: Callable[[str], None]):
+        """注册熔断回调 callback(reason)"""
+        self._listeners.append(callback)
+
+    @staticmethod
+    def _compute(entry: Dict, price: float):
+        """按最新价格计算单个持仓的名义价值、未实现盈亏和保证金"""
+        size = entry['size']
+        multiplier = entry['multiplier']
+        entry['price'] = price
+        entry['notional'] = abs(size) * price * multiplier
+        entry['upnl'] = size * multiplier * (price - entry['entry_price'])
+        leverage = entry['leverage']
+        # 逐仓按杠杆估算；全仓 (leverage 为 0) 使用交易所返回的保证金
+        entry['margin'] = entry['notional'] / leverage if leverage > 0 else entry['reported_margin']
+
+    def _apply(self, entry: Dict, sign: int):
+        """把单个持仓的贡献加到 (sign=1) 或移出 (sign=-1) 汇总值"""
+        notional = entry['notional'] * sign
+        self.total_margin += entry['margin'] * sign
+        self.total_upnl += entry['upnl'] * sign
+        self.gross_notional += notional
+        self.leveraged_notional += notional * max(entry['leverage'], 1.0)
+        exposure = self.settle_exposure.setdefault(entry['settle'], {'long': 0.0, 'short': 0.0})
+        exposure['long' if entry['size'] > 0 else 'short'] += notional
+
+    def _entry(self, contract: str, position: Dict, settle: str) -> Dict:
+        size = float(position['size'])
+        price = float(position.get('mark_price') or position.get('entry_price') or 0)
+        value = float(position.get('value') or 0)
+        # 合约乘数由仓位价值反推 (value = |size| * mark_price * multiplier)，缺失时按 1
+        multiplier = value / (abs(size) * price) if value and size and price else 1.0
+        entry = {
+            'contract': contract,
+            'settle': settle,
+            'size': size,
+            'mode': position.get('mode'),
+            'entry_price': float(position.get('entry_price') or 0),
+            'leverage': float(position.get('leverage') or 0),
+            'multiplier': multiplier,
+            'reported_margin': float(position.get('margin') or 0),
+        }
+        self._compute(entry, price)
+        return entry
+
+    def update_position(self, contract: str, position: Optional[Dict], settle: str = 'usdt'):
+        """单个合约持仓变化 (position 为 None 表示已平仓)"""
+        with self._lock:
+            old = self.positions.pop(contract, None)
+            if old is not None:
+                self._apply(old, -1)
+            if position and float(position['size']) != 0:
+                entry = self._entry(contract, position, settle)
+                self.positions[contract] = entry
+                self._apply(entry, 1)
+            reason = self._check()
+        self._trip(reason)
+
+    def sync_positions(self, positions: Dict[str, Dict], settle: str = 'usdt'):
+        """用完整持仓快照 (Exchange.get_positions 的返回值) 替换该结算货币的全部持仓并重算汇总"""
+        with self._lock:
+            for contract in [c for c, e in self.positions.items() if e['settle'] == settle]:
+                del self.positions[contract]
+            for contract, position in positions.items():
+                if float(position['size']) != 0:
+                    self.positions[contract] = self._entry(contract, position, settle)
+            self._recompute()
+            reason = self._check()
+        self._trip(reason)
+
+    def _recompute(self):
+        self.total_margin = self.total_upnl = self.gross_notional = self.leveraged_notional = 0.0
+        self.settle_exposure = {}
+        for entry in self.positions.values():
+            self._apply(entry, 1)
+
+    def on_price(self, contract: str, price: float):
+        """行情更新 (可直接注册为 PriceFeed 监听器)"""
+        with self._lock:
+            entry = self.positions.get(contract)
+            if entry is None or price <= 0:
+                return
+            self._apply(entry, -1)
+            self._compute(entry, price)
+            self._apply(entry, 1)
+            reason = self._check()
+        self._trip(reason)
+
+    def update_account(self, balance: float):
+        """更新账户余额 (不含未实现盈亏)"""
+        with self._lock:
+            self.balance = float(balance)
+            reason = self._check()
+        self._trip(reason)
+
+    # ============ 汇总指标 ============
+    @property
+    def equity(self) -> Optional[float]:
+        if self.balance is None:
+            return None
+        return self.balance + self.total_upnl
+
+    @property
+    def margin_ratio(self) -> float:
+        equity = self.equity
+        if not equity or equity <= 0:
+            return 0.0 if not self.total_margin else float('inf')
+        return self.total_margin / equity
+
+    @property
+    def drawdown(self) -> float:
+        equity = self.equity
+        if equity is None or not self.peak_equity or self.peak_equity <= 0:
+            return 0.0
+        return max(0.0, (self.peak_equity - equity) / self.peak_equity)
+
+    def exposure(self, contract: str) -> float:
+        """单个合约的带方向名义价值 (多为正，空为负)"""
+        entry = self.positions.get(contract)
+        if entry is None:
+            return 0.0
+        return entry['notional'] if entry['size'] > 0 else -entry['notional']
+
+    def snapshot(self) -> Dict:
+        """当前组合状态 (用于日志/监控)"""
+        with self._lock:
+            return {
+                'positions': len(self.positions),
+                'gross_notional': self.gross_notional,
+                'leveraged_notional': self.leveraged_notional,
+                'total_margin': self.total_margin,
+                'total_upnl': self.total_upnl,
+                'equity': self.equity,
+                'margin_ratio': self.margin_ratio,
+                'drawdown': self.drawdown,
+                'settle_exposure': {
+                    s: dict(e, net=e['long'] - e['short'], gross=e['long'] + e['short'])
+                    for s, e in self.settle_exposure.items()
+                },
+                'killed': self.killed,
+                'kill_reason': self.kill_reason,
+            }
+
+    # ============ 熔断 ============
+    def _check(self) -> Optional[str]:
+        """检查全局阈值 (需持有锁)，返回熔断原因"""
+        equity = self.equity
+        if equity is not None and (self.peak_equity is None or equity > self.peak_equity):
+            self.peak_equity = equity
+        if self.killed:
+            return None
+        reason = None
+        if self.max_drawdown and self.drawdown >= self.max_drawdown:
+            reason = f"权益回撤 {self.drawdown * 100:.2f}% 超过上限 {self.max_drawdown * 100:.2f}%"
+        elif self.max_margin_ratio and equity is not None and self.margin_ratio >= self.max_margin_ratio:
+            reason = f"保证金率 {self.margin_ratio * 100:.2f}% 超过上限 {self.max_margin_ratio * 100:.2f}%"
+        elif self.max_unrealised_loss and -self.total_upnl >= self.max_unrealised_loss:
+            reason = f"未实现亏损 {-self.total_upnl:.4f} 超过上限 {self.max_unrealised_loss:.4f}"
+        return reason
+
+    def _trip(self, reason: Optional[str]):
+        # 在锁外触发，回调中可以安全地读取状态或下单
+        if reason:
+            self.kill(reason)
+
+    def kill(self, reason: str):
+        """触发熔断: 禁止开仓，并通知监听者"""
+        with self._lock:
+            if self.killed:
+                return
+            self.killed = True
+            self.kill_reason = reason
+        logger.critical(f"🛑 风控熔断: {reason}")
+        for callback in self._listeners:
+            try:
+                callback(reason)
+            except Exception as e:
+                logger.error(f"熔断回调出错: {e}", exc_info=True)
+
+    def reset(self):
+        """人工解除熔断，并以当前权益重新计算回撤峰值"""
+        with self._lock:
+            self.killed = False
+            self.kill_reason = None
+            self.peak_equity = self.equity
+        logger.warning("风控熔断已解除")
+
+    # ============ 交易前检查 ============
+    def check_open(self, contract: str, size: float, price: float, leverage: float = 0, settle: str = 'usdt',
+                   multiplier: Optional[float] = None) -> bool:
+        """开仓/加仓前检查 (size 带方向)，不通过时记录原因并返回 False"""
+        with self._lock:
+            if self.killed:
+                logger.warning(f"[{contract}] 风控熔断中，禁止开仓: {self.kill_reason}")
+                return False
+            entry = self.positions.get(contract)
+            if multiplier is None:
+                multiplier = entry['multiplier'] if entry else 1.0
+            added = abs(size) * price * multiplier
+            current = entry['size'] if entry else 0.0
+            after = abs(current + size) * price * multiplier
+            if self.max_contract_notional and after > self.max_contract_notional:
+                logger.warning(f"[{contract}] 开仓后名义价值 {after:.2f} 超过单合约上限 {self.max_contract_notional:.2f}")
+                return False
+            if self.max_total_notional and self.gross_notional + added > self.max_total_notional:
+                logger.warning(f"[{contract}] 开仓后总名义价值超过上限 {self.max_total_notional:.2f}")
+                return False
+            equity = self.equity
+            if self.max_margin_ratio and equity:
+                margin = added / leverage if leverage > 0 else added
+                ratio = (self.total_margin + margin) / equity
+                if ratio >= self.max_margin_ratio:
+                    logger.warning(f"[{contract}] 开仓后保证金率 {ratio * 100:.2f}% 超过上限 {self.max_margin_ratio * 100:.2f}%")
+                    return False
+            return True
+
+    def check_close(self, contract: str, size: float) -> bool:
+        """平仓/减仓前检查 (size 为下单数量，带方向)：熔断时也允许，但不能反向开仓"""
+        with self._lock:
+            entry = self.positions.get(contract)
+            if entry is None:
+                # 状态尚未同步时不阻止平仓 (止损优先)
+                return True
+            if entry['size'] * size > 0 or abs(size) > abs(entry['size']):
+                logger.warning(f"[{contract}] 平仓数量 {size} 与持仓 {entry['size']} 不匹配，已拒绝")
+                return False
+            return True
@@ -0,0 +1,55 @@
+"""gate_api 按需导入
+
+gate_api 导入时会加载全部模型 (约 0.3 秒)，入口脚本只在第一次真正调用 API 时才导入。
+本模块不导入日志配置，interactive_bot 可在顶部导入。
+"""
+import sys
+import threading
+
+LIVE_HOST = "https://api.gateio.ws/api/v4"
+
+
+def gate_api():
+    """导入并返回 gate_api 模块"""
+    import gate_api
+    return gate_api
+
+
+def api_errors() -> tuple:
+    """SDK 异常类型，用于 except 子句: gate_api 尚未导入时返回空元组 (SDK 不可能抛出异常)"""
+    module = sys.modules.get('gate_api.exceptions')
+    return (module.ApiException, module.GateApiException) if module is not None else ()
+
+
+def gate_errors() -> tuple:
+    """带 label/message 的交易所业务异常 (GateApiException)"""
+    module = sys.modules.get('gate_api.exceptions')
+    return (module.GateApiException,) if module is not None else ()
+
+
+class LazyFuturesApi:
+    """首次访问属性时才创建 ApiClient/FuturesApi，用法与 gate_api.FuturesApi 相同"""
+
+    def __init__(self, key: str, secret: str, host: str = LIVE_HOST):
+        self._params = {'host': host, 'key': key, 'secret': secret}
+        self._api = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._api is not None
+
+    @property
+    def api_client(self):
+        return self._load().api_client
+
+    def _load(self):
+        if self._api is None:
+            with self._lock:
+                if self._api is None:
+                    sdk = gate_api()
+                    self._api = sdk.FuturesApi(sdk.ApiClient(sdk.Configuration(**self._params)))
+        return self._api
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class SnapshotCache:
+    """短时快照缓存 (持仓、账户、行情)
+
+    TTL 内的读取共用同一次请求结果；缓存过期时并发调用方等待同一个在途请求。
+    下单后调用 invalidate()，之后的读取一定会重新请求。loader 返回 None 或抛出异常时不缓存。
+    """
+
+    def __init__(self, ttl: float = 1.0):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> (过期时间, 值)
+        self._entries: Dict[Hashable, tuple] = {}
+        self._inflight: Dict[Hashable, Future] = {}
+        self._inflight_async: Dict[Hashable, asyncio.Future] = {}
+        # invalidate 时递增，之前发出的请求结果不再写入缓存
+        self._generation = 0
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """返回未过期的缓存值，不触发请求"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+        return None
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """清除指定 key (默认全部) 的缓存"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+                self._inflight.clear()
+                self._inflight_async.clear()
+            else:
+                self._entries.pop(key, None)
+                self._inflight.pop(key, None)
+                self._inflight_async.pop(key, None)
+
+    def _lookup(self, key: Hashable, inflight: Dict, make_future: Callable):
+        """返回 (缓存值, 在途请求, 是否由本调用发起, 代数)，需要请求时登记新的在途请求"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1], None, False, self._generation
+            future = inflight.get(key)
+            if future is not None:
+                self.hits += 1
+                return None, future, False, self._generation
+            self.misses += 1
+            inflight[key] = make_future()
+            return None, inflight[key], True, self._generation
+
+    def _store(self, key: Hashable, value, generation: int, inflight: Dict, future):
+        with self._lock:
+            if inflight.get(key) is future:
+                del inflight[key]
+            if value is not None and self.ttl > 0 and generation == self._generation:
+                self._entries[key] = (time.monotonic() + self.ttl, value)
+
+    def get(self, key: Hashable, loader: Callable[[], Any]):
+        """读取快照，过期时调用 loader() 获取"""
+        value, future, leader, generation = self._lookup(key, self._inflight, Future)
+        if not leader:
+            return value if future is None else future.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            self._store(key, None, generation, self._inflight, future)
+            future.set_exception(e)
+            raise
+        self._store(key, value, generation, self._inflight, future)
+        future.set_result(value)
+        return value
+
+    async def get_async(self, key: Hashable, loader: Callable[[], Any]):
+        """get 的异步版本，loader 为协程函数"""
+        value, future, leader, generation = self._lookup(
+            key, self._inflight_async, asyncio.get_running_loop().create_future)
+        if not leader:
+            return value if future is None else await asyncio.shield(future)
+        try:
+            value = await loader()
+        except BaseException as e:
+            self._store(key, None, generation, self._inflight_async, future)
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                # 没有其他等待者时避免 "exception was never retrieved" 警告
+                future.exception()
+            raise
+        self._store(key, value, generation, self._inflight_async, future)
+        future.set_result(value)
+        return value
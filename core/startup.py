@@ -0,0 +1,130 @@
+"""启动耗时统计
+
+入口脚本最先导入本模块，之后按阶段调用 startup.mark()，第一轮执行完后调用 startup.report()
+输出一行各阶段耗时。设置环境变量 QQQROBOT_IMPORT_PROFILE=1 时还会记录每个模块的导入耗时
+(与 python -X importtime 相同的自身/累计口径)，报告中按顶层包汇总列出最慢的几个。
+
+本模块不导入日志配置，report() 使用调用方传入的 logger。
+"""
+import os
+import sys
+import time
+from importlib.abc import MetaPathFinder
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_ENV = "QQQROBOT_IMPORT_PROFILE"
+
+
+class _TimedLoader:
+    """包装模块加载器，记录 exec_module 耗时；执行前把模块的 loader 还原为原加载器"""
+
+    def __init__(self, loader, profiler: 'ImportProfiler'):
+        self.loader = loader
+        self.profiler = profiler
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        self.profiler.enter()
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.profiler.leave(module.__name__, time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+
+class ImportProfiler(MetaPathFinder):
+    """记录每个模块的导入耗时: 模块名 -> (自身耗时, 累计耗时)，单位秒"""
+
+    def __init__(self):
+        self.records: Dict[str, Tuple[float, float]] = {}
+        # 正在导入的模块中，已完成的子模块导入耗时之和
+        self._children: List[float] = []
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def enter(self):
+        self._children.append(0.0)
+
+    def leave(self, name: str, elapsed: float):
+        children = self._children.pop()
+        self.records[name] = (elapsed - children, elapsed)
+        if self._children:
+            self._children[-1] += elapsed
+
+    def by_package(self) -> List[Tuple[str, float, int]]:
+        """按顶层包汇总自身耗时: [(包名, 耗时, 模块数)]，耗时降序"""
+        totals: Dict[str, List] = {}
+        for name, (own, _) in self.records.items():
+            entry = totals.setdefault(name.partition('.')[0], [0.0, 0])
+            entry[0] += own
+            entry[1] += 1
+        return sorted(((name, t, n) for name, (t, n) in totals.items()), key=lambda x: -x[1])
+
+
+class StartupTimer:
+    """启动各阶段耗时 (从导入本模块开始计时)"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self._last = self.start
+        self.phases: List[Tuple[str, float]] = []
+        self.reported = False
+        self.profiler: Optional[ImportProfiler] = None
+        if os.environ.get(PROFILE_ENV, '').lower() in ('1', 'true', 'yes'):
+            self.profiler = ImportProfiler()
+            self.profiler.install()
+
+    def mark(self, phase: str):
+        """记录从上一个阶段结束到现在的耗时"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def summary(self, top: int = 8) -> str:
+        parts = ' | '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases)
+        text = f"启动耗时 {self.elapsed() * 1000:.0f}ms: {parts}"
+        if self.profiler is not None:
+            slowest = ', '.join(f"{name} {seconds * 1000:.0f}ms/{count}个模块"
+                                for name, seconds, count in self.profiler.by_package()[:top])
+            text += f"\n导入耗时 (按顶层包): {slowest}"
+        return text
+
+    def report(self, logger):
+        """首次调用时输出启动耗时并停止导入计时，之后调用无效"""
+        if self.reported:
+            return
+        self.reported = True
+        if self.profiler is not None:
+            self.profiler.uninstall()
+        logger.info(self.summary())
+
+
+startup = StartupTimer()
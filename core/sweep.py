@@ -0,0 +1,161 @@
+"""ATR 止损/止盈参数扫描
+
+参数组合 (atr_k, take_profit_pct, period, interval) 分发到进程池并行回测。
+K线数据先写入临时目录的 .npy 文件，各进程以 mmap 只读方式打开，
+共享同一份页缓存，任务只传递参数而不序列化K线数组。
+"""
+import itertools
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from core.backtest import atr_before, simulate_atr_stop, summarize
+from core.candles import Candles
+from core.exchange import INTERVAL_SECONDS
+from core.notifier import logger
+
+COLUMNS = ('time', 'open', 'high', 'low', 'close', 'volume')
+
+# 工作进程内的共享数据 (由 _init_worker 设置)
+_worker = {}
+
+
+def grid(atr_k: Iterable[float], take_profit_pct: Iterable[float], period: Iterable[int] = (14,),
+         interval: Iterable[str] = ('1h',)) -> List[Dict]:
+    """网格搜索的全部参数组合"""
+    return [
+        {'atr_k': k, 'take_profit_pct': tp, 'period': p, 'interval': i}
+        for k, tp, p, i in itertools.product(atr_k, take_profit_pct, period, interval)
+    ]
+
+
+def random_search(n: int, atr_k: tuple = (0.5, 5.0), take_profit_pct: tuple = (1.0, 20.0),
+                  period: Iterable[int] = (7, 14, 21, 28), interval: Iterable[str] = ('15m', '1h', '4h'),
+                  seed: Optional[int] = None, base_interval: str = '1m') -> List[Dict]:
+    """随机搜索: atr_k/take_profit_pct 在区间内均匀采样，period/interval 从候选中选取
+
+    比回测K线周期 base_interval 更小的 interval 无法由回测K线聚合，不参与选取 (全部更小时使用 base_interval)。
+    """
+    rng = random.Random(seed)
+    period = list(period)
+    interval = [i for i in interval if INTERVAL_SECONDS[i] >= INTERVAL_SECONDS[base_interval]] or [base_interval]
+    return [
+        {
+            'atr_k': round(rng.uniform(*atr_k), 3),
+            'take_profit_pct': round(rng.uniform(*take_profit_pct), 3),
+            'period': rng.choice(period),
+            'interval': rng.choice(interval),
+        }
+        for _ in range(n)
+    ]
+
+
+def drop_finer_intervals(params: List[Dict], base_interval: str) -> List[Dict]:
+    """去掉 ATR K线周期小于回测K线周期的参数组合 (无法由回测K线聚合)"""
+    base_sec = INTERVAL_SECONDS[base_interval]
+    kept = [p for p in params if INTERVAL_SECONDS[p['interval']] >= base_sec]
+    if len(kept) < len(params):
+        dropped = sorted({p['interval'] for p in params if INTERVAL_SECONDS[p['interval']] < base_sec})
+        logger.warning(f"ATR K线周期 {dropped} 小于回测K线周期 {base_interval}，已跳过 {len(params) - len(kept)} 组参数")
+    return kept
+
+
+def share_candles(candles: Dict[str, Candles], directory) -> Dict:
+    """把所有合约的K线按列拼接写入 directory，返回供工作进程打开的清单"""
+    directory = Path(directory)
+    offsets = {}
+    start = 0
+    for contract, c in candles.items():
+        offsets[contract] = (start, start + len(c))
+        start += len(c)
+    for column in COLUMNS:
+        data = np.concatenate([getattr(c, column) for c in candles.values()]) if candles else np.empty(0)
+        np.save(directory / f"{column}.npy", data)
+    return {'directory': str(directory), 'offsets': offsets}
+
+
+def open_shared(manifest: Dict) -> Dict[str, Candles]:
+    """以 mmap 方式打开共享K线，返回的 Candles 各列都是映射文件上的视图"""
+    directory = Path(manifest['directory'])
+    columns = {k: np.load(directory / f"{k}.npy", mmap_mode='r') for k in COLUMNS}
+    return {
+        contract: Candles(*(columns[k][start:end] for k in COLUMNS))
+        for contract, (start, end) in manifest['offsets'].items()
+    }
+
+
+def _init_worker(manifest: Dict, base_interval: str, fee_rate: float):
+    _worker['candles'] = open_shared(manifest)
+    _worker['interval'] = base_interval
+    _worker['fee_rate'] = fee_rate
+    _worker['atr_key'] = None
+    _worker['atr'] = {}
+
+
+def _worker_atr(period: int, interval: str) -> Dict[str, np.ndarray]:
+    """同一进程内连续任务的 (period, interval) 相同时复用 ATR，只保留最近一组以限制内存"""
+    key = (period, interval)
+    if _worker['atr_key'] != key:
+        base_sec = INTERVAL_SECONDS[_worker['interval']]
+        _worker['atr'] = {
+            contract: atr_before(c, base_sec, INTERVAL_SECONDS[interval], period)
+            for contract, c in _worker['candles'].items()
+        }
+        _worker['atr_key'] = key
+    return _worker['atr']
+
+
+def evaluate(params: Dict) -> Dict:
+    """在工作进程中回测一组参数，返回不含成交明细的汇总"""
+    started = time.perf_counter()
+    atr = _worker_atr(params['period'], params['interval'])
+    fills = []
+    for contract, candles in _worker['candles'].items():
+        fills.extend(simulate_atr_stop(
+            contract, candles, atr_k=params['atr_k'], take_profit_pct=params['take_profit_pct'],
+            period=params['period'], interval=_worker['interval'], atr_interval=params['interval'],
+            fee_rate=_worker['fee_rate'], atr_prev=atr[contract],
+        ))
+    report = summarize(fills, time.perf_counter() - started)
+    del report['fills'], report['candles'], report['candles_per_sec']
+    return dict(params, **report)
+
+
+def run_sweep(candles: Dict[str, Candles], params: List[Dict], base_interval: str = '1m', fee_rate: float = 0.0005,
+              workers: Optional[int] = None, sort_by: str = 'pnl') -> List[Dict]:
+    """并行执行参数扫描，返回按 sort_by 降序排列的结果"""
+    # 相同 (period, interval) 的任务相邻，便于工作进程复用 ATR
+    ordered = sorted(drop_finer_intervals(params, base_interval), key=lambda p: (p['period'], p['interval']))
+    if not ordered:
+        return []
+    tmpdir = tempfile.mkdtemp(prefix='qqqrobot_sweep_')
+    started = time.perf_counter()
+    try:
+        manifest = share_candles(candles, tmpdir)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(manifest, base_interval, fee_rate)) as pool:
+            chunksize = max(1, len(ordered) // ((workers or os.cpu_count() or 1) * 4))
+            results = list(pool.map(evaluate, ordered, chunksize=chunksize))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    logger.info(f"参数扫描完成: {len(results)} 组参数，耗时 {time.perf_counter() - started:.2f}s")
+    return sorted(results, key=lambda r: r[sort_by], reverse=True)
+
+
+def format_table(results: List[Dict], top: int = 20) -> str:
+    """把扫描结果格式化为表格"""
+    header = f"{'排名':<4} {'ATR_K':>6} {'止盈%':>7} {'周期':>4} {'K线':>4} {'笔数':>7} {'总盈亏':>12} {'胜率':>7} {'最大回撤':>12}"
+    lines = [header, "-" * 100]
+    for rank, r in enumerate(results[:top], 1):
+        lines.append(
+            f"{rank:<6} {r['atr_k']:>6.2f} {r['take_profit_pct']:>8.2f} {r['period']:>6} {r['interval']:>5} "
+            f"{r['trades']:>8} {r['pnl']:>13.4f} {r['win_rate'] * 100:>7.2f}% {r['max_drawdown']:>13.4f}"
+        )
+    return "\n".join(lines)
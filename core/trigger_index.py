@@ -0,0 +1,120 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from typing import Dict, List, Optional
+
+# 下穿触发: 价格 <= level 时触发 (多仓止损、空仓止盈)
+FALLING = 'falling'
+# 上穿触发: 价格 >= level 时触发 (多仓止盈、空仓止损)
+RISING = 'rising'
+
+Trigger = namedtuple('Trigger', ['id', 'contract', 'direction', 'level', 'data'])
+
+
+class _SortedLevels:
+    """按价格排序的触发价列表，levels 与 ids 下标一一对应"""
+
+    __slots__ = ('levels', 'ids')
+
+    def __init__(self):
+        self.levels: List[float] = []
+        self.ids: List[str] = []
+
+    def add(self, level: float, trigger_id: str):
+        i = bisect_right(self.levels, level)
+        self.levels.insert(i, level)
+        self.ids.insert(i, trigger_id)
+
+    def remove(self, level: float, trigger_id: str):
+        i = bisect_left(self.levels, level)
+        while self.ids[i] != trigger_id:
+            i += 1
+        del self.levels[i]
+        del self.ids[i]
+
+    def __len__(self):
+        return len(self.levels)
+
+
+class TriggerIndex:
+    """按合约分组的止损/止盈触发价索引
+
+    每个合约分别维护下穿 (FALLING) 和上穿 (RISING) 两个有序列表，
+    价格更新时二分定位被穿越的区间，只返回触发的价位: O(log n + k)。
+    增删改单个价位为 O(log n) 查找加一次列表内存移动。
+    """
+
+    def __init__(self):
+        # contract -> {FALLING: _SortedLevels, RISING: _SortedLevels}
+        self._books: Dict[str, Dict[str, _SortedLevels]] = {}
+        # trigger_id -> Trigger
+        self._triggers: Dict[str, Trigger] = {}
+
+    def __len__(self):
+        return len(self._triggers)
+
+    def __contains__(self, trigger_id: str):
+        return trigger_id in self._triggers
+
+    def get(self, trigger_id: str) -> Optional[Trigger]:
+        return self._triggers.get(trigger_id)
+
+    def _book(self, contract: str, direction: str) -> _SortedLevels:
+        books = self._books.get(contract)
+        if books is None:
+            books = self._books[contract] = {FALLING: _SortedLevels(), RISING: _SortedLevels()}
+        return books[direction]
+
+    def set(self, trigger_id: str, contract: str, level: float, direction: str, data=None) -> Trigger:
+        """新增或移动触发价 (同 id 已存在时先移除旧价位)"""
+        if direction not in (FALLING, RISING):
+            raise ValueError(f"未知的触发方向: {direction}")
+        old = self._triggers.get(trigger_id)
+        if old is not None:
+            if old.contract == contract and old.direction == direction and old.level == level:
+                if old.data != data:
+                    self._triggers[trigger_id] = old._replace(data=data)
+                return self._triggers[trigger_id]
+            self.remove(trigger_id)
+        trigger = Trigger(trigger_id, contract, direction, level, data)
+        self._book(contract, direction).add(level, trigger_id)
+        self._triggers[trigger_id] = trigger
+        return trigger
+
+    def remove(self, trigger_id: str) -> bool:
+        trigger = self._triggers.pop(trigger_id, None)
+        if trigger is None:
+            return False
+        self._book(trigger.contract, trigger.direction).remove(trigger.level, trigger_id)
+        return True
+
+    def remove_contract(self, contract: str):
+        """移除某合约的全部触发价"""
+        books = self._books.pop(contract, None)
+        if books is None:
+            return
+        for book in books.values():
+            for trigger_id in book.ids:
+                self._triggers.pop(trigger_id, None)
+
+    def crossed(self, contract: str, price: float, pop: bool = True) -> List[Trigger]:
+        """返回在该价格下被穿越的触发价 (pop=True 时同时从索引中移除)"""
+        books = self._books.get(contract)
+        if books is None:
+            return []
+
+        falling = books[FALLING]
+        rising = books[RISING]
+        # 下穿: level >= price 的部分位于列表尾部；上穿: level <= price 的部分位于列表头部
+        f_start = bisect_left(falling.levels, price)
+        r_end = bisect_right(rising.levels, price)
+        ids = falling.ids[f_start:][::-1] + rising.ids[:r_end]
+        if not ids:
+            return []
+
+        fired = [self._triggers[trigger_id] for trigger_id in ids]
+        if pop:
+            del falling.levels[f_start:], falling.ids[f_start:]
+            del rising.levels[:r_end], rising.ids[:r_end]
+            for trigger_id in ids:
+                del self._triggers[trigger_id]
+        return fired
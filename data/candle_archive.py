@@ -0,0 +1,238 @@
+"""本地K线归档
+
+每个 (合约, 周期) 一个定长记录的二进制文件 data/archive/{settle}/{contract}_{interval}.bin，
+只保存已收盘K线，按时间追加写入。读取通过 np.memmap 映射文件，多个进程共享同一份页缓存，
+只有请求的时间范围会被复制为 Candles。
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from core.candles import Candles, RECORD_DTYPE
+from core.exchange import INTERVAL_SECONDS
+from core.notifier import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent / "archive"
+
+# 交易所单次K线请求最多返回的数量
+MAX_POINTS = 2000
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """跨进程互斥写入同一个归档文件"""
+    with open(path.with_suffix('.lock'), 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CandleArchive:
+    """已收盘K线的本地归档，get_candlesticks 优先从这里读取，只向交易所请求缺失部分"""
+
+    def __init__(self, root=None, settle: str = 'usdt'):
+        self.root = Path(root) if root else DEFAULT_ARCHIVE_DIR
+        self.settle = settle
+        self.directory = self.root / settle
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # path -> (文件大小, memmap)，文件被追加或替换后重新映射
+        self._maps: Dict[Path, Tuple[int, np.ndarray]] = {}
+        # (contract, interval) -> 已确认交易所没有更早数据的时间点，避免重复回补
+        self._head: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def path(self, contract: str, interval: str) -> Path:
+        return self.directory / f"{contract}_{interval}.bin"
+
+    @staticmethod
+    def supports(interval: str) -> bool:
+        return interval in INTERVAL_SECONDS
+
+    def contracts(self, interval: str) -> List[str]:
+        """归档中有该周期K线的合约"""
+        suffix = f"_{interval}.bin"
+        return sorted(p.name[:-len(suffix)] for p in self.directory.glob(f"*{suffix}"))
+
+    # ============ 读取 ============
+    def records(self, contract: str, interval: str) -> np.ndarray:
+        """返回整个归档文件的只读 mmap 视图 (RECORD_DTYPE)"""
+        path = self.path(contract, interval)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        count = size // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        with self._lock:
+            cached = self._maps.get(path)
+            if cached is None or cached[0] != size:
+                cached = (size, np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,)))
+                self._maps[path] = cached
+        return cached[1]
+
+    def bounds(self, contract: str, interval: str) -> Tuple[Optional[int], Optional[int]]:
+        """归档中第一根和最后一根K线的开盘时间"""
+        records = self.records(contract, interval)
+        if len(records) == 0:
+            return None, None
+        return int(records['time'][0]), int(records['time'][-1])
+
+    def read(self, contract: str, interval: str, start: Optional[int] = None, end: Optional[int] = None) -> Candles:
+        """读取 [start, end] 时间范围内的归档K线"""
+        records = self.records(contract, interval)
+        times = records['time']
+        lo = int(np.searchsorted(times, start, side='left')) if start is not None else 0
+        hi = int(np.searchsorted(times, end, side='right')) if end is not None else len(records)
+        return Candles.from_records(records[lo:hi])
+
+    def load_all(self, interval: str, contracts: Optional[List[str]] = None) -> Dict[str, Candles]:
+        """读取全部 (或指定) 合约的完整归档，供回测使用"""
+        return {c: self.read(c, interval) for c in (contracts or self.contracts(interval))}
+
+    # ============ 写入 ============
+    def store(self, contract: str, interval: str, candles: Candles, now: Optional[float] = None) -> int:
+        """写入已收盘K线 (未收盘的会被忽略)，返回新增数量
+
+        新K线都晚于归档末尾时直接追加；需要回补更早或中间的数据时合并后整体替换文件。
+        """
+        interval_sec = INTERVAL_SECONDS[interval]
+        now = time.time() if now is None else now
+        candles = candles[:int(np.searchsorted(candles.time, now - interval_sec, side='right'))]
+        if len(candles) == 0:
+            return 0
+
+        path = self.path(contract, interval)
+        with _file_lock(path):
+            _, last = self.bounds(contract, interval)
+            if last is None or candles.time[0] > last:
+                with open(path, 'ab') as f:
+                    candles.to_records().tofile(f)
+                return len(candles)
+            return self._merge(contract, interval, candles)
+
+    def _merge(self, contract: str, interval: str, candles: Candles) -> int:
+        path = self.path(contract, interval)
+        existing = np.array(self.records(contract, interval))
+        merged = np.concatenate([existing, candles.to_records()])
+        # 同一时间戳保留已有记录 (stable 排序下靠前)
+        merged = merged[np.argsort(merged['time'], kind='stable')]
+        keep = np.r_[True, merged['time'][1:] != merged['time'][:-1]]
+        merged = merged[keep]
+        added = len(merged) - len(existing)
+        if added == 0:
+            return 0
+
+        tmp = path.with_suffix('.tmp')
+        merged.tofile(tmp)
+        with self._lock:
+            self._maps.pop(path, None)
+        try:
+            os.replace(tmp, path)
+        except OSError as e:
+            # Windows 下其他进程仍映射着旧文件时无法替换，下次再回补
+            logger.warning(f"K线归档替换失败 {path.name}: {e}")
+            tmp.unlink(missing_ok=True)
+            return 0
+        return added
+
+    # ============ 读取 + 增量拉取 ============
+    def missing(self, contract: str, interval: str, limit: int = 200, start: Optional[int] = None,
+                now: Optional[float] = None) -> Tuple[int, List[Tuple[int, int]]]:
+        """计算请求需要的起始时间和需向交易所拉取的 (from, to) 区间 (每段不超过 MAX_POINTS 根)
+
+        末尾始终包含到当前未收盘K线为止的一段，归档已是最新时只拉取最后一根。
+        """
+        interval_sec = INTERVAL_SECONDS[interval]
+        now = time.time() if now is None else now
+        current = int(now // interval_sec * interval_sec)
+        if start is not None:
+            want = -(-int(start) // interval_sec) * interval_sec
+        else:
+            want = current - (limit - 1) * interval_sec
+
+        first, last = self.bounds(contract, interval)
+        if first is None:
+            return want, self._chunks(want, current, interval_sec)
+
+        ranges = []
+        head = min(first, self._head.get((contract, interval), first))
+        if want < head:
+            ranges += self._chunks(want, first - interval_sec, interval_sec)
+        ranges += self._chunks(max(last + interval_sec, want), current, interval_sec)
+        return want, ranges
+
+    @staticmethod
+    def _chunks(start: int, end: int, interval_sec: int) -> List[Tuple[int, int]]:
+        step = (MAX_POINTS - 1) * interval_sec
+        return [(t, min(end, t + step)) for t in range(start, end + 1, step + interval_sec)]
+
+    def _finish(self, contract: str, interval: str, want: int, ranges: List[Tuple[int, int]],
+                fetched: List[Candles], now: float) -> Candles:
+        """写入拉取结果，返回 want 之后的归档K线 + 当前未收盘K线"""
+        first, _ = self.bounds(contract, interval)
+        for candles in fetched:
+            self.store(contract, interval, candles, now)
+        new_first, last = self.bounds(contract, interval)
+        if ranges and first is not None and ranges[0][0] < first:
+            # 已回补到交易所最早的数据
+            self._head[(contract, interval)] = want if new_first is None else min(want, new_first)
+        closed = self.read(contract, interval, start=want)
+        tail = fetched[-1] if fetched else Candles.empty()
+        if last is not None:
+            tail = tail[int(np.searchsorted(tail.time, last, side='right')):]
+        return Candles.concat([closed, tail])
+
+    def serve(self, contract: str, interval: str, fetch: Callable[[int, int], Candles], limit: int = 200,
+              start: Optional[int] = None, now: Optional[float] = None) -> Candles:
+        """按 get_candlesticks 的语义返回K线 (limit 根或 start 之后全部)
+
+        fetch(from, to) 向交易所请求一段K线，失败时应抛出异常 (已拉取的部分仍会写入归档)。
+        """
+        now = time.time() if now is None else now
+        want, ranges = self.missing(contract, interval, limit, start, now)
+        fetched = []
+        try:
+            for begin, end in ranges:
+                fetched.append(fetch(begin, end))
+        finally:
+            if len(fetched) < len(ranges):
+                for candles in fetched:
+                    self.store(contract, interval, candles, now)
+        return self._finish(contract, interval, want, ranges, fetched, now)
+
+    async def serve_async(self, contract: str, interval: str, fetch, limit: int = 200,
+                          start: Optional[int] = None, now: Optional[float] = None) -> Candles:
+        """serve 的异步版本，fetch 为协程函数"""
+        now = time.time() if now is None else now
+        want, ranges = self.missing(contract, interval, limit, start, now)
+        fetched = []
+        try:
+            for begin, end in ranges:
+                fetched.append(await fetch(begin, end))
+        finally:
+            if len(fetched) < len(ranges):
+                for candles in fetched:
+                    self.store(contract, interval, candles, now)
+        return self._finish(contract, interval, want, ranges, fetched, now)
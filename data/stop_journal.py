@@ -0,0 +1,135 @@
+"""移动止损状态日志
+
+每次止损价或高低水位变化只向 data/trailing_stops.journal 追加一行 JSON (不 fsync)，
+启动时按顺序重放得到最新状态。追加行数超过 compact_every 时把当前状态整体写入临时文件
+并原子替换，日志大小始终与持仓数量同一量级。
+
+同一文件在进程内只能有一个 StopJournal 写入: 策略通过 open_journal() 获取，路径相同时共用同一个对象
+(引用计数)，配置热更新重建策略时新实例直接接管旧实例的日志，旧实例关闭时不会替换掉新实例正在写入的文件。
+"""
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+
+from core.notifier import logger
+
+DEFAULT_JOURNAL_PATH = Path(__file__).parent / "trailing_stops.journal"
+
+
+def journal_path(path=None) -> Path:
+    """日志文件的绝对路径 (未指定时为默认路径)"""
+    return (Path(path) if path else DEFAULT_JOURNAL_PATH).resolve()
+
+
+class StopJournal:
+    """contract -> 状态字典 的追加式持久化"""
+
+    def __init__(self, path=None, compact_every: int = 1000):
+        self.path = journal_path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        # open_journal() 共用时的持有者数量，最后一个持有者 close() 时才真正关闭
+        self._refs = 1
+        self.state: Dict[str, Dict] = self._replay()
+        # 从上次压缩以来追加的行数
+        self._appended = 0
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def _replay(self) -> Dict[str, Dict]:
+        state = {}
+        if not self.path.exists():
+            return state
+        with open(self.path, 'rb+') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                # 进程中断时最后一行可能不完整: 截断到最后一个换行，之后的追加从新行开始
+                logger.warning(f"止损日志最后一行不完整，已忽略: {data[end:end + 80]!r}")
+                f.truncate(end)
+        for line in data[:end].decode('utf-8', errors='replace').splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            contract = record.pop('contract', None) if isinstance(record, dict) else None
+            if contract is None:
+                logger.warning(f"止损日志存在损坏的记录，已忽略: {line[:80]!r}")
+                continue
+            if record.get('deleted'):
+                state.pop(contract, None)
+            else:
+                state[contract] = record
+        return state
+
+    def get(self, contract: str) -> Optional[Dict]:
+        return self.state.get(contract)
+
+    def put(self, contract: str, record: Dict):
+        """记录合约的最新状态"""
+        with self._lock:
+            self.state[contract] = dict(record)
+            self._append(dict(record, contract=contract))
+
+    def delete(self, contract: str):
+        with self._lock:
+            if self.state.pop(contract, None) is not None:
+                self._append({'contract': contract, 'deleted': True})
+
+    def _append(self, record: Dict):
+        self._file.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self._file.flush()
+        self._appended += 1
+        if self._appended >= self.compact_every:
+            self._compact()
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        """用当前状态重写日志 (临时文件 + 原子替换)"""
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for contract, record in self.state.items():
+                f.write(json.dumps(dict(record, contract=contract), separators=(',', ':')) + '\n')
+        self._file.close()
+        try:
+            os.replace(tmp, self.path)
+        except OSError as e:
+            logger.warning(f"止损日志压缩失败: {e}")
+            tmp.unlink(missing_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._appended = 0
+
+    def close(self):
+        with _open_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            if _open_journals.get(self.path) is self:
+                del _open_journals[self.path]
+        with self._lock:
+            self._compact()
+            self._file.close()
+
+
+# 已打开的日志: 绝对路径 -> StopJournal
+_open_journals: Dict[Path, StopJournal] = {}
+_open_lock = threading.Lock()
+
+
+def open_journal(path=None, compact_every: int = 1000) -> StopJournal:
+    """打开状态日志，该路径已打开时返回同一个对象 (引用计数加一，compact_every 取新值)"""
+    path = journal_path(path)
+    with _open_lock:
+        journal = _open_journals.get(path)
+        if journal is None:
+            journal = StopJournal(path, compact_every)
+            _open_journals[path] = journal
+        else:
+            journal._refs += 1
+            journal.compact_every = compact_every
+        return journal
@@ -1,6 +1,245 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.notifier import logger
+
+DEFAULT_DB_PATH = Path(__file__).parent / "qqqrobot.db"
+# 过期持仓快照的清理间隔 (秒)
+PRUNE_INTERVAL = 3600
+
+# 表名 -> 列 (除自增 id 外)，所有表都有 time (unix 秒) 和 contract 列
+TABLES = {
+    'trades': ('time', 'contract', 'side', 'size', 'price', 'pnl', 'fee', 'order_id', 'reason', 'extra'),
+    'orders': ('time', 'contract', 'size', 'price', 'tif', 'reduce_only', 'order_id', 'status', 'success',
+               'error', 'extra'),
+    'positions': ('time', 'contract', 'size', 'entry_price', 'mark_price', 'unrealised_pnl', 'leverage', 'mode'),
+    'triggers': ('time', 'contract', 'strategy', 'rule', 'price', 'level', 'reason'),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, contract TEXT NOT NULL, side TEXT, size REAL,
+    price REAL, pnl REAL, fee REAL, order_id TEXT, reason TEXT, extra TEXT
+);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, contract TEXT NOT NULL, size REAL, price TEXT,
+    tif TEXT, reduce_only INTEGER, order_id TEXT, status TEXT, success INTEGER, error TEXT, extra TEXT
+);
+CREATE TABLE IF NOT EXISTS positions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, contract TEXT NOT NULL, size REAL,
+    entry_price REAL, mark_price REAL, unrealised_pnl REAL, leverage REAL, mode TEXT
+);
+CREATE TABLE IF NOT EXISTS triggers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, time REAL NOT NULL, contract TEXT NOT NULL, strategy TEXT,
+    rule TEXT, price REAL, level REAL, reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trades_contract_time ON trades (contract, time);
+CREATE INDEX IF NOT EXISTS idx_trades_time ON trades (time);
+CREATE INDEX IF NOT EXISTS idx_orders_contract_time ON orders (contract, time);
+CREATE INDEX IF NOT EXISTS idx_orders_time ON orders (time);
+CREATE INDEX IF NOT EXISTS idx_positions_contract_time ON positions (contract, time);
+CREATE INDEX IF NOT EXISTS idx_positions_time ON positions (time);
+CREATE INDEX IF NOT EXISTS idx_triggers_contract_time ON triggers (contract, time);
+CREATE INDEX IF NOT EXISTS idx_triggers_time ON triggers (time);
+"""
+
+
 class Storage:
-    def __init__(self):
-        pass
-    
-    def save_trade(self, trade_data):
-        pass
+    """交易数据持久化 (SQLite WAL)
+
+    save_* 方法只把记录放入内存队列立即返回，由后台线程批量写入；
+    队列满时丢弃记录并告警，保证交易主循环不会因磁盘阻塞。
+    持仓快照只在持仓变化 (数量/入场价/杠杆/模式) 或距上次完整快照超过 position_interval 秒时写入，
+    后台线程每小时删除超过 position_retention_days 天的持仓快照 (0 表示不删除)。
+    查询方法使用独立的只读连接，可与写入并发。
+    """
+
+    def __init__(self, db_path=None, batch_size: int = 500, flush_interval: float = 1.0,
+                 max_queue: int = 100000, position_interval: float = 300, position_retention_days: float = 30):
+        self.db_path = Path(db_path) if db_path else DEFAULT_DB_PATH
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.position_interval = position_interval
+        self.position_retention = position_retention_days * 86400
+        self.dropped = 0
+        # 上次写入的持仓 (contract -> 比较用的字段) 和上次完整快照时间
+        self._last_positions: Dict[str, tuple] = {}
+        self._last_snapshot = 0.0
+        self._positions_lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+
+        conn = sqlite3.connect(str(self.db_path))
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="StorageWriter", daemon=True)
+        self._writer.start()
+
+    # ============ 写入 ============
+    def _put(self, table: str, row: Dict):
+        row.setdefault('time', time.time())
+        if isinstance(row.get('extra'), (dict, list)):
+            row['extra'] = json.dumps(row['extra'], ensure_ascii=False, default=str)
+        try:
+            self._queue.put_nowait((table, tuple(row.get(col) for col in TABLES[table])))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"存储队列已满，已丢弃 {self.dropped} 条记录")
+
+    def save_trade(self, trade_data: Dict):
+        """成交记录: contract, side, size, price, pnl, fee, order_id, reason, extra"""
+        self._put('trades', dict(trade_data))
+
+    def save_order(self, order_data: Dict):
+        """下单结果: contract, size, price, tif, reduce_only, order_id, status, success, error, extra"""
+        self._put('orders', dict(order_data))
+
+    def save_positions(self, positions: Dict[str, Dict], snapshot_time: Optional[float] = None):
+        """持仓快照 (contract -> position，与 Exchange.get_positions 返回格式一致)
+
+        只写入变化的持仓 (已平仓的合约写入一条 size 为 0 的记录)，每隔 position_interval 秒写入一次完整快照。
+        """
+        snapshot_time = snapshot_time or time.time()
+        with self._positions_lock:
+            full = snapshot_time - self._last_snapshot >= self.position_interval
+            if full:
+                self._last_snapshot = snapshot_time
+            current = {}
+            for contract, pos in positions.items():
+                key = (pos.get('size'), pos.get('entry_price'), pos.get('leverage'), pos.get('mode'))
+                current[contract] = key
+                if full or self._last_positions.get(contract) != key:
+                    self._put('positions', dict(pos, contract=contract, time=snapshot_time))
+            for contract in self._last_positions.keys() - current.keys():
+                self._put('positions', {'contract': contract, 'size': 0, 'time': snapshot_time})
+            self._last_positions = current
+
+    def save_trigger(self, trigger_data: Dict):
+        """触发的止损/止盈规则: contract, strategy, rule, price, level, reason"""
+        self._put('triggers', dict(trigger_data))
+
+    def _write_loop(self):
+        conn = sqlite3.connect(str(self.db_path))
+        conn.execute("PRAGMA synchronous=NORMAL")
+        pending: Dict[str, List[tuple]] = {}
+        count = 0
+        waiters = []
+        stop = False
+        last_flush = time.monotonic()
+        last_prune = None
+        while not stop:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    table, row = item
+                    pending.setdefault(table, []).append(row)
+                    count += 1
+            except queue.Empty:
+                pass
+
+            due = time.monotonic() - last_flush >= self.flush_interval
+            if count >= self.batch_size or waiters or stop or (count and due):
+                if count:
+                    try:
+                        with conn:
+                            for table, rows in pending.items():
+                                columns = TABLES[table]
+                                sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                                conn.executemany(sql, rows)
+                    except sqlite3.Error as e:
+                        logger.error(f"写入数据库失败，丢弃 {count} 条记录: {e}")
+                    pending.clear()
+                    count = 0
+                last_flush = time.monotonic()
+                for event in waiters:
+                    event.set()
+                waiters.clear()
+            if self.position_retention and (last_prune is None or time.monotonic() - last_prune >= PRUNE_INTERVAL):
+                last_prune = time.monotonic()
+                self._prune(conn, time.time() - self.position_retention)
+        conn.close()
+
+    @staticmethod
+    def _prune(conn: sqlite3.Connection, before: float):
+        """删除 before 之前的持仓快照"""
+        try:
+            with conn:
+                deleted = conn.execute("DELETE FROM positions WHERE time < ?", (before,)).rowcount
+            if deleted:
+                logger.info(f"已清理 {deleted} 条过期持仓快照")
+        except sqlite3.Error as e:
+            logger.error(f"清理持仓快照失败: {e}")
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待此前放入队列的记录全部写入"""
+        event = threading.Event()
+        self._queue.put(event)
+        return event.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """写完剩余记录后停止后台线程"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    # ============ 查询 ============
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def query(self, table: str, contract: Optional[str] = None, start: Optional[float] = None,
+              end: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        """按合约和时间范围查询 (时间倒序)"""
+        if table not in TABLES:
+            raise ValueError(f"未知的数据表: {table}")
+        clauses, params = [], []
+        if contract:
+            clauses.append("contract = ?")
+            params.append(contract)
+        if start is not None:
+            clauses.append("time >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("time < ?")
+            params.append(end)
+        sql = f"SELECT * FROM {table}"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY time DESC"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [dict(row) for row in self._reader().execute(sql, params)]
+
+    def get_trades(self, contract: Optional[str] = None, start: Optional[float] = None,
+                   end: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        return self.query('trades', contract, start, end, limit)
+
+    def get_orders(self, contract: Optional[str] = None, start: Optional[float] = None,
+                   end: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        return self.query('orders', contract, start, end, limit)
+
+    def get_positions(self, contract: Optional[str] = None, start: Optional[float] = None,
+                      end: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        return self.query('positions', contract, start, end, limit)
+
+    def get_triggers(self, contract: Optional[str] = None, start: Optional[float] = None,
+                     end: Optional[float] = None, limit: Optional[int] = None) -> List[Dict]:
+        return self.query('triggers', contract, start, end, limit)
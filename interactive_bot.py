@@ -13,18 +13,21 @@
 
 import time
 import logging
+from core.startup import startup  # 最先导入项目模块，从这里开始计算启动耗时
 import os
 from pathlib import Path
 from decimal import Decimal as D
 from typing import Optional, Dict, List
-import gate_api
-from gate_api.exceptions import ApiException, GateApiException
-import socket
-import requests
+from concurrent.futures import ThreadPoolExecutor
+from core.candles import Candles
+from core.sdk import LazyFuturesApi, api_errors, gate_errors
+from core.snapshot_cache import SnapshotCache
+from core.position_analytics import PositionBook
 
 # ============ 网络检测函数 ============
 def check_network() -> bool:
     """检测网络连接是否正常"""
+    import socket
     try:
         # 尝试连接到公共DNS服务器
         socket.create_connection(("8.8.8.8", 53), timeout=3)
@@ -32,6 +35,7 @@ def check_network() -> bool:
     except (socket.timeout, socket.error):
         try:
             # 备用方案：尝试连接到百度
+            import requests
             requests.get("https://www.baidu.com", timeout=3)
             return True
         except:
@@ -87,6 +91,7 @@ class TradingConfig:
     
     # 合约配置
     SETTLE = "usdt"  # 结算货币 (usdt 或 btc)
+    SETTLES = ["usdt", "btc"]  # 多币种仓位查询（菜单7）的结算货币
     CONTRACT = "BTC_USDT"  # 合约名称
     
     # 交易参数
@@ -95,6 +100,8 @@ class TradingConfig:
     
     # 机器人参数
     CHECK_INTERVAL = 10  # 检查间隔（秒）
+    USE_CANDLE_ARCHIVE = True  # K线优先读取本地归档 data/archive/（仅实盘）
+    SNAPSHOT_TTL = 2  # 仓位/账户快照缓存时间（秒），菜单各项查询共用一次请求
     ERROR_WAIT_TIME = 5  # 错误后等待时间（秒）
     
     def __init__(self):
@@ -139,19 +146,21 @@ class GateIOTrader:
     def _init_api(self):
         """初始化API客户端"""
         host = self.config.TESTNET_HOST if self.config.USE_TESTNET else self.config.LIVE_HOST
-        configuration = gate_api.Configuration(
-            host=host,
-            key=self.config.API_KEY,
-            secret=self.config.API_SECRET
-        )
-        self.api_client = gate_api.ApiClient(configuration)
-        self.futures_api = gate_api.FuturesApi(self.api_client)
+        # gate_api 在第一次请求时才导入
+        self.futures_api = LazyFuturesApi(self.config.API_KEY, self.config.API_SECRET, host=host)
+        # 仓位/账户快照，FuturesPositionQuery 共用；下单后调用 snapshots.invalidate()
+        self.snapshots = SnapshotCache(ttl=self.config.SNAPSHOT_TTL)
+        self.candle_archive = None
+        if self.config.USE_CANDLE_ARCHIVE and not self.config.USE_TESTNET:
+            from data.candle_archive import CandleArchive
+            self.candle_archive = CandleArchive(settle=self.config.SETTLE)
         logger.info(f"合约API已初始化 - 模式: {'测试网' if self.config.USE_TESTNET else '实盘'} | 结算: {self.config.SETTLE.upper()}")
     
     def get_positions(self) -> Optional[List[Dict]]:
         """获取当前合约仓位"""
         try:
-            positions = self.futures_api.list_positions(settle=self.config.SETTLE)  # type: ignore
+            settle = self.config.SETTLE
+            positions = self.snapshots.get(('positions', settle), lambda: self.futures_api.list_positions(settle=settle))  # type: ignore
             result = []
             for pos in positions:  # type: ignore
                 size = float(pos.size) if pos.size else 0
@@ -179,14 +188,15 @@ class GateIOTrader:
                         'mode': pos.mode if hasattr(pos, 'mode') else 'unknown',
                     })
             return result
-        except (ApiException, GateApiException) as e:
+        except api_errors() as e:
             logger.error(f"获取仓位失败: {e}")
             return None
     
     def get_account_info(self) -> Optional[Dict]:
         """获取合约账户信息"""
         try:
-            account = self.futures_api.list_futures_accounts(settle=self.config.SETTLE)  # type: ignore
+            settle = self.config.SETTLE
+            account = self.snapshots.get(('accounts', settle), lambda: self.futures_api.list_futures_accounts(settle=settle))  # type: ignore
             if account:
                 return {
                     'total': float(account.total) if account.total else 0,  # type: ignore
@@ -195,38 +205,50 @@ class GateIOTrader:
                     'position_margin': float(account.position_margin) if account.position_margin else 0,  # type: ignore
                     'order_margin': float(account.order_margin) if account.order_margin else 0,  # type: ignore
                 }
-        except (ApiException, GateApiException) as e:
+        except api_errors() as e:
             logger.error(f"获取账户信息失败: {e}")
             return None
     
-    def get_candlesticks(self, contract: str, interval: str = '1h', limit: int = 200) -> List[Dict]:
-        """获取K线数据"""
+    def get_candlesticks(self, contract: str, interval: str = '1h', limit: int = 200) -> Candles:
+        """获取K线数据 (列式存储，按下标访问仍返回字典视图)"""
         try:
+            if self.candle_archive is not None and self.candle_archive.supports(interval):
+                return self.candle_archive.serve(
+                    contract, interval,
+                    lambda begin, end: Candles.from_api(self.futures_api.list_futures_candlesticks(
+                        settle=self.config.SETTLE, contract=contract, interval=interval, _from=begin, to=end
+                    )),
+                    limit=limit,
+                )
             candlesticks = self.futures_api.list_futures_candlesticks(
                 settle=self.config.SETTLE,
                 contract=contract,
                 interval=interval,
                 limit=limit
             )
-            from datetime import datetime
-            return [
-                {
-                    'time': int(cs.t),
-                    'datetime': datetime.fromtimestamp(int(cs.t)),
-                    'open': float(cs.o),
-                    'close': float(cs.c),
-                    'high': float(cs.h),
-                    'low': float(cs.l),
-                    'volume': float(cs.v) if cs.v else 0
-                }
-                for cs in candlesticks
-            ]
-        except (ApiException, GateApiException) as e:
+            return Candles.from_api(candlesticks)
+        except api_errors() as e:
             logger.error(f"获取K线数据失败: {e}")
-            return []
-    
-    
+            return Candles.empty()
+
+    def flatten_positions(self, contracts: Optional[List[str]] = None, side: Optional[str] = None) -> Optional[List[Dict]]:
+        """一键平仓: 取一次最新仓位，为匹配的仓位生成只减仓 IOC 单，按批并发提交 (经共享调度器限频)
 
+        contracts 限定合约，side 为 'long' / 'short' 时只平该方向；返回每个平仓单的结果，获取仓位失败返回 None
+        """
+        from core.exchange import default_scheduler, flatten_orders, flatten_report, submit_batch_orders, submit_flatten
+        self.snapshots.invalidate()
+        positions = self.get_positions()
+        if positions is None:
+            return None
+        orders = flatten_orders({pos['contract']: pos for pos in positions}, contracts, side)
+        if not orders:
+            return []
+        scheduler = default_scheduler()
+        results = submit_flatten(orders, lambda batch: submit_batch_orders(self.futures_api, self.config.SETTLE,
+                                                                            batch, scheduler))
+        self.snapshots.invalidate()
+        return flatten_report(orders, results)
 
 
 # ============ 策略统一导入 ============
@@ -237,19 +259,17 @@ from all_strategies import MAStrategy, RSIStrategy, GridTradingStrategy, EMABrea
 # ============ 多币种详细仓位查询类 ============
 class FuturesPositionQuery:
     """期货/永续合约仓位查询（支持多币种）"""
-    def __init__(self, api_key: str, api_secret: str):
-        configuration = gate_api.Configuration(
-            host="https://api.gateio.ws/api/v4",
-            key=api_key,
-            secret=api_secret
-        )
-        self.api_client = gate_api.ApiClient(configuration)
-        self.futures_api = gate_api.FuturesApi(self.api_client)
+    def __init__(self, api_key: str, api_secret: str, snapshots: Optional[SnapshotCache] = None,
+                 settles: Optional[List[str]] = None):
+        self.settles = list(settles or TradingConfig.SETTLES)
+        # 与 GateIOTrader 共用快照缓存时，同一账户的仓位/账户请求只发一次
+        self.snapshots = snapshots or SnapshotCache(ttl=0)
+        self.futures_api = LazyFuturesApi(api_key, api_secret)
         logger.info("期货 API 客户端已初始化")
 
     def get_account_leverage(self, settle: str = 'usdt'):
         try:
-            account = self.futures_api.list_futures_accounts(settle=settle)
+            account = self.snapshots.get(('accounts', settle), lambda: self.futures_api.list_futures_accounts(settle=settle))
             if account:
                 cross_leverage = getattr(account, 'cross_leverage', None)
                 logger.info(f"[INFO] {settle.upper()} 账户全仓杠杆: {cross_leverage}")
@@ -258,65 +278,22 @@ class FuturesPositionQuery:
             logger.error(f"[ERROR] 获取账户杠杆失败: {e}")
         return None
 
-    def get_all_positions(self, settle: str = 'usdt'):
+    def _list_positions(self, settle: str):
+        """请求 settle 结算的全部仓位，失败返回 None"""
         try:
-            logger.info(f"\n[*] 获取 {settle.upper()} 所有合约仓位...")
-            account_leverage = self.get_account_leverage(settle)
-            positions = self.futures_api.list_positions(settle=settle)
-            if not positions:
-                logger.info(f"   {settle.upper()} 无持仓")
-                return []
-            result = []
-            for pos in positions:
-                try:
-                    size_float = float(pos.size) if pos.size else 0
-                    if abs(size_float) == 0:
-                        continue
-                except (ValueError, TypeError):
-                    continue
-                leverage_val = D(str(pos.leverage)) if pos.leverage and str(pos.leverage) != '0' else D(0)
-                final_leverage = D(0)
-                if leverage_val > 0:
-                    final_leverage = leverage_val
-                elif hasattr(pos, 'cross_leverage_limit') and pos.cross_leverage_limit:
-                    try:
-                        final_leverage = D(str(pos.cross_leverage_limit))
-                    except:
-                        pass
-                elif account_leverage:
-                    try:
-                        final_leverage = D(str(account_leverage))
-                    except:
-                        pass
-                entry_price_val = D(str(pos.entry_price)) if pos.entry_price else D(0)
-                mark_price_val = D(str(pos.mark_price)) if pos.mark_price else D(0)
-                size_val = D(str(pos.size))
-                roi_percent = D(0)
-                if entry_price_val > 0:
-                    price_change_rate = (mark_price_val - entry_price_val) / entry_price_val
-                    if size_val > 0:
-                        roi_percent = price_change_rate * final_leverage * 100
-                    else:
-                        roi_percent = -price_change_rate * final_leverage * 100
-                result.append({
-                    'contract': str(pos.contract) if pos.contract else 'N/A',
-                    'size': size_val,
-                    'leverage': final_leverage,
-                    'entry_price': entry_price_val,
-                    'mark_price': mark_price_val,
-                    'unrealised_pnl': D(str(pos.unrealised_pnl)) if pos.unrealised_pnl else D(0),
-                    'roi_percent': roi_percent,
-                    'pnl_percent': D(str(pos.pnl_percent)) if hasattr(pos, 'pnl_percent') and pos.pnl_percent else D(0),
-                    'margin': D(str(pos.margin)) if hasattr(pos, 'margin') and pos.margin else D(0),
-                    'maintenance_rate': D(str(pos.maintenance_rate)) if hasattr(pos, 'maintenance_rate') and pos.maintenance_rate else D(0),
-                })
-            logger.info(f"   找到 {len(result)} 个有持仓的合约")
-            return result
-        except GateApiException as ex:
+            return self.snapshots.get(('positions', settle), lambda: self.futures_api.list_positions(settle=settle))
+        except gate_errors() as ex:
             logger.error(f"Gate API异常 - {ex.label}: {ex.message}")
-        except ApiException as e:
+        except api_errors() as e:
             logger.error(f"API异常: {e}")
-        return []
+        return None
+
+    def _parse_positions(self, settle: str, positions, account_leverage) -> PositionBook:
+        """把 SDK 仓位对象解析为列式持仓表 (跳过空仓)，杠杆缺失时使用账户全仓杠杆"""
+        return PositionBook.from_api(positions, settle=settle, account_leverage=account_leverage)
+
+    def get_all_positions(self, settle: str = 'usdt'):
+        return self.get_all_settle_positions([settle]).get(settle, [])
 
     def get_usdt_perpetual_positions(self):
         return self.get_all_positions(settle='usdt')
@@ -324,16 +301,34 @@ class FuturesPositionQuery:
     def get_btc_perpetual_positions(self):
         return self.get_all_positions(settle='btc')
 
-    def get_all_settle_positions(self):
-        result = {}
-        usdt_pos = self.get_usdt_perpetual_positions()
-        if usdt_pos:
-            result['usdt'] = usdt_pos
-        btc_pos = self.get_btc_perpetual_positions()
-        if btc_pos:
-            result['btc'] = btc_pos
+    def get_all_settle_positions(self, settles: Optional[List[str]] = None) -> Dict[str, PositionBook]:
+        """并发查询多个结算货币的仓位 (每个结算货币的仓位和账户杠杆也并发请求)
+
+        只返回有持仓的结算货币 (settle -> 仓位列表)，总耗时约为一次请求往返
+        """
+        settles = list(settles or self.settles)
+        logger.info(f"\n[*] 获取 {'/'.join(s.upper() for s in settles)} 所有合约仓位...")
+        with ThreadPoolExecutor(max_workers=2 * len(settles)) as pool:
+            jobs = {
+                settle: (pool.submit(self.get_account_leverage, settle), pool.submit(self._list_positions, settle))
+                for settle in settles
+            }
+            result = {}
+            for settle, (leverage_job, positions_job) in jobs.items():
+                positions = positions_job.result()
+                if not positions:
+                    logger.info(f"   {settle.upper()} 无持仓")
+                    continue
+                parsed = self._parse_positions(settle, positions, leverage_job.result())
+                logger.info(f"   {settle.upper()} 找到 {len(parsed)} 个有持仓的合约")
+                if parsed:
+                    result[settle] = parsed
         return result
 
+    def get_portfolio(self, settles: Optional[List[str]] = None) -> PositionBook:
+        """全部结算货币的仓位合并为一个持仓表 (每项带 settle 字段)"""
+        return PositionBook.concat(self.get_all_settle_positions(settles).values())
+
 # ============ 仓位信息格式化打印 ============
 def print_positions(positions, title: str):
     if not positions:
@@ -348,21 +343,18 @@ def print_positions(positions, title: str):
         direction = "[多]" if pos['size'] > 0 else "[空]"
         size = abs(pos['size'])
         leverage_val = pos['leverage']
-        if isinstance(leverage_val, D):
-            leverage_str = f"{float(leverage_val):.1f}x"
-        else:
-            leverage_str = f"{float(leverage_val):.1f}x" if leverage_val and leverage_val != 0 else "N/A"
-        pnl_val = float(pos['unrealised_pnl'])
+        leverage_str = f"{leverage_val:.1f}x" if leverage_val else "N/A"
+        pnl_val = pos['unrealised_pnl']
         if pnl_val >= 0:
             pnl_display = f"[+] {pnl_val:>12.2f}"
         else:
             pnl_display = f"[-] {pnl_val:>12.2f}"
-        roi_val = float(pos['roi_percent'])
+        roi_val = pos['roi_percent']
         if roi_val >= 0:
             roi_display = f"[+]{roi_val:>7.2f}%"
         else:
             roi_display = f"[{roi_val:>8.2f}%"
-        print(f"{pos['contract']:<18} {direction:<8} {float(size):<15.4f} {float(pos['entry_price']):<18.2f} {float(pos['mark_price']):<18.2f} {pnl_display:<18} {roi_display:<12} {leverage_str:<10}")
+        print(f"{pos['contract']:<18} {direction:<8} {size:<15.4f} {pos['entry_price']:<18.2f} {pos['mark_price']:<18.2f} {pnl_display:<18} {roi_display:<12} {leverage_str:<10}")
     print("-" * 145)
 
 # ============ 显示功能 ============
@@ -437,9 +429,45 @@ def display_menu():
 
 
 def handle_manual_trade(trader: GateIOTrader):
-    """处理手动交易"""
-    print("\n🔧 手动交易功能开发中...")
-    print("即将支持: 开多、开空、平仓等操作")
+    """处理手动交易 (目前支持一键平仓)"""
+    print("\n🔧 手动交易 - 一键平仓 (市价 IOC、只减仓):")
+    print("  1. 平掉全部仓位")
+    print("  2. 按合约平仓")
+    print("  3. 平掉全部多仓")
+    print("  4. 平掉全部空仓")
+    print("  0. 返回")
+    choice = input("请输入选项 (0-4): ").strip()
+    contracts, side = None, None
+    if choice == '1':
+        target = "全部仓位"
+    elif choice == '2':
+        contracts = [c.strip().upper() for c in input("请输入合约 (多个用逗号分隔，如 BTC_USDT,ETH_USDT): ").split(',') if c.strip()]
+        if not contracts:
+            return
+        target = ', '.join(contracts)
+    elif choice in ('3', '4'):
+        side = 'long' if choice == '3' else 'short'
+        target = "全部多仓" if side == 'long' else "全部空仓"
+    else:
+        return
+    if input(f"⚠️  确认市价平掉 {target}? 输入 yes 确认: ").strip().lower() != 'yes':
+        print("已取消")
+        return
+
+    start = time.perf_counter()
+    report = trader.flatten_positions(contracts=contracts, side=side)
+    if report is None:
+        print("❌ 获取仓位失败，未平仓")
+        return
+    if not report:
+        print("没有匹配的仓位")
+        return
+    print(f"\n平仓结果 (耗时 {(time.perf_counter() - start) * 1000:.0f}ms):")
+    for item in report:
+        status = f"✅ ID={item['id']} 状态={item['status']}" if item['succeeded'] else f"❌ {item['error']}"
+        print(f"  {item['contract']}: 数量 {item['size']} {status}")
+    succeeded = sum(1 for item in report if item['succeeded'])
+    print(f"成功 {succeeded}/{len(report)}，选择菜单1刷新仓位确认成交")
 
 
 def handle_strategy_view(trader: GateIOTrader):
@@ -479,20 +507,58 @@ def handle_auto_strategy(trader: GateIOTrader):
         print(f"策略调用示例出错: {e}")
 
 
-def handle_view_orders(trader: GateIOTrader):
-    """查看订单"""
-    print("\n📜 订单查询功能开发中...")
+def handle_view_orders(trader: GateIOTrader, limit: int = 20):
+    """查看本地记录的平仓订单和成交 (需在配置中启用 storage)"""
+    from core.engine import load_settings, open_storage
+    from data.storage import DEFAULT_DB_PATH
+    try:
+        storage_config = load_settings().get('storage') or {}
+    except Exception as e:
+        logger.warning(f"读取配置失败，使用默认数据库路径: {e}")
+        storage_config = {}
+    # 与引擎使用同一数据库 (storage.path)
+    db_path = Path(storage_config.get('path') or DEFAULT_DB_PATH)
+    if not db_path.exists():
+        print("\n📜 暂无订单记录 (在 config/settings.yaml 中启用 storage 后由引擎写入)")
+        return
+    storage = open_storage(storage_config)
+    try:
+        orders = storage.get_orders(limit=limit)
+        trades = storage.get_trades(limit=limit)
+    finally:
+        storage.close()
+
+    print(f"\n📜 最近 {limit} 条订单:")
+    print("-" * 100)
+    for o in orders:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(o['time']))
+        state = o['status'] if o['success'] else f"失败: {o['error']}"
+        print(f"{when}  {o['contract']:<18} {o['size']:>12g}  ID={o['order_id'] or '-':<20} {state}")
+    if not orders:
+        print("   无订单")
+
+    print(f"\n💱 最近 {limit} 笔成交:")
+    print("-" * 100)
+    for t in trades:
+        when = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t['time']))
+        print(f"{when}  {t['contract']:<18} {t['side']:<5} {t['size']:>12g} @ {t['price']:<14g} {t['reason'] or ''}")
+    if not trades:
+        print("   无成交")
 
 
 def run_bot(config: TradingConfig):
     """运行交易机器人主程序"""
     try:
         trader = GateIOTrader(config)
+        startup.mark("初始化")
         # 启动时显示仓位信息
         display_positions(trader)
+        startup.mark("首次查询")
+        startup.report(logger)
         # 初始化多币种查询类
         api_key, api_secret = config.API_KEY, config.API_SECRET
-        futures_query = FuturesPositionQuery(api_key, api_secret)
+        futures_query = FuturesPositionQuery(api_key, api_secret,
+                                             snapshots=None if config.USE_TESTNET else trader.snapshots)
         # 主循环
         while True:
             try:
@@ -519,14 +585,15 @@ def run_bot(config: TradingConfig):
                     if not all_positions:
                         print("\n[!] 未找到任何合约持仓")
                     else:
-                        if 'usdt' in all_positions:
-                            print_positions(all_positions['usdt'], "[USDT] 永续合约仓位")
-                        else:
-                            print("\n[USDT] 永续合约仓位\n   无持仓")
-                        if 'btc' in all_positions:
-                            print_positions(all_positions['btc'], "[BTC] 永续合约仓位")
-                        else:
-                            print("\n[BTC] 永续合约仓位\n   无持仓")
+                        for settle in futures_query.settles:
+                            title = f"[{settle.upper()}] 永续合约仓位"
+                            if settle in all_positions:
+                                print_positions(all_positions[settle], title)
+                            else:
+                                print(f"\n{title}\n   无持仓")
+                        totals = PositionBook.concat(all_positions.values()).totals()
+                        summary = ', '.join(f"{k.upper()} {v['positions']} 个 / 未实现盈亏 {v['unrealised_pnl']:.4f}" for k, v in totals.items())
+                        print(f"\n合计: {summary}")
                     print("\n========== 查询完成 ==========")
                 else:
                     print("❌ 无效选项，请重新输入")
@@ -542,6 +609,7 @@ def run_bot(config: TradingConfig):
 
 
 if __name__ == '__main__':
+    startup.mark("导入")
     print("🚀 合约交易机器人启动中...\n")
     
     try:
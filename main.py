@@ -4,9 +4,12 @@
 QQQRobot 统一入口
 """
 import sys
+from core.startup import startup  # 最先导入，从这里开始计算启动耗时
 from core.engine import Engine
 from core.notifier import logger
 
+startup.mark("导入")
+
 def main():
     try:
         engine = Engine()
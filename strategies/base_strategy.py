@@ -1,13 +1,99 @@
+import asyncio
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
 from core.exchange import Exchange
+from core.notifier import logger
 
 class BaseStrategy(ABC):
+    # 策略在 settings.yaml 中的参数段名称，None 表示直接读取顶层配置
+    config_key = None
+
     def __init__(self, exchange: Exchange, config: dict):
         self.exchange = exchange
         self.config = config
         self.name = "BaseStrategy"
+        # 启用推送行情时由 Engine 注入 (core.price_feed.PriceFeed)
+        self.price_feed = None
+        # 启用持久化时由 Engine 注入 (data.storage.Storage)
+        self.storage = None
+        # 启用风控时由 Engine 注入 (core.risk_control.RiskControl)
+        self.risk = None
+        # 推送行情回调中提交的平仓: 同步模式的后台线程池 (首次使用时创建) / 异步模式的任务
+        self._close_executor: Optional[ThreadPoolExecutor] = None
+        self._close_tasks = set()
 
     @abstractmethod
     def run(self):
         """执行策略逻辑"""
         pass
+
+    async def run_async(self):
+        """异步模式下执行策略逻辑 (此时 self.exchange 为 AsyncExchange)
+
+        默认在线程池中执行 run()，需要访问交易所的策略应重写此方法。
+        """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.run)
+
+    def allow_open(self, contract: str, size: float, price: float, leverage: float = 0) -> bool:
+        """开仓/加仓前的风控检查 (size 带方向)，未启用风控时总是允许"""
+        if self.risk is None:
+            return True
+        return self.risk.check_open(contract, size, price, leverage, settle=self.exchange.settle)
+
+    def allow_close(self, contract: str, size: float) -> bool:
+        """平仓/减仓前的风控检查 (size 为下单数量，带方向)"""
+        if self.risk is None:
+            return True
+        return self.risk.check_close(contract, size)
+
+    def describe(self) -> str:
+        """启动日志中显示的策略摘要"""
+        return ""
+
+    def watched_contracts(self) -> list:
+        """需要订阅推送行情的合约"""
+        return []
+
+    def on_price(self, contract: str, price: float):
+        """推送行情回调 (在行情源线程中调用，应尽快返回)"""
+        pass
+
+    def close_in_background(self, close: Callable, *args):
+        """在推送行情回调中提交平仓，不阻塞行情线程
+
+        同步模式交给后台线程执行 close(*args)；异步模式下 close 返回协程，在事件循环中创建任务并保留引用。
+        """
+        if asyncio.iscoroutinefunction(self.exchange.close_position):
+            result = close(*args)
+            if result is not None:
+                task = asyncio.ensure_future(result)
+                self._close_tasks.add(task)
+                task.add_done_callback(self._close_tasks.discard)
+                task.add_done_callback(self._log_close_error)
+            return
+        if self._close_executor is None:
+            self._close_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix=f"{type(self).__name__}-close")
+        self._close_executor.submit(close, *args).add_done_callback(self._log_close_error)
+
+    def _log_close_error(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"策略 {self.name} 平仓出错: {future.exception()!r}")
+
+    def shutdown(self):
+        """引擎停止时调用，用于落盘或释放资源 (子类重写时应调用 super().shutdown())"""
+        if self._close_executor is not None:
+            # 等待已提交的平仓完成
+            self._close_executor.shutdown(wait=True)
+
+    def settings(self, config: dict):
+        """本策略用到的配置部分，配置热更新时据此判断参数是否变化"""
+        return config.get(self.config_key) if self.config_key else config
+
+    def reconfigure(self, config: dict):
+        """配置热更新: 校验新配置并返回就地生效的函数 (引擎在两轮之间调用，此后 self.config 为新配置)
+
+        新配置无效时抛出异常 (整次热更新被拒绝)；返回 None 表示不支持就地更新，引擎会停止旧实例并按新配置重建。
+        """
+        return None
@@ -1,5 +1,282 @@
+import asyncio
+import time
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
 from strategies.base_strategy import BaseStrategy
+from core.notifier import logger
+
+# 网格挂单的自定义标识前缀 (交易所要求以 t- 开头)，后缀为价位下标，全量对账时据此认领挂单
+ORDER_TEXT_PREFIX = "t-grid-"
+
+BUY = 1
+SELL = -1
+
+
+class GridTradingStrategy:
+    """网格价位计算 (不访问交易所)
+
+    lower/upper 之间生成 grid_count + 1 个价位 (等差或等比)。离当前价最近的价位留空 (中性价位)，
+    其下挂买单、其上挂卖单；成交后中性价位随之移动，相邻价位补上反向挂单。
+    """
+
+    def __init__(self, lower, upper, grid_count: int = 10, order_size: float = 1, geometric: bool = False,
+                 tick_size: float = 0):
+        lower, upper = float(lower), float(upper)
+        if grid_count < 1 or lower <= 0 or upper <= lower:
+            raise ValueError(f"网格参数无效: lower={lower}, upper={upper}, grid_count={grid_count}")
+        self.grid_count = int(grid_count)
+        self.order_size = order_size
+        if geometric:
+            ratio = (upper / lower) ** (1.0 / self.grid_count)
+            levels = [lower * ratio ** i for i in range(self.grid_count + 1)]
+        else:
+            step = (upper - lower) / self.grid_count
+            levels = [lower + step * i for i in range(self.grid_count + 1)]
+        if tick_size > 0:
+            levels = [round(round(level / tick_size) * tick_size, 12) for level in levels]
+        self.levels: List[float] = levels
+
+    def nearest(self, price: float) -> int:
+        """离价格最近的价位下标"""
+        i = bisect_left(self.levels, price)
+        if i == 0:
+            return 0
+        if i == len(self.levels):
+            return i - 1
+        return i if self.levels[i] - price < price - self.levels[i - 1] else i - 1
+
+    def desired(self, neutral: int) -> Dict[int, int]:
+        """中性价位为 neutral 时应有的挂单: 价位下标 -> BUY/SELL"""
+        return {i: BUY if i < neutral else SELL for i in range(len(self.levels)) if i != neutral}
+
+    def get_orders(self, price) -> List[Dict]:
+        """当前价格下应挂的全部订单"""
+        return [
+            {'price': self.levels[i], 'side': 'buy' if side == BUY else 'sell', 'size': self.order_size}
+            for i, side in self.desired(self.nearest(float(price))).items()
+        ]
+
+
+class GridOrderBook:
+    """网格挂单索引: 价位下标 -> 挂单，订单 ID -> 价位下标"""
+
+    def __init__(self):
+        self.by_level: Dict[int, Dict] = {}
+        self.by_id: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.by_level)
+
+    def add(self, level: int, order: Dict):
+        self.remove(level)
+        self.by_level[level] = order
+        self.by_id[order['id']] = level
+
+    def remove(self, level: int) -> Optional[Dict]:
+        order = self.by_level.pop(level, None)
+        if order is not None:
+            self.by_id.pop(order['id'], None)
+        return order
+
+    def remove_id(self, order_id: str) -> Optional[Dict]:
+        level = self.by_id.get(order_id)
+        return self.remove(level) if level is not None else None
+
+    def clear(self):
+        self.by_level.clear()
+        self.by_id.clear()
+
 
 class GridStrategy(BaseStrategy):
+    """网格交易
+
+    挂单以价位下标为键保存在内存中。每轮只查询价格穿越过的价位上的挂单状态，
+    再把应有挂单与现有挂单做差，仅对变化的价位批量撤单/下单；
+    每隔 resync_interval 秒才全量拉取一次挂单对账。
+    """
+
+    config_key = 'grid'
+
+    def __init__(self, exchange, config):
+        super().__init__(exchange, config)
+        self.name = "GridStrategy"
+        grid_config = config.get('grid') or {}
+        self.contract = grid_config['contract']
+        self.grid = GridTradingStrategy(
+            grid_config['lower'], grid_config['upper'], grid_count=int(grid_config.get('grid_count', 10)),
+            order_size=int(grid_config.get('order_size', 1)), geometric=bool(grid_config.get('geometric', False)),
+            tick_size=float(grid_config.get('tick_size', 0) or 0),
+        )
+        self.resync_interval = float(grid_config.get('resync_interval', 300))
+        self.book = GridOrderBook()
+        # 全量对账时发现的需撤销挂单 (重复或不属于当前网格价位)
+        self._stale: List[str] = []
+        self.neutral: Optional[int] = None
+        self.last_price: Optional[float] = None
+        # 上次全量对账时间 (0 表示启动后尚未对账)
+        self.last_resync = 0.0
+
+    def describe(self) -> str:
+        levels = self.grid.levels
+        return f"网格合约: {self.contract} | 区间: {levels[0]} ~ {levels[-1]} | 价位数: {len(levels)}"
+
+    def watched_contracts(self) -> list:
+        return [self.contract]
+
+    # ============ 主循环 ============
     def run(self):
-        pass
+        price = self.exchange.get_current_price(self.contract)
+        if price <= 0:
+            logger.error(f"[{self.contract}] 获取价格失败，跳过本次网格检查")
+            return
+        if self.resync_due():
+            self.resync(self.exchange.list_open_orders(self.contract))
+        else:
+            for level, order in self.crossed_orders(price):
+                self.apply_status(level, order['id'], self.exchange.get_order(order['id']))
+
+        cancels, places = self.plan(price)
+        if cancels:
+            self.apply_cancels(self.exchange.cancel_orders(cancels))
+        if places:
+            self.apply_places(places, self.exchange.place_orders([order for _, order in places]))
+
+    async def run_async(self):
+        price = await self.exchange.get_current_price(self.contract)
+        if price <= 0:
+            logger.error(f"[{self.contract}] 获取价格失败，跳过本次网格检查")
+            return
+        if self.resync_due():
+            self.resync(await self.exchange.list_open_orders(self.contract))
+        else:
+            crossed = self.crossed_orders(price)
+            statuses = await asyncio.gather(*(self.exchange.get_order(order['id']) for _, order in crossed))
+            for (level, order), status in zip(crossed, statuses):
+                self.apply_status(level, order['id'], status)
+
+        cancels, places = self.plan(price)
+        if cancels:
+            self.apply_cancels(await self.exchange.cancel_orders(cancels))
+        if places:
+            self.apply_places(places, await self.exchange.place_orders([order for _, order in places]))
+
+    # ============ 对账 ============
+    def resync_due(self) -> bool:
+        return time.time() - self.last_resync >= self.resync_interval
+
+    def resync(self, open_orders: Optional[List[Dict]]):
+        """用交易所的全部挂单重建索引: 认领本网格的挂单，不在当前网格价位上的加入撤单"""
+        if open_orders is None:
+            return
+        self.last_resync = time.time()
+        known = dict(self.book.by_id)
+        self.book.clear()
+        self._stale = []
+        for order in open_orders:
+            if not (order.get('text') or '').startswith(ORDER_TEXT_PREFIX):
+                # 非网格挂单 (手动下单等) 不处理
+                continue
+            level = self._level_of(order)
+            if level is None or level in self.book.by_level:
+                # 网格参数已修改，或同一价位重复挂单
+                self._stale.append(order['id'])
+                continue
+            self.book.add(level, {'id': order['id'], 'side': BUY if order['size'] > 0 else SELL,
+                                  'size': abs(order['size']), 'price': order['price']})
+        gone = len([order_id for order_id in known if order_id not in self.book.by_id])
+        logger.info(f"[{self.contract}] 网格对账: 挂单 {len(self.book)} 个，已成交或撤销 {gone} 个")
+
+    def _level_of(self, order: Dict) -> Optional[int]:
+        """按挂单标识和价格找到对应的当前网格价位"""
+        try:
+            level = int(order['text'][len(ORDER_TEXT_PREFIX):])
+        except ValueError:
+            return None
+        if not 0 <= level < len(self.grid.levels):
+            return None
+        if abs(order['price'] - self.grid.levels[level]) > 1e-9 * order['price']:
+            return None
+        return level
+
+    def crossed_orders(self, price: float) -> List[Tuple[int, Dict]]:
+        """上一轮到本轮之间价格经过的价位上的挂单 (只有这些可能已成交)"""
+        last = self.last_price if self.last_price is not None else price
+        lo, hi = min(last, price), max(last, price)
+        start = bisect_left(self.grid.levels, lo)
+        end = bisect_right(self.grid.levels, hi)
+        return [(i, self.book.by_level[i]) for i in range(start, end) if i in self.book.by_level]
+
+    def apply_status(self, level: int, order_id: str, status: Optional[Dict]):
+        """处理单个挂单的查询结果，已结束的从索引中移除并移动中性价位"""
+        if status is None or status['status'] != 'finished':
+            return
+        order = self.book.by_level.get(level)
+        if order is None or order['id'] != order_id:
+            return
+        self.book.remove(level)
+        if status.get('finish_as') == 'filled':
+            side = "买入" if order['side'] == BUY else "卖出"
+            logger.info(f"[{self.contract}] 网格{side}成交: 价位 {self.grid.levels[level]} 数量 {order['size']}")
+            self.neutral = level
+            if self.storage is not None:
+                self.storage.save_trade({
+                    'contract': self.contract, 'side': 'buy' if order['side'] == BUY else 'sell',
+                    'size': order['size'] * order['side'], 'price': status.get('fill_price') or order['price'],
+                    'order_id': order_id, 'reason': 'grid',
+                })
+
+    # ============ 挂单差异 ============
+    def plan(self, price: float) -> Tuple[List[str], List[Tuple[int, Dict]]]:
+        """计算需撤销的订单 ID 和需新挂的 (价位, 订单)"""
+        # 中性价位只在价格越过相邻价位时移动，避免价格在两价位之间来回时反复撤挂
+        if self.neutral is None:
+            self.neutral = self.grid.nearest(price)
+        else:
+            levels = self.grid.levels
+            if (self.neutral > 0 and price <= levels[self.neutral - 1]) or \
+                    (self.neutral < len(levels) - 1 and price >= levels[self.neutral + 1]):
+                self.neutral = self.grid.nearest(price)
+        desired = self.grid.desired(self.neutral)
+        self.last_price = price
+
+        cancels, self._stale = self._stale, []
+        for level, order in self.book.by_level.items():
+            if desired.get(level) != order['side']:
+                cancels.append(order['id'])
+
+        places = []
+        for level, side in desired.items():
+            existing = self.book.by_level.get(level)
+            if existing is not None and existing['side'] == side:
+                continue
+            level_price = self.grid.levels[level]
+            # 挂单不能穿过当前价，否则会以市价成交
+            if (side == BUY and level_price >= price) or (side == SELL and level_price <= price):
+                continue
+            size = self.grid.order_size * side
+            if not self.allow_open(self.contract, size, level_price):
+                continue
+            places.append((level, {'contract': self.contract, 'size': size, 'price': level_price,
+                                   'tif': 'gtc', 'text': f"{ORDER_TEXT_PREFIX}{level}"}))
+        return cancels, places
+
+    def apply_cancels(self, results: Dict[str, bool]):
+        for order_id, succeeded in results.items():
+            if succeeded:
+                self.book.remove_id(order_id)
+            else:
+                # 撤单失败通常是已成交，下一次全量对账确认
+                self.last_resync = 0.0
+        logger.info(f"[{self.contract}] 网格撤单 {sum(results.values())}/{len(results)}")
+
+    def apply_places(self, places: List[Tuple[int, Dict]], results: List[Dict]):
+        placed = 0
+        for (level, order), result in zip(places, results):
+            if not result['succeeded']:
+                logger.warning(f"[{self.contract}] 网格挂单失败 价位 {order['price']}: {result['error']}")
+                continue
+            self.book.add(level, {'id': result['id'], 'side': BUY if order['size'] > 0 else SELL,
+                                  'size': abs(order['size']), 'price': order['price']})
+            placed += 1
+        logger.info(f"[{self.contract}] 网格挂单 {placed}/{len(places)}，当前挂单 {len(self.book)} 个")
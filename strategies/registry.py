@@ -0,0 +1,145 @@
+"""策略注册表
+
+只在启动时列出 strategies/ 下的模块名和 qqqrobot.strategies 入口点名称，不导入任何策略；
+配置中实际用到的策略才会被导入和实例化，单个策略导入或初始化失败只影响该策略。
+
+settings.yaml 示例:
+    strategies:
+      - type: stop_loss                 # strategies/ 下的模块名、入口点名称或 "模块:类名"
+      - type: grid
+        name: "ETH网格"                 # 可选，默认使用策略类的名称
+        params: {contract: "ETH_USDT", lower: 2000, upper: 4000}
+"""
+import importlib
+import inspect
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from core.notifier import logger
+
+STRATEGY_DIR = Path(__file__).parent
+ENTRY_POINT_GROUP = "qqqrobot.strategies"
+
+# 非策略模块
+_EXCLUDED = {'base_strategy', 'registry'}
+
+
+class StrategyRegistry:
+    """策略名 -> "模块:类名" (类名可省略，导入后自动查找模块中定义的策略类)"""
+
+    def __init__(self):
+        self.specs: Dict[str, str] = {
+            p.stem: f"strategies.{p.stem}"
+            for p in sorted(STRATEGY_DIR.glob("*.py"))
+            if p.stem not in _EXCLUDED and not p.stem.startswith('_')
+        }
+        self._entry_points = None
+        self._classes: Dict[str, type] = {}
+
+    def register(self, name: str, spec):
+        """注册策略 (spec 为 "模块:类名" 或策略类)"""
+        if isinstance(spec, type):
+            self._classes[name] = spec
+        else:
+            self.specs[name] = spec
+
+    def available(self) -> List[str]:
+        return sorted(set(self.specs) | set(self._classes) | set(self.entry_points()))
+
+    def entry_points(self) -> Dict:
+        """第三方包通过 qqqrobot.strategies 入口点注册的策略 (首次需要时才扫描)"""
+        if self._entry_points is None:
+            from importlib.metadata import entry_points
+            try:
+                self._entry_points = {ep.name: ep for ep in entry_points(group=ENTRY_POINT_GROUP)}
+            except Exception as e:
+                logger.warning(f"读取策略入口点失败: {e}")
+                self._entry_points = {}
+        return self._entry_points
+
+    def load(self, name: str) -> type:
+        """按名称导入策略类"""
+        cls = self._classes.get(name)
+        if cls is not None:
+            return cls
+        spec = self.specs.get(name)
+        if spec is None and ':' in name:
+            spec = name
+        if spec is not None:
+            module_name, _, class_name = spec.partition(':')
+            cls = self._find_class(importlib.import_module(module_name), class_name)
+        elif name in self.entry_points():
+            cls = self.entry_points()[name].load()
+        else:
+            raise ValueError(f"未知的策略: {name} (可用: {self.available()})")
+        self._classes[name] = cls
+        return cls
+
+    @staticmethod
+    def _find_class(module, class_name: str = '') -> type:
+        from strategies.base_strategy import BaseStrategy
+        if class_name:
+            return getattr(module, class_name)
+        candidates = [
+            obj for obj in vars(module).values()
+            if inspect.isclass(obj) and issubclass(obj, BaseStrategy) and obj is not BaseStrategy
+            and obj.__module__ == module.__name__ and not inspect.isabstract(obj)
+        ]
+        if len(candidates) != 1:
+            raise ValueError(f"模块 {module.__name__} 中有 {len(candidates)} 个策略类，请使用 \"模块:类名\" 指定")
+        return candidates[0]
+
+    def strategy_config(self, item: Dict, config: Dict) -> Dict:
+        """配置项对应的策略配置: params 覆盖该策略在全局配置中的参数段"""
+        cls = self.load(item['type'])
+        params = item.get('params') or {}
+        strategy_config = dict(config)
+        key = getattr(cls, 'config_key', None)
+        if key:
+            strategy_config[key] = dict(config.get(key) or {}, **params)
+        else:
+            strategy_config.update(params)
+        return strategy_config
+
+    def create(self, item: Dict, exchange, config: Dict):
+        """按配置项实例化策略"""
+        strategy = self.load(item['type'])(exchange, self.strategy_config(item, config))
+        if item.get('name'):
+            strategy.name = item['name']
+        return strategy
+
+
+def configured_strategies(config: Dict) -> List[Dict]:
+    """配置中启用的策略实例列表
+
+    未配置 strategies 列表时兼容旧写法: 止损默认启用 (enable_stop_loss)，
+    其余策略由各自参数段的 enabled 控制。
+    """
+    items = config.get('strategies')
+    if items is None:
+        items = []
+        if config.get('enable_stop_loss', True):
+            items.append({'type': 'stop_loss'})
+        for key in ('trailing_stop', 'grid', 'trend_following'):
+            if (config.get(key) or {}).get('enabled', False):
+                items.append({'type': key})
+    result = []
+    for item in items:
+        if isinstance(item, str):
+            item = {'type': item}
+        if not item.get('type'):
+            logger.warning(f"策略配置缺少 type 字段，已忽略: {item}")
+            continue
+        if item.get('enabled', True):
+            result.append(item)
+    return result
+
+
+_registry: Optional[StrategyRegistry] = None
+
+
+def default_registry() -> StrategyRegistry:
+    global _registry
+    if _registry is None:
+        _registry = StrategyRegistry()
+    return _registry
@@ -1,62 +1,246 @@
+import asyncio
+import threading
+import time
 from strategies.base_strategy import BaseStrategy
-from core.notifier import logger
+from core.notifier import logger, log_tick
+from core.trigger_index import TriggerIndex, FALLING, RISING
 from datetime import datetime
+from typing import Dict, Optional
 
 class StopLossStrategy(BaseStrategy):
     def __init__(self, exchange, config):
         super().__init__(exchange, config)
         self.name = "StopLossStrategy"
-        self.contract = config.get('contract')
-        self.stop_loss_price = float(config.get('stop_loss_price', 0))
-        self.take_profit_price = float(config.get('take_profit_price', 0))
+        self.rules = self.load_rules(config)
+        # 最近一次持仓快照，供推送行情回调使用
+        self.positions = {}
+        # 当前持仓对应的止损/止盈触发价，触发后移除，下一次持仓快照时重建
+        self.triggers = TriggerIndex()
+        # 正在平仓的合约 -> 平仓是否已成功。平仓返回前、以及成功后的下一次持仓快照 (可能取于成交之前) 都不重挂
+        # 触发价，避免同一持仓被重复平仓；平仓失败时立即移除，下一次快照重新挂上以便重试
+        self._closing: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        # 推送价格超过该秒数未更新时回退到 REST 行情
+        self.price_max_age = float(config.get('price_max_age', 5))
+
+    @staticmethod
+    def load_rules(config: dict) -> dict:
+        """解析止损止盈规则 (contract -> 阈值)
+
+        优先读取 contracts 列表，兼容旧版顶层 contract/stop_loss_price/take_profit_price 写法
+        """
+        items = config.get('contracts')
+        if not items:
+            items = [config] if config.get('contract') else []
+
+        rules = {}
+        for item in items:
+            contract = item.get('contract')
+            if not contract:
+                logger.warning(f"止损规则缺少 contract 字段，已忽略: {item}")
+                continue
+            rules[contract] = {
+                'stop_loss_price': float(item.get('stop_loss_price', 0) or 0),
+                'take_profit_price': float(item.get('take_profit_price', 0) or 0),
+            }
+        return rules
+
+    def settings(self, config: dict):
+        return {key: config.get(key) for key in ('contracts', 'contract', 'stop_loss_price', 'take_profit_price',
+                                                 'price_max_age')}
+
+    def reconfigure(self, config: dict):
+        """热更新止损止盈规则: 按当前持仓立即重挂触发价，移除的合约不再监控"""
+        rules = self.load_rules(config)
+        price_max_age = float(config.get('price_max_age', 5))
+
+        def apply():
+            with self._lock:
+                for contract in set(self.rules) - set(rules):
+                    self.triggers.remove(f"{contract}:stop_loss")
+                    self.triggers.remove(f"{contract}:take_profit")
+                self.rules = rules
+                self.price_max_age = price_max_age
+                self.sync_triggers(self.positions)
+        return apply
 
     def run(self):
         """执行止损止盈检查"""
-        if not self.contract:
+        if not self.rules:
             logger.warning("未配置合约，跳过检查")
             return
 
-        # 获取当前持仓
-        position = self.exchange.get_position(self.contract)
-        
-        if not position:
-            # logger.debug(f"未找到 {self.contract} 持仓") # 减少日志噪音
+        # 一次请求获取全部持仓，按合约索引
+        positions = self.exchange.get_positions()
+        self.update_positions(positions)
+        if not positions or not any(c in positions for c in self.rules):
+            # logger.debug("未找到任何持仓") # 减少日志噪音
             return
-        
-        # 获取当前价格
-        current_price = self.exchange.get_current_price(self.contract)
-        if current_price == 0:
-            logger.error("获取价格失败，跳过本次检查")
+
+        # 优先使用推送行情，缺失时一次请求获取全部合约价格
+        prices = self.feed_prices(positions) or self.exchange.get_tickers()
+        triggered = self.evaluate(positions, prices)
+        detected_at = time.perf_counter()
+        for contract, position in triggered:
+            self.close(contract, position, detected_at)
+
+    async def run_async(self):
+        """异步执行止损止盈检查 (持仓与行情并发请求，平仓并发提交)"""
+        if not self.rules:
+            logger.warning("未配置合约，跳过检查")
+            return
+
+        if self.price_feed is not None:
+            positions = await self.exchange.get_positions()
+            prices = self.feed_prices(positions or {}) or await self.exchange.get_tickers()
+        else:
+            positions, prices = await asyncio.gather(self.exchange.get_positions(), self.exchange.get_tickers())
+        self.update_positions(positions)
+        if not positions:
+            return
+
+        triggered = self.evaluate(positions, prices)
+        detected_at = time.perf_counter()
+        orders = [self.close(contract, position, detected_at) for contract, position in triggered]
+        await asyncio.gather(*(order for order in orders if order is not None))
+
+    def update_positions(self, positions):
+        """记录最新持仓快照并同步触发价 (已触发过的合约在此重新挂上，失败的平仓可重试)"""
+        if positions is None:
+            return
+        with self._lock:
+            self.positions = positions
+            self.sync_triggers(positions)
+            for contract in [c for c, done in self._closing.items() if done]:
+                del self._closing[contract]
+        watched = [c for c in self.rules if c in positions]
+        if watched:
+            self.exchange.warm_close_path(watched)
+        if self.storage is not None and positions:
+            self.storage.save_positions(positions)
+
+    def sync_triggers(self, positions: dict):
+        """按持仓方向挂止损/止盈触发价: 多仓止损和空仓止盈为下穿，其余为上穿 (正在平仓的合约不挂，需持有锁)"""
+        for contract, rule in self.rules.items():
+            position = positions.get(contract)
+            for kind in ('stop_loss', 'take_profit'):
+                trigger_id = f"{contract}:{kind}"
+                level = rule[f'{kind}_price']
+                if position is None or level <= 0 or contract in self._closing:
+                    self.triggers.remove(trigger_id)
+                    continue
+                is_long = position['size'] > 0
+                direction = FALLING if (kind == 'stop_loss') == is_long else RISING
+                self.triggers.set(trigger_id, contract, level, direction, kind)
+
+    def feed_prices(self, positions: dict):
+        """从推送行情表读取持仓合约价格，不可用时返回 None"""
+        if self.price_feed is None:
+            return None
+        watched = [c for c in self.rules if c in positions]
+        return self.price_feed.table.snapshot(watched, max_age=self.price_max_age)
+
+    def describe(self) -> str:
+        return f"止损监控合约: {list(self.rules)}"
+
+    def watched_contracts(self) -> list:
+        return list(self.rules)
+
+    def on_price(self, contract: str, price: float):
+        """每条推送行情到达时立即评估该合约的规则"""
+        if contract not in self.rules:
             return
-        
+        with self._lock:
+            position = self.positions.get(contract)
+            if position is None or not self.check_rule(contract, position, price, verbose=False):
+                return
+            self._closing[contract] = False
+        # 平仓 (含重试和确认) 不在行情线程中执行
+        self.close_in_background(self.close, contract, position, time.perf_counter())
+
+    def close(self, contract: str, position: dict, detected_at: Optional[float] = None):
+        """提交平仓 (异步模式下返回协程)，风控拒绝时返回 None；detected_at 为触发时刻，用于统计平仓延迟"""
+        detected_at = detected_at or time.perf_counter()
+        if not self.allow_close(contract, -position['size']):
+            self.finish_close(contract, False)
+            return None
+        with self._lock:
+            self._closing[contract] = False
+        try:
+            result = self.exchange.close_position(contract, position['size'], position['mode'], detected_at=detected_at)
+        except Exception:
+            self.finish_close(contract, False)
+            raise
+        if asyncio.iscoroutine(result):
+            return self._await_close(contract, result)
+        self.finish_close(contract, result)
+        return result
+
+    async def _await_close(self, contract: str, close):
+        success = False
+        try:
+            success = await close
+            return success
+        finally:
+            self.finish_close(contract, success)
+
+    def finish_close(self, contract: str, success: bool):
+        """平仓返回: 成功时等下一次持仓快照再解除，失败时立即解除"""
+        with self._lock:
+            if success:
+                self._closing[contract] = True
+            else:
+                self._closing.pop(contract, None)
+
+    def evaluate(self, positions: dict, prices: dict) -> list:
+        """根据持仓和行情快照评估全部规则，返回需要平仓的 (contract, position) 列表"""
+        watched = [c for c in self.rules if c in positions]
+        if not watched:
+            return []
+        if not prices:
+            logger.error("获取价格失败，跳过本次检查")
+            return []
+
+        to_close = []
+        with self._lock:
+            for contract in watched:
+                current_price = prices.get(contract, 0.0)
+                if current_price == 0:
+                    logger.error(f"[{contract}] 获取价格失败，跳过本次检查")
+                    continue
+                if self.check_rule(contract, positions[contract], current_price):
+                    to_close.append((contract, positions[contract]))
+        return to_close
+
+    def check_rule(self, contract: str, position: dict, current_price: float, verbose: bool = True) -> bool:
+        """对单个合约评估止损止盈条件，返回是否需要平仓 (触发的价位会从索引中移除)"""
         # 计算盈亏
         entry_price = position['entry_price']
         size = position['size']
-        pnl_pct = ((current_price - entry_price) / entry_price) * 100
-        
+        pnl_pct = ((current_price - entry_price) / entry_price) * 100 if entry_price else 0.0
+
         is_long = size > 0
         direction = "做多" if is_long else "做空"
-        
-        logger.info(f"[{self.contract}] {direction} | 价格: {current_price:.4f} | 入场: {entry_price:.4f} | 盈亏: {pnl_pct:+.2f}%")
-        
-        should_close = False
-        reason = ""
-        
-        if is_long:
-            if self.stop_loss_price > 0 and current_price <= self.stop_loss_price:
-                should_close = True
-                reason = f"触发止损 (价格 {current_price} <= {self.stop_loss_price})"
-            elif self.take_profit_price > 0 and current_price >= self.take_profit_price:
-                should_close = True
-                reason = f"触发止盈 (价格 {current_price} >= {self.take_profit_price})"
-        else:
-            if self.stop_loss_price > 0 and current_price >= self.stop_loss_price:
-                should_close = True
-                reason = f"触发止损 (价格 {current_price} >= {self.stop_loss_price})"
-            elif self.take_profit_price > 0 and current_price <= self.take_profit_price:
-                should_close = True
-                reason = f"触发止盈 (价格 {current_price} <= {self.take_profit_price})"
-        
-        if should_close:
-            logger.warning(f"🚨 {reason}")
-            self.exchange.close_position(self.contract, size, position['mode'])
+
+        if verbose:
+            # 每轮每个合约一行，格式化延迟到日志后台线程
+            logger.info("[%s] %s | 价格: %.4f | 入场: %.4f | 盈亏: %+.2f%%", contract, direction, current_price, entry_price, pnl_pct)
+            rule = self.rules.get(contract) or {}
+            log_tick(strategy=self.name, contract=contract, price=current_price, entry=entry_price, size=size,
+                     pnl_pct=round(pnl_pct, 4), stop=rule.get('stop_loss_price'), take_profit=rule.get('take_profit_price'))
+
+        fired = self.triggers.crossed(contract, current_price)
+        if not fired:
+            return False
+
+        # 止损优先于止盈
+        trigger = min(fired, key=lambda t: t.data != 'stop_loss')
+        label = "止损" if trigger.data == 'stop_loss' else "止盈"
+        op = "<=" if trigger.direction == FALLING else ">="
+        logger.warning(f"🚨 [{contract}] 触发{label} (价格 {current_price} {op} {trigger.level})")
+        if self.storage is not None:
+            self.storage.save_trigger({
+                'contract': contract, 'strategy': self.name, 'rule': trigger.data,
+                'price': current_price, 'level': trigger.level, 'reason': f"{label} {op} {trigger.level}",
+            })
+        return True
@@ -0,0 +1,302 @@
+import asyncio
+import threading
+import time
+from typing import Dict, Optional
+
+from strategies.base_strategy import BaseStrategy
+from core.notifier import logger, log_tick
+
+
+class TrailingStopStrategy(BaseStrategy):
+    """移动止损 / ATR 吊灯止损
+
+    每个持仓记录开仓以来的最高价 (多) / 最低价 (空) 和当前止损价，止损价只会向有利方向移动:
+    多仓 stop = max(stop, 最高价 - K * ATR)，空仓 stop = min(stop, 最低价 + K * ATR)；
+    未配置 atr_k 时按 trail_pct 百分比回撤计算。
+    状态写入追加式日志 (data.stop_journal.StopJournal，同一路径只能由一个策略使用)，重启后从日志恢复水位和止损价。
+    ATR 使用 Exchange.calculate_atr 的滚动状态，只有新K线收盘时才增量更新。
+    """
+
+    config_key = 'trailing_stop'
+
+    def __init__(self, exchange, config):
+        super().__init__(exchange, config)
+        self.name = "TrailingStopStrategy"
+        ts_config = config.get('trailing_stop') or {}
+        self.rules, self.default_rule = self.load_rules(ts_config)
+        self.atr_interval = ts_config.get('atr_interval', '1h')
+        self.atr_period = int(ts_config.get('atr_period', 22))
+        self.price_max_age = float(config.get('price_max_age', 5))
+        from data.stop_journal import open_journal
+        self.journal = open_journal(ts_config.get('journal'), compact_every=int(ts_config.get('compact_every', 1000)))
+        # contract -> {'side', 'mode', 'entry', 'high', 'low', 'stop', 'atr'}，启动时从日志恢复
+        self.states: Dict[str, Dict] = {c: dict(s) for c, s in self.journal.state.items()}
+        # 正在平仓的合约 -> 平仓是否已成功 (与 StopLossStrategy 相同): 平仓返回前不再触发，成功后等下一次持仓快照、
+        # 失败时立即解除；恢复的状态在首次持仓快照确认前同样不触发
+        self._closing: Dict[str, bool] = {contract: True for contract in self.states}
+        self._lock = threading.Lock()
+        if self.states:
+            logger.info(f"已从日志恢复移动止损状态: {sorted(self.states)}")
+
+    @staticmethod
+    def load_rules(ts_config: dict):
+        """解析规则 (contract -> {'atr_k', 'trail_pct'})，default 规则用于其余全部持仓"""
+        def parse(item):
+            return {
+                'atr_k': float(item.get('atr_k', 0) or 0),
+                'trail_pct': float(item.get('trail_pct', 0) or 0),
+            }
+
+        rules = {}
+        for item in ts_config.get('contracts') or []:
+            contract = item.get('contract')
+            if not contract:
+                logger.warning(f"移动止损规则缺少 contract 字段，已忽略: {item}")
+                continue
+            rules[contract] = parse(item)
+        default = ts_config.get('default')
+        return rules, parse(default) if default else None
+
+    def settings(self, config: dict):
+        return config.get('trailing_stop'), config.get('price_max_age')
+
+    def reconfigure(self, config: dict):
+        """热更新规则、ATR 参数和日志压缩间隔: 规则变化的合约按当前水位重新计算止损价；日志路径变化时需要重建"""
+        ts_config = config.get('trailing_stop') or {}
+        old_config = self.config.get('trailing_stop') or {}
+        if ts_config.get('journal') != old_config.get('journal'):
+            return None
+        compact_every = int(ts_config.get('compact_every', 1000))
+        rules, default_rule = self.load_rules(ts_config)
+        atr_interval = ts_config.get('atr_interval', '1h')
+        atr_period = int(ts_config.get('atr_period', 22))
+        price_max_age = float(config.get('price_max_age', 5))
+
+        def apply():
+            with self._lock:
+                old_rules = {contract: self.rule_for(contract) for contract in self.states}
+                self.rules, self.default_rule = rules, default_rule
+                self.atr_interval, self.atr_period = atr_interval, atr_period
+                self.price_max_age = price_max_age
+                self.journal.compact_every = compact_every
+                for contract, state in self.states.items():
+                    if self.rule_for(contract) != old_rules[contract]:
+                        state['stop'] = None
+                        self._ratchet(contract, state)
+                        self.journal.put(contract, state)
+        return apply
+
+    def rule_for(self, contract: str) -> Optional[Dict]:
+        return self.rules.get(contract, self.default_rule)
+
+    def describe(self) -> str:
+        default = '，其余持仓使用默认规则' if self.default_rule else ''
+        return f"移动止损合约: {list(self.rules)}{default}"
+
+    def watched_contracts(self) -> list:
+        return list(self.rules)
+
+    # ============ 主循环 ============
+    def run(self):
+        positions = self.exchange.get_positions()
+        if positions is None:
+            return
+        managed = self.update_positions(positions)
+        if not managed:
+            return
+
+        for contract in managed:
+            atr = self.exchange.calculate_atr(contract, interval=self.atr_interval, period=self.atr_period)
+            self.set_atr(contract, atr)
+        prices = self.feed_prices(managed) or self.exchange.get_tickers()
+        if not prices:
+            logger.error("获取价格失败，跳过本次检查")
+            return
+        for contract in managed:
+            if self.advance(contract, prices.get(contract, 0.0), verbose=True):
+                self.close(contract)
+
+    async def run_async(self):
+        positions = await self.exchange.get_positions()
+        if positions is None:
+            return
+        managed = self.update_positions(positions)
+        if not managed:
+            return
+
+        atrs = await asyncio.gather(*(
+            self.exchange.calculate_atr(c, interval=self.atr_interval, period=self.atr_period) for c in managed
+        ))
+        for contract, atr in zip(managed, atrs):
+            self.set_atr(contract, atr)
+        prices = self.feed_prices(managed) or await self.exchange.get_tickers()
+        if not prices:
+            logger.error("获取价格失败，跳过本次检查")
+            return
+        orders = [self.close(c) for c in managed if self.advance(c, prices.get(c, 0.0), verbose=True)]
+        await asyncio.gather(*(order for order in orders if order is not None))
+
+    def feed_prices(self, contracts: list):
+        """从推送行情表读取价格，不可用时返回 None"""
+        if self.price_feed is None:
+            return None
+        return self.price_feed.table.snapshot(contracts, max_age=self.price_max_age)
+
+    def on_price(self, contract: str, price: float):
+        """推送行情: 更新水位并立即检查止损 (O(1))"""
+        if contract not in self.states:
+            return
+        if not self.advance(contract, price):
+            return
+        # 平仓 (含重试和确认) 不在行情线程中执行
+        self.close_in_background(self.close, contract)
+
+    # ============ 状态维护 ============
+    def update_positions(self, positions: dict) -> list:
+        """按持仓快照建立/清理状态，返回受管理的合约"""
+        managed = []
+        with self._lock:
+            for contract in [c for c, done in self._closing.items() if done or c not in positions]:
+                # 平仓已完成，或持仓已不存在
+                del self._closing[contract]
+            for contract, position in positions.items():
+                if self.rule_for(contract) is None:
+                    continue
+                side = 1 if position['size'] > 0 else -1
+                state = self.states.get(contract)
+                if state is None or state['side'] != side:
+                    # 新开仓或反向: 水位从入场价开始
+                    entry = position['entry_price'] or position['mark_price']
+                    state = {'side': side, 'entry': entry, 'high': entry, 'low': entry, 'stop': None, 'atr': 0.0,
+                             'mode': position['mode'], 'size': position['size']}
+                    self.states[contract] = state
+                    self.journal.put(contract, state)
+                elif state['size'] != position['size'] or state.get('mode') != position['mode']:
+                    state['mode'] = position['mode']
+                    state['size'] = position['size']
+                    self.journal.put(contract, state)
+                managed.append(contract)
+            for contract in [c for c in self.states if c not in managed]:
+                # 已平仓或不再管理
+                del self.states[contract]
+                self.journal.delete(contract)
+        if managed:
+            self.exchange.warm_close_path(managed)
+        return managed
+
+    def set_atr(self, contract: str, atr: float):
+        if atr <= 0:
+            return
+        with self._lock:
+            state = self.states.get(contract)
+            if state is not None and state['atr'] != atr:
+                state['atr'] = atr
+                self._ratchet(contract, state)
+                self.journal.put(contract, state)
+
+    def _candidate(self, contract: str, state: Dict) -> Optional[float]:
+        rule = self.rule_for(contract)
+        if rule is None:
+            return None
+        if rule['atr_k'] > 0 and state['atr'] > 0:
+            offset = rule['atr_k'] * state['atr']
+        elif rule['trail_pct'] > 0:
+            offset = (state['high'] if state['side'] > 0 else state['low']) * rule['trail_pct'] / 100
+        else:
+            return None
+        return state['high'] - offset if state['side'] > 0 else state['low'] + offset
+
+    def _ratchet(self, contract: str, state: Dict) -> bool:
+        """按当前水位重新计算止损价 (只向有利方向移动)，返回是否变化 (需持有锁)"""
+        candidate = self._candidate(contract, state)
+        stop = state['stop']
+        if candidate is not None:
+            if stop is None:
+                stop = candidate
+            else:
+                stop = max(stop, candidate) if state['side'] > 0 else min(stop, candidate)
+        changed = stop != state['stop']
+        state['stop'] = stop
+        return changed
+
+    def advance(self, contract: str, price: float, verbose: bool = False) -> bool:
+        """用最新价格推进水位和止损价，返回是否触发止损"""
+        if price <= 0:
+            if verbose:
+                logger.error(f"[{contract}] 获取价格失败，跳过本次检查")
+            return False
+        with self._lock:
+            state = self.states.get(contract)
+            if state is None or contract in self._closing:
+                return False
+            if price > state['high'] or price < state['low']:
+                state['high'] = max(state['high'], price)
+                state['low'] = min(state['low'], price)
+                self._ratchet(contract, state)
+                self.journal.put(contract, state)
+            elif state['stop'] is None and self._ratchet(contract, state):
+                self.journal.put(contract, state)
+
+            stop = state['stop']
+            if verbose:
+                direction = "做多" if state['side'] > 0 else "做空"
+                watermark = state['high'] if state['side'] > 0 else state['low']
+                # 格式化延迟到日志后台线程
+                logger.info("[%s] %s | 价格: %.6f | 水位: %.6f | 移动止损: %s | ATR: %.6f",
+                            contract, direction, price, watermark, stop if stop is not None else "未设置", state['atr'])
+                log_tick(strategy=self.name, contract=contract, price=price, entry=state['entry'], size=state['size'],
+                         watermark=watermark, stop=stop, atr=state['atr'])
+            if stop is None:
+                return False
+            hit = price <= stop if state['side'] > 0 else price >= stop
+            if not hit:
+                return False
+            self._closing[contract] = False
+
+        op = "<=" if state['side'] > 0 else ">="
+        logger.warning(f"🚨 [{contract}] 触发移动止损 (价格 {price} {op} {stop:.6f})")
+        if self.storage is not None:
+            self.storage.save_trigger({
+                'contract': contract, 'strategy': self.name, 'rule': 'trailing_stop',
+                'price': price, 'level': stop, 'reason': f"移动止损 {op} {stop:.6f}",
+            })
+        return True
+
+    def close(self, contract: str):
+        """提交平仓 (异步模式下返回协程)，风控拒绝时返回 None"""
+        detected_at = time.perf_counter()
+        with self._lock:
+            state = self.states.get(contract)
+            self._closing[contract] = False
+        if state is None or not self.allow_close(contract, -state['size']):
+            self.finish_close(contract, False)
+            return None
+        try:
+            result = self.exchange.close_position(contract, state['size'], state['mode'], detected_at=detected_at)
+        except Exception:
+            self.finish_close(contract, False)
+            raise
+        if asyncio.iscoroutine(result):
+            return self._await_close(contract, result)
+        self.finish_close(contract, result)
+        return result
+
+    async def _await_close(self, contract: str, close):
+        success = False
+        try:
+            success = await close
+            return success
+        finally:
+            self.finish_close(contract, success)
+
+    def finish_close(self, contract: str, success: bool):
+        """平仓返回: 成功时等下一次持仓快照再解除，失败时立即解除"""
+        with self._lock:
+            if success:
+                self._closing[contract] = True
+            else:
+                self._closing.pop(contract, None)
+
+    def shutdown(self):
+        super().shutdown()
+        self.journal.close()
@@ -1,5 +1,421 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
 from strategies.base_strategy import BaseStrategy
+from core.exchange import INTERVAL_SECONDS
+from core.notifier import logger
+
+# 指标参数默认值
+DEFAULT_PARAMS = {
+    'ma_fast': 10, 'ma_slow': 30,
+    'ema_period': 20,
+    'macd_fast': 12, 'macd_slow': 26, 'macd_signal': 9,
+    'rsi_period': 14, 'rsi_low': 30.0, 'rsi_high': 70.0,
+    'breakout_period': 20,
+    'boll_period': 20, 'boll_k': 2.0,
+    'momentum_period': 10, 'momentum_threshold': 0.02,
+    'atr_period': 14, 'vol_k': 1.5,
+}
+
+# 可用信号: +1 做多 / -1 做空 / 0 无信号 (指标未就绪时为 0)
+SIGNAL_NAMES = ('ma', 'ema', 'macd', 'rsi', 'breakout', 'bollinger', 'momentum', 'volatility')
+
+
+class _Ema:
+    """按合约向量化的 EMA / Wilder 递推，以前 period 个有效值的均值作为初值 (与 core.indicators 一致)"""
+
+    __slots__ = ('alpha', 'period', 'value', 'acc')
+
+    def __init__(self, n: int, period: int, alpha: float):
+        self.alpha = alpha
+        self.period = period
+        self.value = np.full(n, np.nan)
+        self.acc = np.zeros(n)
+
+    def update(self, x: np.ndarray, n_valid: np.ndarray) -> np.ndarray:
+        """x 为本根K线的输入，n_valid 为包含本根在内的有效输入个数"""
+        warming = (n_valid > 0) & (n_valid <= self.period)
+        if warming.any():
+            self.acc[warming] += x[warming]
+            seed = n_valid == self.period
+            self.value[seed] = self.acc[seed] / self.period
+        running = n_valid > self.period
+        self.value[running] += self.alpha * (x[running] - self.value[running])
+        return self.value
+
+
+class TrendEngine:
+    """多合约向量化趋势信号引擎
+
+    收盘价/最高价/最低价保存在 (合约数 × 窗口) 的环形二维数组中，均线、EMA、MACD、RSI、
+    唐奇安通道、布林带、动量和 ATR 均为按合约向量化的递推状态。每根新K线只做一次
+    O(合约数) 的更新，不重新扫描历史。
+    """
+
+    def __init__(self, contracts: List[str], params: Optional[Dict] = None):
+        self.params = p = dict(DEFAULT_PARAMS, **(params or {}))
+        self.contracts = list(contracts)
+        self.index = {c: i for i, c in enumerate(self.contracts)}
+        n = len(self.contracts)
+        self.window = max(p['ma_slow'], p['boll_period'], p['breakout_period'] + 1,
+                          p['momentum_period'] + 1, p['atr_period'] + 1) + 1
+        shape = (n, self.window)
+        # 环形缓冲，head 为最新一根所在列；合约开始有数据之前写入 0，滚动和无需特殊处理
+        self.close = np.zeros(shape)
+        self.high = np.zeros(shape)
+        self.low = np.zeros(shape)
+        self.tr = np.zeros(shape)
+        self.head = -1
+        self.count = np.zeros(n, dtype=np.int64)
+        self.last_time: Optional[int] = None
+        self._updates = 0
+
+        # 滚动和: name -> (缓冲, 周期)
+        self._sums = {
+            'ma_fast': (self.close, p['ma_fast']),
+            'ma_slow': (self.close, p['ma_slow']),
+            'boll': (self.close, p['boll_period']),
+            'tr': (self.tr, p['atr_period']),
+        }
+        self.sums = {name: np.zeros(n) for name in self._sums}
+        self.boll_sq = np.zeros(n)
+
+        self.ema = _Ema(n, p['ema_period'], 2.0 / (p['ema_period'] + 1))
+        self.ema_fast = _Ema(n, p['macd_fast'], 2.0 / (p['macd_fast'] + 1))
+        self.ema_slow = _Ema(n, p['macd_slow'], 2.0 / (p['macd_slow'] + 1))
+        self.dea = _Ema(n, p['macd_signal'], 2.0 / (p['macd_signal'] + 1))
+        self.avg_gain = _Ema(n, p['rsi_period'], 1.0 / p['rsi_period'])
+        self.avg_loss = _Ema(n, p['rsi_period'], 1.0 / p['rsi_period'])
+
+        self.values: Dict[str, np.ndarray] = {}
+        self.signals: Dict[str, np.ndarray] = {name: np.zeros(n, dtype=np.int8) for name in SIGNAL_NAMES}
+
+    def __len__(self):
+        return len(self.contracts)
+
+    def _column(self, lag: int) -> int:
+        return (self.head - lag) % self.window
+
+    # ============ 更新 ============
+    def fit(self, high: np.ndarray, low: np.ndarray, close: np.ndarray, times=None):
+        """按时间顺序灌入 (合约数 × K线数) 的历史数据，缺失为 NaN"""
+        for j in range(close.shape[1]):
+            self.update(high[:, j], low[:, j], close[:, j], None if times is None else int(times[j]))
+
+    def update(self, high, low, close, bar_time: Optional[int] = None):
+        """追加一根K线 (每个合约一个值，缺失为 NaN)，并重算全部信号"""
+        close = np.asarray(close, dtype=np.float64)
+        started = self.count > 0
+        prev_close = self.close[:, self.head] if self.head >= 0 else np.zeros(len(close))
+        # 已有数据的合约缺失本根K线时沿用上一根收盘价
+        close = np.where(np.isnan(close) & started, prev_close, close)
+        active = ~np.isnan(close)
+        close = np.where(active, close, 0.0)
+        high = np.where(active, np.nan_to_num(np.asarray(high, dtype=np.float64), nan=0.0), 0.0)
+        low = np.where(active, np.nan_to_num(np.asarray(low, dtype=np.float64), nan=0.0), 0.0)
+        high = np.where(high > 0, np.maximum(high, close), close)
+        low = np.where(low > 0, np.minimum(low, close), close)
+
+        count = self.count + active
+        has_prev = started & active
+        tr = np.where(has_prev, np.maximum.reduce([high - low, np.abs(high - prev_close), np.abs(low - prev_close)]), 0.0)
+
+        self.head = (self.head + 1) % self.window
+        for name, (buffer, period) in self._sums.items():
+            # 先取出滑出窗口的旧值 (尚未覆盖)
+            self.sums[name] -= buffer[:, self._column(period)]
+        self.boll_sq -= self.close[:, self._column(self.params['boll_period'])] ** 2
+        self.close[:, self.head] = close
+        self.high[:, self.head] = high
+        self.low[:, self.head] = low
+        self.tr[:, self.head] = tr
+        for name, (buffer, _) in self._sums.items():
+            self.sums[name] += buffer[:, self.head]
+        self.boll_sq += close ** 2
+        self.count = count
+        if bar_time is not None:
+            self.last_time = bar_time
+
+        self._updates += 1
+        if self._updates >= self.window:
+            self._recalibrate()
+
+        self._compute(close, prev_close, has_prev, active)
+
+    def _recalibrate(self):
+        """每滚动一整轮重新求和，消除浮点累计误差 (均摊 O(1))"""
+        self._updates = 0
+        for name, (buffer, period) in self._sums.items():
+            columns = [self._column(lag) for lag in range(period)]
+            self.sums[name] = buffer[:, columns].sum(axis=1)
+        columns = [self._column(lag) for lag in range(self.params['boll_period'])]
+        self.boll_sq = (self.close[:, columns] ** 2).sum(axis=1)
+
+    def _compute(self, close, prev_close, has_prev, active):
+        p = self.params
+        count = self.count
+        nan = np.nan
+
+        def rolling_mean(name, period, n_valid=count):
+            return np.where(n_valid >= period, self.sums[name] / period, nan)
+
+        ma_fast = rolling_mean('ma_fast', p['ma_fast'])
+        ma_slow = rolling_mean('ma_slow', p['ma_slow'])
+        boll_mid = rolling_mean('boll', p['boll_period'])
+        with np.errstate(invalid='ignore'):
+            boll_std = np.sqrt(np.clip(self.boll_sq / p['boll_period'] - boll_mid ** 2, 0, None))
+        atr = rolling_mean('tr', p['atr_period'], count - 1)
+
+        n_close = np.where(active, count, 0)
+        ema = self.ema.update(close, n_close).copy()
+        fast = self.ema_fast.update(close, n_close)
+        slow = self.ema_slow.update(close, n_close)
+        dif = fast - slow
+        dea = self.dea.update(np.nan_to_num(dif), np.where(active, count - p['macd_slow'] + 1, 0)).copy()
+
+        delta = np.where(has_prev, close - prev_close, 0.0)
+        n_delta = np.where(has_prev, count - 1, 0)
+        gain = self.avg_gain.update(np.clip(delta, 0, None), n_delta)
+        loss = self.avg_loss.update(np.clip(-delta, 0, None), n_delta)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = np.where(loss == 0, 100.0, 100.0 - 100.0 / (1.0 + gain / loss))
+        rsi[np.isnan(gain)] = nan
+
+        # 唐奇安通道 (不含本根)
+        n = p['breakout_period']
+        columns = [self._column(lag) for lag in range(1, n + 1)]
+        ready = count > n
+        upper = np.where(ready, self.high[:, columns].max(axis=1), nan)
+        lower = np.where(ready, self.low[:, columns].min(axis=1), nan)
+
+        m = p['momentum_period']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            momentum = np.where(count > m, close / self.close[:, self._column(m)] - 1.0, nan)
+
+        self.values = {
+            'close': close, 'ma_fast': ma_fast, 'ma_slow': ma_slow, 'ema': ema, 'dif': dif, 'dea': dea,
+            'macd': dif - dea, 'rsi': rsi, 'upper': upper, 'lower': lower, 'boll_mid': boll_mid,
+            'boll_upper': boll_mid + p['boll_k'] * boll_std, 'boll_lower': boll_mid - p['boll_k'] * boll_std,
+            'momentum': momentum, 'atr': atr,
+        }
+        v = self.values
+        with np.errstate(invalid='ignore'):
+            move = np.where(has_prev, close - prev_close, 0.0)
+            self.signals = {
+                'ma': self._sign(ma_fast - ma_slow),
+                'ema': self._sign(close - ema),
+                'macd': self._sign(v['macd']),
+                'rsi': self._vote(rsi < p['rsi_low'], rsi > p['rsi_high']),
+                'breakout': self._vote(close > upper, close < lower),
+                'bollinger': self._vote(close < v['boll_lower'], close > v['boll_upper']),
+                'momentum': self._vote(momentum > p['momentum_threshold'], momentum < -p['momentum_threshold']),
+                'volatility': self._vote(move > p['vol_k'] * atr, move < -p['vol_k'] * atr),
+            }
+
+    @staticmethod
+    def _sign(x: np.ndarray) -> np.ndarray:
+        return np.nan_to_num(np.sign(x)).astype(np.int8)
+
+    @staticmethod
+    def _vote(long: np.ndarray, short: np.ndarray) -> np.ndarray:
+        return (long.astype(np.int8) - short.astype(np.int8)).astype(np.int8)
+
+    def combined(self, names: List[str], min_votes: Optional[int] = None) -> np.ndarray:
+        """多个信号投票: 同向票数达到 min_votes (默认过半) 时给出方向"""
+        if min_votes is None:
+            min_votes = len(names) // 2 + 1
+        votes = np.sum([self.signals[name] for name in names], axis=0, dtype=np.int64)
+        return np.where(np.abs(votes) >= min_votes, np.sign(votes), 0).astype(np.int8)
+
+
+def align_candles(candles_by_contract: Dict, contracts: List[str], times: np.ndarray):
+    """把各合约的 Candles 按 times 对齐为 (合约数 × K线数) 的 high/low/close 矩阵，缺失为 NaN"""
+    shape = (len(contracts), len(times))
+    high, low, close = np.full(shape, np.nan), np.full(shape, np.nan), np.full(shape, np.nan)
+    for i, contract in enumerate(contracts):
+        candles = candles_by_contract.get(contract)
+        if candles is None or len(candles) == 0:
+            continue
+        pos = np.searchsorted(times, candles.time)
+        ok = pos < len(times)
+        ok[ok] = times[pos[ok]] == candles.time[ok]
+        high[i, pos[ok]] = candles.high[ok]
+        low[i, pos[ok]] = candles.low[ok]
+        close[i, pos[ok]] = candles.close[ok]
+    return high, low, close
+
 
 class TrendFollowingStrategy(BaseStrategy):
+    """多合约趋势跟随
+
+    启动时拉取 warmup 根已收盘K线预热 TrendEngine，之后每根新K线收盘时只增量拉取新K线
+    并做一次向量化更新。组合信号变化的合约会被记录并通知监听者；
+    设置 order_size 且 trade 为 true 时以市价 IOC 调整到目标持仓。
+    """
+
+    config_key = 'trend_following'
+
+    def __init__(self, exchange, config):
+        super().__init__(exchange, config)
+        self.name = "TrendFollowingStrategy"
+        tf_config = config.get('trend_following') or {}
+        self.contracts: List[str] = list(tf_config.get('contracts') or [])
+        self.all_contracts = bool(tf_config.get('all_contracts', False))
+        self.interval = tf_config.get('interval', '1h')
+        self.interval_sec = INTERVAL_SECONDS[self.interval]
+        self.warmup = int(tf_config.get('warmup', 200))
+        self.signal_names = list(tf_config.get('signals') or ['ma', 'macd', 'breakout'])
+        unknown = [name for name in self.signal_names if name not in SIGNAL_NAMES]
+        if unknown:
+            raise ValueError(f"未知的趋势信号: {unknown} (可用: {SIGNAL_NAMES})")
+        self.min_votes = tf_config.get('min_votes')
+        self.params = tf_config.get('params') or {}
+        self.trade = bool(tf_config.get('trade', False))
+        self.order_size = int(tf_config.get('order_size', 0) or 0)
+        self.engine: Optional[TrendEngine] = None
+        # 上一次的组合信号，信号变化时才输出
+        self.targets: Optional[np.ndarray] = None
+        self._listeners: List[Callable[[str, int], None]] = []
+
+    def describe(self) -> str:
+        scope = "全部合约" if not self.contracts and self.all_contracts else self.contracts
+        return f"趋势跟随合约: {scope} | 信号: {self.signal_names}"
+
+    def add_listener(self, callback: Callable[[str, int], None]):
+        """注册信号回调 callback(contract, signal)"""
+        self._listeners.append(callback)
+
+    def closed_bar_time(self, now: Optional[float] = None) -> int:
+        """最近一根已收盘K线的开盘时间"""
+        now = time.time() if now is None else now
+        return int(now // self.interval_sec * self.interval_sec) - self.interval_sec
+
+    # ============ 主循环 ============
     def run(self):
-        pass
+        if self.engine is None:
+            contracts = self.contracts or (list(self.exchange.get_tickers()) if self.all_contracts else [])
+            if not contracts:
+                logger.warning("趋势跟随未配置合约，跳过")
+                return
+            candles = {c: self.exchange.get_candlesticks(c, interval=self.interval, limit=self.warmup + 1)
+                       for c in contracts}
+            self.start(contracts, candles)
+            return
+        start = self.pending_start()
+        if start is None:
+            return
+        candles = {c: self.exchange.get_candlesticks(c, interval=self.interval, start=start)
+                   for c in self.engine.contracts}
+        self.advance(candles)
+        self.execute(self.positions_for_trade())
+
+    async def run_async(self):
+        if self.engine is None:
+            contracts = self.contracts or (list(await self.exchange.get_tickers()) if self.all_contracts else [])
+            if not contracts:
+                logger.warning("趋势跟随未配置合约，跳过")
+                return
+            results = await asyncio.gather(*(
+                self.exchange.get_candlesticks(c, interval=self.interval, limit=self.warmup + 1) for c in contracts
+            ))
+            self.start(contracts, dict(zip(contracts, results)))
+            return
+        start = self.pending_start()
+        if start is None:
+            return
+        contracts = self.engine.contracts
+        results = await asyncio.gather(*(
+            self.exchange.get_candlesticks(c, interval=self.interval, start=start) for c in contracts
+        ))
+        self.advance(dict(zip(contracts, results)))
+        positions = await self.exchange.get_positions() if self.trade and self.order_size else None
+        orders = self.plan_orders(positions)
+        if orders:
+            self.report(await self.exchange.place_orders(orders), orders)
+
+    # ============ 信号 ============
+    def start(self, contracts: List[str], candles: Dict):
+        """用历史K线预热引擎 (不输出信号，只记录当前方向)"""
+        bar_time = self.closed_bar_time()
+        times = bar_time - self.interval_sec * np.arange(self.warmup)[::-1]
+        self.engine = TrendEngine(contracts, self.params)
+        self.engine.fit(*align_candles(candles, contracts, times), times)
+        self.targets = self.engine.combined(self.signal_names, self.min_votes)
+        ready = int((self.engine.count > 0).sum())
+        logger.info(f"趋势引擎预热完成: {ready}/{len(contracts)} 个合约 | 周期: {self.interval} | "
+                    f"信号: {self.signal_names} | 多 {int((self.targets > 0).sum())} 空 {int((self.targets < 0).sum())}")
+
+    def pending_start(self) -> Optional[int]:
+        """有新K线收盘时返回需拉取的起始时间"""
+        if self.engine.last_time is None or self.closed_bar_time() <= self.engine.last_time:
+            return None
+        return self.engine.last_time + self.interval_sec
+
+    def advance(self, candles: Dict):
+        """把新收盘的K线逐根送入引擎，并输出组合信号发生变化的合约"""
+        bar_time = self.closed_bar_time()
+        times = np.arange(self.engine.last_time + self.interval_sec, bar_time + 1, self.interval_sec)
+        self.engine.fit(*align_candles(candles, self.engine.contracts, times), times)
+        targets = self.engine.combined(self.signal_names, self.min_votes)
+        changed = np.flatnonzero(targets != self.targets)
+        self.targets = targets
+        for i in changed:
+            self.emit(self.engine.contracts[i], int(targets[i]))
+
+    def emit(self, contract: str, signal: int):
+        label = {1: "做多", -1: "做空", 0: "观望"}[signal]
+        close = self.engine.values['close'][self.engine.index[contract]]
+        logger.info(f"📈 [{contract}] 趋势信号: {label} (收盘 {close:.6f})")
+        if self.storage is not None:
+            self.storage.save_trigger({
+                'contract': contract, 'strategy': self.name, 'rule': '+'.join(self.signal_names),
+                'price': float(close), 'level': signal, 'reason': f"趋势信号 {label}",
+            })
+        for callback in self._listeners:
+            try:
+                callback(contract, signal)
+            except Exception as e:
+                logger.error(f"趋势信号回调出错: {e}", exc_info=True)
+
+    # ============ 下单 ============
+    def positions_for_trade(self):
+        if not (self.trade and self.order_size):
+            return None
+        return self.exchange.get_positions()
+
+    def execute(self, positions):
+        orders = self.plan_orders(positions)
+        if orders:
+            self.report(self.exchange.place_orders(orders), orders)
+
+    def plan_orders(self, positions) -> List[Dict]:
+        """把持仓调整到 目标方向 × order_size 所需的市价 IOC 订单"""
+        if positions is None:
+            return []
+        orders = []
+        close = self.engine.values['close']
+        for i, contract in enumerate(self.engine.contracts):
+            position = positions.get(contract)
+            current = int(position['size']) if position else 0
+            delta = int(self.targets[i]) * self.order_size - current
+            if delta == 0:
+                continue
+            # 减仓部分与开仓部分分别检查
+            reducing = current != 0 and (delta > 0) != (current > 0)
+            if reducing and abs(delta) <= abs(current):
+                if not self.allow_close(contract, delta):
+                    continue
+            elif not self.allow_open(contract, delta + (current if reducing else 0), float(close[i])):
+                continue
+            orders.append({'contract': contract, 'size': delta, 'price': 0, 'tif': 'ioc'})
+        return orders
+
+    def report(self, results: List[Dict], orders: List[Dict]):
+        for order, result in zip(orders, results):
+            if result['succeeded']:
+                logger.info(f"[{order['contract']}] 趋势调仓 {order['size']:+d} 已提交: ID={result['id']}")
+            else:
+                logger.error(f"[{order['contract']}] 趋势调仓失败: {result['error']}")
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+ATR 止损参数扫描入口
+功能：
+1. 读取 data/candles/ 下的历史K线
+2. 对 (atr_k, 止盈比例, ATR 周期, ATR K线周期) 做网格或随机搜索，多进程并行回测
+3. 按总盈亏排序输出结果表
+"""
+
+from core.backtest import load_candle_files
+from core.notifier import logger
+from core.sweep import grid, random_search, run_sweep, format_table
+
+
+def main():
+    # 配置
+    DATA_DIR = "data/candles"   # 历史K线目录
+    INTERVAL = "1m"             # 回测K线周期
+    CONTRACTS = None            # 指定合约列表，None 表示目录下全部
+    SEARCH = "grid"             # grid 或 random
+    RANDOM_SAMPLES = 200        # 随机搜索的组合数
+    WORKERS = None              # 进程数，None 表示 CPU 核数
+    FEE_RATE = 0.0005           # 单边手续费率
+    SORT_BY = "pnl"             # 排序指标: pnl / win_rate / trades
+
+    candles = load_candle_files(DATA_DIR, INTERVAL, CONTRACTS)
+    if not candles:
+        logger.error(f"未在 {DATA_DIR} 找到 *_{INTERVAL}.npz/.csv 历史K线文件")
+        return
+
+    if SEARCH == "random":
+        params = random_search(RANDOM_SAMPLES, base_interval=INTERVAL)
+    else:
+        params = grid(
+            atr_k=[1.0, 1.5, 2.0, 2.5, 3.0],
+            take_profit_pct=[2.0, 3.0, 5.0, 8.0],
+            period=[14, 21],
+            interval=['15m', '1h'],
+        )
+
+    logger.info(f"开始参数扫描: {len(candles)} 个合约，{len(params)} 组参数")
+    results = run_sweep(candles, params, base_interval=INTERVAL, fee_rate=FEE_RATE, workers=WORKERS, sort_by=SORT_BY)
+    print(format_table(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,15 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pytest
+
+# 测试直接导入项目模块 (core/、strategies/、data/)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+
+@pytest.fixture
+def interactive_bot(tmp_path, monkeypatch):
+    # 导入时在当前目录创建 trading_bot.log
+    monkeypatch.chdir(tmp_path)
+    return importlib.import_module('interactive_bot')
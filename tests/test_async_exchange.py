@@ -0,0 +1,155 @@
+import asyncio
+import hashlib
+import hmac
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import core.async_exchange as async_exchange
+from core.async_exchange import AsyncApiError, AsyncExchange, endpoint_name
+from core.exchange import RequestScheduler
+from core.snapshot_cache import SnapshotCache
+
+
+def test_endpoint_name_hides_ids():
+    assert endpoint_name('GET', '/futures/usdt/orders/12345') == 'GET /futures/usdt/orders/{id}'
+    assert endpoint_name('GET', '/futures/usdt/orders/t-close-1') == 'GET /futures/usdt/orders/{id}'
+    assert endpoint_name('GET', '/futures/usdt/positions') == 'GET /futures/usdt/positions'
+
+
+class FakeGate:
+    """本地 HTTP 服务: 校验签名，记录客户端端口与并发数"""
+
+    def __init__(self, secret):
+        self.secret = secret
+        self.peers = set()
+        self.active = self.max_active = 0
+        self.bad_signatures = 0
+
+    def check_signature(self, request, body):
+        if 'SIGN' not in request.headers:
+            return
+        hashed = hashlib.sha512(body).hexdigest()
+        message = f"{request.method}\n{request.path}\n{request.query_string}\n{hashed}\n{request.headers['Timestamp']}"
+        expected = hmac.new(self.secret.encode(), message.encode(), hashlib.sha512).hexdigest()
+        if request.headers['SIGN'] != expected or request.headers['KEY'] != 'key':
+            self.bad_signatures += 1
+
+    @web.middleware
+    async def track(self, request, handler):
+        self.peers.add(request.transport.get_extra_info('peername')[1])
+        self.check_signature(request, await request.read())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.02)
+            return await handler(request)
+        finally:
+            self.active -= 1
+
+    async def positions(self, request):
+        return web.json_response([
+            {'contract': 'BTC_USDT', 'size': '2', 'entry_price': '100', 'mark_price': '101', 'unrealised_pnl': '2',
+             'mode': 'single', 'leverage': '10', 'margin': '20', 'value': '202'},
+            {'contract': 'ETH_USDT', 'size': '0', 'entry_price': '0', 'mark_price': '0', 'unrealised_pnl': '0',
+             'mode': 'single', 'leverage': '10'},
+        ])
+
+    async def tickers(self, request):
+        contract = request.query.get('contract')
+        tickers = [{'contract': 'BTC_USDT', 'last': '101.5'}, {'contract': 'ETH_USDT', 'last': '10'}]
+        return web.json_response([t for t in tickers if contract in (None, t['contract'])])
+
+    async def order(self, request):
+        return web.json_response({'label': 'ORDER_NOT_FOUND', 'message': 'order not found'}, status=404)
+
+    def app(self):
+        app = web.Application(middlewares=[self.track])
+        app.router.add_get('/api/v4/futures/usdt/positions', self.positions)
+        app.router.add_get('/api/v4/futures/usdt/tickers', self.tickers)
+        app.router.add_get('/api/v4/futures/usdt/orders/{id}', self.order)
+        return app
+
+
+def make_exchange(max_concurrency=10):
+    exchange = AsyncExchange.__new__(AsyncExchange)
+    exchange.api_key, exchange.api_secret = 'key', 'secret'
+    exchange.settle = 'usdt'
+    exchange.scheduler = RequestScheduler()
+    exchange.snapshots = SnapshotCache(1.0)
+    exchange.max_concurrency = max_concurrency
+    exchange.request_timeout = 5
+    exchange.candle_cache_size = 500
+    exchange._candle_cache = {}
+    exchange.storage = exchange.candle_archive = None
+    exchange._session = exchange._semaphore = None
+    exchange._close_templates = {}
+    exchange._confirm_tasks = set()
+    return exchange
+
+
+def run_with_server(monkeypatch, main):
+    gate = FakeGate('secret')
+
+    async def runner():
+        server = TestServer(gate.app())
+        await server.start_server()
+        monkeypatch.setattr(async_exchange, 'API_HOST', str(server.make_url('')).rstrip('/'))
+        try:
+            return await main()
+        finally:
+            await server.close()
+
+    return gate, asyncio.run(runner())
+
+
+def test_signed_requests_share_one_keep_alive_connection(monkeypatch):
+    async def main():
+        exchange = make_exchange()
+        positions = await exchange.get_positions()
+        exchange.snapshots.invalidate()
+        tickers = await exchange.get_tickers()
+        price = await exchange.get_current_price('ETH_USDT')
+        await exchange.close()
+        return exchange, positions, tickers, price
+
+    gate, (exchange, positions, tickers, price) = run_with_server(monkeypatch, main)
+    assert list(positions) == ['BTC_USDT']
+    assert positions['BTC_USDT']['size'] == 2.0 and positions['BTC_USDT']['value'] == 202.0
+    assert tickers == {'BTC_USDT': 101.5, 'ETH_USDT': 10.0}
+    # 行情快照未过期时直接复用
+    assert price == 10.0
+    assert gate.bad_signatures == 0
+    assert len(gate.peers) == 1
+    assert exchange._session is None
+
+
+def test_concurrency_is_bounded_by_the_pool(monkeypatch):
+    contracts = ['BTC_USDT', 'ETH_USDT'] * 3
+
+    async def main():
+        exchange = make_exchange(max_concurrency=2)
+        results = await asyncio.gather(*(exchange._load_price(c) for c in contracts))
+        await exchange.close()
+        return results
+
+    gate, results = run_with_server(monkeypatch, main)
+    assert results == [101.5, 10.0] * 3
+    assert gate.max_active == 2
+    assert len(gate.peers) <= 2
+
+
+def test_http_errors_raise_api_error(monkeypatch):
+    async def main():
+        exchange = make_exchange()
+        with pytest.raises(AsyncApiError) as excinfo:
+            await exchange._request('GET', '/futures/usdt/orders/123', signed=True)
+        missing = await exchange.get_order('123')
+        await exchange.close()
+        return excinfo.value, missing
+
+    _, (error, missing) = run_with_server(monkeypatch, main)
+    assert error.status == 404 and error.body['label'] == 'ORDER_NOT_FOUND'
+    assert 'ORDER_NOT_FOUND' in str(error)
+    assert missing is None
@@ -0,0 +1,79 @@
+import threading
+
+from auto_stop_loss import AutoTradingMonitor
+from core.trigger_index import FALLING, RISING
+
+
+class FakeFeed:
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def subscribe(self, contracts):
+        pass
+
+    def start_background(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+def make_monitor():
+    monitor = AutoTradingMonitor(price_feed=FakeFeed(), exchange=object())
+    monitor.triggers.set("BTC_USDT:stop_loss", "BTC_USDT", 90.0, FALLING)
+    monitor.triggers.set("BTC_USDT:take_profit", "BTC_USDT", 110.0, RISING)
+    return monitor
+
+
+def test_wakes_only_when_a_level_is_newly_crossed():
+    monitor = make_monitor()
+    monitor.on_price("BTC_USDT", 100.0)
+    assert not monitor._wake.is_set()
+
+    monitor.on_price("BTC_USDT", 89.0)
+    assert monitor._wake.is_set()
+    # 价格停留在止损价之外 (例如平仓失败待重试) 不再唤醒
+    monitor._wake.clear()
+    for price in (88.0, 87.5, 89.9):
+        monitor.on_price("BTC_USDT", price)
+    assert not monitor._wake.is_set()
+
+    # 回到价位内再次越过时重新唤醒
+    monitor.on_price("BTC_USDT", 95.0)
+    monitor.on_price("BTC_USDT", 89.0)
+    assert monitor._wake.is_set()
+
+
+def test_moved_level_wakes_when_newly_crossed():
+    monitor = make_monitor()
+    monitor.on_price("BTC_USDT", 95.0)
+    # 主循环按新的 ATR 把止损价上移到 96
+    monitor.triggers.set("BTC_USDT:stop_loss", "BTC_USDT", 96.0, FALLING)
+    monitor.on_price("BTC_USDT", 95.5)
+    assert monitor._wake.is_set()
+
+
+def test_wakeup_during_check_is_not_lost():
+    monitor = make_monitor()
+    checks = []
+    done = threading.Event()
+
+    def check_and_execute(contract, atr_k, take_profit_pct):
+        checks.append(contract)
+        if len(checks) == 1:
+            # 检查期间到达的推送行情
+            monitor.on_price("BTC_USDT", 89.0)
+            return True
+        done.set()
+        return False
+
+    monitor.check_and_execute = check_and_execute
+    thread = threading.Thread(target=monitor.run, args=("BTC_USDT",), kwargs={'interval': 30})
+    thread.start()
+    # 唤醒丢失时第二次检查要等满 30 秒
+    assert done.wait(5)
+    thread.join(5)
+    assert len(checks) == 2
@@ -0,0 +1,131 @@
+import random
+
+import numpy as np
+import pytest
+
+from core import indicators
+from core.backtest import (Backtester, SimExchange, atr_before, load_candle_files, make_fill, simulate_atr_stop,
+                           summarize)
+from core.candles import Candles
+from strategies.stop_loss import StopLossStrategy
+
+
+def random_candles(count, interval=60, seed=0, start_price=100.0):
+    rng = random.Random(seed)
+    rows, close = [], start_price
+    for i in range(count):
+        open_ = close + rng.gauss(0, 0.3)
+        close = max(1.0, open_ + rng.gauss(0, 1))
+        rows.append({'time': i * interval, 'open': open_, 'high': max(open_, close) + rng.uniform(0, 1),
+                     'low': min(open_, close) - rng.uniform(0, 1), 'close': close, 'volume': 1.0})
+    return Candles.from_dicts(rows)
+
+
+def closes(values, interval=60):
+    return Candles(np.arange(len(values)) * interval, values, values, values, values, np.ones(len(values)))
+
+
+def reference_atr_stop(candles, atr_prev, atr_k, take_profit_pct, side):
+    """逐根K线的参考实现"""
+    fills, start, n = [], 0, len(candles)
+    while start < n - 1:
+        entry = candles.close[start]
+        for j in range(start + 1, n):
+            atr = atr_prev[j]
+            if atr > 0:
+                stop = entry - side * atr_k * atr
+                take = entry * (1 + side * take_profit_pct / 100)
+            else:
+                stop, take = entry * (1 - side * 0.05), entry * (1 + side * 0.05)
+            low, high, open_ = candles.low[j], candles.high[j], candles.open[j]
+            if (low <= stop) if side > 0 else (high >= stop):
+                fills.append((j, min(open_, stop) if side > 0 else max(open_, stop), 'stop_loss'))
+                break
+            if (high >= take) if side > 0 else (low <= take):
+                fills.append((j, max(open_, take) if side > 0 else min(open_, take), 'take_profit'))
+                break
+        else:
+            fills.append((n - 1, candles.close[-1], 'end'))
+            break
+        start = j
+    return fills
+
+
+@pytest.mark.parametrize('side', [1, -1])
+def test_vectorized_atr_stop_matches_reference(side):
+    candles = random_candles(3000, seed=side + 5)
+    atr_prev = atr_before(candles, 60, 900, 14)
+    fills = simulate_atr_stop('BTC_USDT', candles, atr_k=1.5, take_profit_pct=1.0, interval='1m', atr_interval='15m',
+                              side=side, atr_prev=atr_prev)
+    expected = reference_atr_stop(candles, atr_prev, 1.5, 1.0, side)
+    assert len(fills) == len(expected) > 10
+    for fill, (j, price, reason) in zip(fills, expected):
+        assert (fill['exit_time'], fill['reason']) == (candles.time[j], reason)
+        assert fill['exit_price'] == pytest.approx(price)
+
+
+def test_atr_before_only_uses_closed_candles():
+    candles = random_candles(600)
+    atr_prev = atr_before(candles, 60, 3600, 3)
+    hourly = candles.resample(3600)
+    hourly_atr = indicators.atr(hourly.high, hourly.low, hourly.close, 3)
+    # 第 5 小时的第一根分钟K线只能看到前 4 根小时K线
+    assert atr_prev[4 * 60] == pytest.approx(hourly_atr[3])
+    assert atr_prev[5 * 60 - 1] == pytest.approx(hourly_atr[3])
+    assert np.isnan(atr_prev[:3 * 60]).all()
+    same = atr_before(candles, 60, 60, 3)
+    assert np.isnan(same[0]) and same[10] == pytest.approx(indicators.atr(candles.high, candles.low, candles.close, 3)[9])
+    with pytest.raises(ValueError):
+        atr_before(candles, 3600, 60, 3)
+
+
+def test_sim_exchange_hides_unclosed_candles():
+    candles = random_candles(180)
+    exchange = SimExchange({'BTC_USDT': candles}, '1m')
+    exchange.now = 119 * 60
+    assert exchange.get_current_price('BTC_USDT') == candles.close[119]
+    assert exchange.get_candlesticks('BTC_USDT', '1m', limit=5).time.tolist() == [115 * 60, 116 * 60, 117 * 60,
+                                                                                118 * 60, 119 * 60]
+    # 第 2 小时在当前分钟K线收盘时才收盘
+    assert exchange.get_candlesticks('BTC_USDT', '1h').time.tolist() == [0, 3600]
+    exchange.now = 118 * 60
+    assert exchange.get_candlesticks('BTC_USDT', '1h').time.tolist() == [0]
+    assert exchange.calculate_atr('BTC_USDT', '1h', 14) == 0.0
+    assert exchange.get_tickers()['BTC_USDT'] == candles.close[118]
+    with pytest.raises(KeyError):
+        exchange.get_tickers()['ETH_USDT']
+
+
+def test_replay_drives_stop_loss_strategy_with_reentry():
+    # 价格跌破 95 后回升，再次跌破
+    prices = [100, 98, 94, 99, 100, 96, 93, 97]
+    backtester = Backtester({'BTC_USDT': closes(prices)}, '1m', fee_rate=0.0)
+    config = {'contracts': [{'contract': 'BTC_USDT', 'stop_loss_price': 95}]}
+    result = backtester.replay(lambda ex: StopLossStrategy(ex, config).run, {'BTC_USDT': 2})
+
+    fills = result['fills']
+    assert [(f['entry_price'], f['exit_price']) for f in fills] == [(100, 94), (99, 93), (97, 97)]
+    assert [f['reason'] for f in fills][-1] == 'end'
+    assert result['pnl'] == pytest.approx(2 * (-6 - 6 + 0))
+    assert result['trades'] == 3 and result['candles'] == len(prices)
+
+
+def test_summarize_drawdown_and_fees():
+    fills = [make_fill('A', 1, 0, t, 100, exit_price, 0.001) for t, exit_price in
+             [(3, 110), (1, 90), (2, 95)]]
+    summary = summarize(fills, elapsed=1.0, candles=10)
+    assert [f['exit_time'] for f in summary['fills']] == [1, 2, 3]
+    assert summary['fees'] == pytest.approx(0.001 * (190 + 195 + 210))
+    assert summary['max_drawdown'] == pytest.approx(-summary['fills'][0]['pnl'] - summary['fills'][1]['pnl'])
+    assert summary['win_rate'] == pytest.approx(1 / 3)
+
+
+def test_load_candle_files(tmp_path):
+    candles = random_candles(10)
+    candles.save(tmp_path / "BTC_USDT_1m.npz")
+    candles.save(tmp_path / "ETH_USDT_1m.bin")
+    candles.save(tmp_path / "ETH_USDT_1h.csv")
+    (tmp_path / "notes_1m.txt").write_text("x")
+    loaded = load_candle_files(tmp_path, '1m')
+    assert sorted(loaded) == ['BTC_USDT', 'ETH_USDT']
+    assert list(load_candle_files(tmp_path, '1m', contracts=['ETH_USDT'])) == ['ETH_USDT']
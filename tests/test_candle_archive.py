@@ -0,0 +1,135 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import data.candle_archive as candle_archive
+from core.candles import Candles
+from data.candle_archive import CandleArchive
+
+MINUTE = 60
+
+
+def candles_between(begin, end, listed_at=0):
+    """[begin, end] 内的分钟K线 (价格由时间决定)，交易所只有 listed_at 之后的数据"""
+    times = np.arange(max(begin, listed_at), end + 1, MINUTE)
+    price = 100 + (times // MINUTE) % 50
+    return Candles(times, price, price + 1, price - 1, price + 0.5, np.ones(len(times)))
+
+
+class FakeMarket:
+    """按 (from, to) 返回K线并记录请求，只返回到当前未收盘K线为止"""
+
+    def __init__(self, now, listed_at=0):
+        self.now, self.listed_at = now, listed_at
+        self.requests = []
+
+    def fetch(self, begin, end):
+        self.requests.append((begin, end))
+        current = self.now // MINUTE * MINUTE
+        return candles_between(begin, min(end, current), self.listed_at)
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return CandleArchive(root=tmp_path)
+
+
+def serve(archive, market, **kwargs):
+    return archive.serve('BTC_USDT', '1m', market.fetch, now=market.now, **kwargs)
+
+
+def test_first_request_archives_closed_candles(archive):
+    market = FakeMarket(now=1000 * MINUTE + 30)
+    candles = serve(archive, market, limit=10)
+    assert market.requests == [(991 * MINUTE, 1000 * MINUTE)]
+    assert candles.time.tolist() == list(range(991 * MINUTE, 1001 * MINUTE, MINUTE))
+    # 未收盘的最后一根不写入归档
+    assert archive.bounds('BTC_USDT', '1m') == (991 * MINUTE, 999 * MINUTE)
+
+
+def test_later_request_fetches_only_the_tail(archive):
+    market = FakeMarket(now=1000 * MINUTE + 30)
+    serve(archive, market, limit=10)
+    market.now += 5 * MINUTE
+    market.requests.clear()
+
+    candles = serve(archive, market, limit=10)
+    assert market.requests == [(1000 * MINUTE, 1005 * MINUTE)]
+    assert candles.time.tolist() == list(range(996 * MINUTE, 1006 * MINUTE, MINUTE))
+    np.testing.assert_array_equal(candles.close, candles_between(996 * MINUTE, 1005 * MINUTE).close)
+
+    # 归档已是最新时只请求当前这一根
+    market.requests.clear()
+    serve(archive, market, limit=3)
+    assert market.requests == [(1005 * MINUTE, 1005 * MINUTE)]
+
+
+def test_backfill_stops_at_the_listing_time(archive):
+    market = FakeMarket(now=1000 * MINUTE + 30, listed_at=950 * MINUTE)
+    serve(archive, market, limit=10)
+    market.requests.clear()
+
+    candles = serve(archive, market, start=900 * MINUTE)
+    assert market.requests[0] == (900 * MINUTE, 990 * MINUTE)
+    assert candles.time[0] == 950 * MINUTE and len(candles) == 51
+
+    # 已确认交易所没有更早的数据，不再重复回补
+    market.requests.clear()
+    serve(archive, market, start=900 * MINUTE)
+    assert market.requests == [(1000 * MINUTE, 1000 * MINUTE)]
+
+
+def test_missing_splits_long_ranges(archive, monkeypatch):
+    monkeypatch.setattr(candle_archive, 'MAX_POINTS', 100)
+    want, ranges = archive.missing('BTC_USDT', '1m', limit=250, now=1000 * MINUTE + 30)
+    assert want == 751 * MINUTE
+    assert ranges == [(751 * MINUTE, 850 * MINUTE), (851 * MINUTE, 950 * MINUTE), (951 * MINUTE, 1000 * MINUTE)]
+    # start 向上取整到周期边界
+    assert archive.missing('BTC_USDT', '1m', start=990 * MINUTE + 1, now=1000 * MINUTE)[0] == 991 * MINUTE
+
+
+def test_failed_fetch_keeps_downloaded_chunks(archive, monkeypatch):
+    monkeypatch.setattr(candle_archive, 'MAX_POINTS', 10)
+    market = FakeMarket(now=1000 * MINUTE + 30)
+
+    def flaky(begin, end):
+        if market.requests:
+            raise ConnectionError("network")
+        return market.fetch(begin, end)
+
+    with pytest.raises(ConnectionError):
+        archive.serve('BTC_USDT', '1m', flaky, limit=30, now=market.now)
+    assert archive.bounds('BTC_USDT', '1m') == (971 * MINUTE, 980 * MINUTE)
+
+
+def test_store_merges_and_keeps_existing_records(archive):
+    archive.store('BTC_USDT', '1m', candles_between(10 * MINUTE, 20 * MINUTE), now=10 ** 6)
+    mapped = archive.records('BTC_USDT', '1m')
+    assert len(mapped) == 11
+
+    # 追加后重新映射
+    assert archive.store('BTC_USDT', '1m', candles_between(21 * MINUTE, 22 * MINUTE), now=10 ** 6) == 2
+    assert len(archive.records('BTC_USDT', '1m')) == 13
+
+    replacement = candles_between(5 * MINUTE, 15 * MINUTE)
+    replacement.close[:] = -1
+    assert archive.store('BTC_USDT', '1m', replacement, now=10 ** 6) == 5
+    merged = archive.read('BTC_USDT', '1m')
+    assert merged.time.tolist() == list(range(5 * MINUTE, 23 * MINUTE, MINUTE))
+    assert (merged.close[:5] == -1).all() and (merged.close[5:] > 0).all()
+    assert archive.store('BTC_USDT', '1m', candles_between(10 * MINUTE, 12 * MINUTE), now=10 ** 6) == 0
+    assert archive.contracts('1m') == ['BTC_USDT']
+    assert archive.read('BTC_USDT', '1m', start=7 * MINUTE, end=8 * MINUTE).time.tolist() == [7 * MINUTE, 8 * MINUTE]
+
+
+def test_serve_async_matches_serve(tmp_path):
+    market = FakeMarket(now=1000 * MINUTE + 30)
+    expected = serve(CandleArchive(root=tmp_path / "sync"), market, limit=20)
+
+    async def fetch(begin, end):
+        return market.fetch(begin, end)
+
+    candles = asyncio.run(CandleArchive(root=tmp_path / "async").serve_async('BTC_USDT', '1m', fetch, limit=20,
+                                                                            now=market.now))
+    np.testing.assert_array_equal(candles.time, expected.time)
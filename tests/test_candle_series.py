@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from core.exchange import CandleSeries, Exchange
+
+
+def make_candles(count, start=0, interval=60, seed=0):
+    rng = random.Random(seed)
+    candles, close = [], 100.0
+    for i in range(count):
+        open_ = close
+        close = max(1.0, open_ + rng.uniform(-3, 3))
+        high = max(open_, close) + rng.uniform(0, 2)
+        low = min(open_, close) - rng.uniform(0, 2)
+        candles.append({'time': start + i * interval, 'open': open_, 'high': high, 'low': low, 'close': close})
+    return candles
+
+
+def brute_atr(candles, period):
+    """最近 period 根K线的真实波幅均值"""
+    window = candles[-(period + 1):]
+    trs = [max(c['high'] - c['low'], abs(c['high'] - p['close']), abs(c['low'] - p['close']))
+           for p, c in zip(window, window[1:])]
+    return sum(trs) / period if len(trs) == period else 0.0
+
+
+def test_rolling_atr_matches_full_recompute():
+    candles = make_candles(600)
+    series = CandleSeries(60, maxlen=200)
+    for candle in candles[:20]:
+        series.append(candle)
+    # 先初始化一个周期，另一个在中途首次请求
+    assert series.atr(14) == pytest.approx(brute_atr(candles[:20], 14))
+    for i, candle in enumerate(candles[20:], start=21):
+        assert series.append(candle)
+        assert series.atr(14) == pytest.approx(brute_atr(candles[:i], 14), rel=1e-12)
+        if i == 300:
+            assert series.atr(50) == pytest.approx(brute_atr(candles[:i], 50))
+    assert series.atr(50) == pytest.approx(brute_atr(candles, 50), rel=1e-12)
+    assert len(series) == 200
+
+
+def test_periodic_resync_removes_float_drift():
+    series = CandleSeries(60)
+    series.atr(3)
+    for candle in make_candles(4):
+        series.append(candle)
+    state = series._atr_state[3]
+    state['sum'] += 1e-6
+    # 滚动一整轮后重新求和
+    for candle in make_candles(3, start=4 * 60, seed=1):
+        series.append(candle)
+    assert state['sum'] == sum(state['trs'])
+
+
+def test_not_enough_candles_and_out_of_order_append():
+    series = CandleSeries(60)
+    candles = make_candles(5)
+    for candle in candles:
+        series.append(candle)
+    assert series.atr(14) == 0.0
+    assert not series.append(candles[2])
+    assert not series.append(dict(candles[-1]))
+    assert len(series) == 5
+
+
+def test_fetch_params_warmup_then_incremental():
+    series = CandleSeries(60)
+    assert series.fetch_params(15, now=1000) == {'limit': 16}
+    assert series.warmup == 15
+
+    # 最后一根 (time=960) 尚未收盘，不缓存
+    series.extend(make_candles(17, start=0), now=1000)
+    assert series.last_time == 900
+    # 下一根 (960) 收盘前无需请求
+    assert series.fetch_params(15, now=1019) is None
+    assert series.fetch_params(15, now=1020) == {'start': 960}
+    # 需要更长的历史时重新预热
+    assert series.fetch_params(30, now=1020) == {'limit': 31}
+    assert len(series) == 0
+
+
+class FakeExchange(Exchange):
+    """只实现K线请求的交易所"""
+
+    def __init__(self, candles):
+        self.candle_cache_size = 500
+        self._candle_cache = {}
+        self.all_candles = candles
+        self.requests = []
+
+    def get_candlesticks(self, contract, interval='1h', limit=200, start=None):
+        self.requests.append({'limit': limit} if start is None else {'start': start})
+        if start is None:
+            return self.all_candles[-limit:]
+        return [c for c in self.all_candles if c['time'] >= start]
+
+
+def test_calculate_atr_fetches_only_new_candles(monkeypatch):
+    now = [3600 * 100 + 10]
+    monkeypatch.setattr('core.exchange.time.time', lambda: now[0])
+    candles = make_candles(101, interval=3600)
+    exchange = FakeExchange(candles)
+
+    atr = exchange.calculate_atr('BTC_USDT', '1h', 14)
+    # 最后一根 (未收盘) 不参与计算
+    assert atr == pytest.approx(brute_atr(candles[:100], 14))
+    assert exchange.calculate_atr('BTC_USDT', '1h', 14) == atr
+    assert exchange.requests == [{'limit': 16}]
+
+    exchange.all_candles = candles + make_candles(1, start=101 * 3600, interval=3600, seed=2)
+    now[0] += 3600
+    assert exchange.calculate_atr('BTC_USDT', '1h', 14) == pytest.approx(brute_atr(exchange.all_candles[:101], 14))
+    assert exchange.requests[1:] == [{'start': 100 * 3600}]
+
+
+def test_calculate_atr_unknown_interval():
+    assert FakeExchange([]).calculate_atr('BTC_USDT', '7m') == 0.0
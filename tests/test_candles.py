@@ -0,0 +1,123 @@
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from core import indicators
+from core.candles import Candles
+from core.exchange import CandleSeries
+
+
+def random_candles(count, interval=60, seed=0):
+    rng = random.Random(seed)
+    rows, close = [], 100.0
+    for i in range(count):
+        open_ = close
+        close = max(1.0, open_ + rng.uniform(-3, 3))
+        rows.append({'time': i * interval, 'open': open_, 'high': max(open_, close) + rng.uniform(0, 2),
+                     'low': min(open_, close) - rng.uniform(0, 2), 'close': close, 'volume': rng.uniform(0, 10)})
+    return rows
+
+
+def test_views_keep_dict_access():
+    rows = random_candles(5)
+    candles = Candles.from_dicts(rows)
+    assert len(candles) == 5
+    assert candles[-1]['close'] == rows[-1]['close']
+    assert candles[0]['time'] == 0 and isinstance(candles[0]['time'], int)
+    assert candles[1]['datetime'].timestamp() == 60
+    assert [c['open'] for c in candles] == [r['open'] for r in rows]
+    assert {k: v for k, v in candles.to_dicts()[2].items() if k != 'datetime'} == rows[2]
+    assert len(candles[1:3]) == 2 and candles[1:3][0]['time'] == 60
+    with pytest.raises(IndexError):
+        candles[5]
+    with pytest.raises(KeyError):
+        candles[0]['foo']
+
+
+def test_from_api_parses_strings():
+    sticks = [SimpleNamespace(t=60, o='1.5', h='2', l='1', c='1.8', v=None)]
+    candles = Candles.from_api(sticks)
+    assert candles.close.dtype == np.float64 and candles.close[0] == 1.8
+    assert candles.volume[0] == 0
+    assert len(Candles.from_api(None)) == 0
+
+
+@pytest.mark.parametrize('suffix', ['.npz', '.csv', '.bin'])
+def test_save_load_roundtrip(tmp_path, suffix):
+    candles = Candles.from_dicts(random_candles(20))
+    path = tmp_path / f"candles{suffix}"
+    candles.save(path)
+    loaded = Candles.load(path)
+    for key in Candles.__slots__:
+        np.testing.assert_allclose(getattr(loaded, key), getattr(candles, key), rtol=1e-9)
+
+
+def test_resample_and_concat():
+    candles = Candles.from_dicts(random_candles(10))
+    parts = Candles.concat([candles[:4], Candles.empty(), candles[4:]])
+    np.testing.assert_array_equal(parts.close, candles.close)
+
+    hourly = candles.resample(180)
+    assert hourly.time.tolist() == [0, 180, 360, 540]
+    assert hourly.open[1] == candles.open[3]
+    assert hourly.close[1] == candles.close[5]
+    assert hourly.high[1] == candles.high[3:6].max()
+    assert hourly.low[3] == candles.low[9]
+    assert hourly.volume[0] == pytest.approx(candles.volume[:3].sum())
+
+
+def reference_smoothing(values, alpha, period):
+    """逐点递推: 以前 period 个值的均值为初值"""
+    out = [np.nan] * len(values)
+    if len(values) < period:
+        return out
+    out[period - 1] = sum(values[:period]) / period
+    for i in range(period, len(values)):
+        out[i] = (1 - alpha) * out[i - 1] + alpha * values[i]
+    return out
+
+
+@pytest.mark.parametrize('period', [3, 14, 200])
+def test_ema_and_wilder_match_recursion(period):
+    close = np.array([c['close'] for c in random_candles(3000, seed=period)])
+    np.testing.assert_allclose(indicators.ema(close, period), reference_smoothing(close, 2 / (period + 1), period),
+                               rtol=1e-9)
+    np.testing.assert_allclose(indicators.wilder(close, period), reference_smoothing(close, 1 / period, period),
+                               rtol=1e-9)
+
+
+def test_atr_matches_candle_series():
+    rows = random_candles(100)
+    candles = Candles.from_dicts(rows)
+    values = indicators.atr(candles.high, candles.low, candles.close, 14)
+    assert np.isnan(values[:14]).all()
+
+    series = CandleSeries(60)
+    for i, row in enumerate(rows):
+        series.append(row)
+        if i >= 14:
+            assert values[i] == pytest.approx(series.atr(14))
+    with pytest.raises(ValueError):
+        indicators.atr(candles.high, candles.low, candles.close, method='ema')
+
+
+def test_rsi_bounds_and_monotonic_input():
+    assert indicators.rsi(np.arange(30.0), 14)[-1] == 100.0
+    assert indicators.rsi(np.arange(30.0, 0, -1), 14)[-1] == pytest.approx(0.0)
+    values = indicators.rsi([c['close'] for c in random_candles(200)], 14)
+    assert np.isnan(values[:14]).all()
+    assert ((values[14:] >= 0) & (values[14:] <= 100)).all()
+
+
+def test_bollinger_and_macd_shapes():
+    close = np.array([c['close'] for c in random_candles(60)])
+    mid, upper, lower = indicators.bollinger(close, 20, 2.0)
+    assert mid[-1] == pytest.approx(close[-20:].mean())
+    assert upper[-1] - mid[-1] == pytest.approx(2.0 * close[-20:].std())
+    assert np.isnan(mid[:19]).all()
+
+    dif, dea, hist = indicators.macd(close)
+    np.testing.assert_allclose(hist[~np.isnan(hist)], (dif - dea)[~np.isnan(hist)])
+    assert np.isnan(dif[:25]).all() and not np.isnan(dif[25])
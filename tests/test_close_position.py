@@ -0,0 +1,190 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+import core.async_exchange as async_exchange
+import core.exchange as exchange_module
+from core.async_exchange import AsyncApiError, AsyncExchange
+from core.exchange import Exchange, RequestScheduler
+from core.snapshot_cache import SnapshotCache
+
+
+class ApiError(Exception):
+    def __init__(self, status=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+
+
+class FakeStorage:
+    def __init__(self):
+        self.orders, self.trades = [], []
+
+    def save_order(self, order):
+        self.orders.append(order)
+
+    def save_trade(self, trade):
+        self.trades.append(trade)
+
+
+def sdk_order(text, status='finished'):
+    return SimpleNamespace(id=42, contract='BTC_USDT', size=-2, left=0, price='0', fill_price='99.5',
+                           status=status, finish_as='filled', text=text)
+
+
+class FakeFuturesApi:
+    """create_futures_order 依次抛出 create_errors 中的异常；get_futures_order 按标识查询已提交的订单"""
+
+    def __init__(self, create_errors=(), lookup_error=None):
+        self.create_errors = list(create_errors)
+        self.lookup_error = lookup_error
+        self.submitted = []
+        self.lookups = []
+        self.arrived = {}
+
+    def create_futures_order(self, settle, futures_order, _request_timeout=None):
+        self.submitted.append(futures_order.text)
+        if self.create_errors:
+            error, arrived = self.create_errors.pop(0)
+            if arrived:
+                # 请求到达交易所但响应丢失
+                self.arrived[futures_order.text] = sdk_order(futures_order.text)
+            raise error
+        return sdk_order(futures_order.text)
+
+    def get_futures_order(self, settle, order_id, _request_timeout=None):
+        self.lookups.append(order_id)
+        if order_id in self.arrived:
+            return self.arrived[order_id]
+        raise self.lookup_error or ApiError(404)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    for module in (exchange_module, async_exchange):
+        monkeypatch.setattr(module, 'CLOSE_BACKOFF', 0)
+        monkeypatch.setattr(module, 'CONFIRM_INTERVAL', 0.01)
+
+
+def make_exchange(api):
+    exchange = Exchange.__new__(Exchange)
+    exchange.settle = 'usdt'
+    exchange.scheduler = RequestScheduler()
+    exchange.snapshots = SnapshotCache(1.0)
+    exchange.storage = FakeStorage()
+    exchange.futures_api = api
+    exchange._close_templates = {}
+    exchange._confirmer = ThreadPoolExecutor(max_workers=1)
+    return exchange
+
+
+def test_uncertain_submit_found_by_text_is_not_resent():
+    api = FakeFuturesApi(create_errors=[(ApiError(None), True)])
+    exchange = make_exchange(api)
+    assert exchange.close_position('BTC_USDT', 2, 'single') is True
+    exchange.close()
+
+    assert len(api.submitted) == 1
+    assert api.lookups == api.submitted
+    assert exchange.storage.orders[0]['order_id'] == '42'
+    assert exchange.storage.trades[0]['size'] == -2
+
+
+def test_uncertain_submit_not_on_exchange_is_resent_with_same_text():
+    api = FakeFuturesApi(create_errors=[(ApiError(503), False), (ApiError(None), False)])
+    exchange = make_exchange(api)
+    assert exchange.close_position('BTC_USDT', 2, 'single') is True
+    exchange.close()
+
+    assert len(api.submitted) == 3 and len(set(api.submitted)) == 1
+    assert api.submitted[0].startswith(exchange_module.CLOSE_TEXT_PREFIX)
+    assert len(api.lookups) == 2
+
+
+def test_rejected_submit_is_not_retried():
+    api = FakeFuturesApi(create_errors=[(ApiError(400), False)])
+    exchange = make_exchange(api)
+    assert exchange.close_position('BTC_USDT', 2, 'single') is False
+    exchange.close()
+    assert len(api.submitted) == 1 and api.lookups == []
+    assert exchange.storage.orders[0]['success'] == 0
+
+
+def test_close_waits_for_pending_confirmation():
+    api = FakeFuturesApi()
+    api.create_futures_order = lambda settle, futures_order, _request_timeout=None: sdk_order(
+        futures_order.text, status='open')
+    exchange = make_exchange(api)
+    polls = []
+
+    def get_order(order_id):
+        polls.append(order_id)
+        return exchange._parse_order(sdk_order('t-x', status='finished' if len(polls) > 2 else 'open'))
+
+    exchange.get_order = get_order
+    assert exchange.close_position('BTC_USDT', 2, 'single') is True
+    exchange.close()
+    assert len(polls) == 3
+    assert [order['status'] for order in exchange.storage.orders] == ['finished']
+
+
+def make_async_exchange(responses):
+    """_send 依次返回/抛出 responses 中的结果，_request (按标识查询) 查找已到达的订单"""
+    exchange = AsyncExchange.__new__(AsyncExchange)
+    exchange.settle = 'usdt'
+    exchange.scheduler = RequestScheduler()
+    exchange.snapshots = SnapshotCache(1.0)
+    exchange.storage = FakeStorage()
+    exchange._close_templates = {}
+    exchange._confirm_tasks = set()
+    exchange._session = None
+    exchange.sent, exchange.arrived = [], {}
+
+    async def send(method, path, query, body, signed):
+        exchange.sent.append(body['text'])
+        result = responses.pop(0)
+        order = dict(vars(sdk_order(body['text'])), status=result)
+        if isinstance(result, Exception):
+            exchange.arrived[body['text']] = dict(order, status='finished')
+            raise result
+        return order
+
+    async def request(method, path, query=None, body=None, signed=False):
+        text = path.rsplit('/', 1)[-1]
+        if text in exchange.arrived:
+            return exchange.arrived[text]
+        if text == '42':
+            # 确认轮询
+            await asyncio.sleep(0.01)
+            return dict(vars(sdk_order(text)))
+        raise AsyncApiError(404, {'label': 'ORDER_NOT_FOUND'})
+
+    exchange._send = send
+    exchange._request = request
+    return exchange
+
+
+def test_async_uncertain_submit_found_by_text_is_not_resent():
+    async def main():
+        exchange = make_async_exchange([asyncio.TimeoutError()])
+        assert await exchange.close_position('BTC_USDT', 2, 'single') is True
+        await exchange.close()
+        return exchange
+
+    exchange = asyncio.run(main())
+    assert len(exchange.sent) == 1
+    assert [order['status'] for order in exchange.storage.orders] == ['finished']
+
+
+def test_async_close_drains_confirmations():
+    async def main():
+        exchange = make_async_exchange(['open'])
+        assert await exchange.close_position('BTC_USDT', 2, 'single') is True
+        assert len(exchange._confirm_tasks) == 1
+        await exchange.close()
+        assert exchange._confirm_tasks == set()
+        return exchange
+
+    exchange = asyncio.run(main())
+    assert [order['status'] for order in exchange.storage.orders] == ['finished']
@@ -0,0 +1,155 @@
+import pytest
+
+from core.engine import Engine
+from strategies.base_strategy import BaseStrategy
+from strategies.registry import default_registry
+
+
+class FakeSnapshots:
+    ttl = 1.0
+
+
+class FakeExchange:
+    settle = 'usdt'
+    snapshots = FakeSnapshots()
+
+
+class FakeStrategy(BaseStrategy):
+    """参数在 fake 段: fail 为真时初始化失败，inplace 为真时支持就地更新，reject 为真时拒绝新参数"""
+
+    config_key = 'fake'
+
+    def __init__(self, exchange, config):
+        super().__init__(exchange, config)
+        if config['fake'].get('fail'):
+            raise RuntimeError("初始化失败")
+        self.name = "FakeStrategy"
+        self.stopped = False
+        self.applied = []
+
+    def run(self):
+        pass
+
+    def reconfigure(self, config):
+        params = config['fake']
+        if params.get('reject'):
+            raise ValueError("参数无效")
+        if not self.config['fake'].get('inplace'):
+            return None
+        return lambda: self.applied.append(params)
+
+    def shutdown(self):
+        super().shutdown()
+        self.stopped = True
+
+
+default_registry().register('fake_reload', FakeStrategy)
+
+
+def fake_config(**params):
+    """每个键为一个策略实例的名称，值为其参数"""
+    return {'strategies': [{'type': 'fake_reload', 'name': name, 'params': p} for name, p in params.items()]}
+
+
+@pytest.fixture
+def engine():
+    engine = Engine.__new__(Engine)
+    engine.config = fake_config(kept={'x': 1}, inplace={'inplace': True, 'x': 1}, rebuilt={'x': 1},
+                                removed={'x': 1})
+    engine.exchange = FakeExchange()
+    engine.strategies, engine._loaded = [], {}
+    engine.price_feed = engine.storage = engine.risk = None
+    engine.init_strategies()
+    return engine
+
+
+def loaded(engine):
+    return {key: strategy for key, (_, strategy) in engine._loaded.items()}
+
+
+def test_plan_reuses_updates_and_creates(engine):
+    before = loaded(engine)
+    config = fake_config(kept={'x': 1}, inplace={'inplace': True, 'x': 2}, rebuilt={'x': 2}, added={'x': 1})
+    plan = engine.plan_strategies(config)
+    by_key = {key: (strategy, apply) for key, _, strategy, apply, _ in plan}
+
+    assert by_key['kept'] == (before['kept'], None)
+    assert by_key['inplace'][0] is before['inplace'] and by_key['inplace'][1] is not None
+    assert by_key['rebuilt'][0] is not before['rebuilt']
+    assert 'removed' not in by_key
+    # 计划阶段不改变当前策略
+    assert loaded(engine) == before
+    assert before['inplace'].applied == []
+
+    engine.apply_config(config, plan)
+    after = loaded(engine)
+    assert after['kept'] is before['kept'] and after['inplace'] is before['inplace']
+    assert before['inplace'].applied == [{'inplace': True, 'x': 2}]
+    assert before['inplace'].config['fake']['x'] == 2
+    assert before['rebuilt'].stopped and before['removed'].stopped
+    assert not any(strategy.stopped for strategy in after.values())
+    assert engine.config is config
+
+
+@pytest.mark.parametrize('failing_key, failing', [
+    ('removed', {'fail': True}),                    # 重建时初始化失败
+    ('inplace', {'inplace': True, 'reject': True}),  # reconfigure 拒绝新参数
+])
+def test_failed_plan_stops_created_and_keeps_current(engine, monkeypatch, failing_key, failing):
+    before = loaded(engine)
+    config_before = engine.config
+    created = []
+    original_init = FakeStrategy.__init__
+
+    def tracking_init(self, exchange, config):
+        original_init(self, exchange, config)
+        created.append(self)
+
+    # added 与 rebuilt 先新建成功，随后的策略失败
+    params = dict(added={'x': 1}, rebuilt={'x': 2}, kept={'x': 1}, inplace={'inplace': True, 'x': 2})
+    params[failing_key] = failing
+    monkeypatch.setattr(FakeStrategy, '__init__', tracking_init)
+    with pytest.raises(ValueError, match=f"策略 {failing_key}"):
+        engine.plan_strategies(fake_config(**params))
+
+    assert len(created) == 2 and all(strategy.stopped for strategy in created)
+    assert loaded(engine) == before
+    assert not any(strategy.stopped for strategy in before.values())
+    assert before['inplace'].applied == []
+    assert engine.config is config_before
+
+
+def test_reload_config_keeps_original_on_failure(engine, monkeypatch):
+    before = loaded(engine)
+    config_before = engine.config
+    engine._config_mtime = 1
+    monkeypatch.setattr('core.engine.config_mtime', lambda: 2)
+    engine.load_config = lambda: fake_config(kept={'x': 1}, broken={'fail': True})
+
+    assert engine.reload_config() is False
+    assert loaded(engine) == before
+    assert engine.config is config_before
+
+
+def test_reload_follows_hot_reload_of_the_new_file(engine, monkeypatch):
+    mtime = [1]
+    engine._config_mtime = 1
+    monkeypatch.setattr('core.engine.config_mtime', lambda: mtime[0])
+    before = loaded(engine)
+
+    # 关闭热更新的修改不生效
+    disabled = dict(fake_config(kept={'x': 1}), hot_reload=False)
+    engine.load_config = lambda: disabled
+    mtime[0] = 2
+    assert engine.reload_config() is False
+    assert loaded(engine) == before
+
+    # 再改回 true 时立即生效
+    enabled = dict(fake_config(kept={'x': 1}, added={'x': 1}), hot_reload=True)
+    engine.load_config = lambda: enabled
+    mtime[0] = 3
+    assert engine.reload_config() is True
+    assert engine.config is enabled
+    assert sorted(loaded(engine)) == ['added', 'kept']
+    # 文件未再修改时不重复加载
+    assert engine.reload_config() is False
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from gate_api.exceptions import ApiException
+
+import core.exchange as exchange_module
+from core.async_exchange import AsyncExchange
+from core.exchange import Exchange, flatten_orders, flatten_report, submit_batch_orders, submit_flatten
+from core.snapshot_cache import SnapshotCache
+
+POSITIONS = {
+    'BTC_USDT': {'contract': 'BTC_USDT', 'size': 3, 'unrealised_pnl': -5.0},
+    'ETH_USDT': {'contract': 'ETH_USDT', 'size': -2, 'unrealised_pnl': 1.0},
+    'SOL_USDT': {'contract': 'SOL_USDT', 'size': 0, 'unrealised_pnl': 0.0},
+    'XRP_USDT': {'contract': 'XRP_USDT', 'size': 7, 'unrealised_pnl': 2.0},
+}
+
+
+def test_flatten_orders_filters():
+    orders = flatten_orders(POSITIONS)
+    # 空仓跳过；平仓单为反向的只减仓市价 IOC 单
+    assert [(o['contract'], o['size']) for o in orders] == [('BTC_USDT', -3), ('ETH_USDT', 2), ('XRP_USDT', -7)]
+    assert all(o['price'] == 0 and o['tif'] == 'ioc' and o['reduce_only'] for o in orders)
+    assert all(o['text'].startswith(exchange_module.CLOSE_TEXT_PREFIX) and len(o['text']) <= 28 for o in orders)
+    assert len({o['text'] for o in orders}) == 3
+
+    assert [o['contract'] for o in flatten_orders(POSITIONS, contracts=['ETH_USDT', 'SOL_USDT'])] == ['ETH_USDT']
+    assert [o['contract'] for o in flatten_orders(POSITIONS, side='long')] == ['BTC_USDT', 'XRP_USDT']
+    assert [o['contract'] for o in flatten_orders(POSITIONS, side='short')] == ['ETH_USDT']
+    losing = flatten_orders(POSITIONS, predicate=lambda p: p['unrealised_pnl'] < 0)
+    assert [o['contract'] for o in losing] == ['BTC_USDT']
+
+
+def test_flatten_report_merges_orders_and_results():
+    orders = flatten_orders(POSITIONS, side='long')
+    results = [{'succeeded': True, 'id': '1', 'status': 'finished', 'error': None},
+               {'succeeded': False, 'id': None, 'status': None, 'error': 'INSUFFICIENT'}]
+    report = flatten_report(orders, results)
+    assert report == [dict(results[0], contract='BTC_USDT', size=-3), dict(results[1], contract='XRP_USDT', size=-7)]
+
+
+def orders_for(count):
+    return [{'contract': f"C{i}_USDT", 'size': -1, 'price': 0} for i in range(count)]
+
+
+def test_submit_flatten_sends_batches_concurrently():
+    # 三批同时在 barrier 会合，串行提交时 barrier 超时
+    barrier = threading.Barrier(3, timeout=5)
+    batches = []
+
+    def submit(batch):
+        batches.append(len(batch))
+        barrier.wait()
+        return [{'contract': order['contract']} for order in batch]
+
+    orders = orders_for(25)
+    results = submit_flatten(orders, submit)
+    assert sorted(batches) == [5, 10, 10]
+    assert [r['contract'] for r in results] == [o['contract'] for o in orders]
+
+
+class FakeScheduler:
+    def __init__(self):
+        self.kinds = []
+
+    def call(self, kind, func, **kwargs):
+        self.kinds.append(kind)
+        return func(**kwargs)
+
+
+def test_submit_batch_orders_maps_responses():
+    sent = []
+
+    def create_batch_futures_order(settle, futures_order):
+        sent.append((settle, futures_order))
+        return [SimpleNamespace(succeeded=True, id=11, status='finished', label=None, detail=None),
+                SimpleNamespace(succeeded=False, id=None, status=None, label='REDUCE_ONLY_FAIL', detail='no position')]
+
+    api = SimpleNamespace(create_batch_futures_order=create_batch_futures_order)
+    scheduler = FakeScheduler()
+    results = submit_batch_orders(api, 'usdt', flatten_orders(POSITIONS, side='long'), scheduler)
+
+    settle, request = sent[0]
+    assert settle == 'usdt' and scheduler.kinds == ['order']
+    assert [(o.contract, o.size, o.price, o.tif, o.reduce_only) for o in request] == [
+        ('BTC_USDT', -3, '0', 'ioc', True), ('XRP_USDT', -7, '0', 'ioc', True)]
+    assert results == [{'succeeded': True, 'id': '11', 'status': 'finished', 'error': None},
+                       {'succeeded': False, 'id': None, 'status': None, 'error': 'REDUCE_ONLY_FAIL no position'}]
+
+
+def test_submit_batch_orders_marks_every_order_failed_on_api_error():
+    def create_batch_futures_order(settle, futures_order):
+        raise ApiException(status=500, reason="server error")
+
+    api = SimpleNamespace(create_batch_futures_order=create_batch_futures_order)
+    results = submit_batch_orders(api, 'usdt', orders_for(3), FakeScheduler())
+    assert [r['succeeded'] for r in results] == [False] * 3 and all(r['error'] for r in results)
+
+
+def make_exchange(cls, positions, place_orders):
+    exchange = cls.__new__(cls)
+    exchange.snapshots = SnapshotCache(ttl=60)
+    exchange.snapshots.get('stale', lambda: 'cached')
+    exchange.get_positions = positions
+    exchange.place_orders = place_orders
+    return exchange
+
+
+def test_exchange_flatten_refreshes_positions_and_reports():
+    submitted = []
+
+    def get_positions():
+        # 平仓前先使快照失效，保证使用最新持仓
+        assert exchange.snapshots.get('stale', lambda: 'fresh') == 'fresh'
+        return POSITIONS
+
+    def place_orders(batch):
+        submitted.extend(batch)
+        return [{'succeeded': True, 'id': str(i), 'status': 'finished', 'error': None} for i in range(len(batch))]
+
+    exchange = make_exchange(Exchange, get_positions, place_orders)
+    report = exchange.flatten(side='long')
+    assert [o['contract'] for o in submitted] == ['BTC_USDT', 'XRP_USDT']
+    assert [(r['contract'], r['size'], r['succeeded']) for r in report] == [('BTC_USDT', -3, True),
+                                                                           ('XRP_USDT', -7, True)]
+    assert exchange.flatten(contracts=['SOL_USDT']) == []
+    assert make_exchange(Exchange, lambda: None, place_orders).flatten() is None
+
+
+def test_async_exchange_flatten_gathers_batches():
+    positions = {f"C{i}_USDT": {'contract': f"C{i}_USDT", 'size': i + 1} for i in range(15)}
+
+    async def main():
+        started = asyncio.Event()
+        active = []
+
+        async def get_positions():
+            return positions
+
+        async def place_orders(batch):
+            active.append(len(batch))
+            if len(active) == 2:
+                started.set()
+            # 两批都开始提交后才返回，串行提交时会超时
+            await asyncio.wait_for(started.wait(), 5)
+            return [{'succeeded': True, 'id': o['contract'], 'status': 'finished', 'error': None} for o in batch]
+
+        exchange = make_exchange(AsyncExchange, get_positions, place_orders)
+        return active, await exchange.flatten()
+
+    active, report = asyncio.run(main())
+    assert active == [10, 5]
+    assert [r['contract'] for r in report] == list(positions)
+    assert [r['size'] for r in report] == [-(i + 1) for i in range(15)]
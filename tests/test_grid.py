@@ -0,0 +1,111 @@
+import pytest
+
+from strategies.grid import BUY, ORDER_TEXT_PREFIX, SELL, GridStrategy, GridTradingStrategy
+
+
+class FakeExchange:
+    settle = 'usdt'
+
+
+def make_strategy(**grid):
+    config = {'grid': dict({'contract': 'BTC_USDT', 'lower': 100, 'upper': 200, 'grid_count': 10,
+                            'order_size': 2}, **grid)}
+    return GridStrategy(FakeExchange(), config)
+
+
+def placed(strategy, places, first_id=1):
+    """模拟全部挂单成功"""
+    results = [{'succeeded': True, 'id': str(first_id + i), 'error': None} for i in range(len(places))]
+    strategy.apply_places(places, results)
+
+
+def test_levels_arithmetic_and_geometric():
+    grid = GridTradingStrategy(100, 200, grid_count=4)
+    assert grid.levels == [100, 125, 150, 175, 200]
+    geo = GridTradingStrategy(100, 400, grid_count=2, geometric=True)
+    assert geo.levels == pytest.approx([100, 200, 400])
+    with pytest.raises(ValueError):
+        GridTradingStrategy(200, 100)
+
+
+def test_initial_plan_places_buys_below_and_sells_above():
+    strategy = make_strategy()
+    cancels, places = strategy.plan(151.0)
+
+    assert cancels == []
+    assert strategy.neutral == 5
+    by_level = {level: order for level, order in places}
+    assert 5 not in by_level
+    assert sorted(by_level) == [0, 1, 2, 3, 4, 6, 7, 8, 9, 10]
+    for level, order in by_level.items():
+        side = BUY if level < 5 else SELL
+        assert order['size'] == 2 * side
+        assert order['price'] == strategy.grid.levels[level]
+        assert order['text'] == f"{ORDER_TEXT_PREFIX}{level}"
+        assert order['tif'] == 'gtc'
+
+
+def test_plan_is_idempotent_once_orders_are_placed():
+    strategy = make_strategy()
+    _, places = strategy.plan(151.0)
+    placed(strategy, places)
+    # 价格在相邻价位之间波动不移动中性价位
+    assert strategy.plan(158.0) == ([], [])
+    assert strategy.plan(142.0) == ([], [])
+    assert strategy.neutral == 5
+
+
+def test_fill_moves_neutral_and_replaces_opposite_side():
+    strategy = make_strategy()
+    _, places = strategy.plan(151.0)
+    placed(strategy, places)
+    # 140 的买单成交: 中性价位移到 4，原中性价位 150 补挂卖单
+    buy_140 = strategy.book.by_level[4]
+    strategy.apply_status(4, buy_140['id'], {'status': 'finished', 'finish_as': 'filled'})
+    assert strategy.neutral == 4
+
+    cancels, places = strategy.plan(139.0)
+    assert cancels == []
+    assert [(level, order['size']) for level, order in places] == [(5, -2)]
+
+
+def test_price_jump_flips_crossed_levels():
+    strategy = make_strategy()
+    _, places = strategy.plan(151.0)
+    placed(strategy, places)
+    # 价格跳到 176 而挂单状态尚未更新: 中性价位移到 8，160/170 的卖单改为买单，180 的卖单撤销
+    cancels, places = strategy.plan(176.0)
+    assert strategy.neutral == 8
+    assert sorted(strategy.book.by_id[order_id] for order_id in cancels) == [6, 7, 8]
+    assert [(level, order['size']) for level, order in places] == [(5, 2), (6, 2), (7, 2)]
+
+
+def test_price_outside_range_places_one_side():
+    strategy = make_strategy(tick_size=0.5, lower=100.2)
+    assert strategy.grid.levels[0] == 100.0
+    _, places = strategy.plan(250.0)
+    assert strategy.neutral == 10
+    assert len(places) == 10
+    assert all(order['size'] > 0 and order['price'] < 250.0 for _, order in places)
+
+
+def test_stale_orders_from_resync_are_cancelled():
+    strategy = make_strategy()
+    strategy.resync([
+        {'id': 'a', 'text': f"{ORDER_TEXT_PREFIX}0", 'size': 2, 'price': 100.0},
+        {'id': 'b', 'text': f"{ORDER_TEXT_PREFIX}0", 'size': 2, 'price': 100.0},
+        {'id': 'c', 'text': f"{ORDER_TEXT_PREFIX}3", 'size': 2, 'price': 131.0},
+        {'id': 'manual', 'text': 't-manual', 'size': 1, 'price': 120.0},
+    ])
+    assert strategy.book.by_level[0]['id'] == 'a'
+    cancels, places = strategy.plan(151.0)
+    assert sorted(cancels) == ['b', 'c']
+    assert 0 not in [level for level, _ in places]
+    assert 3 in [level for level, _ in places]
+
+
+def test_plan_respects_risk_control():
+    strategy = make_strategy()
+    strategy.allow_open = lambda contract, size, price, leverage=0: size < 0
+    _, places = strategy.plan(151.0)
+    assert places and all(order['size'] < 0 for _, order in places)
@@ -0,0 +1,76 @@
+import math
+import random
+
+import pytest
+
+from core.metrics import Histogram, Metrics
+
+
+def exact_quantile(values, q):
+    """与 Histogram 相同的最近秩定义"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(q * len(ordered))) - 1]
+
+
+def test_empty_histogram():
+    assert Histogram().quantiles() == [0.0, 0.0, 0.0]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_quantiles_within_relative_error(seed):
+    rng = random.Random(seed)
+    hist = Histogram()
+    # 跨越 1µs ~ 10s 的对数均匀分布
+    values = [10 ** rng.uniform(-6, 1) for _ in range(5000)]
+    for value in values:
+        hist.record(value)
+
+    qs = (0.01, 0.25, 0.5, 0.9, 0.99, 0.999, 1.0)
+    for q, estimate in zip(qs, hist.quantiles(qs)):
+        exact = exact_quantile(values, q)
+        # 取桶上界: 不低于真实值，相对误差不超过 1/sub_buckets
+        assert exact * (1 - 1e-12) <= estimate <= exact * (1 + 1 / hist.sub_buckets), q
+    assert hist.quantiles((1.0,)) == [max(values)]
+    assert hist.count == len(values)
+    assert hist.sum == pytest.approx(sum(values))
+
+
+def test_values_below_min_value_share_first_bucket():
+    hist = Histogram(min_value=1e-3)
+    for value in (0.0, 1e-5, 5e-4):
+        hist.record(value)
+    assert hist.counts == {0: 3}
+    assert hist.quantiles((0.5,)) == [5e-4]
+
+
+def test_power_of_two_boundaries():
+    hist = Histogram(sub_buckets=4, min_value=1.0)
+    for value in (1.0, 2.0, 4.0, 8.0):
+        index = hist._index(value)
+        # 2 的幂落在新区间的第一个子桶，其上界为 value * (1 + 1/sub_buckets)
+        assert hist._upper(index) == pytest.approx(value * 1.25)
+        assert hist._index(value * 0.999) == index - 1
+
+
+def test_render_prometheus_and_summary():
+    metrics = Metrics()
+    for ms in range(1, 101):
+        metrics.observe('request_seconds', ms / 1000, endpoint='orders')
+    metrics.inc('request_errors_total', endpoint='orders')
+
+    text = metrics.render_prometheus()
+    assert '# TYPE qqqrobot_request_seconds summary' in text
+    assert 'qqqrobot_request_seconds_count{endpoint="orders"} 100' in text
+    assert 'qqqrobot_request_seconds{endpoint="orders",quantile="0.5"}' in text
+    assert 'qqqrobot_request_errors_total{endpoint="orders"} 1' in text
+    (line,) = [line for line in metrics.summary() if line.startswith('request_seconds')]
+    assert '次数: 100' in line and '错误率: 1.0%' in line
+
+
+def test_timer_records_errors():
+    metrics = Metrics()
+    with pytest.raises(RuntimeError):
+        with metrics.timer('call_seconds', strategy='x'):
+            raise RuntimeError
+    assert metrics.histogram('call_seconds', (('strategy', 'x'),)).count == 1
+    assert metrics.counters[('call_errors_total', (('strategy', 'x'),))] == 1
@@ -0,0 +1,142 @@
+import json
+import logging
+import threading
+
+import pytest
+
+import core.notifier as notifier
+from core.notifier import JsonLinesFormatter, LogPipeline
+
+
+class BlockingHandler(logging.Handler):
+    """unblock 设置之前阻塞，记录格式化后的消息及格式化所在线程"""
+
+    def __init__(self):
+        super().__init__()
+        self.unblock = threading.Event()
+        self.messages = []
+        self.threads = []
+
+    def emit(self, record):
+        assert self.unblock.wait(5)
+        self.messages.append(self.format(record))
+        self.threads.append(threading.current_thread())
+
+
+@pytest.fixture
+def pipeline_logger():
+    pipeline = LogPipeline()
+    handler = BlockingHandler()
+    pipeline.set_handler('test', handler)
+    # pytest 会给测试开始时已存在的非传播 logger 挂上捕获 handler，这里用独立的 Logger 实例
+    logger = logging.Logger('qqqrobot.test_pipeline', logging.INFO)
+    logger.addHandler(pipeline.handler())
+    yield pipeline, handler, logger
+    handler.unblock.set()
+    pipeline.stop()
+
+
+def test_logging_does_not_wait_for_slow_output(pipeline_logger):
+    pipeline, handler, logger = pipeline_logger
+    formatted_in = []
+
+    class Lazy:
+        def __str__(self):
+            formatted_in.append(threading.current_thread())
+            return "lazy"
+
+    for i in range(100):
+        logger.info("tick %d %s", i, Lazy())
+    # 输出仍被阻塞，调用方已经返回，且尚未格式化
+    assert handler.messages == [] and formatted_in == []
+
+    handler.unblock.set()
+    pipeline.stop()
+    assert handler.messages == [f"tick {i} lazy" for i in range(100)]
+    assert threading.current_thread() not in set(formatted_in) | set(handler.threads)
+
+
+def test_records_after_stop_are_written_directly(pipeline_logger):
+    pipeline, handler, logger = pipeline_logger
+    handler.unblock.set()
+    pipeline.stop()
+    logger.warning("late")
+    assert handler.messages == ["late"] and handler.threads == [threading.current_thread()]
+
+
+def test_replacing_a_handler_closes_the_old_one():
+    pipeline = LogPipeline()
+    closed = []
+
+    class Closing(logging.Handler):
+        def emit(self, record):
+            pass
+
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    first, second = Closing(), Closing()
+    pipeline.set_handler('out', first)
+    pipeline.set_handler('out', second)
+    assert closed == [first] and pipeline.listener.handlers == (second,)
+    pipeline.set_handler('out', None)
+    assert closed == [first, second] and pipeline.listener.handlers == ()
+    pipeline.stop()
+
+
+def test_json_lines_formatter():
+    record = logging.LogRecord('t', logging.INFO, __file__, 1, '', None, None)
+    record.created = 12.34567
+    record.fields = {'contract': 'BTC_USDT', 'price': 1.5, 'note': '止损'}
+    assert json.loads(JsonLinesFormatter().format(record)) == {'ts': 12.346, 'contract': 'BTC_USDT',
+                                                               'price': 1.5, 'note': '止损'}
+    plain = logging.LogRecord('t', logging.INFO, __file__, 1, 'hello %s', ('world',), None)
+    assert json.loads(JsonLinesFormatter().format(plain))['msg'] == 'hello world'
+
+
+@pytest.fixture
+def restore_logging():
+    yield
+    notifier.configure_logging({})
+    if notifier._tick_pipeline is not None:
+        notifier._tick_pipeline.set_handler('ticks', None)
+
+
+def flush(pipeline):
+    pipeline.listener.stop()
+    pipeline.listener.start()
+
+
+def test_tick_log_writes_json_lines_when_enabled(tmp_path, restore_logging):
+    path = tmp_path / "ticks.jsonl"
+    notifier.log_tick(contract='IGNORED')
+    notifier.configure_logging({'tick_log': True, 'tick_log_path': str(path)})
+    notifier.log_tick(contract='BTC_USDT', price=100.5, stop=None)
+    notifier.log_tick(contract='ETH_USDT', price=10)
+    flush(notifier._tick_pipeline)
+
+    lines = [json.loads(line) for line in path.read_text(encoding='utf-8').splitlines()]
+    assert [(line['contract'], line['price']) for line in lines] == [('BTC_USDT', 100.5), ('ETH_USDT', 10)]
+    assert lines[0]['stop'] is None and 'ts' in lines[0]
+
+    notifier.configure_logging({'tick_log': False})
+    notifier.log_tick(contract='AFTER')
+    flush(notifier._tick_pipeline)
+    assert len(path.read_text(encoding='utf-8').splitlines()) == 2
+
+
+def test_rotation_settings_rebuild_file_handlers(tmp_path, monkeypatch, restore_logging):
+    monkeypatch.setattr(notifier, 'LOG_DIR', tmp_path)
+    notifier.add_log_file("extra.log")
+    key = str(tmp_path / "extra.log")
+    try:
+        assert notifier.pipeline.handlers[key].maxBytes == notifier.MAX_BYTES
+        notifier.configure_logging({'max_bytes': 1000, 'backup_count': 2})
+        handler = notifier.pipeline.handlers[key]
+        assert (handler.maxBytes, handler.backupCount) == (1000, 2)
+        notifier.configure_logging({'when': 'midnight'})
+        assert isinstance(notifier.pipeline.handlers[key], logging.handlers.TimedRotatingFileHandler)
+    finally:
+        notifier._log_files.pop(key, None)
+        notifier.pipeline.set_handler(key, None)
@@ -0,0 +1,88 @@
+import random
+from decimal import Decimal as D
+from types import SimpleNamespace
+
+import pytest
+
+from core.position_analytics import PositionBook
+
+
+def sdk_position(rng, contract):
+    return SimpleNamespace(
+        contract=contract, mode=rng.choice(['single', 'dual_long']),
+        size=str(rng.choice([-1, 0, 1, 1]) * rng.randint(1, 1000)),
+        leverage=rng.choice(['0', '', None, str(rng.randint(1, 100))]),
+        cross_leverage_limit=rng.choice(['0', None, str(rng.randint(1, 50))]),
+        entry_price=f"{rng.uniform(0.001, 70000):.6f}", mark_price=f"{rng.uniform(0.001, 70000):.6f}",
+        value=f"{rng.uniform(0, 1e5):.4f}", unrealised_pnl=f"{rng.uniform(-1e4, 1e4):.4f}", realised_pnl='0',
+        pnl_percent=None, margin=f"{rng.uniform(0, 1e4):.4f}", maintenance_rate='0.005',
+    )
+
+
+def decimal_reference(pos, account_leverage):
+    """原 Decimal 实现的收益率与杠杆"""
+    leverage = D(str(pos.leverage)) if pos.leverage and str(pos.leverage) != '0' else D(0)
+    if leverage <= 0:
+        if pos.cross_leverage_limit and D(str(pos.cross_leverage_limit)) > 0:
+            leverage = D(str(pos.cross_leverage_limit))
+        else:
+            leverage = D(str(account_leverage))
+    entry, mark, size = D(pos.entry_price), D(pos.mark_price), D(pos.size)
+    change = (mark - entry) / entry if entry > 0 else D(0)
+    roi = change * leverage * 100 if size > 0 else -change * leverage * 100
+    return float(leverage), float(roi)
+
+
+def test_matches_decimal_path():
+    rng = random.Random(7)
+    positions = [sdk_position(rng, f"C{i}_USDT") for i in range(500)]
+    book = PositionBook.from_api(positions, settle='usdt', account_leverage='20')
+
+    held = [p for p in positions if float(p.size) != 0]
+    assert 0 < len(book) == len(held) < len(positions)
+    for view, pos in zip(book, held):
+        leverage, roi = decimal_reference(pos, 20)
+        assert view['contract'] == pos.contract and view['mode'] == pos.mode
+        assert view['size'] == float(pos.size)
+        assert view['leverage'] == leverage
+        assert view['roi_percent'] == pytest.approx(roi, rel=1e-12, abs=1e-9)
+        assert view['margin_ratio'] == pytest.approx(float(pos.margin) / float(pos.value) if float(pos.value) else 0)
+
+
+def test_objects_missing_fields_default_to_zero():
+    positions = [SimpleNamespace(contract='BTC_USDT', size='3', entry_price='100', mark_price='90'),
+                 SimpleNamespace(contract=None, size='-1', entry_price=None, mark_price='5', mode=None)]
+    book = PositionBook.from_api(positions, account_leverage=None)
+    assert book.contract == ['BTC_USDT', 'N/A'] and book.mode == ['unknown', 'unknown']
+    assert book[0]['roi_percent'] == 0.0 and book[0]['margin'] == 0.0
+    assert book[-1]['roi_percent'] == 0.0
+
+
+def test_ratios_views_and_totals():
+    positions = [
+        SimpleNamespace(contract='BTC_USDT', size='2', leverage='10', entry_price='100', mark_price='110',
+                        value='220', margin='20', unrealised_pnl='20', maintenance_rate='0.01'),
+        SimpleNamespace(contract='ETH_USDT', size='-4', leverage='5', entry_price='10', mark_price='9',
+                        value='36', margin='8', unrealised_pnl='-12', maintenance_rate='0.01'),
+    ]
+    usdt = PositionBook.from_api(positions, settle='usdt')
+    btc = PositionBook.from_api(positions[:1], settle='btc')
+    assert usdt[0]['roi_percent'] == pytest.approx(100.0)
+    assert usdt[1]['roi_percent'] == pytest.approx(50.0)
+    assert usdt[0]['maintenance_ratio'] == pytest.approx(220 * 0.01 / 40)
+    # 权益为负时不计算维持保证金占用率
+    assert usdt[1]['maintenance_ratio'] == 0.0
+
+    book = PositionBook.concat([usdt, btc])
+    assert len(book) == 3 and book.find('BTC_USDT', settle='btc')['settle'] == 'btc'
+    assert book.find('SOL_USDT') is None
+    assert book.totals() == {
+        'usdt': {'positions': 2, 'unrealised_pnl': 8.0, 'margin': 28.0, 'value': 256.0},
+        'btc': {'positions': 1, 'unrealised_pnl': 20.0, 'margin': 20.0, 'value': 220.0},
+    }
+    assert book.to_dicts()[2]['contract'] == 'BTC_USDT'
+    assert len(PositionBook.concat([])) == 0 and len(PositionBook.from_api(None)) == 0
+    with pytest.raises(IndexError):
+        book[3]
+    with pytest.raises(KeyError):
+        book[0]['price']
@@ -0,0 +1,79 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from gate_api.exceptions import ApiException
+
+
+def sdk_position(contract, size, leverage='0', cross_leverage_limit='0'):
+    return SimpleNamespace(contract=contract, size=size, leverage=leverage, cross_leverage_limit=cross_leverage_limit,
+                           entry_price='100', mark_price='110', value='220', unrealised_pnl='20',
+                           realised_pnl='0', pnl_percent='0', margin='22', maintenance_rate='0.005', mode='single')
+
+
+class FakeFuturesApi:
+    """所有请求在 barrier 处会合: 串行请求时 barrier 超时"""
+
+    def __init__(self, positions, parties, failing=()):
+        self.positions = positions
+        self.failing = set(failing)
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.calls = []
+
+    def list_positions(self, settle):
+        self.calls.append(('positions', settle))
+        self.barrier.wait()
+        if settle in self.failing:
+            raise ApiException(status=500, reason="server error")
+        return self.positions.get(settle, [])
+
+    def list_futures_accounts(self, settle):
+        self.calls.append(('accounts', settle))
+        self.barrier.wait()
+        return SimpleNamespace(cross_leverage={'usdt': '5', 'btc': '3'}[settle])
+
+
+@pytest.fixture
+def make_query(interactive_bot):
+    def make(api, settles=('usdt', 'btc'), snapshots=None):
+        query = interactive_bot.FuturesPositionQuery('key', 'secret', snapshots=snapshots, settles=list(settles))
+        query.futures_api = api
+        return query
+    return make
+
+
+def test_settles_and_requests_run_concurrently(make_query):
+    api = FakeFuturesApi({'usdt': [sdk_position('BTC_USDT', 2, leverage='10'), sdk_position('ETH_USDT', 0)],
+                          'btc': [sdk_position('BTC_USD', -5)]}, parties=4)
+    result = make_query(api).get_all_settle_positions()
+
+    assert sorted(api.calls) == [('accounts', 'btc'), ('accounts', 'usdt'), ('positions', 'btc'),
+                                 ('positions', 'usdt')]
+    assert list(result) == ['usdt', 'btc']
+    assert [p['contract'] for p in result['usdt']] == ['BTC_USDT']
+    # 未设置杠杆时使用账户全仓杠杆
+    assert result['usdt'][0]['leverage'] == 10.0 and result['btc'][0]['leverage'] == 3.0
+    assert result['btc'][0]['roi_percent'] == pytest.approx(-30.0)
+
+
+def test_failed_settle_does_not_hide_others(make_query):
+    api = FakeFuturesApi({'usdt': [sdk_position('BTC_USDT', 1)]}, parties=4, failing={'btc'})
+    result = make_query(api).get_all_settle_positions()
+    assert list(result) == ['usdt']
+
+
+def test_portfolio_merges_settles(make_query):
+    api = FakeFuturesApi({'usdt': [sdk_position('BTC_USDT', 1)], 'btc': [sdk_position('BTC_USD', 1)]}, parties=4)
+    book = make_query(api).get_portfolio()
+    assert book.contract == ['BTC_USDT', 'BTC_USD'] and book.settle == ['usdt', 'btc']
+    assert book.totals()['btc']['positions'] == 1
+
+
+def test_shared_snapshots_reuse_requests(make_query):
+    from core.snapshot_cache import SnapshotCache
+
+    api = FakeFuturesApi({'usdt': [sdk_position('BTC_USDT', 1)]}, parties=2)
+    query = make_query(api, settles=['usdt'], snapshots=SnapshotCache(ttl=60))
+    query.get_all_settle_positions()
+    query.get_all_settle_positions()
+    assert len(api.calls) == 2
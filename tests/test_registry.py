@@ -0,0 +1,131 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from core.engine import Engine
+from strategies.base_strategy import BaseStrategy
+from strategies.registry import StrategyRegistry, configured_strategies
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_listing_does_not_import_strategies():
+    """在新进程中检查: 创建注册表不导入策略模块，load 只导入用到的那个"""
+    script = textwrap.dedent("""
+        import sys
+        from strategies.registry import StrategyRegistry
+        registry = StrategyRegistry()
+        assert {'stop_loss', 'grid', 'trailing_stop', 'trend_following'} <= set(registry.specs)
+        assert 'base_strategy' not in registry.specs and 'registry' not in registry.specs
+        assert not [m for m in sys.modules if m.startswith('strategies.') and m != 'strategies.registry']
+        assert registry.load('grid').__name__ == 'GridStrategy'
+        assert 'strategies.grid' in sys.modules and 'strategies.trend_following' not in sys.modules
+    """)
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, check=True, timeout=60)
+
+
+@pytest.fixture
+def plugin_dir(tmp_path, monkeypatch):
+    (tmp_path / "my_plugins.py").write_text(textwrap.dedent("""
+        from strategies.base_strategy import BaseStrategy
+
+        class Alpha(BaseStrategy):
+            config_key = 'alpha'
+            def run(self):
+                pass
+
+        class Beta(BaseStrategy):
+            def run(self):
+                pass
+    """))
+    (tmp_path / "single_plugin.py").write_text(textwrap.dedent("""
+        from strategies.base_strategy import BaseStrategy
+        from my_plugins import Alpha
+
+        class Only(BaseStrategy):
+            def run(self):
+                pass
+    """))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    return tmp_path
+
+
+def test_module_specs_and_class_lookup(plugin_dir):
+    registry = StrategyRegistry()
+    # 只有一个本模块定义的策略类时自动查找 (导入的类不算)
+    assert registry.load('single_plugin:').__name__ == 'Only'
+    assert registry.load('my_plugins:Beta').__name__ == 'Beta'
+    registry.register('ambiguous', 'my_plugins')
+    with pytest.raises(ValueError, match="2 个策略类"):
+        registry.load('ambiguous')
+    with pytest.raises(ValueError, match="未知的策略"):
+        registry.load('nope')
+
+
+def test_entry_points_are_loaded_on_demand(plugin_dir, monkeypatch):
+    loaded = []
+
+    class FakeEntryPoint:
+        name = 'third_party'
+
+        def load(self):
+            loaded.append(self.name)
+            from my_plugins import Beta
+            return Beta
+
+    monkeypatch.setattr('importlib.metadata.entry_points', lambda group: [FakeEntryPoint()])
+    registry = StrategyRegistry()
+    assert 'third_party' in registry.available() and loaded == []
+    assert registry.load('third_party').__name__ == 'Beta'
+    registry.load('third_party')
+    assert loaded == ['third_party']
+
+
+def test_params_override_the_strategy_section(plugin_dir):
+    registry = StrategyRegistry()
+    registry.register('alpha', 'my_plugins:Alpha')
+    registry.register('beta', 'my_plugins:Beta')
+    config = {'alpha': {'a': 1, 'b': 2}, 'settle': 'usdt'}
+
+    alpha = registry.strategy_config({'type': 'alpha', 'params': {'b': 3}}, config)
+    assert alpha['alpha'] == {'a': 1, 'b': 3} and config['alpha'] == {'a': 1, 'b': 2}
+    beta = registry.strategy_config({'type': 'beta', 'params': {'b': 3}}, config)
+    assert beta['b'] == 3 and 'b' not in config
+
+    strategy = registry.create({'type': 'alpha', 'name': 'A1'}, SimpleNamespace(settle='usdt'), config)
+    assert strategy.name == 'A1'
+
+
+def test_configured_strategies_legacy_and_list():
+    assert configured_strategies({}) == [{'type': 'stop_loss'}]
+    assert configured_strategies({'enable_stop_loss': False, 'grid': {'enabled': True}}) == [{'type': 'grid'}]
+    items = configured_strategies({'strategies': ['grid', {'type': 'x', 'enabled': False}, {'name': 'no type'}]})
+    assert items == [{'type': 'grid'}]
+
+
+def test_engine_skips_a_failing_strategy(plugin_dir):
+
+    class Broken(BaseStrategy):
+        def __init__(self, exchange, config):
+            raise RuntimeError("初始化失败")
+
+        def run(self):
+            pass
+
+    from strategies.registry import default_registry
+    default_registry().register('broken_for_test', Broken)
+    default_registry().register('beta_for_test', 'my_plugins:Beta')
+
+    engine = Engine.__new__(Engine)
+    engine.config = {'strategies': ['broken_for_test', {'type': 'unknown_for_test'}, 'beta_for_test',
+                                    'beta_for_test']}
+    engine.exchange = SimpleNamespace(settle='usdt')
+    engine.strategies, engine._loaded = [], {}
+    engine.price_feed = engine.storage = engine.risk = None
+    engine.init_strategies()
+    assert [type(s).__name__ for s in engine.strategies] == ['Beta', 'Beta']
+    assert list(engine._loaded) == ['beta_for_test', 'beta_for_test#2']
@@ -0,0 +1,189 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.exchange import RequestScheduler, TokenBucket
+
+
+class RateLimited(Exception):
+    def __init__(self, headers=None, status=429, label=None):
+        super().__init__(f"HTTP {status}")
+        self.status, self.headers, self.label = status, headers or {}, label
+
+
+def test_token_bucket_refills_up_to_burst():
+    bucket = TokenBucket(rate=10, burst=2)
+    now = bucket.updated
+    bucket.tokens = 0
+    assert bucket.wait_time(now) == pytest.approx(0.1)
+    assert bucket.wait_time(now + 0.05) == pytest.approx(0.05)
+    assert bucket.wait_time(now + 10) == 0.0 and bucket.tokens == 2
+    bucket.paused_until = now + 20
+    assert bucket.wait_time(now + 15) == pytest.approx(5)
+
+
+def test_acquire_spaces_requests_beyond_the_burst():
+    scheduler = RequestScheduler({'public': (100, 2, 0)}, total=None)
+    started = time.monotonic()
+    waits = [scheduler.acquire('public') for _ in range(5)]
+    assert waits[:2] == pytest.approx([0, 0], abs=0.005)
+    # 突发用完后每 10ms 一个令牌
+    assert time.monotonic() - started >= 0.025
+    stats = scheduler.stats()['public']
+    assert stats['requests'] == 5 and stats['queue_depth'] == 0
+    with pytest.raises(ValueError):
+        scheduler.acquire('order')
+
+
+def test_orders_take_the_shared_token_before_earlier_public_requests():
+    scheduler = RequestScheduler({'order': (10, 1, 0), 'public': (10, 1, 2)}, total=(10, 1))
+    public = scheduler._enqueue('public')
+    order = scheduler._enqueue('order')
+    with scheduler._cond:
+        assert scheduler._try_acquire(public) > 0
+        assert scheduler._try_acquire(order) == 0
+        # 总令牌已用完
+        assert scheduler._try_acquire(public) > 0
+    assert scheduler.stats()['public']['queue_depth'] == 1
+
+
+def test_same_kind_is_first_come_first_served():
+    scheduler = RequestScheduler({'public': (10, 5, 0)}, total=None)
+    first = scheduler._enqueue('public')
+    second = scheduler._enqueue('public')
+    with scheduler._cond:
+        assert scheduler._try_acquire(second) > 0
+        assert scheduler._try_acquire(first) == 0
+        assert scheduler._try_acquire(second) == 0
+
+
+def test_concurrent_identical_calls_are_coalesced():
+    scheduler = RequestScheduler()
+    release = threading.Event()
+    calls = []
+
+    def fetch(settle):
+        calls.append(settle)
+        assert release.wait(5)
+        return {'settle': settle}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.call('public', fetch, 'usdt', coalesce=True)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while scheduler.stats()['public']['coalesced'] < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ['usdt']
+    assert results == [{'settle': 'usdt'}] * 5
+    # 参数不同或请求结束后不再合并
+    assert scheduler.call('public', fetch, 'btc', coalesce=True) == {'settle': 'btc'}
+    assert scheduler.call('public', fetch, 'usdt', coalesce=True) == {'settle': 'usdt'}
+    assert calls == ['usdt', 'btc', 'usdt']
+
+
+def test_coalesced_callers_share_the_error():
+    scheduler = RequestScheduler()
+    release = threading.Event()
+    errors = []
+
+    def fetch():
+        assert release.wait(5)
+        raise ValueError("boom")
+
+    def caller():
+        try:
+            scheduler.call('private', fetch, coalesce=True)
+        except ValueError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while scheduler.stats()['private']['coalesced'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(errors) == 3 and len(set(map(id, errors))) == 1
+    assert scheduler.stats()['private']['errors'] == 1
+
+
+def test_retry_after_reads_gate_headers(monkeypatch):
+    monkeypatch.setattr('core.exchange.time.time', lambda: 1000.0)
+    assert RequestScheduler.retry_after(RateLimited({'X-Gate-RateLimit-Reset-Timestamp': '1002500'})) == 2.5
+    assert RequestScheduler.retry_after(RateLimited({'X-Gate-RateLimit-Reset-Timestamp': '999000'})) == 0.0
+    assert RequestScheduler.retry_after(RateLimited({'Retry-After': '3'})) == 3.0
+    assert RequestScheduler.retry_after(RateLimited(status=None, label='TOO_MANY_REQUESTS')) == 0.0
+    assert RequestScheduler.retry_after(RateLimited(status=500)) is None
+
+
+def test_throttled_backs_off_exponentially():
+    scheduler = RequestScheduler(base_backoff=0.5, max_backoff=1.5)
+    assert [scheduler.throttled('order') for _ in range(4)] == [0.5, 1.0, 1.5, 1.5]
+    # 响应头给出的等待时间优先
+    assert scheduler.throttled('order', 0.2) == 0.2
+    bucket = scheduler.buckets['order']
+    assert bucket.tokens == 0 and bucket.paused_until > time.monotonic() + 1
+    assert scheduler.stats()['order']['throttled'] == 5
+
+
+def test_429_pauses_then_retries():
+    scheduler = RequestScheduler(base_backoff=0.01)
+    attempts = []
+
+    def place():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise RateLimited({'Retry-After': '0.02'} if len(attempts) == 1 else None)
+        return 'ok'
+
+    assert scheduler.call('order', place) == 'ok'
+    assert attempts[1] - attempts[0] >= 0.02
+    assert attempts[2] - attempts[1] >= 0.02
+    assert scheduler.stats()['order']['throttled'] == 2
+    assert scheduler.buckets['order'].strikes == 0
+
+
+def test_gives_up_after_max_retries():
+    scheduler = RequestScheduler(max_retries=1, base_backoff=0.001)
+    calls = []
+
+    def place():
+        calls.append(1)
+        raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        scheduler.call('order', place)
+    assert len(calls) == 2
+    stats = scheduler.stats()['order']
+    assert stats['errors'] == 1 and stats['throttled'] == 1
+
+
+def test_async_coalescing_and_backoff():
+    scheduler = RequestScheduler(base_backoff=0.001)
+    calls = []
+
+    async def fetch(path):
+        calls.append(path)
+        await asyncio.sleep(0.01)
+        if len(calls) == 1:
+            raise RateLimited()
+        return path.upper()
+
+    async def main():
+        return await asyncio.gather(*(scheduler.call_async('public', fetch, '/tickers', coalesce=True)
+                                      for _ in range(4)))
+
+    assert asyncio.run(main()) == ['/TICKERS'] * 4
+    assert calls == ['/tickers', '/tickers']
+    stats = scheduler.stats()['public']
+    assert stats['coalesced'] == 3 and stats['throttled'] == 1
@@ -0,0 +1,149 @@
+import asyncio
+import threading
+
+import pytest
+
+from core.engine import Engine
+from core.risk_control import RiskControl
+
+
+def position(size, entry_price, mark_price, leverage=10, value=None):
+    return {'size': size, 'entry_price': entry_price, 'mark_price': mark_price, 'leverage': leverage,
+            'mode': 'single', 'value': value, 'margin': 0}
+
+
+def test_incremental_updates_match_full_recompute():
+    risk = RiskControl()
+    risk.sync_positions({'BTC_USDT': position(2, 100, 100), 'ETH_USDT': position(-3, 10, 10, leverage=5)})
+    risk.on_price('BTC_USDT', 110)
+    risk.on_price('ETH_USDT', 12)
+    risk.update_position('SOL_USDT', position(5, 20, 20))
+    risk.update_position('ETH_USDT', None)
+
+    fields = ('gross_notional', 'leveraged_notional', 'total_margin', 'total_upnl')
+    incremental = [getattr(risk, name) for name in fields]
+    risk._recompute()
+    assert [getattr(risk, name) for name in fields] == pytest.approx(incremental)
+    assert risk.gross_notional == pytest.approx(2 * 110 + 5 * 20)
+    assert risk.total_upnl == pytest.approx(2 * 10)
+    assert risk.exposure('BTC_USDT') == pytest.approx(220)
+
+
+def test_multiplier_is_derived_from_position_value():
+    risk = RiskControl()
+    risk.sync_positions({'BTC_USDT': position(-4, 100, 100, value=4)})
+    assert risk.positions['BTC_USDT']['multiplier'] == pytest.approx(0.01)
+    assert risk.exposure('BTC_USDT') == pytest.approx(-4)
+
+
+def test_check_open_limits():
+    risk = RiskControl({'max_contract_notional': 1000, 'max_total_notional': 1500, 'max_margin_ratio': 0.5})
+    risk.sync_positions({'BTC_USDT': position(5, 100, 100, leverage=10)})
+    risk.update_account(1000)
+
+    assert risk.check_open('BTC_USDT', 4, 100, leverage=10)
+    # 单合约: 持仓 5 + 6 张超过 1000
+    assert not risk.check_open('BTC_USDT', 6, 100, leverage=10)
+    # 反向开仓减少单合约敞口，但总名义价值仍按新增计算
+    assert risk.check_open('BTC_USDT', -9, 100, leverage=10)
+    assert not risk.check_open('ETH_USDT', 11, 100, leverage=10)
+    # 保证金率: 现有 50 + 新增 1000 / 2 超过权益的一半
+    assert not risk.check_open('ETH_USDT', 10, 100, leverage=2)
+
+
+def test_check_close_rejects_wrong_side_and_oversize():
+    risk = RiskControl()
+    risk.sync_positions({'BTC_USDT': position(5, 100, 100)})
+    assert risk.check_close('BTC_USDT', -5)
+    assert risk.check_close('BTC_USDT', -2)
+    assert not risk.check_close('BTC_USDT', 1)
+    assert not risk.check_close('BTC_USDT', -6)
+    # 未同步的合约不阻止平仓
+    assert risk.check_close('ETH_USDT', 3)
+
+
+@pytest.mark.parametrize('config, size, leverage, price, reason', [
+    ({'max_drawdown': 0.1}, 10, 1, 79, '权益回撤'),
+    ({'max_unrealised_loss': 200}, 10, 1, 79, '未实现亏损'),
+    # 空仓 2 倍杠杆: 价格涨到 125 时保证金 625 / 权益 1250
+    ({'max_margin_ratio': 0.5}, -10, 2, 125, '保证金率'),
+])
+def test_kill_switch_trips_once_on_price(config, size, leverage, price, reason):
+    risk = RiskControl(config)
+    calls = []
+    risk.add_listener(calls.append)
+    risk.sync_positions({'BTC_USDT': position(size, 100, 100, leverage=leverage)})
+    risk.update_account(1500 if size < 0 else 1000)
+    risk.on_price('BTC_USDT', 99 if size > 0 else 101)
+    assert not risk.killed
+
+    risk.on_price('BTC_USDT', price)
+    assert risk.killed and reason in risk.kill_reason
+    risk.on_price('BTC_USDT', price - 1 if size > 0 else price + 1)
+    assert len(calls) == 1 and reason in calls[0]
+
+    # 熔断后禁止开仓，平仓仍然允许
+    assert not risk.check_open('BTC_USDT', size, price)
+    assert risk.check_close('BTC_USDT', -size)
+    risk.reset()
+    assert not risk.killed and risk.drawdown == 0
+
+
+def test_listener_error_does_not_stop_other_listeners():
+    risk = RiskControl()
+    calls = []
+    risk.add_listener(lambda reason: 1 / 0)
+    risk.add_listener(calls.append)
+    risk.kill("手动")
+    assert calls == ["手动"]
+
+
+def test_sync_kill_flatten_runs_off_the_calling_thread():
+    """同步模式下熔断 (可能在推送行情线程中) 不等待平仓完成"""
+    release = threading.Event()
+    threads = []
+
+    class FakeExchange:
+        def flatten(self, contracts=None):
+            threads.append(threading.current_thread())
+            assert release.wait(5)
+            return [{'contract': c, 'succeeded': True} for c in contracts]
+
+    engine = Engine.__new__(Engine)
+    engine.exchange = FakeExchange()
+    engine._kill_tasks, engine._kill_executor = set(), None
+    engine.risk = RiskControl({'max_unrealised_loss': 50, 'close_on_kill': True})
+    engine.risk.add_listener(engine.on_kill)
+    engine.risk.sync_positions({'BTC_USDT': position(10, 100, 100)})
+
+    engine.risk.on_price('BTC_USDT', 90)
+    assert engine.risk.killed
+    (task,) = engine._kill_tasks
+    assert not task.done()
+    release.set()
+    engine._kill_executor.shutdown(wait=True)
+    assert threads and threads[0] is not threading.current_thread()
+    assert engine._kill_tasks == set()
+
+
+def test_async_kill_flatten_is_tracked_until_done():
+
+    class FakeAsyncExchange:
+        async def flatten(self, contracts=None):
+            await asyncio.sleep(0)
+            raise RuntimeError("网络错误")
+
+    async def main():
+        engine = Engine.__new__(Engine)
+        engine.exchange = FakeAsyncExchange()
+        engine._kill_tasks, engine._kill_executor = set(), None
+        engine.risk = RiskControl({'close_on_kill': True})
+        engine.risk.add_listener(engine.on_kill)
+        engine.risk.kill("手动")
+        (task,) = engine._kill_tasks
+        await asyncio.gather(task, return_exceptions=True)
+        return engine
+
+    engine = asyncio.run(main())
+    # 异常由完成回调记录，任务引用随之释放
+    assert engine._kill_tasks == set()
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from core.snapshot_cache import SnapshotCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('core.snapshot_cache.time.monotonic', lambda: now[0])
+    return now
+
+
+def counting_loader(values):
+    calls = []
+
+    def load():
+        calls.append(1)
+        return values[len(calls) - 1]
+    return load, calls
+
+
+def test_reads_within_ttl_share_one_load(clock):
+    cache = SnapshotCache(ttl=1.0)
+    load, calls = counting_loader(['a', 'b'])
+    assert cache.get('positions', load) == 'a'
+    clock[0] += 0.9
+    assert cache.get('positions', load) == 'a'
+    assert cache.peek('positions') == 'a'
+    clock[0] += 0.2
+    assert cache.peek('positions') is None
+    assert cache.get('positions', load) == 'b'
+    assert (len(calls), cache.hits, cache.misses) == (2, 1, 2)
+
+
+def test_failures_and_none_are_not_cached(clock):
+    cache = SnapshotCache(ttl=1.0)
+
+    def fail():
+        raise ConnectionError("down")
+
+    with pytest.raises(ConnectionError):
+        cache.get('tickers', fail)
+    load, calls = counting_loader([None, {'BTC_USDT': 1.0}])
+    assert cache.get('tickers', load) is None
+    assert cache.get('tickers', load) == {'BTC_USDT': 1.0}
+    assert len(calls) == 2
+
+
+def test_zero_ttl_disables_caching(clock):
+    cache = SnapshotCache(ttl=0)
+    load, calls = counting_loader([1, 2])
+    assert [cache.get('k', load), cache.get('k', load)] == [1, 2]
+
+
+def test_invalidate_drops_entries(clock):
+    cache = SnapshotCache(ttl=1.0)
+    cache.get('positions', lambda: 'p')
+    cache.get('account', lambda: 'a')
+    cache.invalidate('positions')
+    assert cache.peek('positions') is None and cache.peek('account') == 'a'
+    cache.invalidate()
+    assert cache.peek('account') is None
+
+
+def test_concurrent_readers_wait_for_one_request():
+    cache = SnapshotCache(ttl=1.0)
+    release = threading.Event()
+    calls = []
+
+    def load():
+        calls.append(1)
+        assert release.wait(5)
+        return 'snapshot'
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('positions', load))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.hits < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == ['snapshot'] * 4 and len(calls) == 1
+
+
+def test_result_started_before_invalidate_is_not_cached():
+    """下单前发出的持仓请求在下单后返回: 结果交给等待者，但不写入缓存"""
+    cache = SnapshotCache(ttl=10.0)
+    started, release = threading.Event(), threading.Event()
+    loads = []
+
+    def stale_load():
+        loads.append('stale')
+        started.set()
+        assert release.wait(5)
+        return 'before order'
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(cache.get('positions', stale_load)))
+    thread.start()
+    assert started.wait(5)
+
+    cache.invalidate()
+    # 失效后的读取不加入旧请求
+    assert cache.get('positions', lambda: loads.append('fresh') or 'after order') == 'after order'
+    release.set()
+    thread.join(5)
+    assert result == ['before order']
+    assert cache.peek('positions') == 'after order'
+    assert loads == ['stale', 'fresh']
+
+
+def test_async_invalidate_and_sharing():
+    cache = SnapshotCache(ttl=10.0)
+    loads = []
+
+    async def load():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return len(loads)
+
+    async def main():
+        shared = await asyncio.gather(*(cache.get_async('positions', load) for _ in range(3)))
+        stale = asyncio.ensure_future(cache.get_async('account', load))
+        await asyncio.sleep(0)
+        cache.invalidate()
+        stale_value = await stale
+        return shared, stale_value, cache.peek('account'), cache.peek('positions')
+
+    shared, stale_value, account, positions = asyncio.run(main())
+    assert shared == [1, 1, 1]
+    assert stale_value == 2 and account is None and positions is None
@@ -0,0 +1,120 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import core.exchange as exchange_module
+import core.sdk as sdk
+from core.engine import load_settings
+from core.startup import ImportProfiler, StartupTimer
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_entry_points_do_not_import_gate_api(tmp_path):
+    """在新进程中导入入口模块 (工作目录为临时目录，避免写入日志文件)"""
+    script = textwrap.dedent("""
+        import sys
+        import core.engine, core.exchange, core.async_exchange, interactive_bot, auto_stop_loss
+        from core.sdk import LazyFuturesApi, api_errors
+        assert 'gate_api' not in sys.modules, 'gate_api imported at startup'
+        assert api_errors() == ()
+        api = LazyFuturesApi('key', 'secret')
+        assert not api.loaded and 'gate_api' not in sys.modules
+        api.api_client
+        assert api.loaded and len(api_errors()) == 2
+    """)
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    subprocess.run([sys.executable, '-c', script], cwd=tmp_path, env=env, check=True, timeout=60)
+
+
+def test_lazy_api_is_created_once(monkeypatch):
+    created = []
+    barrier = threading.Barrier(4, timeout=5)
+
+    class FakeSdk:
+        Configuration = staticmethod(lambda **params: params)
+        ApiClient = staticmethod(lambda configuration: configuration)
+
+        @staticmethod
+        def FuturesApi(client):
+            created.append(client)
+            return SimpleNamespace(api_client=client, list_positions=lambda settle: [settle])
+
+    monkeypatch.setattr(sdk, 'gate_api', lambda: FakeSdk)
+    api = sdk.LazyFuturesApi('key', 'secret', host='http://localhost')
+
+    def use():
+        barrier.wait()
+        api.list_positions(settle='usdt')
+
+    threads = [threading.Thread(target=use) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert created == [{'host': 'http://localhost', 'key': 'key', 'secret': 'secret'}]
+    assert api.list_positions(settle='btc') == ['btc']
+
+
+def test_api_keys_are_read_once(monkeypatch):
+    monkeypatch.setattr(exchange_module, '_api_keys', None)
+    monkeypatch.setenv('GATE_API_KEY', 'k1')
+    monkeypatch.setenv('GATE_API_SECRET', 's1')
+    assert exchange_module.load_api_keys() == ('k1', 's1')
+    monkeypatch.setenv('GATE_API_KEY', 'k2')
+    assert exchange_module.load_api_keys() == ('k1', 's1')
+
+
+def test_settings_are_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / "settings.yaml"
+    path.write_text("settle: usdt\n")
+    first = load_settings(path)
+    assert load_settings(path) is first
+
+    path.write_text("settle: btc\n")
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert load_settings(path) == {'settle': 'btc'}
+    with pytest.raises(FileNotFoundError):
+        load_settings(tmp_path / "missing.yaml")
+
+
+def test_import_profiler_splits_self_and_cumulative_time(tmp_path, monkeypatch):
+    (tmp_path / "slow_child_mod.py").write_text("import time\ntime.sleep(0.05)\n")
+    (tmp_path / "slow_parent_mod.py").write_text("import time\nimport slow_child_mod\ntime.sleep(0.02)\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    profiler = ImportProfiler()
+    profiler.install()
+    try:
+        import slow_parent_mod  # noqa: F401
+    finally:
+        profiler.uninstall()
+        for name in ('slow_parent_mod', 'slow_child_mod'):
+            sys.modules.pop(name, None)
+
+    assert profiler not in sys.meta_path
+    child_own, child_total = profiler.records['slow_child_mod']
+    parent_own, parent_total = profiler.records['slow_parent_mod']
+    assert child_own == child_total >= 0.05
+    assert parent_total >= child_total + 0.02
+    assert parent_own == pytest.approx(parent_total - child_total)
+    assert [name for name, _, _ in profiler.by_package()[:2]] == ['slow_child_mod', 'slow_parent_mod']
+
+
+def test_startup_report_is_logged_once(monkeypatch):
+    monkeypatch.delenv('QQQROBOT_IMPORT_PROFILE', raising=False)
+    timer = StartupTimer()
+    timer.mark("初始化")
+    timer.mark("首次查询")
+    messages = []
+    logger = SimpleNamespace(info=messages.append)
+    timer.report(logger)
+    timer.report(logger)
+    assert len(messages) == 1
+    assert messages[0].startswith("启动耗时") and "初始化" in messages[0] and "首次查询" in messages[0]
@@ -0,0 +1,112 @@
+from data.stop_journal import StopJournal, open_journal
+
+
+def lines(path):
+    return path.read_text(encoding='utf-8').splitlines()
+
+
+def test_replay_restores_latest_state(tmp_path):
+    path = tmp_path / "stops.journal"
+    journal = StopJournal(path, compact_every=1000)
+    journal.put("BTC_USDT", {'stop': 90.0, 'high': 100.0})
+    journal.put("ETH_USDT", {'stop': 9.0, 'high': 10.0})
+    journal.put("BTC_USDT", {'stop': 95.0, 'high': 105.0})
+    journal.delete("ETH_USDT")
+    journal.delete("DOGE_USDT")
+    # 不存在的合约不写删除记录
+    assert len(lines(path)) == 4
+    journal._file.close()
+
+    replayed = StopJournal(path)
+    assert replayed.state == {"BTC_USDT": {'stop': 95.0, 'high': 105.0}}
+    assert replayed.get("ETH_USDT") is None
+    replayed.close()
+
+
+def test_put_stores_a_copy(tmp_path):
+    journal = StopJournal(tmp_path / "stops.journal")
+    record = {'stop': 90.0}
+    journal.put("BTC_USDT", record)
+    record['stop'] = 0.0
+    assert journal.get("BTC_USDT") == {'stop': 90.0}
+    journal.close()
+
+
+def test_replay_skips_truncated_last_line(tmp_path):
+    path = tmp_path / "stops.journal"
+    journal = StopJournal(path)
+    journal.put("BTC_USDT", {'stop': 90.0})
+    journal._file.close()
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{"contract":"BTC_USDT","stop":9')
+
+    replayed = StopJournal(path)
+    assert replayed.state == {"BTC_USDT": {'stop': 90.0}}
+    # 不完整的行已截断，下一条记录不会拼接到它后面
+    replayed.put("ETH_USDT", {'stop': 9.0})
+    replayed._file.close()
+    assert len(lines(path)) == 2
+    again = StopJournal(path)
+    assert again.state == {"BTC_USDT": {'stop': 90.0}, "ETH_USDT": {'stop': 9.0}}
+    again.close()
+
+
+def test_replay_skips_records_without_contract(tmp_path):
+    path = tmp_path / "stops.journal"
+    path.write_text('{"stop":1.0}\n5\n{"contract":"BTC_USDT","stop":90.0}\n', encoding='utf-8')
+    journal = StopJournal(path)
+    assert journal.state == {"BTC_USDT": {'stop': 90.0}}
+    journal.close()
+
+
+def test_compaction_rewrites_current_state(tmp_path):
+    path = tmp_path / "stops.journal"
+    journal = StopJournal(path, compact_every=5)
+    for i in range(4):
+        journal.put("BTC_USDT", {'stop': float(i)})
+    assert len(lines(path)) == 4
+    # 第 5 次追加触发压缩，只剩每个合约一行
+    journal.put("ETH_USDT", {'stop': 9.0})
+    assert len(lines(path)) == 2
+    assert not path.with_suffix('.tmp').exists()
+    # 压缩后继续追加到新文件
+    journal.put("BTC_USDT", {'stop': 10.0})
+    assert len(lines(path)) == 3
+    journal._file.close()
+    replayed = StopJournal(path)
+    assert replayed.state == {"BTC_USDT": {'stop': 10.0}, "ETH_USDT": {'stop': 9.0}}
+    replayed.close()
+
+
+def test_close_compacts(tmp_path):
+    path = tmp_path / "stops.journal"
+    journal = StopJournal(path)
+    for i in range(10):
+        journal.put("BTC_USDT", {'stop': float(i)})
+    journal.delete("BTC_USDT")
+    journal.close()
+    assert lines(path) == []
+
+
+def test_open_journal_shares_until_last_close(tmp_path):
+    path = tmp_path / "stops.journal"
+    old = open_journal(path, compact_every=1000)
+    # 热更新: 新策略实例在旧实例关闭前打开同一路径
+    new = open_journal(str(path), compact_every=3)
+    assert new is old
+    assert new.compact_every == 3
+
+    old.put("BTC_USDT", {'stop': 90.0})
+    old.close()
+    new.put("ETH_USDT", {'stop': 9.0})
+    assert not new._file.closed
+    new.close()
+    assert new._file.closed
+
+    replayed = StopJournal(path)
+    assert replayed.state == {"BTC_USDT": {'stop': 90.0}, "ETH_USDT": {'stop': 9.0}}
+    replayed.close()
+    # 全部关闭后再次打开得到新对象
+    reopened = open_journal(path)
+    assert reopened is not old
+    reopened.close()
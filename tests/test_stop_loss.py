@@ -0,0 +1,162 @@
+import asyncio
+
+import pytest
+
+from strategies.stop_loss import StopLossStrategy
+
+
+class FakeExchange:
+    """返回固定持仓/行情快照并记录请求次数的同步交易所"""
+
+    settle = 'usdt'
+
+    def __init__(self, positions, prices, result=True):
+        self.positions, self.prices, self.result = positions, prices, result
+        self.calls = {'positions': 0, 'tickers': 0}
+        self.closes = []
+
+    def get_positions(self):
+        self.calls['positions'] += 1
+        return self.positions
+
+    def get_tickers(self):
+        self.calls['tickers'] += 1
+        return self.prices
+
+    def warm_close_path(self, contracts):
+        pass
+
+    def close_position(self, contract, size, mode, detected_at=None):
+        self.closes.append((contract, size))
+        return self.result
+
+
+class FakeAsyncExchange(FakeExchange):
+
+    async def get_positions(self):
+        return FakeExchange.get_positions(self)
+
+    async def get_tickers(self):
+        return FakeExchange.get_tickers(self)
+
+    async def close_position(self, contract, size, mode, detected_at=None):
+        await asyncio.sleep(0)
+        return FakeExchange.close_position(self, contract, size, mode, detected_at)
+
+
+def position(size, entry_price=100.0):
+    return {'size': size, 'entry_price': entry_price, 'mark_price': entry_price, 'mode': 'single'}
+
+
+RULES = {'contracts': [
+    {'contract': 'BTC_USDT', 'stop_loss_price': 90, 'take_profit_price': 120},
+    {'contract': 'ETH_USDT', 'stop_loss_price': 110, 'take_profit_price': 80},
+    {'contract': 'SOL_USDT', 'stop_loss_price': 90},
+]}
+
+
+def make_strategy(exchange, config=RULES):
+    return StopLossStrategy(exchange, config)
+
+
+def test_load_rules_accepts_legacy_single_contract():
+    rules = StopLossStrategy.load_rules({'contract': 'BTC_USDT', 'stop_loss_price': '90'})
+    assert rules == {'BTC_USDT': {'stop_loss_price': 90.0, 'take_profit_price': 0.0}}
+    assert StopLossStrategy.load_rules({'contracts': [{'stop_loss_price': 1}]}) == {}
+
+
+def test_one_snapshot_per_run_closes_only_triggered_contracts():
+    # BTC 多仓跌破止损，ETH 空仓跌破止盈，SOL 未触发
+    exchange = FakeExchange({'BTC_USDT': position(2), 'ETH_USDT': position(-3), 'SOL_USDT': position(1)},
+                            {'BTC_USDT': 89.0, 'ETH_USDT': 79.0, 'SOL_USDT': 95.0})
+    strategy = make_strategy(exchange)
+    strategy.run()
+
+    assert exchange.calls == {'positions': 1, 'tickers': 1}
+    assert sorted(exchange.closes) == [('BTC_USDT', 2), ('ETH_USDT', -3)]
+
+
+def test_short_stop_loss_is_a_rising_level():
+    exchange = FakeExchange({'ETH_USDT': position(-3)}, {'ETH_USDT': 111.0})
+    make_strategy(exchange).run()
+    assert exchange.closes == [('ETH_USDT', -3)]
+
+
+def test_missing_price_skips_only_that_contract():
+    exchange = FakeExchange({'BTC_USDT': position(2), 'SOL_USDT': position(1)}, {'SOL_USDT': 80.0})
+    make_strategy(exchange).run()
+    assert exchange.closes == [('SOL_USDT', 1)]
+
+
+def test_no_positions_skips_tickers():
+    exchange = FakeExchange({'DOGE_USDT': position(1)}, {})
+    make_strategy(exchange).run()
+    assert exchange.calls == {'positions': 1, 'tickers': 0}
+
+
+def test_successful_close_is_not_repeated_until_the_next_snapshot():
+    exchange = FakeExchange({'BTC_USDT': position(2)}, {'BTC_USDT': 89.0})
+    strategy = make_strategy(exchange)
+    strategy.run()
+    # 同一快照上的推送行情不再触发
+    strategy.on_price('BTC_USDT', 85.0)
+    assert exchange.closes == [('BTC_USDT', 2)]
+
+    # 下一次快照 (可能取于成交之前) 仍持有时不重挂，再下一次才恢复监控
+    strategy.run()
+    assert exchange.closes == [('BTC_USDT', 2)]
+    strategy.run()
+    assert exchange.closes == [('BTC_USDT', 2)] * 2
+
+
+def test_failed_close_retries_on_the_next_run():
+    exchange = FakeExchange({'BTC_USDT': position(2)}, {'BTC_USDT': 89.0}, result=False)
+    strategy = make_strategy(exchange)
+    strategy.run()
+    strategy.run()
+    assert exchange.closes == [('BTC_USDT', 2)] * 2
+    assert strategy._closing == {}
+
+
+def test_risk_rejection_does_not_block_retry():
+
+    class RejectingRisk:
+        def check_close(self, contract, size):
+            return False
+
+    exchange = FakeExchange({'BTC_USDT': position(2)}, {'BTC_USDT': 89.0})
+    strategy = make_strategy(exchange)
+    strategy.risk = RejectingRisk()
+    strategy.run()
+    assert exchange.closes == [] and strategy._closing == {}
+
+
+def test_run_async_closes_concurrently():
+    exchange = FakeAsyncExchange({'BTC_USDT': position(2), 'ETH_USDT': position(-3)},
+                                 {'BTC_USDT': 121.0, 'ETH_USDT': 111.0})
+    strategy = make_strategy(exchange)
+    asyncio.run(strategy.run_async())
+    assert sorted(exchange.closes) == [('BTC_USDT', 2), ('ETH_USDT', -3)]
+    assert exchange.calls == {'positions': 1, 'tickers': 1}
+    assert strategy._closing == {'BTC_USDT': True, 'ETH_USDT': True}
+
+
+@pytest.mark.parametrize('price, rule', [(85.0, 'stop_loss'), (125.0, 'take_profit')])
+def test_triggers_are_recorded(price, rule):
+
+    class FakeStorage:
+        def __init__(self):
+            self.triggers = []
+
+        def save_positions(self, positions):
+            pass
+
+        def save_trigger(self, trigger):
+            self.triggers.append(trigger)
+
+    exchange = FakeExchange({'BTC_USDT': position(2)}, {'BTC_USDT': price})
+    strategy = make_strategy(exchange)
+    strategy.storage = FakeStorage()
+    strategy.run()
+    (trigger,) = strategy.storage.triggers
+    assert trigger['rule'] == rule and trigger['price'] == price
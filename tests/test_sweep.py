@@ -0,0 +1,40 @@
+import numpy as np
+
+from core.candles import Candles
+from core.sweep import drop_finer_intervals, grid, random_search, run_sweep
+
+
+def hourly_candles(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.r_[close[0], close[:-1]]
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.005, n))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.005, n))
+    return Candles(np.arange(n) * 3600, open_, high, low, close, np.ones(n))
+
+
+def test_random_search_skips_intervals_finer_than_base():
+    params = random_search(200, seed=1, base_interval='1h')
+    assert {p['interval'] for p in params} == {'1h', '4h'}
+    # 候选全部更小时使用回测K线周期
+    assert {p['interval'] for p in random_search(10, interval=('1m', '5m'), base_interval='15m')} == {'15m'}
+    # 默认 1m 回测K线时保留全部候选
+    assert {p['interval'] for p in random_search(200, seed=1)} == {'15m', '1h', '4h'}
+
+
+def test_random_search_is_reproducible():
+    assert random_search(20, seed=7) == random_search(20, seed=7)
+
+
+def test_drop_finer_intervals():
+    params = grid([1.0], [5.0], interval=['15m', '1h', '4h'])
+    assert [p['interval'] for p in drop_finer_intervals(params, '1h')] == ['1h', '4h']
+
+
+def test_run_sweep_with_coarse_base_interval():
+    candles = {'BTC_USDT': hourly_candles()}
+    params = grid([1.0, 2.0], [3.0], period=[14], interval=['15m', '1h', '4h'])
+    results = run_sweep(candles, params, base_interval='1h', workers=1)
+    assert sorted((r['atr_k'], r['interval']) for r in results) == [(1.0, '1h'), (1.0, '4h'), (2.0, '1h'), (2.0, '4h')]
+    assert [r['pnl'] for r in results] == sorted((r['pnl'] for r in results), reverse=True)
+    assert run_sweep(candles, grid([1.0], [3.0], interval=['15m']), base_interval='1h', workers=1) == []
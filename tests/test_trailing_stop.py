@@ -0,0 +1,91 @@
+import threading
+
+import pytest
+
+from strategies.trailing_stop import TrailingStopStrategy
+
+
+class FakeExchange:
+    """同步交易所: close_position 在 release 设置前阻塞，返回 result"""
+
+    settle = 'usdt'
+
+    def __init__(self):
+        self.closes = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.result = True
+
+    def warm_close_path(self, contracts):
+        pass
+
+    def close_position(self, contract, size, mode, detected_at=None):
+        self.closes.append(contract)
+        self.started.set()
+        assert self.release.wait(5)
+        return self.result
+
+
+def position(size=1):
+    return {'size': size, 'entry_price': 100.0, 'mark_price': 100.0, 'mode': 'single'}
+
+
+@pytest.fixture
+def strategy(tmp_path):
+    config = {'trailing_stop': {'contracts': [{'contract': 'BTC_USDT', 'trail_pct': 10}],
+                                'journal': str(tmp_path / "stops.journal")}}
+    strategy = TrailingStopStrategy(FakeExchange(), config)
+    strategy.update_positions({'BTC_USDT': position()})
+    yield strategy
+    strategy.exchange.release.set()
+    strategy.shutdown()
+
+
+def trigger(strategy):
+    """推送行情触发止损 (止损价 90)，等待后台平仓开始"""
+    assert strategy.advance('BTC_USDT', 100.0) is False
+    strategy.on_price('BTC_USDT', 89.0)
+    assert strategy.exchange.started.wait(5)
+
+
+def test_snapshot_during_pending_close_does_not_rearm(strategy):
+    trigger(strategy)
+    # 平仓尚未返回时到达的持仓快照 (仍有持仓) 不解除
+    strategy.update_positions({'BTC_USDT': position()})
+    strategy.on_price('BTC_USDT', 88.0)
+    assert strategy.advance('BTC_USDT', 87.0) is False
+
+    strategy.exchange.release.set()
+    strategy._close_executor.shutdown(wait=True)
+    assert strategy.exchange.closes == ['BTC_USDT']
+    assert strategy._closing == {'BTC_USDT': True}
+    # 平仓成功后的下一次快照解除
+    strategy.update_positions({})
+    assert strategy._closing == {}
+    assert 'BTC_USDT' not in strategy.states
+
+
+def test_failed_close_rearms_immediately(strategy):
+    strategy.exchange.result = False
+    strategy.exchange.release.set()
+    trigger(strategy)
+    strategy._close_executor.shutdown(wait=True)
+    assert strategy._closing == {}
+    assert strategy.advance('BTC_USDT', 88.0) is True
+
+
+def test_snapshot_without_position_clears_pending_close(strategy):
+    trigger(strategy)
+    strategy.update_positions({})
+    assert strategy._closing == {}
+    strategy.exchange.release.set()
+
+
+def test_restored_state_waits_for_first_snapshot(strategy, tmp_path):
+    strategy.advance('BTC_USDT', 100.0)
+    restored = TrailingStopStrategy(FakeExchange(), strategy.config)
+    assert restored.states['BTC_USDT']['stop'] == pytest.approx(90.0)
+    assert restored.advance('BTC_USDT', 80.0) is False
+    restored.update_positions({'BTC_USDT': position()})
+    assert restored.advance('BTC_USDT', 80.0) is True
+    restored.shutdown()
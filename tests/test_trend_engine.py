@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from core import indicators
+from strategies.trend_following import TrendEngine
+
+BARS = 200
+# 第二个合约晚 37 根K线才开始有数据
+LATE_START = 37
+
+
+def random_candles(seed, n=BARS):
+    rng = np.random.default_rng(seed)
+    close = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    high = close * (1 + rng.uniform(0, 0.01, n))
+    low = close * (1 - rng.uniform(0, 0.01, n))
+    return high, low, close
+
+
+def reference(high, low, close, p):
+    """用 core.indicators 对整段数据计算的结果 (与逐根递推应一致)"""
+    n = p['breakout_period']
+    upper = np.full(len(close), np.nan)
+    lower = np.full(len(close), np.nan)
+    for i in range(n, len(close)):
+        upper[i] = high[i - n:i].max()
+        lower[i] = low[i - n:i].min()
+    m = p['momentum_period']
+    momentum = np.full(len(close), np.nan)
+    momentum[m:] = close[m:] / close[:-m] - 1.0
+    dif, dea, hist = indicators.macd(close, p['macd_fast'], p['macd_slow'], p['macd_signal'])
+    boll_mid, boll_upper, boll_lower = indicators.bollinger(close, p['boll_period'], p['boll_k'])
+    return {
+        'ma_fast': indicators.sma(close, p['ma_fast']),
+        'ma_slow': indicators.sma(close, p['ma_slow']),
+        'ema': indicators.ema(close, p['ema_period']),
+        'dif': dif, 'dea': dea, 'macd': hist,
+        'rsi': indicators.rsi(close, p['rsi_period']),
+        'boll_mid': boll_mid, 'boll_upper': boll_upper, 'boll_lower': boll_lower,
+        'atr': indicators.atr(high, low, close, p['atr_period']),
+        'upper': upper, 'lower': lower, 'momentum': momentum,
+    }
+
+
+@pytest.fixture(scope='module')
+def run():
+    """逐根更新引擎，记录每根K线后的指标值"""
+    candles = [random_candles(1), random_candles(2)]
+    high = np.full((2, BARS), np.nan)
+    low = np.full((2, BARS), np.nan)
+    close = np.full((2, BARS), np.nan)
+    for i, (h, l, c) in enumerate(candles):
+        start = LATE_START if i == 1 else 0
+        high[i, start:], low[i, start:], close[i, start:] = h[:BARS - start], l[:BARS - start], c[:BARS - start]
+
+    engine = TrendEngine(["BTC_USDT", "ETH_USDT"])
+    history = {}
+    for j in range(BARS):
+        engine.update(high[:, j], low[:, j], close[:, j])
+        for name, value in engine.values.items():
+            history.setdefault(name, np.empty((2, BARS)))[:, j] = value
+    return engine, high, low, close, history
+
+
+@pytest.mark.parametrize('row, start', [(0, 0), (1, LATE_START)])
+def test_values_match_indicators(run, row, start):
+    engine, high, low, close, history = run
+    expected = reference(high[row, start:], low[row, start:], close[row, start:], engine.params)
+    for name, values in expected.items():
+        np.testing.assert_allclose(history[name][row, start:], values, rtol=1e-9, atol=1e-9,
+                                   equal_nan=True, err_msg=name)
+
+
+def test_late_contract_has_no_values_before_data(run):
+    _, _, _, _, history = run
+    for name in ('ma_fast', 'ema', 'rsi', 'atr', 'upper', 'momentum'):
+        assert np.isnan(history[name][1, LATE_START:LATE_START + 5]).all(), name
+
+
+def test_window_recalibration_keeps_sums_exact(run):
+    engine, high, low, close, history = run
+    # 运行超过多个窗口后滚动和仍与直接求和一致
+    assert BARS > 3 * engine.window
+    np.testing.assert_allclose(history['ma_slow'][0, -1], close[0, -engine.params['ma_slow']:].mean(), rtol=1e-12)
+
+
+def test_signals_follow_values(run):
+    engine, *_ = run
+    v = engine.values
+    assert (engine.signals['ma'] == np.sign(v['ma_fast'] - v['ma_slow'])).all()
+    assert (engine.signals['macd'] == np.sign(v['macd'])).all()
+    votes = engine.combined(['ma', 'ema', 'macd'])
+    total = engine.signals['ma'] + engine.signals['ema'] + engine.signals['macd']
+    assert (votes == np.where(np.abs(total) >= 2, np.sign(total), 0)).all()
+
+
+def test_missing_bar_carries_close_forward():
+    engine = TrendEngine(["BTC_USDT"], {'ma_fast': 2, 'ma_slow': 3})
+    for price in (100.0, 101.0):
+        engine.update([price], [price], [price])
+    engine.update([np.nan], [np.nan], [np.nan])
+    assert engine.values['close'][0] == 101.0
+    assert engine.values['ma_slow'][0] == pytest.approx((100.0 + 101.0 + 101.0) / 3)
@@ -0,0 +1,100 @@
+import random
+
+import pytest
+
+from core.trigger_index import FALLING, RISING, TriggerIndex
+
+
+def test_crossed_returns_only_crossed_levels():
+    index = TriggerIndex()
+    index.set("A:stop_loss", "A", 90.0, FALLING, 'stop_loss')
+    index.set("A:take_profit", "A", 110.0, RISING, 'take_profit')
+
+    assert index.crossed("A", 100.0) == []
+    fired = index.crossed("A", 89.5)
+    assert [t.id for t in fired] == ["A:stop_loss"]
+    assert fired[0].data == 'stop_loss'
+    # 触发后已移除
+    assert "A:stop_loss" not in index
+    assert index.crossed("A", 80.0) == []
+    assert [t.id for t in index.crossed("A", 110.0)] == ["A:take_profit"]
+    assert len(index) == 0
+
+
+def test_crossed_without_pop_keeps_triggers():
+    index = TriggerIndex()
+    index.set("A:stop_loss", "A", 90.0, FALLING)
+    assert len(index.crossed("A", 85.0, pop=False)) == 1
+    assert len(index.crossed("A", 85.0, pop=False)) == 1
+    assert "A:stop_loss" in index
+
+
+def test_contracts_are_independent():
+    index = TriggerIndex()
+    index.set("A:stop_loss", "A", 90.0, FALLING)
+    index.set("B:stop_loss", "B", 90.0, FALLING)
+    assert [t.contract for t in index.crossed("B", 50.0)] == ["B"]
+    assert "A:stop_loss" in index
+    assert index.crossed("C", 1.0) == []
+
+
+def test_set_moves_existing_level():
+    index = TriggerIndex()
+    index.set("A:stop_loss", "A", 90.0, FALLING)
+    index.set("A:stop_loss", "A", 95.0, FALLING)
+    assert len(index) == 1
+    assert index.get("A:stop_loss").level == 95.0
+    assert index.crossed("A", 96.0) == []
+    assert [t.level for t in index.crossed("A", 94.0)] == [95.0]
+
+
+def test_set_changes_direction():
+    index = TriggerIndex()
+    index.set("A:stop_loss", "A", 90.0, FALLING)
+    index.set("A:stop_loss", "A", 90.0, RISING)
+    assert index.crossed("A", 80.0) == []
+    assert len(index.crossed("A", 91.0)) == 1
+
+
+def test_remove_and_remove_contract():
+    index = TriggerIndex()
+    index.set("A:1", "A", 90.0, FALLING)
+    index.set("A:2", "A", 90.0, FALLING)
+    index.set("B:1", "B", 110.0, RISING)
+    assert index.remove("A:1")
+    assert not index.remove("A:1")
+    assert [t.id for t in index.crossed("A", 80.0, pop=False)] == ["A:2"]
+    index.remove_contract("A")
+    assert "A:2" not in index
+    assert len(index) == 1
+
+
+def test_invalid_direction():
+    with pytest.raises(ValueError):
+        TriggerIndex().set("A:1", "A", 1.0, "sideways")
+
+
+def test_matches_brute_force():
+    rng = random.Random(7)
+    index = TriggerIndex()
+    expected = {}
+    for step in range(2000):
+        trigger_id = f"t{rng.randrange(50)}"
+        action = rng.random()
+        if action < 0.5:
+            level = round(rng.uniform(90, 110), 1)
+            direction = rng.choice((FALLING, RISING))
+            index.set(trigger_id, "A", level, direction)
+            expected[trigger_id] = (level, direction)
+        elif action < 0.6:
+            assert index.remove(trigger_id) == (expected.pop(trigger_id, None) is not None)
+        else:
+            price = round(rng.uniform(88, 112), 1)
+            want = {tid for tid, (level, direction) in expected.items()
+                    if (direction == FALLING and price <= level) or (direction == RISING and price >= level)}
+            pop = rng.random() < 0.5
+            assert {t.id for t in index.crossed("A", price, pop=pop)} == want
+            if pop:
+                for tid in want:
+                    del expected[tid]
+        assert len(index) == len(expected)
@@ -0,0 +1,23 @@
+from data.storage import Storage
+
+
+def test_view_orders_reads_configured_database(interactive_bot, tmp_path, monkeypatch, capsys):
+    db_path = tmp_path / "orders.db"
+    storage = Storage(db_path=db_path)
+    storage.save_order({'contract': 'BTC_USDT', 'size': -2, 'order_id': '42', 'status': 'finished',
+                        'success': 1})
+    storage.close()
+    monkeypatch.setattr('core.engine.load_settings', lambda: {'storage': {'enabled': True, 'path': str(db_path)}})
+
+    interactive_bot.handle_view_orders(None)
+    out = capsys.readouterr().out
+    assert 'BTC_USDT' in out and 'ID=42' in out
+
+
+def test_view_orders_without_database(interactive_bot, tmp_path, monkeypatch, capsys):
+    db_path = tmp_path / "missing.db"
+    monkeypatch.setattr('core.engine.load_settings', lambda: {'storage': {'path': str(db_path)}})
+
+    interactive_bot.handle_view_orders(None)
+    assert '暂无订单记录' in capsys.readouterr().out
+    assert not db_path.exists()